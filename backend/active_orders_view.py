@@ -0,0 +1,420 @@
+"""
+Active Orders Materialized View
+===============================
+
+Per-organization view of today's active orders (not completed/cancelled)
+that is patched in place on every order write instead of being dropped:
+- Redis hash ``active_orders_view:{org}:{day}``: order id -> compact
+  JSON, ``v:{order id}`` -> the order's ``version`` and a ``__meta__``
+  field once the view was built from MongoDB
+- Every write to the hash is a versioned merge: a patch only lands when
+  its order version is newer than the one stored, and removals leave the
+  version behind as a tombstone, so patches arriving out of order from
+  several instances (or a build's older snapshot) never undo newer ones
+- In-process mirror of the hash, refreshed from Redis every few seconds
+  so writes made on other instances become visible
+- MongoDB is only queried to build the view (first read of the day,
+  after an explicit invalidation or when Redis expired it)
+
+Creating, editing, cancelling or completing one order costs one merge
+script call; readers (order list, kitchen display, billing) never re-query the
+full list after a single-order change.
+
+PERFORMANCE TARGETS:
+- Local read: <1ms (vs MongoDB active-orders query: 20-100ms)
+- Patch: one Redis round trip (versioned merge script), no MongoDB read
+"""
+
+import asyncio
+import json
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from cache_codec import CacheCodecError, get_cache_codec, to_json_bytes
+from order_dates import CREATED_AT_DT, created_range, created_sort_field
+from order_transitions import ORDER_STATUSES
+
+IST = timezone(timedelta(hours=5, minutes=30))
+INACTIVE_STATUSES = ("completed", "cancelled")
+META_FIELD = "__meta__"
+VERSION_PREFIX = "v:"
+# Tombstone version of deleted orders: nothing may bring them back
+DELETED_VERSION = 2 ** 53 - 1
+
+
+def business_day_start(now: Optional[datetime] = None) -> datetime:
+    """Start of the current IST business day, in UTC"""
+    now_ist = (now or datetime.now(timezone.utc)).astimezone(IST)
+    return now_ist.replace(hour=0, minute=0, second=0, microsecond=0).astimezone(timezone.utc)
+
+
+def _created_at(order: Dict[str, Any]) -> Optional[datetime]:
+    value = order.get("created_at")
+    if isinstance(value, str):
+        try:
+            value = datetime.fromisoformat(value.replace("Z", "+00:00"))
+        except ValueError:
+            return None
+    if isinstance(value, datetime) and value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value if isinstance(value, datetime) else None
+
+
+def compact_order(order: Dict[str, Any]) -> Dict[str, Any]:
+    """Copy of an order with datetimes as ISO strings and no Mongo _id / date mirror"""
+    compact = {key: value for key, value in order.items() if key not in ("_id", CREATED_AT_DT)}
+    for field in ("created_at", "updated_at"):
+        if isinstance(compact.get(field), datetime):
+            compact[field] = compact[field].isoformat()
+    return compact
+
+
+def _encode(order: Dict[str, Any]) -> str:
+    return get_cache_codec().encode(order)
+
+
+def _version(order: Dict[str, Any]) -> int:
+    return int(order.get("version") or 0)
+
+
+def _put_newer(orders: Dict[str, Dict[str, Any]], order_id: str, order: Dict[str, Any]):
+    """Store ``order`` unless the mapping already holds a newer version of it"""
+    current = orders.get(order_id)
+    if current is None or _version(order) >= _version(current):
+        orders[order_id] = order
+
+
+class ActiveOrdersView:
+    """Incrementally maintained active-orders view (Redis hash + local mirror)"""
+
+    def __init__(self, redis_client=None, local_ttl: float = 5, redis_ttl: int = 1800, build_limit: int = 500):
+        # Local mirror: {org_id: (day, {order_id: order}, expiry_time)}
+        self._views: Dict[str, Tuple[str, Dict[str, Dict[str, Any]], float]] = {}
+        self._locks: Dict[str, asyncio.Lock] = {}
+        # Patches applied while a build is in flight: {org_id: [(order_id, order_or_None)]}
+        self._building: Dict[str, List[Tuple[str, Optional[Dict[str, Any]]]]] = {}
+        # Serialized order list per org and status filter, dropped on every change
+        self._rendered: Dict[str, Dict[Optional[str], bytes]] = {}
+        # Mongo _id -> (org_id, order_id) of mirrored orders, to place deletes
+        # that arrive with nothing but the _id, and its reverse per org
+        # ({org_id: {order_id: _id}}) to drop entries as orders leave the view
+        self._object_ids: Dict[str, Tuple[str, str]] = {}
+        self._org_object_ids: Dict[str, Dict[str, str]] = {}
+        self._stats = {
+            "local_hits": 0, "redis_loads": 0, "builds": 0, "patches": 0, "removals": 0, "render_hits": 0,
+        }
+
+        # Cache configuration
+        self.LOCAL_TTL = local_ttl
+        self.REDIS_TTL = redis_ttl
+        self.BUILD_LIMIT = build_limit
+
+        # Redis cache (RedisCache instance)
+        self.redis_client = redis_client
+
+        # Response normalizer applied when rendering JSON (see fast_response.response_shape)
+        self.shape: Optional[Callable[[Dict[str, Any]], Dict[str, Any]]] = None
+
+    @staticmethod
+    def _redis_key(org_id: str, day: Optional[str] = None) -> str:
+        day = day or business_day_start().date().isoformat()
+        return f"active_orders_view:{org_id}:{day}"
+
+    def _index_object_id(self, org_id: str, order: Dict[str, Any]):
+        if order.get("_id") is not None and order.get("id"):
+            object_id = str(order["_id"])
+            self._object_ids[object_id] = (org_id, order["id"])
+            self._org_object_ids.setdefault(org_id, {})[order["id"]] = object_id
+
+    def _unindex_object_id(self, org_id: str, order_id: str):
+        object_id = self._org_object_ids.get(org_id, {}).pop(order_id, None)
+        if object_id is not None:
+            self._object_ids.pop(object_id, None)
+
+    def _unindex_org(self, org_id: str, keep: Optional[Dict[str, Any]] = None):
+        """Drop an organization's _id entries, except for orders in ``keep``"""
+        indexed = self._org_object_ids.pop(org_id, {})
+        for order_id, object_id in indexed.items():
+            if keep is not None and order_id in keep:
+                self._org_object_ids.setdefault(org_id, {})[order_id] = object_id
+            else:
+                self._object_ids.pop(object_id, None)
+
+    def locate(self, object_id: str) -> Optional[Tuple[str, str]]:
+        """(org_id, order_id) of a mirrored order by its Mongo _id, if known here"""
+        return self._object_ids.get(object_id)
+
+    def _redis_available(self) -> bool:
+        return self.redis_client is not None and self.redis_client.is_connected()
+
+    def _lock_for(self, org_id: str) -> asyncio.Lock:
+        lock = self._locks.get(org_id)
+        if lock is None:
+            lock = self._locks[org_id] = asyncio.Lock()
+        return lock
+
+    @staticmethod
+    def _is_active(order: Dict[str, Any], day_start: datetime) -> bool:
+        if order.get("status") in INACTIVE_STATUSES:
+            return False
+        created_at = _created_at(order)
+        return created_at is not None and created_at >= day_start
+
+    # ============ READS ============
+
+    async def get_orders(self, org_id: str, db) -> List[Dict[str, Any]]:
+        """Today's active orders for an organization, newest first"""
+        orders = await self._load(org_id, db)
+        ordered = sorted(orders.values(), key=lambda o: str(o.get("created_at", "")), reverse=True)
+        return [dict(order) for order in ordered]
+
+    async def get_orders_json(self, org_id: str, db, status: Optional[str] = None) -> bytes:
+        """
+        Today's active orders (optionally one status) as JSON bytes, newest
+        first, each passed through ``shape`` when one is set
+        """
+        orders = await self._load(org_id, db)
+        memoize = status is None or status in ORDER_STATUSES
+        rendered = self._rendered.get(org_id, {}).get(status) if memoize else None
+        if rendered is not None:
+            self._stats["render_hits"] += 1
+            return rendered
+        ordered = sorted(orders.values(), key=lambda o: str(o.get("created_at", "")), reverse=True)
+        if status is not None:
+            ordered = [order for order in ordered if order.get("status") == status]
+        if self.shape is not None:
+            ordered = [self.shape(order) for order in ordered]
+        rendered = to_json_bytes(ordered)
+        if memoize:
+            # Only known filters: the status comes straight from the query string
+            self._rendered.setdefault(org_id, {})[status] = rendered
+        return rendered
+
+    def peek(self, org_id: str, order_id: str) -> Optional[Dict[str, Any]]:
+        """An order from the local mirror, if it is fresh and holds it"""
+        view = self._views.get(org_id)
+        if view is None or time.time() >= view[2]:
+            return None
+        order = view[1].get(order_id)
+        return dict(order) if order is not None else None
+
+    async def _load(self, org_id: str, db) -> Dict[str, Dict[str, Any]]:
+        day = business_day_start().date().isoformat()
+        view = self._views.get(org_id)
+        if view is not None and view[0] == day and time.time() < view[2]:
+            self._stats["local_hits"] += 1
+            return view[1]
+
+        async with self._lock_for(org_id):
+            # Another coroutine may have loaded while we waited
+            view = self._views.get(org_id)
+            if view is not None and view[0] == day and time.time() < view[2]:
+                self._stats["local_hits"] += 1
+                return view[1]
+
+            if self._redis_available():
+                raw = await self.redis_client.hgetall(self._redis_key(org_id, day))
+                if raw:
+                    meta = json.loads(raw.pop(META_FIELD, "{}"))
+                    if meta.get("day") == day:
+                        codec = get_cache_codec()
+                        try:
+                            orders = {
+                                order_id: codec.decode(value)
+                                for order_id, value in raw.items()
+                                if not order_id.startswith(VERSION_PREFIX)
+                            }
+                        except CacheCodecError as e:
+                            # Written by an instance with a newer codec: rebuild
+                            print(f"⚠️ Active orders view for org {org_id} unreadable ({e}), rebuilding")
+                        else:
+                            self._views[org_id] = (day, orders, time.time() + self.LOCAL_TTL)
+                            self._rendered.pop(org_id, None)
+                            # Redis entries carry no _id: keep what is still in the view
+                            self._unindex_org(org_id, keep=orders)
+                            self._stats["redis_loads"] += 1
+                            return orders
+
+            return await self._build(org_id, db, day)
+
+    async def _build(self, org_id: str, db, day: str) -> Dict[str, Dict[str, Any]]:
+        """Build the view from MongoDB (caller holds the org lock)"""
+        self._building[org_id] = []
+        # Indexed again from the query and the patches that land meanwhile
+        self._unindex_org(org_id)
+        try:
+            day_start = business_day_start()
+            docs = await db.orders.find(
+                {
+                    "organization_id": org_id,
+                    "status": {"$nin": list(INACTIVE_STATUSES)},
+                    **created_range(day_start),
+                },
+                {CREATED_AT_DT: 0},
+            ).sort(created_sort_field(), -1).limit(self.BUILD_LIMIT).to_list(self.BUILD_LIMIT)
+
+            orders = {}
+            for doc in docs:
+                if doc.get("id"):
+                    self._index_object_id(org_id, doc)
+                    orders[doc["id"]] = compact_order(doc)
+            # Re-apply writes that landed while the query was running
+            for order_id, order in self._building.get(org_id, []):
+                if order is not None and self._is_active(order, day_start):
+                    _put_newer(orders, order_id, order)
+                else:
+                    orders.pop(order_id, None)
+                    self._unindex_object_id(org_id, order_id)
+        finally:
+            self._building.pop(org_id, None)
+
+        self._views[org_id] = (day, orders, time.time() + self.LOCAL_TTL)
+        self._rendered.pop(org_id, None)
+        self._stats["builds"] += 1
+
+        if self._redis_available():
+            # Merged, not replaced: the snapshot may be older than patches
+            # other instances wrote while the query ran
+            entries = [(order_id, _version(order), _encode(order)) for order_id, order in orders.items()]
+            await self.redis_client.hmerge_versioned(
+                self._redis_key(org_id, day), entries, ttl=self.REDIS_TTL, build=True,
+                meta=(META_FIELD, json.dumps({"day": day, "built_at": time.time()})),
+            )
+
+        print(f"📋 Built active orders view for org {org_id}: {len(orders)} orders")
+        return orders
+
+    # ============ PATCHES ============
+
+    async def apply(self, org_id: str, order: Dict[str, Any]):
+        """Patch the view with the current state of an order"""
+        object_order, order = order, compact_order(order)
+        order_id = order.get("id")
+        if not order_id:
+            return
+        if not self._is_active(order, business_day_start()):
+            await self.remove(org_id, order_id, version=_version(order))
+            return
+        self._index_object_id(org_id, object_order)
+
+        self._stats["patches"] += 1
+        self._rendered.pop(org_id, None)
+        if org_id in self._building:
+            self._building[org_id].append((order_id, order))
+        view = self._views.get(org_id)
+        if view is not None:
+            _put_newer(view[1], order_id, order)
+
+        if self._redis_available():
+            await self.redis_client.hmerge_versioned(
+                self._redis_key(org_id), [(order_id, _version(order), _encode(order))], ttl=self.REDIS_TTL
+            )
+
+    async def apply_many(self, org_id: str, orders: List[Dict[str, Any]]):
+        """Patch the view with several orders of one organization in one round trip"""
+        day_start = business_day_start()
+        entries, patched, removed = [], 0, 0
+        view = self._views.get(org_id)
+        for object_order in orders:
+            order = compact_order(object_order)
+            order_id = order.get("id")
+            if not order_id:
+                continue
+            active = self._is_active(order, day_start)
+            if active:
+                self._index_object_id(org_id, object_order)
+            else:
+                self._unindex_object_id(org_id, order_id)
+            if org_id in self._building:
+                self._building[org_id].append((order_id, order if active else None))
+            if active:
+                entries.append((order_id, _version(order), _encode(order)))
+                patched += 1
+                if view is not None:
+                    _put_newer(view[1], order_id, order)
+            else:
+                entries.append((order_id, _version(order), None))
+                removed += 1
+                if view is not None:
+                    view[1].pop(order_id, None)
+        self._stats["patches"] += patched
+        self._stats["removals"] += removed
+        self._rendered.pop(org_id, None)
+
+        if self._redis_available() and entries:
+            await self.redis_client.hmerge_versioned(self._redis_key(org_id), entries, ttl=self.REDIS_TTL)
+
+    async def remove(self, org_id: str, order_id: str, version: Optional[int] = None):
+        """
+        Drop a completed, cancelled or deleted order from the view.
+
+        ``version`` is the order version that left the view; without it
+        (deleted order) the tombstone outranks every later patch.
+        """
+        self._stats["removals"] += 1
+        self._rendered.pop(org_id, None)
+        self._unindex_object_id(org_id, order_id)
+        if org_id in self._building:
+            self._building[org_id].append((order_id, None))
+        view = self._views.get(org_id)
+        if view is not None:
+            view[1].pop(order_id, None)
+
+        if self._redis_available():
+            tombstone = DELETED_VERSION if version is None else version
+            await self.redis_client.hmerge_versioned(
+                self._redis_key(org_id), [(order_id, tombstone, None)], ttl=self.REDIS_TTL
+            )
+
+    async def refresh_order(self, org_id: str, order_id: str, db):
+        """Re-read a single order and patch the view with it"""
+        order = await db.orders.find_one({"id": order_id, "organization_id": org_id}, {"_id": 0})
+        if order is None:
+            await self.remove(org_id, order_id)
+        else:
+            await self.apply(org_id, order)
+
+    async def invalidate(self, org_id: str):
+        """Drop the whole view (bulk changes); the next read rebuilds it"""
+        self._views.pop(org_id, None)
+        self._rendered.pop(org_id, None)
+        self._unindex_org(org_id)
+        if self._redis_available():
+            await self.redis_client.delete(self._redis_key(org_id))
+
+    def drop_local(self, org_id: Optional[str] = None):
+        """Forget the local mirror (of one or all orgs) so reads reload from Redis"""
+        if org_id is None:
+            self._views.clear()
+            self._rendered.clear()
+            self._object_ids.clear()
+            self._org_object_ids.clear()
+        else:
+            self._views.pop(org_id, None)
+            self._rendered.pop(org_id, None)
+            self._unindex_org(org_id)
+
+    def patch_local(self, org_id: str, order: Dict[str, Any]):
+        """Apply another instance's write to the local mirror only"""
+        view = self._views.get(org_id)
+        if view is None or not order.get("id"):
+            return
+        object_order, order = order, compact_order(order)
+        self._rendered.pop(org_id, None)
+        if self._is_active(order, business_day_start()):
+            self._index_object_id(org_id, object_order)
+            _put_newer(view[1], order["id"], order)
+        else:
+            self._unindex_object_id(org_id, order["id"])
+            view[1].pop(order["id"], None)
+
+    def forget_local(self, org_id: str, order_id: str):
+        """Drop a deleted order from the local mirror only (another instance's delete)"""
+        self._unindex_object_id(org_id, order_id)
+        view = self._views.get(org_id)
+        if view is not None and view[1].pop(order_id, None) is not None:
+            self._rendered.pop(org_id, None)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {**self._stats, "organizations": len(self._views), "object_ids": len(self._object_ids)}
@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+Cache Codec Benchmark
+=====================
+
+Serializes the active orders of a synthetic 100-order organization the
+way the Redis cache stores them and compares:
+- legacy: dict copies + manual isoformat + json.dumps / json.loads
+  (previous set_active_orders / get_active_orders)
+- each installed CacheCodec, with and without zlib compression
+
+Reports mean encode / decode time and the stored entry size. No Redis
+or MongoDB needed.
+
+USAGE:
+    python benchmark_cache_codec.py --orders 100 --items 6 --rounds 500
+"""
+
+import argparse
+import json
+import random
+import statistics
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from cache_codec import CacheCodec, _codec_functions
+
+MENU = [
+    ("Paneer Butter Masala", 280.0), ("Dal Makhani", 220.0), ("Butter Naan", 45.0),
+    ("Jeera Rice", 150.0), ("Masala Chai", 30.0), ("Veg Biryani", 260.0),
+    ("Gulab Jamun", 90.0), ("Chicken Tikka", 320.0), ("Sweet Lassi", 80.0),
+]
+
+
+def make_orders(count: int, items_per_order: int) -> list:
+    now = datetime.now(timezone.utc)
+    org_id = str(uuid.uuid4())
+    orders = []
+    for number in range(count):
+        items = []
+        for name, price in random.sample(MENU, min(items_per_order, len(MENU))):
+            quantity = random.randint(1, 3)
+            items.append({
+                "menu_item_id": str(uuid.uuid4()),
+                "name": name,
+                "price": price,
+                "quantity": quantity,
+                "notes": "",
+            })
+        subtotal = sum(item["price"] * item["quantity"] for item in items)
+        created_at = now - timedelta(minutes=random.randint(0, 600))
+        orders.append({
+            "id": str(uuid.uuid4()),
+            "organization_id": org_id,
+            "invoice_number": 1000 + number,
+            "table_id": str(uuid.uuid4()),
+            "table_number": random.randint(1, 30),
+            "items": items,
+            "subtotal": subtotal,
+            "tax": round(subtotal * 0.05, 2),
+            "total": round(subtotal * 1.05, 2),
+            "status": random.choice(["pending", "preparing", "ready"]),
+            "waiter_id": str(uuid.uuid4()),
+            "waiter_name": "Ravi",
+            "customer_name": "Walk-in",
+            "customer_phone": "",
+            "order_type": "dine_in",
+            "payment_method": None,
+            "version": random.randint(0, 4),
+            "created_at": created_at,
+            "updated_at": created_at + timedelta(minutes=5),
+        })
+    return orders
+
+
+def legacy_encode(orders: list) -> str:
+    serializable_orders = []
+    for order in orders:
+        order_copy = order.copy()
+        for field in ("created_at", "updated_at"):
+            if isinstance(order_copy.get(field), datetime):
+                order_copy[field] = order_copy[field].isoformat()
+        serializable_orders.append(order_copy)
+    return json.dumps(serializable_orders)
+
+
+def measure(encode, decode, orders: list, rounds: int) -> dict:
+    encode_times, decode_times = [], []
+    entry = encode(orders)
+    for _ in range(rounds):
+        start = time.perf_counter()
+        entry = encode(orders)
+        encode_times.append((time.perf_counter() - start) * 1000)
+
+        start = time.perf_counter()
+        decode(entry)
+        decode_times.append((time.perf_counter() - start) * 1000)
+    return {
+        "encode": statistics.mean(encode_times),
+        "decode": statistics.mean(decode_times),
+        "size": len(entry.encode()),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Redis cache codec benchmark")
+    parser.add_argument("--orders", type=int, default=100, help="Active orders in the organization")
+    parser.add_argument("--items", type=int, default=6, help="Items per order")
+    parser.add_argument("--rounds", type=int, default=500, help="Encode/decode rounds per codec")
+    parser.add_argument("--threshold", type=int, default=4096, help="Compression threshold in bytes")
+    args = parser.parse_args()
+
+    random.seed(42)
+    orders = make_orders(args.orders, args.items)
+
+    print("📦 Cache Codec Benchmark")
+    print("=" * 60)
+    print(f"Orders: {args.orders}  Items/order: {args.items}  Rounds: {args.rounds}")
+    print("=" * 60)
+
+    results = [("legacy json", measure(legacy_encode, json.loads, orders, args.rounds))]
+    for name in ("json", "orjson", "msgpack"):
+        if _codec_functions(name) is None:
+            print(f"⚠️ {name} not installed, skipped")
+            continue
+        for threshold in (0, args.threshold):
+            codec = CacheCodec(codec=name, compress_threshold=threshold)
+            label = f"{name}{' + zlib' if threshold else ''}"
+            results.append((label, measure(codec.encode, codec.decode, orders, args.rounds)))
+
+    baseline = results[0][1]
+    for label, result in results:
+        print(
+            f"{label:>16}: encode {result['encode']:.3f}ms  decode {result['decode']:.3f}ms  "
+            f"size {result['size'] / 1024:.1f}KB ({result['size'] / baseline['size']:.0%})"
+        )
+
+
+if __name__ == "__main__":
+    main()
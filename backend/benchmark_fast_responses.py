@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Fast Response Path Benchmark
+============================
+
+Time to turn a 500-order day of cached active orders into the HTTP
+response body of ``GET /orders``:
+- validated: what FastAPI does for ``response_model=List[Order]``:
+  Pydantic validation, JSON-mode dump and the stdlib JSONResponse
+- fast (first render): sort + orjson through FastJSONResponse, i.e. the
+  first poll after an order changed
+- fast (memoized): the serialized copy the active orders view keeps
+  until the next change, which is what most polls get
+
+Runs in the backend environment (imports the Order model from server).
+
+USAGE:
+    python benchmark_fast_responses.py --orders 500 --rounds 200
+"""
+
+import argparse
+import random
+import statistics
+import time
+from typing import List
+
+from fastapi.responses import JSONResponse
+from pydantic import TypeAdapter
+
+from benchmark_cache_codec import make_orders
+from cache_codec import to_json_bytes
+from fast_response import FastJSONResponse
+from server import Order
+
+
+def measure(render, rounds: int) -> dict:
+    times = []
+    body = render()
+    for _ in range(rounds):
+        start = time.perf_counter()
+        body = render()
+        times.append((time.perf_counter() - start) * 1000)
+    ordered = sorted(times)
+    return {
+        "mean": statistics.mean(times),
+        "p95": ordered[min(len(ordered) - 1, int(0.95 * len(ordered)))],
+        "size": len(body),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fast JSON response benchmark")
+    parser.add_argument("--orders", type=int, default=500, help="Active orders in the day")
+    parser.add_argument("--items", type=int, default=6, help="Items per order")
+    parser.add_argument("--rounds", type=int, default=200, help="Renders per mode")
+    args = parser.parse_args()
+
+    random.seed(42)
+    # The view holds compact orders: ISO-string dates, no Mongo _id
+    orders = [
+        {**order, "created_at": order["created_at"].isoformat(), "updated_at": order["updated_at"].isoformat()}
+        for order in make_orders(args.orders, args.items)
+    ]
+    adapter = TypeAdapter(List[Order])
+
+    def validated() -> bytes:
+        content = adapter.dump_python(adapter.validate_python(orders), mode="json")
+        return JSONResponse(content).body
+
+    def fast_first() -> bytes:
+        ordered = sorted(orders, key=lambda o: str(o.get("created_at", "")), reverse=True)
+        return FastJSONResponse(to_json_bytes(ordered)).body
+
+    memoized = to_json_bytes(orders)
+
+    def fast_memoized() -> bytes:
+        return FastJSONResponse(memoized).body
+
+    print("⚡ Fast Response Benchmark")
+    print("=" * 60)
+    print(f"Orders: {args.orders}  Items/order: {args.items}  Rounds: {args.rounds}")
+    print("=" * 60)
+
+    baseline = None
+    for label, render in (("validated", validated), ("fast first", fast_first), ("fast memoized", fast_memoized)):
+        result = measure(render, args.rounds)
+        baseline = baseline or result["mean"]
+        print(
+            f"{label:>14}: mean {result['mean']:.3f}ms  p95 {result['p95']:.3f}ms  "
+            f"body {result['size'] / 1024:.1f}KB  ({baseline / result['mean']:.1f}x)"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+Invoice Number Allocation Benchmark
+===================================
+
+Compares per-order counter updates against block-reserved allocation
+under concurrent order creation for a single organization:
+- per_order: one find_one_and_update($inc 1) per order (previous behaviour)
+- block: InvoiceNumberAllocator with a reserved block per worker
+
+Each simulated terminal allocates a number and inserts a minimal order,
+so the reported latency is the per-order cost seen by create_order.
+
+USAGE:
+    MONGO_URL=mongodb://localhost:27017 python benchmark_invoice_allocator.py \
+        --terminals 20 --orders 50 --block-size 20
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import time
+import uuid
+from pathlib import Path
+
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ReturnDocument
+
+from invoice_allocator import InvoiceNumberAllocator
+
+ROOT_DIR = Path(__file__).parent
+load_dotenv(ROOT_DIR / ".env")
+
+
+async def allocate_per_order(db, org_id: str) -> int:
+    counter = await db.counters.find_one_and_update(
+        {"_id": f"invoice_{org_id}"},
+        {"$inc": {"seq": 1}},
+        upsert=True,
+        return_document=ReturnDocument.AFTER,
+    )
+    return counter["seq"]
+
+
+async def run_terminal(db, allocate, org_id: str, orders: int, latencies: list, numbers: list):
+    for _ in range(orders):
+        start = time.perf_counter()
+        number = await allocate(org_id)
+        await db.orders.insert_one({
+            "id": str(uuid.uuid4()),
+            "organization_id": org_id,
+            "invoice_number": number,
+            "status": "pending",
+        })
+        latencies.append((time.perf_counter() - start) * 1000)
+        numbers.append(number)
+
+
+def percentile(values: list, pct: float) -> float:
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+async def run_mode(db, mode: str, terminals: int, orders: int, block_size: int) -> dict:
+    org_id = f"bench-{mode}-{uuid.uuid4().hex[:8]}"
+    if mode == "block":
+        allocator = InvoiceNumberAllocator(db, block_size=block_size)
+        allocate = allocator.allocate
+    else:
+        allocator = None
+        allocate = lambda org: allocate_per_order(db, org)  # noqa: E731
+
+    latencies, numbers = [], []
+    started = time.perf_counter()
+    await asyncio.gather(*[
+        run_terminal(db, allocate, org_id, orders, latencies, numbers)
+        for _ in range(terminals)
+    ])
+    elapsed = time.perf_counter() - started
+
+    if allocator:
+        await allocator.release_all()
+
+    return {
+        "mode": mode,
+        "orders": len(latencies),
+        "unique": len(set(numbers)) == len(numbers),
+        "p50": percentile(latencies, 50),
+        "p95": percentile(latencies, 95),
+        "mean": statistics.mean(latencies),
+        "throughput": len(latencies) / elapsed,
+        "stats": allocator.get_stats() if allocator else None,
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Invoice number allocation benchmark")
+    parser.add_argument("--terminals", type=int, default=20, help="Concurrent order-taking terminals")
+    parser.add_argument("--orders", type=int, default=50, help="Orders per terminal")
+    parser.add_argument("--block-size", type=int, default=20, help="Invoice numbers reserved per block")
+    args = parser.parse_args()
+
+    mongo_url = os.getenv("MONGO_URL", "mongodb://localhost:27017")
+    db_name = os.getenv("BENCH_DB_NAME", "invoice_allocator_bench")
+    client = AsyncIOMotorClient(mongo_url)
+    db = client[db_name]
+
+    print("🧾 Invoice Allocation Benchmark")
+    print("=" * 60)
+    print(f"Terminals: {args.terminals}  Orders/terminal: {args.orders}  Block size: {args.block_size}")
+    print("=" * 60)
+
+    try:
+        for mode in ("per_order", "block"):
+            result = await run_mode(db, mode, args.terminals, args.orders, args.block_size)
+            print(
+                f"{result['mode']:>10}: p50 {result['p50']:.2f}ms  p95 {result['p95']:.2f}ms  "
+                f"mean {result['mean']:.2f}ms  {result['throughput']:.0f} orders/s  "
+                f"unique={'✅' if result['unique'] else '❌'}"
+            )
+            if result["stats"]:
+                print(f"{'':>10}  allocator: {result['stats']}")
+    finally:
+        await client.drop_database(db_name)
+        client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
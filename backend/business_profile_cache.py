@@ -227,6 +227,13 @@ class BusinessProfileCache:
             print(f"❌ Invalidation error: {e}")
             return False
     
+    def evict_local(self, org_id: Optional[str] = None):
+        """Drop a profile (or all profiles) from the local tier only"""
+        if org_id is None:
+            self._local_cache.clear()
+        else:
+            self._local_cache.pop(org_id, None)
+    
     async def warm_cache(self, org_ids: List[str], db=None):
         """Pre-load profiles into cache"""
         print(f"🔥 Warming cache for {len(org_ids)} organizations...")
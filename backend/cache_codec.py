@@ -0,0 +1,207 @@
+"""
+Redis Cache Codec
+=================
+
+One serialization layer for cached entities (orders, active-order views,
+tables, menu and inventory lists, super admin pages) instead of per-call
+dict copies, hand-written datetime conversion and ``json.dumps``:
+- Codecs: ``orjson`` (default when installed), ``msgpack`` and the
+  stdlib ``json`` fallback; datetimes are written natively and always
+  read back as ISO-8601 strings, whatever the codec
+- zlib compression for payloads above ``CACHE_COMPRESS_THRESHOLD`` bytes
+- Every entry starts with a short header naming the format version,
+  codec and compression, e.g. ``~1oz:`` (orjson, zlib). Readers decode
+  any header they know, plain legacy JSON included, so instances can be
+  rolled to a new codec one at a time; an unknown header is a cache miss
+
+Both Redis clients are text-mode (``decode_responses`` and the Upstash
+REST API), so binary frames (msgpack or compressed) are base64 encoded.
+
+``to_json`` turns an entry straight into JSON response bytes; for the
+text codecs that is a slice (or one decompression), with no Python
+objects built in between.
+
+CONFIGURATION:
+- CACHE_CODEC: orjson | msgpack | json
+- CACHE_COMPRESS_THRESHOLD: bytes before compression (0 disables)
+"""
+
+import base64
+import json
+import os
+import zlib
+from datetime import date, datetime
+from typing import Any, Callable, Dict, Optional, Tuple
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional speedup
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover - optional speedup
+    msgpack = None
+
+MAGIC = "~"
+FORMAT_VERSION = "1"
+HEADER_LENGTH = 5  # "~1oz:"
+
+CODEC_IDS = {"json": "j", "orjson": "o", "msgpack": "m"}
+CODEC_NAMES = {code: name for name, code in CODEC_IDS.items()}
+
+
+class CacheCodecError(ValueError):
+    """Raised for entries this instance cannot decode"""
+
+
+def _default(value: Any) -> Any:
+    """Fallback for values the codecs don't handle natively (ObjectId, Decimal128, ...)"""
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return str(value)
+
+
+def _json_dumps(value: Any) -> bytes:
+    return json.dumps(value, separators=(",", ":"), default=_default).encode()
+
+
+def _orjson_dumps(value: Any) -> bytes:
+    return orjson.dumps(value, default=_default, option=orjson.OPT_NON_STR_KEYS)
+
+
+def _msgpack_dumps(value: Any) -> bytes:
+    # Datetimes go through _default so every codec reads back the same types
+    return msgpack.packb(value, default=_default, datetime=False, use_bin_type=True)
+
+
+def _msgpack_loads(data: bytes) -> Any:
+    return msgpack.unpackb(data, raw=False, strict_map_key=False)
+
+
+def to_json_bytes(value: Any) -> bytes:
+    """Serialize a value to JSON bytes for an HTTP response"""
+    if orjson is not None:
+        return _orjson_dumps(value)
+    return _json_dumps(value)
+
+
+def _codec_functions(name: str) -> Optional[Tuple[Callable[[Any], bytes], Callable[[bytes], Any], bool]]:
+    """(dumps, loads, is_text) for an installed codec, None if it isn't installed"""
+    if name == "orjson" and orjson is not None:
+        return _orjson_dumps, orjson.loads, True
+    if name == "msgpack" and msgpack is not None:
+        return _msgpack_dumps, _msgpack_loads, False
+    if name == "json":
+        return _json_dumps, json.loads, True
+    return None
+
+
+class CacheCodec:
+    """Encodes cache values to headered strings and decodes them back"""
+
+    def __init__(self, codec: str = "orjson", compress_threshold: int = 4096, compress_level: int = 1):
+        if _codec_functions(codec) is None:
+            print(f"⚠️ Cache codec '{codec}' not available, using json")
+            codec = "json"
+        self.codec = codec
+        self._dumps, _, self._text = _codec_functions(codec)
+        self._stats = {
+            "encoded": 0,
+            "decoded": 0,
+            "compressed": 0,
+            "legacy_reads": 0,
+            "json_passthrough": 0,
+            "undecodable": 0,
+            "bytes_raw": 0,
+            "bytes_stored": 0,
+        }
+
+        self.COMPRESS_THRESHOLD = compress_threshold
+        self.COMPRESS_LEVEL = compress_level
+
+    def encode(self, value: Any) -> str:
+        """Serialize a value into a cache entry"""
+        payload = self._dumps(value)
+        raw_size = len(payload)
+        compressed = bool(self.COMPRESS_THRESHOLD) and raw_size > self.COMPRESS_THRESHOLD
+        if compressed:
+            payload = zlib.compress(payload, self.COMPRESS_LEVEL)
+
+        header = f"{MAGIC}{FORMAT_VERSION}{CODEC_IDS[self.codec]}{'z' if compressed else '-'}:"
+        if self._text and not compressed:
+            entry = header + payload.decode()
+        else:
+            entry = header + base64.b64encode(payload).decode("ascii")
+
+        self._stats["encoded"] += 1
+        self._stats["compressed"] += compressed
+        self._stats["bytes_raw"] += raw_size
+        self._stats["bytes_stored"] += len(entry)
+        return entry
+
+    def decode(self, entry: Any) -> Any:
+        """Deserialize a cache entry written by any codec; raises CacheCodecError"""
+        if isinstance(entry, (bytes, bytearray)):
+            entry = entry.decode()
+        self._stats["decoded"] += 1
+
+        if not entry.startswith(MAGIC):
+            # Written before the codec layer: plain JSON
+            self._stats["legacy_reads"] += 1
+            return json.loads(entry)
+
+        header = entry[:HEADER_LENGTH]
+        functions = _codec_functions(CODEC_NAMES.get(header[2:3], ""))
+        if header[1:2] != FORMAT_VERSION or header[3:4] not in ("-", "z") or header[4:5] != ":" or functions is None:
+            self._stats["undecodable"] += 1
+            raise CacheCodecError(f"Unsupported cache entry header {header!r}")
+
+        _, loads, is_text = functions
+        body = entry[HEADER_LENGTH:]
+        compressed = header[3] == "z"
+        if is_text and not compressed:
+            return loads(body)
+        payload = base64.b64decode(body)
+        if compressed:
+            payload = zlib.decompress(payload)
+        return loads(payload)
+
+    def to_json(self, entry: Any) -> bytes:
+        """JSON bytes of a cache entry's value; raises CacheCodecError"""
+        if isinstance(entry, (bytes, bytearray)):
+            entry = entry.decode()
+        if not entry.startswith(MAGIC):
+            self._stats["legacy_reads"] += 1
+            return entry.encode()
+
+        header = entry[:HEADER_LENGTH]
+        codec = CODEC_NAMES.get(header[2:3])
+        if codec in ("json", "orjson") and header[1:2] == FORMAT_VERSION and header[3:5] in ("-:", "z:"):
+            self._stats["json_passthrough"] += 1
+            body = entry[HEADER_LENGTH:]
+            if header[3] == "-":
+                return body.encode()
+            return zlib.decompress(base64.b64decode(body))
+        return to_json_bytes(self.decode(entry))
+
+    def get_stats(self) -> Dict[str, Any]:
+        stored, raw = self._stats["bytes_stored"], self._stats["bytes_raw"]
+        return {
+            **self._stats,
+            "codec": self.codec,
+            "compress_threshold": self.COMPRESS_THRESHOLD,
+            "size_ratio": round(stored / raw, 3) if raw else None,
+        }
+
+
+# Global instance
+_cache_codec = CacheCodec(
+    codec=os.getenv("CACHE_CODEC", "orjson"),
+    compress_threshold=int(os.getenv("CACHE_COMPRESS_THRESHOLD", "4096")),
+)
+
+
+def get_cache_codec() -> CacheCodec:
+    """Get the global cache codec"""
+    return _cache_codec
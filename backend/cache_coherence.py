@@ -0,0 +1,264 @@
+"""
+Cross-Instance Cache Coherence
+==============================
+
+Production runs several backend instances behind ``least_conn``; every
+process-local cache tier (principal LRU, entitlement records, the active
+orders mirror, ``_cache`` in server.py, OrderFastAccessCache and
+BusinessProfileCache) used to be invalidated only on the instance that
+handled the write. This module fans writes out to every instance:
+- Primary: MongoDB change streams on orders, tables, menu_items,
+  inventory and users (requires a replica set / Atlas). Every write is
+  seen, including ones that bypass the cache helpers.
+- Fallback: Redis pub/sub on ``cache_coherence``. Writers announce their
+  changes through ``announce()``; instances ignore their own messages.
+- Without either, local tiers fall back to their (short) TTLs.
+
+Handlers receive a CoherenceEvent per change. A "reset" event means
+changes may have been missed, and handlers should drop everything they
+hold locally. A delete seen by the change stream has no document, so
+its event only carries ``object_id`` (the Mongo ``_id``): handlers evict
+that one document if they can find it, and nothing else.
+"""
+
+import asyncio
+import json
+import os
+import uuid
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+WATCHED_COLLECTIONS = ("orders", "tables", "menu_items", "inventory", "users")
+CHANNEL = "cache_coherence"
+
+# Only orders need the full document (to patch the active orders mirror);
+# other collections are reduced to their ids so users never carry hashes
+_CHANGE_PIPELINE = [
+    {"$match": {
+        "ns.coll": {"$in": list(WATCHED_COLLECTIONS)},
+        "operationType": {"$in": ["insert", "update", "replace", "delete"]},
+    }},
+    {"$project": {
+        "operationType": 1,
+        "ns": 1,
+        "documentKey": 1,
+        "fullDocument": {"$cond": [
+            {"$eq": ["$ns.coll", "orders"]},
+            "$fullDocument",
+            {"id": "$fullDocument.id", "organization_id": "$fullDocument.organization_id"},
+        ]},
+    }},
+]
+
+
+@dataclass
+class CoherenceEvent:
+    """A change to a watched collection"""
+    collection: str
+    operation: str  # insert, update, replace, delete or reset
+    organization_id: Optional[str] = None
+    doc_ids: List[str] = field(default_factory=list)
+    document: Optional[Dict[str, Any]] = None  # current order (change streams only)
+    object_id: Optional[str] = None  # Mongo _id, when the document is gone (deletes)
+    source: str = "local"  # change_stream, pubsub or local
+
+    @property
+    def is_reset(self) -> bool:
+        return self.operation == "reset"
+
+
+Handler = Callable[[CoherenceEvent], Awaitable[None]]
+
+
+class CacheCoherence:
+    """Fans out collection changes to cache handlers on every instance"""
+
+    def __init__(self, collections=WATCHED_COLLECTIONS, reconnect_delay: float = 2.0):
+        self.instance_id = f"{os.getenv('SERVER_INSTANCE', '1')}-{uuid.uuid4().hex[:8]}"
+        self.mode = "off"  # change_streams, pubsub or off
+        self.reconnect_delay = reconnect_delay
+
+        self._handlers: Dict[str, List[Handler]] = {name: [] for name in collections}
+        self._redis = None
+        self._task: Optional[asyncio.Task] = None
+        self._resume_token = None
+        self._stats = {"events": 0, "announced": 0, "handler_errors": 0, "reconnects": 0, "resets": 0}
+
+    def on(self, collection: str, handler: Handler):
+        """Register a handler for changes to a collection"""
+        self._handlers.setdefault(collection, []).append(handler)
+
+    def is_active(self) -> bool:
+        return self.mode != "off"
+
+    async def dispatch(self, event: CoherenceEvent):
+        """Run the handlers registered for the event's collection"""
+        self._stats["events"] += 1
+        for handler in self._handlers.get(event.collection, []):
+            try:
+                await handler(event)
+            except Exception as e:
+                self._stats["handler_errors"] += 1
+                print(f"⚠️ Cache coherence handler error ({event.collection}): {e}")
+
+    async def _reset_all(self):
+        """Changes may have been missed: tell every handler to drop local state"""
+        self._stats["resets"] += 1
+        for collection in self._handlers:
+            await self.dispatch(CoherenceEvent(collection, "reset"))
+
+    # ============ STARTUP ============
+
+    async def start(self, db, redis_client=None):
+        """Start watching: change streams if supported, else Redis pub/sub"""
+        self._redis = redis_client
+        if self._task is not None:
+            return
+
+        if await self._change_streams_supported(db):
+            self.mode = "change_streams"
+            self._task = asyncio.create_task(self._watch_loop(db))
+        elif redis_client is not None and redis_client.is_connected():
+            pubsub = await redis_client.subscribe(CHANNEL)
+            if pubsub is not None:
+                self.mode = "pubsub"
+                self._task = asyncio.create_task(self._pubsub_loop(pubsub))
+
+        if self.mode == "off":
+            print("⚠️ Cache coherence unavailable (no change streams or Redis pub/sub) - local caches rely on TTLs")
+        else:
+            print(f"✅ Cache coherence started ({self.mode}, instance {self.instance_id})")
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+        self.mode = "off"
+
+    @staticmethod
+    async def _change_streams_supported(db) -> bool:
+        try:
+            async with db.watch(_CHANGE_PIPELINE, max_await_time_ms=1) as stream:
+                await stream.try_next()
+            return True
+        except Exception as e:
+            print(f"ℹ️ MongoDB change streams not available: {e}")
+            return False
+
+    # ============ CHANGE STREAMS ============
+
+    @staticmethod
+    def _event_from_change(change: Dict[str, Any]) -> CoherenceEvent:
+        document = change.get("fullDocument") or {}
+        collection = change["ns"]["coll"]
+        doc_id = document.get("id")
+        object_id = None
+        if not doc_id:
+            # Deleted (or deleted before the update lookup): only the key is left
+            key = (change.get("documentKey") or {}).get("_id")
+            object_id = str(key) if key is not None else None
+        return CoherenceEvent(
+            collection=collection,
+            operation=change["operationType"],
+            organization_id=document.get("organization_id"),
+            doc_ids=[doc_id] if doc_id else [],
+            document=document if collection == "orders" and document else None,
+            object_id=object_id,
+            source="change_stream",
+        )
+
+    async def _watch_loop(self, db):
+        while True:
+            try:
+                async with db.watch(
+                    _CHANGE_PIPELINE,
+                    full_document="updateLookup",
+                    resume_after=self._resume_token,
+                ) as stream:
+                    async for change in stream:
+                        self._resume_token = stream.resume_token
+                        await self.dispatch(self._event_from_change(change))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self._stats["reconnects"] += 1
+                print(f"⚠️ Change stream interrupted: {e}, reconnecting in {self.reconnect_delay}s")
+                if self._resume_token is not None and "resume" in str(e).lower():
+                    # The resume point fell off the oplog: start fresh and flush
+                    self._resume_token = None
+                    await self._reset_all()
+                await asyncio.sleep(self.reconnect_delay)
+
+    # ============ REDIS PUB/SUB FALLBACK ============
+
+    async def announce(self, collection: str, organization_id: Optional[str], *doc_ids: str):
+        """
+        Announce a local write to the other instances.
+
+        Only used in pub/sub mode; change streams already see every write.
+        """
+        if self.mode != "pubsub" or self._redis is None:
+            return
+        message = {
+            "origin": self.instance_id,
+            "collection": collection,
+            "organization_id": organization_id,
+            "doc_ids": [doc_id for doc_id in doc_ids if doc_id],
+        }
+        try:
+            await self._redis.publish(CHANNEL, json.dumps(message))
+            self._stats["announced"] += 1
+        except Exception as e:
+            print(f"⚠️ Cache coherence announce failed: {e}")
+
+    async def _pubsub_loop(self, pubsub):
+        while True:
+            try:
+                async for message in pubsub.listen():
+                    if message.get("type") != "message":
+                        continue
+                    data = json.loads(message["data"])
+                    if data.get("origin") == self.instance_id:
+                        continue
+                    await self.dispatch(CoherenceEvent(
+                        collection=data["collection"],
+                        operation="update",
+                        organization_id=data.get("organization_id"),
+                        doc_ids=data.get("doc_ids") or [],
+                        source="pubsub",
+                    ))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self._stats["reconnects"] += 1
+                print(f"⚠️ Cache coherence pub/sub interrupted: {e}, resubscribing in {self.reconnect_delay}s")
+                await self._resubscribe(pubsub)
+
+    async def _resubscribe(self, pubsub):
+        """Resubscribe until it succeeds, then reset: messages published while disconnected are lost"""
+        while True:
+            await asyncio.sleep(self.reconnect_delay)
+            try:
+                await pubsub.subscribe(CHANNEL)
+                break
+            except Exception as e:
+                self._stats["reconnects"] += 1
+                print(f"⚠️ Cache coherence resubscribe failed: {e}, retrying in {self.reconnect_delay}s")
+        await self._reset_all()
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            **self._stats,
+            "mode": self.mode,
+            "instance_id": self.instance_id,
+            "handlers": {name: len(handlers) for name, handlers in self._handlers.items()},
+        }
+
+
+# Global instance
+_cache_coherence = CacheCoherence()
+
+
+def get_cache_coherence() -> CacheCoherence:
+    """Get the global cache coherence instance"""
+    return _cache_coherence
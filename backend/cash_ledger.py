@@ -0,0 +1,302 @@
+"""
+Cash Ledger
+===========
+
+The Day Book showed an opening balance of 0 ("for simplicity") because
+the balance brought forward would have meant summing every earlier order
+and expense. This module keeps one ``cash_ledger`` document per
+(organization, business day) instead:
+- ``inflow``: money received that day. Completed and paid orders, split
+  payments counted as their cash/card/UPI parts, the same way as the
+  ``inflows`` counters of the daily rollups
+- ``outflow``: expenses dated that day
+
+Balances are not stored: the opening and closing balance of any day or
+range is the prefix sum of inflow - outflow over the organization's
+ledger days, computed in one indexed aggregation (``balances``; one
+document per business day, so a few hundred per year). A stored running
+balance would need every later day rewritten on each change, and those
+writes race each other.
+
+Writers report changes like they do to the rollups:
+``record_orders([(before, after), ...])`` and
+``record_expense(before, after)``. Each changed day gets one atomic
+inflow/outflow ``$inc``.
+
+The rebuild job derives the ledger from the rollups (inflows) and
+expenses: once as the initial backfill, after the rollup backfill
+(readers keep the old zero opening until then), and regularly for any
+organization whose recent closed days disagree with their sources, to
+repair lost increments. Rebuilds stop at yesterday so they never replace
+the current day's live increments, and the job runs in one worker at a
+time (``JobLease``).
+"""
+
+import asyncio
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+from pymongo import ReplaceOne
+
+from sales_rollups import IST, get_sales_rollups, order_contribution, order_day_key
+
+MIGRATION_ID = "cash_ledger"
+
+
+def _order_inflow(order: Optional[Dict[str, Any]]) -> float:
+    """Money an order brings into its day (0 until completed or paid)"""
+    return sum(value for path, value in order_contribution(order).items() if path.startswith("inflows."))
+
+
+def _yesterday() -> str:
+    return (datetime.now(IST).date() - timedelta(days=1)).isoformat()
+
+
+def _expense_key(expense: Optional[Dict[str, Any]]) -> Optional[Tuple[str, str]]:
+    if not expense or not expense.get("organization_id") or not expense.get("date"):
+        return None
+    return expense["organization_id"], str(expense["date"])[:10]
+
+
+class CashLedger:
+    """Maintains and reads the cash_ledger collection"""
+
+    def __init__(self, db=None, repair_days: int = 2, batch_size: int = 1000):
+        self.db = db
+        self._ready = False
+        self._stats = {"recorded": 0, "record_errors": 0, "rebuilds": 0, "rebuilt_days": 0, "repaired_orgs": 0}
+
+        self.REPAIR_DAYS = repair_days
+        self.BATCH_SIZE = batch_size
+
+    def is_ready(self) -> bool:
+        """Whether the backfill finished, so balances can be read from the ledger"""
+        return self.db is not None and self._ready
+
+    async def load_state(self):
+        marker = await self.db.migrations.find_one({"_id": MIGRATION_ID})
+        self._ready = bool(marker and marker.get("completed"))
+
+    # ============ WRITES ============
+
+    async def _apply(self, deltas: Dict[Tuple[str, str], Tuple[float, float]]):
+        now = datetime.now(timezone.utc)
+        for (org_id, day), (inflow, outflow) in deltas.items():
+            if not inflow and not outflow:
+                continue
+            await self.db.cash_ledger.update_one(
+                {"_id": f"{org_id}:{day}"},
+                {
+                    "$inc": {"inflow": inflow, "outflow": outflow},
+                    "$set": {"updated_at": now},
+                    "$setOnInsert": {"organization_id": org_id, "date": day},
+                },
+                upsert=True,
+            )
+
+    async def record_orders(self, changes: Iterable[Tuple[Optional[Dict], Optional[Dict]]]):
+        """Apply order changes ``(before, after)``; never raises"""
+        if self.db is None:
+            return
+        try:
+            deltas: Dict[Tuple[str, str], float] = defaultdict(float)
+            for before, after in changes:
+                for order, sign in ((before, -1), (after, 1)):
+                    key = order_day_key(order) if order else None
+                    if key is not None:
+                        deltas[key] += sign * _order_inflow(order)
+            await self._apply({key: (round(inflow, 2), 0) for key, inflow in deltas.items()})
+            self._stats["recorded"] += 1
+        except Exception as e:
+            self._stats["record_errors"] += 1
+            print(f"⚠️ Cash ledger update failed: {e}")
+
+    async def record_expense(self, before: Optional[Dict[str, Any]], after: Optional[Dict[str, Any]]):
+        """Apply an expense change (None for "did not exist"); never raises"""
+        if self.db is None:
+            return
+        try:
+            deltas: Dict[Tuple[str, str], float] = defaultdict(float)
+            for expense, sign in ((before, -1), (after, 1)):
+                key = _expense_key(expense)
+                if key is not None:
+                    deltas[key] += sign * float(expense.get("amount") or 0)
+            await self._apply({key: (0, round(outflow, 2)) for key, outflow in deltas.items()})
+            self._stats["recorded"] += 1
+        except Exception as e:
+            self._stats["record_errors"] += 1
+            print(f"⚠️ Cash ledger update failed: {e}")
+
+    # ============ READS ============
+
+    async def balances(self, org_id: str, start_day: str, end_day: str) -> Tuple[float, float]:
+        """(opening, closing) balance of the business days start_day..end_day"""
+        net = {"$subtract": [{"$ifNull": ["$inflow", 0]}, {"$ifNull": ["$outflow", 0]}]}
+        result = await self.db.cash_ledger.aggregate([
+            {"$match": {"organization_id": org_id, "date": {"$lte": end_day}}},
+            {"$group": {
+                "_id": None,
+                "opening": {"$sum": {"$cond": [{"$lt": ["$date", start_day]}, net, 0]}},
+                "closing": {"$sum": net},
+            }},
+        ]).to_list(1)
+        if not result:
+            return 0, 0
+        return round(result[0]["opening"], 2), round(result[0]["closing"], 2)
+
+    async def closing_through(self, org_id: str, day: str) -> float:
+        """Balance at the end of business day ``day`` (YYYY-MM-DD)"""
+        return (await self.balances(org_id, day, day))[1]
+
+    # ============ REBUILD ============
+
+    async def _day_totals(
+        self, org_id: Optional[str] = None, start_day: Optional[str] = None, end_day: Optional[str] = None
+    ) -> Dict[Tuple[str, str], list]:
+        """{(org, day): [inflow, outflow]} from the rollups and expenses"""
+        scope: Dict[str, Any] = {}
+        if org_id:
+            scope["organization_id"] = org_id
+        if start_day or end_day:
+            scope["date"] = {}
+            if start_day:
+                scope["date"]["$gte"] = start_day
+            if end_day:
+                scope["date"]["$lte"] = end_day
+
+        totals: Dict[Tuple[str, str], list] = defaultdict(lambda: [0.0, 0.0])
+        rollups = self.db.daily_rollups.find(scope, {"_id": 0, "organization_id": 1, "date": 1, "inflows": 1})
+        async for day in rollups.batch_size(self.BATCH_SIZE):
+            totals[(day["organization_id"], day["date"])][0] += sum((day.get("inflows") or {}).values())
+
+        expenses = self.db.expenses.aggregate([
+            {"$match": scope},
+            {"$group": {"_id": {"org": "$organization_id", "date": "$date"}, "amount": {"$sum": "$amount"}}},
+        ], allowDiskUse=True)
+        async for group in expenses:
+            key = group["_id"]
+            if key.get("org") and key.get("date"):
+                totals[(key["org"], str(key["date"])[:10])][1] += group["amount"]
+        return totals
+
+    async def rebuild(self, org_id: Optional[str] = None, end_day: Optional[str] = None) -> int:
+        """
+        Recompute the ledger of one organization (or all) from its sources,
+        optionally only through ``end_day``; returns days written.
+        """
+        self._stats["rebuilds"] += 1
+        totals = await self._day_totals(org_id, end_day=end_day)
+
+        now = datetime.now(timezone.utc)
+        operations = []
+        for (org, day), (inflow, outflow) in sorted(totals.items()):
+            operations.append(ReplaceOne(
+                {"_id": f"{org}:{day}"},
+                {
+                    "organization_id": org,
+                    "date": day,
+                    "inflow": round(inflow, 2),
+                    "outflow": round(outflow, 2),
+                    "updated_at": now,
+                },
+                upsert=True,
+            ))
+        for offset in range(0, len(operations), self.BATCH_SIZE):
+            await self.db.cash_ledger.bulk_write(operations[offset:offset + self.BATCH_SIZE], ordered=False)
+            await asyncio.sleep(0)
+
+        written = {f"{org}:{day}" for org, day in totals}
+        scope: Dict[str, Any] = {"organization_id": org_id} if org_id else {}
+        if end_day:
+            scope["date"] = {"$lte": end_day}
+        existing = await self.db.cash_ledger.distinct("_id", scope)
+        stale = [day_id for day_id in existing if day_id not in written]
+        if stale:
+            await self.db.cash_ledger.delete_many({"_id": {"$in": stale}})
+
+        self._stats["rebuilt_days"] += len(operations)
+        return len(operations)
+
+    async def backfill(self):
+        """Initial rebuild of every closed day; the Day Book switches to ledger balances once it is done"""
+        days = await self.rebuild(end_day=_yesterday())
+        await self.db.migrations.update_one(
+            {"_id": MIGRATION_ID},
+            {"$set": {"completed": True, "completed_at": datetime.now(timezone.utc)}},
+            upsert=True,
+        )
+        self._ready = True
+        print(f"✅ Cash ledger backfilled ({days} organization-days)")
+
+    async def repair_recent(self) -> int:
+        """Rebuild organizations whose last closed days disagree with their sources"""
+        today = datetime.now(IST).date()
+        start_day = (today - timedelta(days=self.REPAIR_DAYS)).isoformat()
+        end_day = (today - timedelta(days=1)).isoformat()
+
+        expected = await self._day_totals(start_day=start_day, end_day=end_day)
+        recorded = {
+            (day["organization_id"], day["date"]): [day.get("inflow", 0), day.get("outflow", 0)]
+            async for day in self.db.cash_ledger.find(
+                {"date": {"$gte": start_day, "$lte": end_day}},
+                {"_id": 0, "organization_id": 1, "date": 1, "inflow": 1, "outflow": 1},
+            )
+        }
+        drifted = {
+            org for org, day in set(expected) | set(recorded)
+            if any(
+                abs(a - b) > 0.005
+                for a, b in zip(expected.get((org, day), [0, 0]), recorded.get((org, day), [0, 0]))
+            )
+        }
+        for org in drifted:
+            await self.rebuild(org, end_day=end_day)
+        self._stats["repaired_orgs"] += len(drifted)
+        return len(drifted)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {**self._stats, "ready": self.is_ready()}
+
+
+# Global instance
+_cash_ledger = CashLedger()
+
+
+def init_cash_ledger(db) -> CashLedger:
+    """Attach the global cash ledger to a database"""
+    _cash_ledger.db = db
+    return _cash_ledger
+
+
+def get_cash_ledger() -> CashLedger:
+    """Get the global cash ledger"""
+    return _cash_ledger
+
+
+async def cash_ledger_task(interval: int = 6 * 3600, retry_delay: int = 300, lease=None):
+    """Background task: backfill once the rollups are ready, then repair drifted organizations"""
+    ledger = _cash_ledger
+    while True:
+        try:
+            await ledger.load_state()
+            if lease is not None and not await lease.acquire():
+                # Another worker runs the job; keep our ready flag current
+                await asyncio.sleep(retry_delay)
+                continue
+            if not get_sales_rollups().is_ready():
+                # Inflows come from the rollups
+                await asyncio.sleep(retry_delay)
+                continue
+            if not ledger.is_ready():
+                await ledger.backfill()
+            else:
+                orgs = await ledger.repair_recent()
+                if orgs:
+                    print(f"🔧 Cash ledger rebuilt for {orgs} organizations")
+            await asyncio.sleep(interval)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"⚠️ Cash ledger rebuild failed: {e}, retrying in {retry_delay}s")
+            await asyncio.sleep(retry_delay)
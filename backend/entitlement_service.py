@@ -0,0 +1,310 @@
+"""
+Organization Entitlement Service
+================================
+
+Computes one small entitlement record per organization (the admin's
+subscription and trial window) and caches it until the earliest of the
+trial end and ``subscription_expires_at``:
+- Tier 1: in-process dict
+- Tier 2: Redis (shared across instances)
+- Tier 3: MongoDB (one admin lookup per organization per window)
+
+The record stores the window boundaries, so entitlement is always
+evaluated against the current time and a cached record never grants
+access past its expiry. Deactivating expired subscriptions in MongoDB is
+done by a background sweeper instead of on the request path, in one
+worker at a time (the holder of its job lease).
+"""
+
+import asyncio
+import json
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional
+
+from cache_coherence import get_cache_coherence
+
+BASE_TRIAL_DAYS = 7
+
+ENTITLEMENT_FIELDS = {
+    "_id": 0,
+    "id": 1,
+    "subscription_active": 1,
+    "subscription_expires_at": 1,
+    "created_at": 1,
+    "trial_extension_days": 1,
+}
+
+
+def parse_timestamp(value) -> Optional[datetime]:
+    """Parse a stored ISO string or datetime into an aware UTC datetime"""
+    if value is None or value == "":
+        return None
+    if isinstance(value, str):
+        try:
+            value = datetime.fromisoformat(value.replace("Z", "+00:00"))
+        except ValueError:
+            return None
+    if not isinstance(value, datetime):
+        return None
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value
+
+
+def build_entitlement(org_id: str, admin: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """Build the entitlement record for an organization from its admin document"""
+    if not admin:
+        return {
+            "organization_id": org_id,
+            "found": False,
+            "subscription_active": False,
+            "subscription_expires_at": None,
+            "trial_ends_at": None,
+        }
+
+    expires_at = parse_timestamp(admin.get("subscription_expires_at"))
+    created_at = parse_timestamp(admin.get("created_at"))
+    trial_ends_at = None
+    if created_at:
+        trial_days = BASE_TRIAL_DAYS + (admin.get("trial_extension_days") or 0)
+        trial_ends_at = created_at + timedelta(days=trial_days)
+
+    return {
+        "organization_id": org_id,
+        "found": True,
+        "subscription_active": bool(admin.get("subscription_active")),
+        "subscription_expires_at": expires_at.isoformat() if expires_at else None,
+        "trial_ends_at": trial_ends_at.isoformat() if trial_ends_at else None,
+    }
+
+
+def evaluate_entitlement(record: Dict[str, Any], now: Optional[datetime] = None) -> str:
+    """
+    Evaluate an entitlement record at ``now``.
+
+    Returns "active" (paid subscription), "trial" or "expired". As in the
+    original ``check_subscription``, a subscription flag without an expiry
+    date does not count as paid: such accounts fall through to the trial
+    check.
+    """
+    now = now or datetime.now(timezone.utc)
+    if not record.get("found"):
+        return "expired"
+
+    if record.get("subscription_active"):
+        expires_at = parse_timestamp(record.get("subscription_expires_at"))
+        if expires_at is not None and expires_at >= now:
+            return "active"
+
+    trial_ends_at = parse_timestamp(record.get("trial_ends_at"))
+    if trial_ends_at and now < trial_ends_at:
+        return "trial"
+
+    return "expired"
+
+
+def next_transition(record: Dict[str, Any], now: Optional[datetime] = None) -> Optional[datetime]:
+    """Earliest future boundary (trial end or subscription expiry) of a record"""
+    now = now or datetime.now(timezone.utc)
+    boundaries = [
+        parse_timestamp(record.get("trial_ends_at")),
+        parse_timestamp(record.get("subscription_expires_at")) if record.get("subscription_active") else None,
+    ]
+    future = [b for b in boundaries if b and b > now]
+    return min(future) if future else None
+
+
+class EntitlementService:
+    """Per-organization entitlement cache with window-bounded expiry"""
+
+    def __init__(self, max_ttl: int = 3600, min_ttl: int = 5):
+        # Local cache (tier 1): {org_id: (record, expiry_time)}
+        self._local_cache: Dict[str, tuple] = {}
+        self._stats = {"hits": 0, "misses": 0, "invalidations": 0, "swept": 0}
+
+        # Cache configuration
+        self.MAX_TTL = max_ttl
+        self.MIN_TTL = min_ttl
+
+        # Redis cache (RedisCache instance, injected on startup)
+        self.redis_client = None
+
+    def set_redis_client(self, redis_client):
+        """Set the Redis client for distributed caching"""
+        self.redis_client = redis_client
+
+    @staticmethod
+    def _redis_key(org_id: str) -> str:
+        return f"entitlement:{org_id}"
+
+    def _redis_available(self) -> bool:
+        return self.redis_client is not None and self.redis_client.is_connected()
+
+    def _ttl_for(self, record: Dict[str, Any]) -> int:
+        """Cache TTL: until the next trial/subscription boundary, capped"""
+        now = datetime.now(timezone.utc)
+        boundary = next_transition(record, now)
+        if boundary is None:
+            return self.MAX_TTL
+        seconds = int((boundary - now).total_seconds())
+        return max(self.MIN_TTL, min(self.MAX_TTL, seconds))
+
+    async def _store(self, org_id: str, record: Dict[str, Any]):
+        ttl = self._ttl_for(record)
+        self._local_cache[org_id] = (record, time.time() + ttl)
+        if self._redis_available():
+            try:
+                await self.redis_client.setex(self._redis_key(org_id), ttl, json.dumps(record))
+            except Exception as e:
+                print(f"⚠️ Entitlement Redis write failed: {e}")
+
+    async def get_entitlement(self, org_id: str, db, admin: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        Get the entitlement record for an organization.
+
+        ``admin`` may be passed when the caller already holds the admin
+        document (e.g. the authenticated admin) to skip the database.
+        """
+        entry = self._local_cache.get(org_id)
+        if entry is not None:
+            record, expiry = entry
+            if time.time() < expiry:
+                self._stats["hits"] += 1
+                return record
+            del self._local_cache[org_id]
+
+        if admin is None and self._redis_available():
+            try:
+                cached = await self.redis_client.get(self._redis_key(org_id))
+                if cached:
+                    record = json.loads(cached)
+                    self._local_cache[org_id] = (record, time.time() + self._ttl_for(record))
+                    self._stats["hits"] += 1
+                    return record
+            except Exception as e:
+                print(f"⚠️ Entitlement Redis read failed: {e}")
+
+        self._stats["misses"] += 1
+        if admin is None:
+            admin = await db.users.find_one({"id": org_id, "role": "admin"}, ENTITLEMENT_FIELDS)
+
+        record = build_entitlement(org_id, admin)
+        await self._store(org_id, record)
+        return record
+
+    async def is_entitled(self, org_id: str, db, admin: Optional[Dict[str, Any]] = None) -> bool:
+        """True while the organization has an active subscription or trial"""
+        record = await self.get_entitlement(org_id, db, admin)
+        return evaluate_entitlement(record) != "expired"
+
+    async def invalidate(self, *org_ids: str):
+        """Drop organizations after a subscription or trial change"""
+        org_ids = [org_id for org_id in org_ids if org_id]
+        if not org_ids:
+            return
+
+        self.evict_local(*org_ids)
+        self._stats["invalidations"] += len(org_ids)
+
+        if self._redis_available():
+            try:
+                await self.redis_client.delete(*[self._redis_key(org_id) for org_id in org_ids])
+            except Exception as e:
+                print(f"⚠️ Entitlement Redis invalidation failed: {e}")
+
+        # Let other instances drop their local copies (pub/sub fallback mode)
+        await get_cache_coherence().announce("users", None, *org_ids)
+
+    def evict_local(self, *org_ids: str):
+        """Drop organizations from this instance's cache only (coherence events)"""
+        if not org_ids:
+            self._local_cache.clear()
+        for org_id in org_ids:
+            self._local_cache.pop(org_id, None)
+
+    async def sweep_expired_subscriptions(self, db, batch_size: int = 500) -> List[str]:
+        """
+        Deactivate subscriptions whose expiry has passed.
+
+        Returns the ids of the users that were deactivated so callers can
+        invalidate any other caches holding them.
+        """
+        now = datetime.now(timezone.utc)
+        # Expiry is stored as a date or as a UTC ISO string (which sorts
+        # like the date it holds); hits are parsed and checked again below
+        candidates = db.users.find(
+            {
+                "subscription_active": True,
+                "$or": [
+                    {"subscription_expires_at": {"$lt": now}},
+                    {"subscription_expires_at": {"$type": "string", "$gt": "", "$lt": now.isoformat()}},
+                ],
+            },
+            {"_id": 0, "id": 1, "subscription_expires_at": 1},
+        ).batch_size(batch_size)
+
+        expired_ids = []
+        async for user in candidates:
+            expires_at = parse_timestamp(user.get("subscription_expires_at"))
+            if expires_at and expires_at < now and user.get("id"):
+                expired_ids.append(user["id"])
+
+        for offset in range(0, len(expired_ids), batch_size):
+            batch = expired_ids[offset:offset + batch_size]
+            await db.users.update_many(
+                {"id": {"$in": batch}},
+                {"$set": {"subscription_active": False}},
+            )
+            await self.invalidate(*batch)
+        if expired_ids:
+            self._stats["swept"] += len(expired_ids)
+            print(f"⏰ Deactivated {len(expired_ids)} expired subscriptions")
+
+        return expired_ids
+
+    def get_cache_stats(self) -> Dict[str, Any]:
+        """Get hit/miss counters"""
+        total_requests = self._stats["hits"] + self._stats["misses"]
+        hit_rate = (self._stats["hits"] / total_requests * 100) if total_requests > 0 else 0
+        return {
+            "total_requests": total_requests,
+            "cache_hits": self._stats["hits"],
+            "cache_misses": self._stats["misses"],
+            "hit_rate": f"{hit_rate:.2f}%",
+            "invalidations": self._stats["invalidations"],
+            "subscriptions_swept": self._stats["swept"],
+            "local_cache_size": len(self._local_cache),
+        }
+
+
+# Global instance
+_entitlement_service = EntitlementService()
+
+
+def init_entitlement_service(redis_client=None) -> EntitlementService:
+    """Attach the Redis tier to the entitlement service"""
+    if redis_client:
+        _entitlement_service.set_redis_client(redis_client)
+    print("✅ Entitlement service initialized")
+    return _entitlement_service
+
+
+def get_entitlement_service() -> EntitlementService:
+    """Get the global entitlement service instance"""
+    return _entitlement_service
+
+
+async def subscription_expiry_sweeper_task(db, interval: int = 900, on_expired=None, lease=None):
+    """Background task: periodically deactivate expired subscriptions (only in the lease holder)"""
+    while True:
+        await asyncio.sleep(interval)
+        if lease is not None and not await lease.acquire():
+            # Another worker sweeps and fires on_expired
+            continue
+        try:
+            expired_ids = await _entitlement_service.sweep_expired_subscriptions(db)
+            if expired_ids and on_expired:
+                await on_expired(expired_ids)
+        except Exception as e:
+            print(f"⚠️ Subscription expiry sweep failed: {e}")
@@ -0,0 +1,239 @@
+"""
+Organization Event Stream (Server-Sent Events)
+==============================================
+
+Pushes order, table and reservation changes to POS, kitchen and billing
+screens so they no longer poll ``GET /orders`` / ``GET /tables``:
+- Writers publish events per organization through the EventBus
+- Redis pub/sub fans events out to every backend instance; without
+  native Redis pub/sub an in-process bus delivers locally
+- Each instance keeps a short replay buffer per organization so a client
+  reconnecting with ``Last-Event-ID`` receives what it missed. Buffers
+  exist only for organizations with a connection on this instance, and
+  are dropped REPLAY_IDLE seconds after their last connection closed; a
+  client resuming where no buffer exists gets ``resync``
+- Every connection has a bounded queue: a client that falls behind gets
+  a ``resync`` event and is disconnected instead of growing memory
+- Heartbeat comments keep proxies from closing idle streams
+
+Event ids are assigned by the publishing instance, so they are the same
+on every instance and resume works across the load balancer.
+"""
+
+import asyncio
+import itertools
+import json
+import time
+import uuid
+from collections import deque
+from typing import Any, AsyncIterator, Deque, Dict, List, Optional, Set, Tuple
+
+CHANNEL = "org_events"
+
+
+def format_sse(event_type: str, data: Any, event_id: Optional[str] = None) -> str:
+    """Encode one Server-Sent Event"""
+    lines = []
+    if event_id:
+        lines.append(f"id: {event_id}")
+    lines.append(f"event: {event_type}")
+    lines.append(f"data: {json.dumps(data, separators=(',', ':'), default=str)}")
+    return "\n".join(lines) + "\n\n"
+
+
+class _Subscriber:
+    """One SSE connection: a bounded queue of pending events"""
+    __slots__ = ("queue", "overflowed")
+
+    def __init__(self, queue_size: int):
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.overflowed = False
+
+    def offer(self, event: Dict[str, Any]) -> bool:
+        if self.overflowed:
+            return False
+        try:
+            self.queue.put_nowait(event)
+            return True
+        except asyncio.QueueFull:
+            # Slow client: stop buffering, the stream sends resync and closes
+            self.overflowed = True
+            return False
+
+
+class EventBus:
+    """Per-organization event fan-out with replay buffer and backpressure"""
+
+    def __init__(self, replay_size: int = 256, queue_size: int = 100,
+                 heartbeat: float = 15, max_connections_per_org: int = 50, replay_idle: float = 300):
+        self._subscribers: Dict[str, Set[_Subscriber]] = {}
+        self._replay: Dict[str, Deque[Dict[str, Any]]] = {}
+        # Organizations whose last local connection closed: {org_id: closed_at}
+        self._idle_since: Dict[str, float] = {}
+        self._instance = uuid.uuid4().hex[:6]
+        self._sequence = itertools.count(1)
+        self._redis = None
+        self._task: Optional[asyncio.Task] = None
+        self.mode = "local"  # local or redis
+        self._stats = {"published": 0, "delivered": 0, "replayed": 0, "resyncs": 0, "overflows": 0}
+
+        # Configuration
+        self.REPLAY_SIZE = replay_size
+        self.QUEUE_SIZE = queue_size
+        self.HEARTBEAT = heartbeat
+        self.MAX_CONNECTIONS_PER_ORG = max_connections_per_org
+        self.REPLAY_IDLE = replay_idle
+
+    # ============ FAN-OUT ============
+
+    async def start(self, redis_client=None):
+        """Subscribe to the Redis channel; without it events stay in process"""
+        if self._task is not None:
+            return
+        self._redis = redis_client
+        if redis_client is not None and redis_client.is_connected():
+            pubsub = await redis_client.subscribe(CHANNEL)
+            if pubsub is not None:
+                self.mode = "redis"
+                self._task = asyncio.create_task(self._listen(pubsub))
+        print(f"✅ Event stream bus started ({self.mode})")
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+        self.mode = "local"
+
+    async def _listen(self, pubsub):
+        while True:
+            try:
+                async for message in pubsub.listen():
+                    if message.get("type") == "message":
+                        self._deliver(json.loads(message["data"]))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"⚠️ Event stream pub/sub interrupted: {e}, resubscribing")
+                await asyncio.sleep(2)
+                try:
+                    await pubsub.subscribe(CHANNEL)
+                except Exception as resubscribe_error:
+                    print(f"⚠️ Event stream resubscribe failed: {resubscribe_error}")
+
+    async def publish(self, org_id: str, event_type: str, data: Dict[str, Any]):
+        """Publish an event to every connection of an organization"""
+        if not org_id:
+            return
+        event = {
+            "id": f"{int(time.time() * 1000)}-{self._instance}-{next(self._sequence)}",
+            "org": org_id,
+            "type": event_type,
+            "data": data,
+        }
+        self._stats["published"] += 1
+
+        if self.mode == "redis" and self._redis is not None:
+            try:
+                # Our own subscription delivers it locally, in channel order
+                if await self._redis.publish(CHANNEL, json.dumps(event, default=str)):
+                    return
+            except Exception as e:
+                print(f"⚠️ Event stream publish failed: {e}")
+        self._deliver(json.loads(json.dumps(event, default=str)))
+
+    def _drop_idle_buffers(self):
+        """Forget replay buffers of organizations idle here for REPLAY_IDLE"""
+        cutoff = time.monotonic() - self.REPLAY_IDLE
+        for org_id in [org for org, since in self._idle_since.items() if since <= cutoff]:
+            del self._idle_since[org_id]
+            self._replay.pop(org_id, None)
+
+    def _deliver(self, event: Dict[str, Any]):
+        org_id = event.get("org")
+        self._drop_idle_buffers()
+        replay = self._replay.get(org_id)
+        if replay is None and org_id in self._subscribers:
+            replay = self._replay[org_id] = deque(maxlen=self.REPLAY_SIZE)
+        if replay is not None:
+            # Buffered while connected here, or recently (clients reconnecting)
+            replay.append(event)
+
+        for subscriber in list(self._subscribers.get(org_id, ())):
+            if subscriber.offer(event):
+                self._stats["delivered"] += 1
+            elif subscriber.overflowed:
+                self._stats["overflows"] += 1
+
+    # ============ CONNECTIONS ============
+
+    def can_accept(self, org_id: str) -> bool:
+        return len(self._subscribers.get(org_id, ())) < self.MAX_CONNECTIONS_PER_ORG
+
+    def _subscribe(self, org_id: str, last_event_id: Optional[str]) -> Tuple[_Subscriber, List[Dict[str, Any]], bool]:
+        """Register a connection; returns (subscriber, backlog, resync_needed)"""
+        subscriber = _Subscriber(self.QUEUE_SIZE)
+        self._subscribers.setdefault(org_id, set()).add(subscriber)
+        self._idle_since.pop(org_id, None)
+
+        if not last_event_id:
+            return subscriber, [], False
+        replay = list(self._replay.get(org_id, ()))
+        for index, event in enumerate(replay):
+            if event["id"] == last_event_id:
+                backlog = replay[index + 1:]
+                self._stats["replayed"] += len(backlog)
+                return subscriber, backlog, False
+        # The event fell out of the replay buffer: client must refetch
+        return subscriber, [], True
+
+    def _unsubscribe(self, org_id: str, subscriber: _Subscriber):
+        subscribers = self._subscribers.get(org_id)
+        if subscribers is not None:
+            subscribers.discard(subscriber)
+            if not subscribers:
+                del self._subscribers[org_id]
+                self._idle_since[org_id] = time.monotonic()
+        self._drop_idle_buffers()
+
+    async def stream(self, org_id: str, last_event_id: Optional[str] = None) -> AsyncIterator[str]:
+        """SSE body for one connection"""
+        subscriber, backlog, resync = self._subscribe(org_id, last_event_id)
+        try:
+            yield "retry: 3000\n\n"
+            if resync:
+                self._stats["resyncs"] += 1
+                yield format_sse("resync", {"reason": "replay_unavailable"})
+            for event in backlog:
+                yield format_sse(event["type"], event["data"], event["id"])
+
+            while True:
+                if subscriber.overflowed:
+                    self._stats["resyncs"] += 1
+                    yield format_sse("resync", {"reason": "client_too_slow"})
+                    return
+                try:
+                    event = await asyncio.wait_for(subscriber.queue.get(), timeout=self.HEARTBEAT)
+                except asyncio.TimeoutError:
+                    yield ": ping\n\n"
+                    continue
+                yield format_sse(event["type"], event["data"], event["id"])
+        finally:
+            self._unsubscribe(org_id, subscriber)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            **self._stats,
+            "mode": self.mode,
+            "connections": sum(len(subs) for subs in self._subscribers.values()),
+            "organizations": len(self._subscribers),
+            "replay_buffers": len(self._replay),
+        }
+
+
+# Global instance
+_event_bus = EventBus()
+
+
+def get_event_bus() -> EventBus:
+    """Get the global event bus instance"""
+    return _event_bus
@@ -0,0 +1,58 @@
+"""
+Fast JSON Responses
+===================
+
+Hot list endpoints (orders, menu, tables) are polled by every open
+screen. With ``response_model=List[...]`` FastAPI validates each cached
+dict through Pydantic and re-serializes it with the stdlib encoder on
+every poll, although the data is our own, already-shaped cache content.
+- FastJSONResponse: orjson rendering (stdlib json fallback); bytes are
+  passed through unchanged, so the cache layer can hand over the JSON
+  it already holds
+- Returning a Response skips FastAPI's response_model validation; only
+  do it for trusted cache data, and keep the validated path for
+  MongoDB fallbacks
+- response_shape: cached documents are normalized to the response
+  model's field set (defaults filled in, extra fields dropped) when they
+  are cached or rendered, so documents that predate a model field look
+  the same on both paths
+- ``FAST_RESPONSES=0`` turns the trusted path off everywhere (tests use
+  it to exercise the response models)
+"""
+
+import os
+from typing import Any, Callable, Dict, Type
+
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel, ValidationError
+
+from cache_codec import to_json_bytes
+
+
+class FastJSONResponse(JSONResponse):
+    """JSON response rendered with orjson; pre-serialized bytes pass through"""
+
+    def render(self, content: Any) -> bytes:
+        if isinstance(content, (bytes, bytearray, memoryview)):
+            return bytes(content)
+        return to_json_bytes(content)
+
+
+def fast_responses_enabled() -> bool:
+    """Whether trusted cache data may skip response_model validation"""
+    return os.getenv("FAST_RESPONSES", "1").lower() not in ("0", "false", "no")
+
+
+def response_shape(model: Type[BaseModel]) -> Callable[[Dict[str, Any]], Dict[str, Any]]:
+    """
+    Normalizer of a cached document to what ``model`` would send: the
+    model's fields with their defaults, JSON-ready. A document the model
+    rejects is left as it is.
+    """
+    def shape(document: Dict[str, Any]) -> Dict[str, Any]:
+        try:
+            return model.model_validate(document).model_dump(mode="json")
+        except ValidationError as e:
+            print(f"⚠️ Cached {model.__name__} {document.get('id', 'unknown')} does not match the model: {e.error_count()} errors")
+            return document
+    return shape
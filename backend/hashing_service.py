@@ -0,0 +1,141 @@
+"""
+Async Password Hashing Service
+==============================
+
+Runs bcrypt hashing and verification on a dedicated, bounded thread pool
+so a login burst never blocks the event loop:
+- The bcrypt C extension releases the GIL, so worker threads hash in
+  parallel while the event loop keeps serving requests
+- A semaphore caps concurrent hashes; excess callers wait in a queue
+- Queue depth, in-flight count and latency are exposed as metrics
+- Hashes made with an outdated work factor are flagged on login so they
+  can be transparently replaced (rehash-on-login)
+
+CONFIGURATION (environment):
+- BCRYPT_ROUNDS: work factor for new hashes (default 12)
+- PASSWORD_HASH_WORKERS: pool size (default 4)
+"""
+
+import asyncio
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Optional, Tuple
+
+from passlib.context import CryptContext
+
+
+class PasswordHasher:
+    """Bounded thread-pool bcrypt hasher with metrics"""
+
+    def __init__(self, rounds: int = 12, max_workers: int = 4):
+        # Hashes below the configured work factor are flagged by needs_update()
+        self.context = CryptContext(
+            schemes=["bcrypt"],
+            deprecated="auto",
+            bcrypt__default_rounds=rounds,
+            bcrypt__min_rounds=rounds,
+        )
+        self.rounds = rounds
+        self.max_workers = max_workers
+
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="bcrypt")
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+        self._stats = {
+            "waiting": 0,
+            "in_flight": 0,
+            "completed": 0,
+            "errors": 0,
+            "rehashes": 0,
+            "total_wait_ms": 0.0,
+            "total_hash_ms": 0.0,
+            "max_hash_ms": 0.0,
+        }
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        # Created lazily so it binds to the running event loop
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_workers)
+        return self._semaphore
+
+    async def _run(self, func, *args):
+        """Run a bcrypt call on the pool, tracking queue depth and latency"""
+        queued_at = time.perf_counter()
+        acquired = False
+        self._stats["waiting"] += 1
+        try:
+            async with self._get_semaphore():
+                acquired = True
+                self._stats["waiting"] -= 1
+                self._stats["in_flight"] += 1
+                started_at = time.perf_counter()
+                try:
+                    loop = asyncio.get_running_loop()
+                    return await loop.run_in_executor(self._executor, func, *args)
+                except Exception:
+                    self._stats["errors"] += 1
+                    raise
+                finally:
+                    hash_ms = (time.perf_counter() - started_at) * 1000
+                    self._stats["in_flight"] -= 1
+                    self._stats["completed"] += 1
+                    self._stats["total_wait_ms"] += (started_at - queued_at) * 1000
+                    self._stats["total_hash_ms"] += hash_ms
+                    self._stats["max_hash_ms"] = max(self._stats["max_hash_ms"], hash_ms)
+        finally:
+            # Cancelled while still queued
+            if not acquired:
+                self._stats["waiting"] -= 1
+
+    async def hash(self, password: str) -> str:
+        """Hash a password with the configured work factor"""
+        return await self._run(self.context.hash, password)
+
+    async def verify(self, password: str, hashed: str) -> bool:
+        """Verify a password against a stored hash"""
+        return await self._run(self.context.verify, password, hashed)
+
+    async def verify_and_update(self, password: str, hashed: str) -> Tuple[bool, Optional[str]]:
+        """
+        Verify a password and rehash it when the stored hash is outdated.
+
+        Returns (valid, new_hash); new_hash is None unless the caller
+        should persist a replacement hash.
+        """
+        valid, new_hash = await self._run(self.context.verify_and_update, password, hashed)
+        if valid and new_hash:
+            self._stats["rehashes"] += 1
+        return valid, new_hash
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get queue-depth and latency metrics"""
+        completed = self._stats["completed"]
+        return {
+            "rounds": self.rounds,
+            "max_workers": self.max_workers,
+            "queue_depth": self._stats["waiting"],
+            "in_flight": self._stats["in_flight"],
+            "completed": completed,
+            "errors": self._stats["errors"],
+            "rehashes": self._stats["rehashes"],
+            "avg_wait_ms": f"{(self._stats['total_wait_ms'] / completed) if completed else 0:.2f}ms",
+            "avg_hash_ms": f"{(self._stats['total_hash_ms'] / completed) if completed else 0:.2f}ms",
+            "max_hash_ms": f"{self._stats['max_hash_ms']:.2f}ms",
+        }
+
+    def shutdown(self):
+        """Release pool threads"""
+        self._executor.shutdown(wait=False)
+
+
+# Global instance
+_password_hasher = PasswordHasher(
+    rounds=int(os.getenv("BCRYPT_ROUNDS", "12")),
+    max_workers=int(os.getenv("PASSWORD_HASH_WORKERS", "4")),
+)
+
+
+def get_password_hasher() -> PasswordHasher:
+    """Get the global password hasher instance"""
+    return _password_hasher
@@ -0,0 +1,173 @@
+"""
+Item Analytics
+==============
+
+The best-selling and category reports used to load up to 1000 completed
+orders into Python and look every item up in ``menu_items`` one by one
+(once per distinct item, or once per order line for categories). This
+engine answers both from one aggregation:
+- ``$unwind`` the order lines and ``$group`` them per menu item through
+  the report engine (hot orders and the archives a date range touches)
+- Categories are joined in Python from a per-organization menu map
+  (id, name, category, price) cached in process for a few minutes and
+  dropped whenever the menu changes
+- Quantity, revenue and their shares per item and per category, for an
+  optional creation-date range
+
+Order lines without a ``menu_item_id`` (older orders) are grouped and
+matched to the menu by name, as before.
+"""
+
+import asyncio
+import time
+from collections import defaultdict
+from datetime import datetime
+from typing import Any, Dict, Optional, Tuple
+
+from report_engine import get_report_engine
+
+UNCATEGORIZED = "Uncategorized"
+
+MENU_FIELDS = {"_id": 0, "id": 1, "name": 1, "category": 1, "price": 1}
+
+# Order lines, grouped per menu item (name for lines without an id)
+LINE_STAGES = [
+    {"$project": {"_id": 0, "items.menu_item_id": 1, "items.name": 1, "items.price": 1, "items.quantity": 1}},
+    {"$unwind": "$items"},
+]
+ITEM_KEY = {"$ifNull": ["$items.menu_item_id", "$items.name"]}
+ITEM_ACCUMULATORS = {
+    "name": {"$last": "$items.name"},
+    "price": {"$last": "$items.price"},
+    "quantity": {"$sum": {"$ifNull": ["$items.quantity", 0]}},
+    "revenue": {"$sum": {"$multiply": [{"$ifNull": ["$items.price", 0]}, {"$ifNull": ["$items.quantity", 0]}]}},
+}
+
+
+def _share(part: float, whole: float) -> float:
+    """Percentage of ``whole``, 0 when there is nothing to share"""
+    return round(part / whole * 100, 2) if whole else 0
+
+
+class ItemAnalytics:
+    """Per-item and per-category sales from a single aggregation"""
+
+    def __init__(self, db=None, menu_ttl: int = 300):
+        self.db = db
+        self._menus: Dict[str, Tuple[float, Dict[str, Dict[str, Dict[str, Any]]]]] = {}
+        self._stats = {
+            "reports": 0,
+            "menu_hits": 0,
+            "menu_loads": 0,
+            "menu_invalidations": 0,
+            "item_groups": 0,
+        }
+
+        self.MENU_TTL = menu_ttl
+
+    # ============ MENU MAP ============
+
+    async def menu_map(self, org_id: str) -> Dict[str, Dict[str, Dict[str, Any]]]:
+        """{"by_id": {...}, "by_name": {...}} of an organization's menu items"""
+        cached = self._menus.get(org_id)
+        if cached and time.monotonic() - cached[0] < self.MENU_TTL:
+            self._stats["menu_hits"] += 1
+            return cached[1]
+
+        self._stats["menu_loads"] += 1
+        items = await self.db.menu_items.find({"organization_id": org_id}, MENU_FIELDS).to_list(None)
+        menu = {
+            "by_id": {item["id"]: item for item in items if item.get("id")},
+            "by_name": {item["name"]: item for item in items if item.get("name")},
+        }
+        self._menus[org_id] = (time.monotonic(), menu)
+        return menu
+
+    def invalidate_menu(self, org_id: Optional[str] = None):
+        """Drop an organization's menu map (every map without one) after a menu change"""
+        if org_id is None:
+            self._stats["menu_invalidations"] += len(self._menus)
+            self._menus.clear()
+        elif self._menus.pop(org_id, None) is not None:
+            self._stats["menu_invalidations"] += 1
+
+    # ============ REPORTS ============
+
+    async def report(
+        self, org_id: str, start: Optional[datetime] = None, end: Optional[datetime] = None
+    ) -> Dict[str, Any]:
+        """
+        Sales per item and per category of orders created in [start, end).
+
+        Items are sorted by quantity and categories by revenue, both
+        descending; shares are percentages of the period's totals.
+        """
+        self._stats["reports"] += 1
+        groups, menu = await asyncio.gather(
+            get_report_engine().group(org_id, ITEM_KEY, ITEM_ACCUMULATORS, LINE_STAGES, start=start, end=end),
+            self.menu_map(org_id),
+        )
+        self._stats["item_groups"] += len(groups)
+
+        items = []
+        for group in groups:
+            name = group.get("name") or str(group["_id"])
+            menu_item = menu["by_id"].get(group["_id"]) or menu["by_name"].get(name) or {}
+            items.append({
+                "menu_item_id": menu_item.get("id") or (group["_id"] if group["_id"] != name else None),
+                "name": name,
+                "category": menu_item.get("category") or UNCATEGORIZED,
+                "price": group.get("price") or menu_item.get("price", 0),
+                "quantity": group["quantity"],
+                "revenue": round(group["revenue"], 2),
+            })
+
+        total_quantity = sum(item["quantity"] for item in items)
+        total_revenue = round(sum(item["revenue"] for item in items), 2)
+
+        categories: Dict[str, Dict[str, Any]] = defaultdict(lambda: {"quantity": 0, "revenue": 0, "items": 0})
+        for item in items:
+            item["quantity_share"] = _share(item["quantity"], total_quantity)
+            item["revenue_share"] = _share(item["revenue"], total_revenue)
+            category = categories[item["category"]]
+            category["quantity"] += item["quantity"]
+            category["revenue"] += item["revenue"]
+            category["items"] += 1
+
+        return {
+            "items": sorted(items, key=lambda x: x["quantity"], reverse=True),
+            "categories": sorted(
+                (
+                    {
+                        "category": name,
+                        **stats,
+                        "revenue": round(stats["revenue"], 2),
+                        "quantity_share": _share(stats["quantity"], total_quantity),
+                        "revenue_share": _share(stats["revenue"], total_revenue),
+                    }
+                    for name, stats in categories.items()
+                ),
+                key=lambda x: x["revenue"],
+                reverse=True,
+            ),
+            "total_quantity": total_quantity,
+            "total_revenue": total_revenue,
+        }
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {**self._stats, "cached_menus": len(self._menus)}
+
+
+# Global instance
+_item_analytics = ItemAnalytics()
+
+
+def init_item_analytics(db) -> ItemAnalytics:
+    """Attach the global item analytics to a database"""
+    _item_analytics.db = db
+    return _item_analytics
+
+
+def get_item_analytics() -> ItemAnalytics:
+    """Get the global item analytics engine"""
+    return _item_analytics
@@ -0,0 +1,103 @@
+"""
+Background Job Leases
+=====================
+
+Every gunicorn worker of every instance runs the startup hook, so
+maintenance loops started there (rollup and ledger rebuilds, order
+archiving) ran once per worker: 4 workers x 3 instances rebuilt the same
+days twelve times over and raced each other's ReplaceOnes. A job now
+runs only in the worker holding its lease:
+- One ``job_leases`` document per job: ``holder`` (host:pid:random) and
+  ``expires_at``. Taking or renewing it is a single conditional upsert,
+  so exactly one worker wins; losers get a duplicate key error
+- The holder renews the lease every TTL/3 for as long as it lives; the
+  others call ``acquire`` on each pass of their loop and take over once
+  a dead holder's lease has expired (they keep refreshing their own read
+  state meanwhile)
+- MongoDB rather than Redis holds the lease, so it works (and stays
+  exclusive) when Redis is down or not configured
+"""
+
+import asyncio
+import os
+import socket
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Optional
+
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+
+class JobLease:
+    """Exclusive, self-renewing lease on a named background job"""
+
+    def __init__(self, db, name: str, ttl: int = 90):
+        self.db = db
+        self.name = name
+        self.holder = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._held = False
+        self._renewer: Optional[asyncio.Task] = None
+        self._stats = {"acquired": 0, "lost": 0, "renewals": 0}
+
+        self.TTL = ttl
+
+    def is_held(self) -> bool:
+        return self._held
+
+    async def _claim(self) -> bool:
+        """Take or renew the lease; False while another live worker holds it"""
+        now = datetime.now(timezone.utc)
+        try:
+            lease = await self.db.job_leases.find_one_and_update(
+                {"_id": self.name, "$or": [{"holder": self.holder}, {"expires_at": {"$lte": now}}]},
+                {"$set": {"holder": self.holder, "expires_at": now + timedelta(seconds=self.TTL)}},
+                upsert=True,
+                return_document=ReturnDocument.AFTER,
+            )
+        except DuplicateKeyError:
+            return False
+        return lease is not None
+
+    async def _renew_forever(self):
+        while self._held:
+            await asyncio.sleep(self.TTL / 3)
+            try:
+                if await self._claim():
+                    self._stats["renewals"] += 1
+                    continue
+                self._stats["lost"] += 1
+                print(f"⚠️ Lost job lease {self.name}")
+            except Exception as e:
+                # Unknown outcome: stop running the job until it is re-acquired
+                print(f"⚠️ Job lease {self.name} renewal failed: {e}")
+            self._held = False
+
+    async def acquire(self) -> bool:
+        """Whether this worker holds the lease, taking it if it is free"""
+        if self._held:
+            return True
+        try:
+            if await self._claim():
+                self._held = True
+                self._stats["acquired"] += 1
+                self._renewer = asyncio.create_task(self._renew_forever())
+                print(f"🔒 Job lease {self.name} acquired by {self.holder}")
+        except Exception as e:
+            print(f"⚠️ Job lease {self.name} claim failed: {e}")
+        return self._held
+
+    async def release(self):
+        """Give the lease up (graceful shutdown) so another worker takes over at once"""
+        if not self._held:
+            return
+        self._held = False
+        if self._renewer is not None:
+            self._renewer.cancel()
+        try:
+            await self.db.job_leases.delete_one({"_id": self.name, "holder": self.holder})
+        except Exception as e:
+            print(f"⚠️ Job lease {self.name} release failed: {e}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {**self._stats, "held": self._held, "holder": self.holder}
@@ -13,6 +13,8 @@ import psutil
 import json
 from collections import defaultdict
 
+from order_dates import CREATED_AT_EXPR, created_range
+
 ops_router = APIRouter(prefix="/api/ops", tags=["Ops Panel"])
 
 # Ops credentials (more secure than super admin)
@@ -98,13 +100,13 @@ async def get_system_overview(
         
         # Recent activity (last 24 hours)
         yesterday = datetime.now(timezone.utc) - timedelta(days=1)
-        recent_orders = await db.orders.count_documents({"created_at": {"$gte": yesterday}})
+        recent_orders = await db.orders.count_documents(created_range(yesterday))
         recent_users = await db.users.count_documents({"created_at": {"$gte": yesterday}})
         
         # Revenue metrics (last 30 days)
         last_month = datetime.now(timezone.utc) - timedelta(days=30)
         revenue_pipeline = [
-            {"$match": {"created_at": {"$gte": last_month}, "status": {"$in": ["completed", "paid"]}}},
+            {"$match": {**created_range(last_month), "status": {"$in": ["completed", "paid"]}}},
             {"$group": {"_id": None, "total_revenue": {"$sum": "$total"}, "order_count": {"$sum": 1}}}
         ]
         revenue_result = await db.orders.aggregate(revenue_pipeline).to_list(1)
@@ -294,9 +296,9 @@ async def get_order_analytics(
         
         # Order trends over time
         trends_pipeline = [
-            {"$match": {"created_at": {"$gte": start_date}}},
+            {"$match": created_range(start_date)},
             {"$group": {
-                "_id": {"$dateToString": {"format": "%Y-%m-%d", "date": "$created_at"}},
+                "_id": {"$dateToString": {"format": "%Y-%m-%d", "date": CREATED_AT_EXPR}},
                 "order_count": {"$sum": 1},
                 "total_revenue": {"$sum": "$total"},
                 "avg_order_value": {"$avg": "$total"}
@@ -307,7 +309,7 @@ async def get_order_analytics(
         
         # Status distribution
         status_pipeline = [
-            {"$match": {"created_at": {"$gte": start_date}}},
+            {"$match": created_range(start_date)},
             {"$group": {
                 "_id": "$status",
                 "count": {"$sum": 1},
@@ -318,7 +320,7 @@ async def get_order_analytics(
         
         # Top performing restaurants
         restaurant_pipeline = [
-            {"$match": {"created_at": {"$gte": start_date}}},
+            {"$match": created_range(start_date)},
             {"$group": {
                 "_id": "$organization_id",
                 "order_count": {"$sum": 1},
@@ -347,7 +349,7 @@ async def get_order_analytics(
         
         # Payment method analysis
         payment_pipeline = [
-            {"$match": {"created_at": {"$gte": start_date}}},
+            {"$match": created_range(start_date)},
             {"$group": {
                 "_id": "$payment_method",
                 "count": {"$sum": 1},
@@ -0,0 +1,326 @@
+"""
+Hot/Cold Order Storage
+======================
+
+Keeps the live ``orders`` collection (and its indexes) limited to recent
+and still-open orders:
+- OrderArchiver moves completed and cancelled orders older than
+  ``ORDER_ARCHIVE_AFTER_DAYS`` (default 90) into per-month collections
+  ``orders_archive_YYYY_MM`` (UTC month of created_at_dt). Orders with an
+  open balance (credit not yet paid) stay hot: receivables and payments
+  read the hot collection only
+- Copies are idempotent upserts; an order is only removed from the hot
+  collection if its version did not change since it was copied
+- Orders archived before open balances were kept hot are moved back once
+  (``restore_open_balances``, recorded in ``db.migrations``)
+- OrderReadRouter lets history and report queries span the hot
+  collection and the archive months overlapping their date range in one
+  aggregation (``$unionWith``), so callers don't care where an order is
+
+Archiving waits for the created_at_dt migration: archive collections
+only ever hold orders with a native creation date.
+"""
+
+import asyncio
+import os
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from pymongo import DeleteOne, ReplaceOne
+
+from order_dates import CREATED_AT_DT, get_order_date_migration
+from order_transitions import TERMINAL_STATUSES, version_filter
+
+HOT_COLLECTION = "orders"
+ARCHIVE_PREFIX = "orders_archive_"
+RESTORE_MIGRATION_ID = "orders_archive_open_balances"
+
+
+def archive_collection_name(created_at: datetime) -> str:
+    return f"{ARCHIVE_PREFIX}{created_at.year:04d}_{created_at.month:02d}"
+
+
+def _month_bounds(name: str) -> Tuple[datetime, datetime]:
+    """[start, end) of an archive collection's month"""
+    year, month = (int(part) for part in name[len(ARCHIVE_PREFIX):].split("_"))
+    start = datetime(year, month, 1, tzinfo=timezone.utc)
+    end = datetime(year + (month == 12), month % 12 + 1, 1, tzinfo=timezone.utc)
+    return start, end
+
+
+def _as_utc(value: Optional[datetime]) -> Optional[datetime]:
+    if value is not None and value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value
+
+
+class OrderReadRouter:
+    """Routes order reads to the hot collection plus relevant archive months"""
+
+    def __init__(self, db, refresh_interval: int = 600):
+        self.db = db
+        self._archives: List[str] = []
+        self._loaded_at = 0.0
+        self.REFRESH_INTERVAL = refresh_interval
+
+    async def archive_collections(self) -> List[str]:
+        """Existing archive collections, newest month first (listed every 10 minutes)"""
+        if time.time() - self._loaded_at >= self.REFRESH_INTERVAL:
+            names = await self.db.list_collection_names(filter={"name": {"$regex": f"^{ARCHIVE_PREFIX}"}})
+            self._archives = sorted(names, reverse=True)
+            self._loaded_at = time.time()
+        return self._archives
+
+    def add_archive(self, name: str):
+        if name not in self._archives:
+            self._archives = sorted(self._archives + [name], reverse=True)
+
+    async def collections(self, start: Optional[datetime] = None, end: Optional[datetime] = None) -> List[str]:
+        """Hot collection plus archive months overlapping [start, end)"""
+        start, end = _as_utc(start), _as_utc(end)
+        selected = [HOT_COLLECTION]
+        for name in await self.archive_collections():
+            month_start, month_end = _month_bounds(name)
+            if (start is None or month_end > start) and (end is None or month_start < end):
+                selected.append(name)
+        return selected
+
+    async def union_pipeline(
+        self,
+        match: Dict[str, Any],
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+        per_collection: Sequence[Dict[str, Any]] = (),
+    ) -> List[Dict[str, Any]]:
+        """
+        Pipeline prefix reading ``match`` from every relevant collection.
+
+        ``per_collection`` stages (e.g. $sort + $limit) run inside each
+        collection so they can use its indexes. Run the result with
+        ``db.orders.aggregate``.
+        """
+        branch = [{"$match": match}, *per_collection]
+        pipeline = list(branch)
+        for name in (await self.collections(start, end))[1:]:
+            pipeline.append({"$unionWith": {"coll": name, "pipeline": branch}})
+        return pipeline
+
+    async def find(
+        self,
+        match: Dict[str, Any],
+        projection: Optional[Dict[str, Any]] = None,
+        sort: Optional[List[Tuple[str, int]]] = None,
+        limit: int = 0,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+    ) -> List[Dict[str, Any]]:
+        """find() across hot and archived orders"""
+        per_collection: List[Dict[str, Any]] = []
+        if sort:
+            per_collection.append({"$sort": dict(sort)})
+        if limit:
+            per_collection.append({"$limit": limit})
+        if projection:
+            per_collection.append({"$project": projection})
+
+        collections = await self.collections(start, end)
+        if len(collections) == 1:
+            cursor = self.db.orders.find(match, projection)
+            if sort:
+                cursor = cursor.sort(sort)
+            if limit:
+                cursor = cursor.limit(limit)
+            return await cursor.to_list(limit or None)
+
+        pipeline = await self.union_pipeline(match, start, end, per_collection)
+        if sort:
+            pipeline.append({"$sort": dict(sort)})
+        if limit:
+            pipeline.append({"$limit": limit})
+        return await self.db.orders.aggregate(pipeline, allowDiskUse=True).to_list(limit or None)
+
+    async def find_one(self, match: Dict[str, Any], projection: Optional[Dict[str, Any]] = None):
+        """Single order lookup; archives are only searched on a hot miss"""
+        doc = await self.db.orders.find_one(match, projection)
+        if doc is not None:
+            return doc
+        for name in await self.archive_collections():
+            doc = await self.db[name].find_one(match, projection)
+            if doc is not None:
+                return doc
+        return None
+
+    async def count_documents(
+        self, match: Dict[str, Any], start: Optional[datetime] = None, end: Optional[datetime] = None
+    ) -> int:
+        counts = await asyncio.gather(*[
+            self.db[name].count_documents(match) for name in await self.collections(start, end)
+        ])
+        return sum(counts)
+
+
+class OrderArchiver:
+    """Moves old closed orders from the hot collection into monthly archives"""
+
+    def __init__(self, db, router: OrderReadRouter, archive_after_days: int = 90, batch_size: int = 500):
+        self.db = db
+        self.router = router
+        self._indexed: set = set()
+        self._restore_done = False
+        self._stats = {"archived": 0, "skipped_changed": 0, "restored": 0, "runs": 0, "last_run": None}
+
+        self.ARCHIVE_AFTER_DAYS = archive_after_days
+        self.BATCH_SIZE = batch_size
+
+    async def _ensure_indexes(self, name: str):
+        if name in self._indexed:
+            return
+        collection = self.db[name]
+        await collection.create_index("id", unique=True)
+        await collection.create_index([("organization_id", 1), (CREATED_AT_DT, -1), ("id", -1)])
+        await collection.create_index([("organization_id", 1), ("status", 1), (CREATED_AT_DT, -1)])
+        self._indexed.add(name)
+        self.router.add_archive(name)
+
+    async def restore_open_balances(self) -> int:
+        """
+        One-off repair: move orders archived with an open balance back to
+        the hot collection. Nothing archives such orders any more, so the
+        unindexed archive scans run until one pass completes, never again.
+        """
+        if self._restore_done:
+            return 0
+        marker = await self.db.migrations.find_one({"_id": RESTORE_MIGRATION_ID})
+        if marker and marker.get("completed"):
+            self._restore_done = True
+            return 0
+
+        restored = 0
+        for name in await self.router.archive_collections():
+            docs = await self.db[name].find({"balance_amount": {"$gt": 0}}).to_list(None)
+            if not docs:
+                continue
+            await self.db.orders.bulk_write(
+                [ReplaceOne({"id": doc["id"]}, doc, upsert=True) for doc in docs], ordered=False
+            )
+            await self.db[name].delete_many({"_id": {"$in": [doc["_id"] for doc in docs]}})
+            restored += len(docs)
+        await self.db.migrations.update_one(
+            {"_id": RESTORE_MIGRATION_ID},
+            {"$set": {"completed": True, "completed_at": datetime.now(timezone.utc), "restored": restored}},
+            upsert=True,
+        )
+        self._restore_done = True
+        if restored:
+            self._stats["restored"] += restored
+            print(f"🗄️ Restored {restored} archived orders with an open balance")
+        return restored
+
+    async def archive_once(self) -> int:
+        """Archive every eligible order; returns how many were moved"""
+        if not get_order_date_migration().is_complete():
+            print("ℹ️ Order archiving waits for the created_at_dt migration")
+            return 0
+
+        self._stats["runs"] += 1
+        await self.restore_open_balances()
+        cutoff = datetime.now(timezone.utc) - timedelta(days=self.ARCHIVE_AFTER_DAYS)
+        moved = 0
+        while True:
+            docs = await self.db.orders.find({
+                "status": {"$in": list(TERMINAL_STATUSES)},
+                CREATED_AT_DT: {"$lt": cutoff, "$type": "date"},
+                "balance_amount": {"$not": {"$gt": 0}},
+            }).sort(CREATED_AT_DT, 1).limit(self.BATCH_SIZE).to_list(self.BATCH_SIZE)
+            if not docs:
+                break
+
+            by_month: Dict[str, List[Dict[str, Any]]] = {}
+            for doc in docs:
+                by_month.setdefault(archive_collection_name(_as_utc(doc[CREATED_AT_DT])), []).append(doc)
+
+            # Copy first; a crash between copy and delete leaves a duplicate
+            # that the next run overwrites, never a lost order
+            for name, month_docs in by_month.items():
+                await self._ensure_indexes(name)
+                await self.db[name].bulk_write(
+                    [ReplaceOne({"id": doc["id"]}, doc, upsert=True) for doc in month_docs],
+                    ordered=False,
+                )
+
+            result = await self.db.orders.bulk_write(
+                [DeleteOne({"_id": doc["_id"], **version_filter(doc.get("version", 0))}) for doc in docs],
+                ordered=False,
+            )
+            moved += result.deleted_count
+            skipped = len(docs) - result.deleted_count
+            self._stats["skipped_changed"] += skipped
+            if skipped == len(docs):
+                # Every order in the batch changed under us; try again next run
+                break
+            await asyncio.sleep(0.1)
+
+        self._stats["archived"] += moved
+        self._stats["last_run"] = datetime.now(timezone.utc).isoformat()
+        if moved:
+            print(f"🗄️ Archived {moved} orders older than {self.ARCHIVE_AFTER_DAYS} days")
+        return moved
+
+    async def delete_organization(self, org_id: str) -> int:
+        """Delete an organization's archived orders from every archive month"""
+        names = await self.db.list_collection_names(filter={"name": {"$regex": f"^{ARCHIVE_PREFIX}"}})
+        results = await asyncio.gather(*[
+            self.db[name].delete_many({"organization_id": org_id}) for name in names
+        ])
+        return sum(result.deleted_count for result in results)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            **self._stats,
+            "archive_after_days": self.ARCHIVE_AFTER_DAYS,
+            "archive_collections": len(self.router._archives),
+        }
+
+
+# Global instances
+_order_router: Optional[OrderReadRouter] = None
+_order_archiver: Optional[OrderArchiver] = None
+
+
+def init_order_archive(db) -> OrderArchiver:
+    """Create the read router and archiver for a database"""
+    global _order_router, _order_archiver
+    _order_router = OrderReadRouter(db)
+    _order_archiver = OrderArchiver(
+        db, _order_router, archive_after_days=int(os.getenv("ORDER_ARCHIVE_AFTER_DAYS", "90"))
+    )
+    print(f"✅ Order archive initialized (archive after {_order_archiver.ARCHIVE_AFTER_DAYS} days)")
+    return _order_archiver
+
+
+def get_order_router() -> Optional[OrderReadRouter]:
+    """Get the global order read router"""
+    return _order_router
+
+
+def get_order_archiver() -> Optional[OrderArchiver]:
+    """Get the global order archiver"""
+    return _order_archiver
+
+
+async def order_archive_task(interval: int = 6 * 3600, initial_delay: int = 300, lease=None):
+    """Background task: archive old closed orders every few hours (in the lease holder only)"""
+    await asyncio.sleep(initial_delay)
+    while True:
+        try:
+            if lease is not None and not await lease.acquire():
+                await asyncio.sleep(initial_delay)
+                continue
+            if _order_archiver is not None:
+                await _order_archiver.archive_once()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"⚠️ Order archiving failed: {e}")
+        await asyncio.sleep(interval)
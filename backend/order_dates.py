@@ -0,0 +1,194 @@
+"""
+Native BSON Dates for Orders
+============================
+
+Orders store ``created_at`` as an ISO string, which the API and the
+frontend rely on. Range queries on strings only work while every writer
+uses the same format, and aggregation operators (``$dateToString``,
+``$hour``, date comparisons in super admin / ops analytics) need real
+dates. This module adds a native mirror field:
+- ``created_at_dt``: BSON date written next to ``created_at`` on insert
+- Every insert and upsert of an order calls ``add_bson_dates``
+- Background migration backfills it for existing orders in batches and
+  records completion in ``db.migrations`` once a sweep finds nothing left
+  to backfill
+- Dual read: until the migration is complete, range filters also match
+  orders that only have the string field; afterwards they use the date
+  field (and its indexes) alone. Instances still running older code
+  (rolling deploys) write orders without the mirror: a sweep that finds
+  any switches every instance back to dual read until a sweep comes up
+  clean
+
+``created_at`` stays the API field; readers never parse it in Python.
+"""
+
+import asyncio
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional
+
+from pymongo import UpdateOne
+
+CREATED_AT_DT = "created_at_dt"
+MIGRATION_ID = "orders_created_at_dt"
+
+# Aggregation expression for an order's creation date during dual read
+CREATED_AT_EXPR = {
+    "$ifNull": [
+        f"${CREATED_AT_DT}",
+        {"$convert": {"input": "$created_at", "to": "date", "onError": None, "onNull": None}},
+    ]
+}
+
+
+def parse_timestamp(value: Any) -> Optional[datetime]:
+    """ISO string or datetime -> timezone-aware UTC datetime (None if invalid)"""
+    if isinstance(value, str):
+        try:
+            value = datetime.fromisoformat(value.replace("Z", "+00:00"))
+        except ValueError:
+            return None
+    if not isinstance(value, datetime):
+        return None
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc)
+
+
+def add_bson_dates(doc: Dict[str, Any]) -> Dict[str, Any]:
+    """Set the native date mirror on an order document before inserting it"""
+    doc[CREATED_AT_DT] = parse_timestamp(doc.get("created_at"))
+    return doc
+
+
+class OrderDateMigration:
+    """Backfills created_at_dt and tracks whether dual read is still needed"""
+
+    def __init__(
+        self, batch_size: int = 500, pause: float = 0.05, recheck_interval: int = 3600, retry_interval: int = 60
+    ):
+        self._complete = False
+        self._stats = {"migrated": 0, "unparseable": 0, "batches": 0, "runs": 0, "reopened": 0}
+
+        self.BATCH_SIZE = batch_size
+        self.PAUSE = pause
+        self.RECHECK_INTERVAL = recheck_interval
+        self.RETRY_INTERVAL = retry_interval
+
+    def is_complete(self) -> bool:
+        return self._complete
+
+    def created_range(self, start: Optional[datetime] = None, end: Optional[datetime] = None) -> Dict[str, Any]:
+        """
+        Filter for orders created in [start, end).
+
+        Returns a dict to merge into a query; during dual read it contains
+        an ``$or``, so don't merge it into a query that has its own.
+        """
+        date_range: Dict[str, Any] = {}
+        if start is not None:
+            date_range["$gte"] = start
+        if end is not None:
+            date_range["$lt"] = end
+        if self._complete:
+            return {CREATED_AT_DT: date_range}
+
+        string_range = {op: value.isoformat() for op, value in date_range.items()}
+        return {"$or": [
+            {CREATED_AT_DT: date_range},
+            {CREATED_AT_DT: {"$exists": False}, "created_at": string_range},
+            {CREATED_AT_DT: {"$exists": False}, "created_at": date_range},
+        ]}
+
+    def sort_field(self) -> str:
+        """Field to sort orders by creation time"""
+        return CREATED_AT_DT if self._complete else "created_at"
+
+    async def load_state(self, db):
+        marker = await db.migrations.find_one({"_id": MIGRATION_ID})
+        self._complete = bool(marker and marker.get("completed"))
+
+    async def run(self, db) -> int:
+        """
+        Backfill every order without created_at_dt; returns how many were
+        updated. Only a sweep that finds none completes the migration, and
+        one that finds some while complete reopens it.
+        """
+        self._stats["runs"] += 1
+        migrated = 0
+        while True:
+            docs = await db.orders.find(
+                {CREATED_AT_DT: {"$exists": False}}, {"_id": 1, "created_at": 1}
+            ).limit(self.BATCH_SIZE).to_list(self.BATCH_SIZE)
+            if not docs:
+                break
+
+            operations = []
+            for doc in docs:
+                created_at = parse_timestamp(doc.get("created_at"))
+                if created_at is None:
+                    # Stored as null so the order isn't picked up again
+                    self._stats["unparseable"] += 1
+                operations.append(UpdateOne(
+                    {"_id": doc["_id"], CREATED_AT_DT: {"$exists": False}},
+                    {"$set": {CREATED_AT_DT: created_at}},
+                ))
+            result = await db.orders.bulk_write(operations, ordered=False)
+            migrated += result.modified_count
+            self._stats["batches"] += 1
+            await asyncio.sleep(self.PAUSE)
+
+        self._stats["migrated"] += migrated
+        if migrated and self._complete:
+            # Written without the mirror (older instance): back to dual read
+            await db.migrations.update_one(
+                {"_id": MIGRATION_ID}, {"$set": {"completed": False}}, upsert=True
+            )
+            self._complete = False
+            self._stats["reopened"] += 1
+            print(f"⚠️ {migrated} orders without {CREATED_AT_DT} found, range filters dual-read again")
+        elif not migrated and not self._complete:
+            await db.migrations.update_one(
+                {"_id": MIGRATION_ID},
+                {"$set": {"completed": True, "completed_at": datetime.now(timezone.utc)}},
+                upsert=True,
+            )
+            self._complete = True
+            print("✅ Order date migration complete")
+        return migrated
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {**self._stats, "complete": self._complete}
+
+
+# Global instance
+_order_date_migration = OrderDateMigration()
+
+
+def get_order_date_migration() -> OrderDateMigration:
+    """Get the global order date migration"""
+    return _order_date_migration
+
+
+def created_range(start: Optional[datetime] = None, end: Optional[datetime] = None) -> Dict[str, Any]:
+    """Creation-date range filter for orders (see OrderDateMigration.created_range)"""
+    return _order_date_migration.created_range(start, end)
+
+
+def created_sort_field() -> str:
+    return _order_date_migration.sort_field()
+
+
+async def order_date_migration_task(db, retry_delay: int = 60):
+    """Background task: backfill created_at_dt, then sweep up stragglers hourly"""
+    migration = _order_date_migration
+    while True:
+        try:
+            await migration.load_state(db)
+            await migration.run(db)
+            # Until a sweep comes up clean, check again soon
+            await asyncio.sleep(migration.RECHECK_INTERVAL if migration.is_complete() else migration.RETRY_INTERVAL)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"⚠️ Order date migration failed: {e}, retrying in {retry_delay}s")
+            await asyncio.sleep(retry_delay)
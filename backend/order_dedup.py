@@ -0,0 +1,264 @@
+"""
+Order Idempotency & Duplicate Detection
+=======================================
+
+Keeps retries and double taps from creating duplicate orders without
+querying MongoDB on the order path:
+- IdempotencyStore: responses keyed by the client's ``Idempotency-Key``
+  header are stored for 24 hours and replayed for retries. A concurrent
+  retry while the first request is still running gets a 409.
+- RecentOrderSignatures: per-table LRU of recent item signatures. An
+  identical order for the same table inside the window is rejected.
+
+Both are kept in process and mirrored to Redis (SET NX) so detection
+also works across instances. Without Redis the local tier alone applies.
+
+PERFORMANCE TARGETS:
+- Local check: <1ms (vs 30-second recent-orders query: 20-100ms)
+- Redis check: <10ms
+"""
+
+import hashlib
+import json
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+IDEMPOTENCY_TTL = 24 * 3600
+PENDING_TTL = 60
+DUPLICATE_WINDOW = 30
+
+
+def order_signature(items: Iterable[Any], *extra: str) -> str:
+    """Stable hash of an order's items (menu item, quantity, price)"""
+    parts = []
+    for item in items:
+        if isinstance(item, dict):
+            parts.append(f"{item.get('menu_item_id', 'unknown')}_{item.get('quantity', 0)}_{item.get('price', 0)}")
+        else:
+            parts.append(f"{item.menu_item_id}_{item.quantity}_{item.price}")
+    payload = "|".join(sorted(parts) + [value or "" for value in extra])
+    return hashlib.sha1(payload.encode()).hexdigest()
+
+
+def request_fingerprint(payload: str) -> str:
+    """Hash of a request body, used to detect key reuse with a different request"""
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class IdempotencyStore:
+    """Stored responses for Idempotency-Key retries (local LRU + Redis)"""
+
+    # begin() outcomes
+    NEW = "new"
+    REPLAY = "replay"
+    IN_PROGRESS = "in_progress"
+    MISMATCH = "mismatch"
+
+    def __init__(self, max_entries: int = 5000, ttl: int = IDEMPOTENCY_TTL, pending_ttl: int = PENDING_TTL):
+        # Local LRU: {redis_key: (entry, expiry_time)}
+        self._local_cache: "OrderedDict[str, tuple]" = OrderedDict()
+        self._stats = {"new": 0, "replayed": 0, "in_progress": 0, "mismatched": 0}
+
+        self.MAX_ENTRIES = max_entries
+        self.TTL = ttl
+        self.PENDING_TTL = pending_ttl
+
+        # Redis cache (RedisCache instance, injected on startup)
+        self.redis_client = None
+
+    def set_redis_client(self, redis_client):
+        """Set the Redis client for cross-instance replay"""
+        self.redis_client = redis_client
+
+    @staticmethod
+    def _redis_key(scope: str, key: str) -> str:
+        return f"idempotency:{scope}:{key}"
+
+    def _redis_available(self) -> bool:
+        return self.redis_client is not None and self.redis_client.is_connected()
+
+    def _store_local(self, cache_key: str, entry: Dict[str, Any], ttl: int):
+        self._local_cache[cache_key] = (entry, time.time() + ttl)
+        self._local_cache.move_to_end(cache_key)
+        while len(self._local_cache) > self.MAX_ENTRIES:
+            self._local_cache.popitem(last=False)
+
+    def _get_local(self, cache_key: str) -> Optional[Dict[str, Any]]:
+        cached = self._local_cache.get(cache_key)
+        if cached is None:
+            return None
+        entry, expiry = cached
+        if time.time() >= expiry:
+            del self._local_cache[cache_key]
+            return None
+        return entry
+
+    def _resolve(self, entry: Dict[str, Any], fingerprint: str) -> Tuple[str, Optional[Any]]:
+        if entry.get("fingerprint") != fingerprint:
+            self._stats["mismatched"] += 1
+            return self.MISMATCH, None
+        if entry.get("state") == "done":
+            self._stats["replayed"] += 1
+            return self.REPLAY, entry.get("response")
+        self._stats["in_progress"] += 1
+        return self.IN_PROGRESS, None
+
+    async def begin(self, scope: str, key: str, fingerprint: str) -> Tuple[str, Optional[Any]]:
+        """
+        Claim an idempotency key before processing a request.
+
+        Returns (outcome, stored_response). Only NEW means the caller should
+        process the request and then call ``complete`` (or ``abort``).
+        """
+        cache_key = self._redis_key(scope, key)
+        entry = self._get_local(cache_key)
+        if entry is not None:
+            return self._resolve(entry, fingerprint)
+
+        pending = {"state": "pending", "fingerprint": fingerprint}
+        if self._redis_available():
+            try:
+                claimed = await self.redis_client.set_nx(cache_key, json.dumps(pending), self.PENDING_TTL)
+                if claimed is False:
+                    cached = await self.redis_client.get(cache_key)
+                    if cached:
+                        entry = json.loads(cached)
+                        if entry.get("state") == "done":
+                            self._store_local(cache_key, entry, self.TTL)
+                        return self._resolve(entry, fingerprint)
+            except Exception as e:
+                print(f"⚠️ Idempotency Redis claim failed: {e}")
+
+        self._store_local(cache_key, pending, self.PENDING_TTL)
+        self._stats["new"] += 1
+        return self.NEW, None
+
+    async def complete(self, scope: str, key: str, fingerprint: str, response: Any):
+        """Store the response of a successfully processed request"""
+        cache_key = self._redis_key(scope, key)
+        entry = {"state": "done", "fingerprint": fingerprint, "response": json.loads(json.dumps(response, default=str))}
+        self._store_local(cache_key, entry, self.TTL)
+        if self._redis_available():
+            try:
+                await self.redis_client.setex(cache_key, self.TTL, json.dumps(entry))
+            except Exception as e:
+                print(f"⚠️ Idempotency Redis write failed: {e}")
+
+    async def abort(self, scope: str, key: str):
+        """Release a claimed key after a failed request so it can be retried"""
+        cache_key = self._redis_key(scope, key)
+        self._local_cache.pop(cache_key, None)
+        if self._redis_available():
+            try:
+                await self.redis_client.delete(cache_key)
+            except Exception as e:
+                print(f"⚠️ Idempotency Redis release failed: {e}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {**self._stats, "local_cache_size": len(self._local_cache)}
+
+
+class RecentOrderSignatures:
+    """Per-table LRU of order signatures seen in the duplicate window"""
+
+    def __init__(self, window: int = DUPLICATE_WINDOW, max_tables: int = 10000):
+        # {(org_id, table_id): {signature: expiry_time}}
+        self._tables: "OrderedDict[Tuple[str, str], Dict[str, float]]" = OrderedDict()
+        self._stats = {"checked": 0, "duplicates_local": 0, "duplicates_redis": 0}
+
+        self.WINDOW = window
+        self.MAX_TABLES = max_tables
+
+        # Redis cache (RedisCache instance, injected on startup)
+        self.redis_client = None
+
+    def set_redis_client(self, redis_client):
+        """Set the Redis client for cross-instance detection"""
+        self.redis_client = redis_client
+
+    @staticmethod
+    def _redis_key(org_id: str, table_id: str, signature: str) -> str:
+        return f"order_sig:{org_id}:{table_id}:{signature}"
+
+    def _redis_available(self) -> bool:
+        return self.redis_client is not None and self.redis_client.is_connected()
+
+    def _table(self, org_id: str, table_id: str, now: float) -> Dict[str, float]:
+        key = (org_id, table_id)
+        signatures = self._tables.get(key)
+        if signatures is None:
+            signatures = self._tables[key] = {}
+            while len(self._tables) > self.MAX_TABLES:
+                self._tables.popitem(last=False)
+        else:
+            self._tables.move_to_end(key)
+            for signature in [s for s, expiry in signatures.items() if expiry <= now]:
+                del signatures[signature]
+        return signatures
+
+    async def claim(self, org_id: str, table_id: str, signature: str) -> bool:
+        """
+        Record an order signature for a table.
+
+        Returns False if the same signature was already seen for the table
+        within the window (a duplicate), True if it was claimed.
+        """
+        now = time.time()
+        self._stats["checked"] += 1
+        signatures = self._table(org_id, table_id, now)
+        if signature in signatures:
+            self._stats["duplicates_local"] += 1
+            return False
+
+        if self._redis_available():
+            try:
+                claimed = await self.redis_client.set_nx(
+                    self._redis_key(org_id, table_id, signature), "1", self.WINDOW
+                )
+                if claimed is False:
+                    signatures[signature] = now + self.WINDOW
+                    self._stats["duplicates_redis"] += 1
+                    return False
+            except Exception as e:
+                print(f"⚠️ Order signature Redis claim failed: {e}")
+
+        signatures[signature] = now + self.WINDOW
+        return True
+
+    async def release(self, org_id: str, table_id: str, signature: str):
+        """Forget a claimed signature when the order was not created"""
+        signatures = self._tables.get((org_id, table_id))
+        if signatures:
+            signatures.pop(signature, None)
+        if self._redis_available():
+            try:
+                await self.redis_client.delete(self._redis_key(org_id, table_id, signature))
+            except Exception as e:
+                print(f"⚠️ Order signature Redis release failed: {e}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {**self._stats, "tracked_tables": len(self._tables)}
+
+
+# Global instances
+_idempotency_store = IdempotencyStore()
+_recent_signatures = RecentOrderSignatures()
+
+
+def init_order_dedup(redis_client=None):
+    """Attach the Redis tier to the idempotency store and signature LRU"""
+    if redis_client:
+        _idempotency_store.set_redis_client(redis_client)
+        _recent_signatures.set_redis_client(redis_client)
+    print("✅ Order idempotency and duplicate detection initialized")
+
+
+def get_idempotency_store() -> IdempotencyStore:
+    """Get the global idempotency store"""
+    return _idempotency_store
+
+
+def get_recent_signatures() -> RecentOrderSignatures:
+    """Get the global recent order signature LRU"""
+    return _recent_signatures
@@ -20,12 +20,16 @@ PERFORMANCE TARGETS:
 import json
 import time
 import asyncio
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 from typing import Dict, List, Optional, Any, Tuple
 from collections import defaultdict
 from enum import Enum
 import hashlib
 
+from order_dates import created_range
+from sales_rollups import IST, get_sales_rollups
+
+
 class OrderState(Enum):
     """Order state enumeration for caching logic"""
     ACTIVE = "active"  # placed, confirmed, preparing
@@ -328,20 +332,26 @@ class OrderFastAccessCache:
                 return summary
         
         try:
-            # Get today's totals
-            today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
-            
-            completed_orders = await db.orders.find(
-                {
-                    "organization_id": org_id,
-                    "status": "completed",
-                    "created_at": {"$gte": today}
-                },
-                {"_id": 0, "total_amount": 1}
-            ).to_list(None)
-            
-            total_revenue = sum(order.get("total_amount", 0) for order in completed_orders)
-            orders_count = len(completed_orders)
+            # Today's totals from the daily rollup (no order scan)
+            rollups = get_sales_rollups()
+            if rollups.is_ready():
+                today = datetime.now(IST).strftime("%Y-%m-%d")
+                today_rollup = await rollups.summary(org_id, today, today)
+                total_revenue = today_rollup.get("revenue", {}).get("completed", 0)
+                orders_count = int(today_rollup.get("orders", {}).get("completed", 0))
+            else:
+                today = datetime.now(IST).replace(hour=0, minute=0, second=0, microsecond=0)
+                completed_orders = await db.orders.find(
+                    {
+                        "organization_id": org_id,
+                        "status": "completed",
+                        **created_range(today.astimezone(timezone.utc)),
+                    },
+                    {"_id": 0, "total": 1}
+                ).to_list(None)
+                
+                total_revenue = sum(order.get("total", 0) for order in completed_orders)
+                orders_count = len(completed_orders)
             
             summary = {
                 "total_revenue": total_revenue,
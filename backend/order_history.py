@@ -0,0 +1,129 @@
+"""
+Keyset-Paginated Order History
+==============================
+
+Browses an organization's orders newest first without skip/limit or
+``to_list(1000)``:
+- Pages are ordered by (created_at, id) descending and continue strictly
+  after the last order of the previous page, so page 500 costs the same
+  index seek as page 1
+- Cursors are opaque (URL-safe base64 of the last order's position);
+  clients pass back ``next_cursor`` unchanged
+- Optional status and date filters; order items are left out of the
+  projection unless ``include_items`` is set
+
+Sorting uses ``created_at_dt`` once the native date migration is done,
+and the ISO-string ``created_at`` until then (cursors work across the
+switch). From then on pages also read archived orders, limited to the
+archive months between the cursor and the start date.
+
+PERFORMANCE TARGETS:
+- Any page: one index range scan of ``limit + 1`` documents
+"""
+
+import base64
+import json
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+from order_archive import get_order_router
+from order_dates import CREATED_AT_DT, created_range, created_sort_field, parse_timestamp
+
+MAX_PAGE_SIZE = 200
+
+# Summary fields for history lists (items only on request)
+SUMMARY_PROJECTION = {"_id": 0, "items": 0, CREATED_AT_DT: 0}
+FULL_PROJECTION = {"_id": 0, CREATED_AT_DT: 0}
+
+
+def encode_cursor(created_at: Any, order_id: str) -> str:
+    """Opaque cursor for the position just after an order"""
+    if isinstance(created_at, datetime):
+        created_at = created_at.isoformat()
+    raw = json.dumps({"c": created_at, "i": order_id}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Dict[str, str]:
+    """Decode a cursor; raises ValueError if it was not produced by encode_cursor"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        data = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        if not isinstance(data.get("c"), str) or not isinstance(data.get("i"), str):
+            raise ValueError("incomplete cursor")
+        return {"created_at": data["c"], "id": data["i"]}
+    except (ValueError, TypeError, AttributeError) as e:
+        raise ValueError(f"Invalid cursor: {e}")
+
+
+def _keyset_filter(field: str, cursor: Dict[str, str]) -> Dict[str, Any]:
+    """Orders strictly after the cursor in (field desc, id desc) order"""
+    value: Any = cursor["created_at"]
+    if field == CREATED_AT_DT:
+        value = parse_timestamp(value)
+        if value is None:
+            raise ValueError("Invalid cursor: bad timestamp")
+    return {"$or": [
+        {field: {"$lt": value}},
+        {field: value, "id": {"$lt": cursor["id"]}},
+    ]}
+
+
+async def fetch_order_page(
+    db,
+    org_id: str,
+    limit: int = 50,
+    cursor: Optional[str] = None,
+    statuses: Optional[List[str]] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    include_items: bool = False,
+) -> Dict[str, Any]:
+    """
+    One page of an organization's order history, newest first.
+
+    Returns {"orders", "next_cursor", "has_more"}; ``next_cursor`` is None
+    on the last page. Raises ValueError for a malformed cursor.
+    """
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    field = created_sort_field()
+
+    conditions: List[Dict[str, Any]] = [{"organization_id": org_id}]
+    if statuses:
+        conditions.append({"status": statuses[0] if len(statuses) == 1 else {"$in": statuses}})
+    if start is not None or end is not None:
+        conditions.append(created_range(start, end))
+    elif field == CREATED_AT_DT:
+        # Orders whose string date could not be migrated have no position
+        conditions.append({CREATED_AT_DT: {"$type": "date"}})
+    if cursor:
+        position = decode_cursor(cursor)
+        conditions.append(_keyset_filter(field, position))
+        if field == CREATED_AT_DT:
+            # Nothing newer than the cursor can be on this page
+            after = parse_timestamp(position["created_at"]) + timedelta(microseconds=1)
+            end = after if end is None else min(end, after)
+    query = conditions[0] if len(conditions) == 1 else {"$and": conditions}
+
+    # The sort key has to come back even though the date mirror is hidden
+    projection = dict(SUMMARY_PROJECTION if not include_items else FULL_PROJECTION)
+    if field == CREATED_AT_DT:
+        projection.pop(CREATED_AT_DT)
+
+    sort = [(field, -1), ("id", -1)]
+    router = get_order_router()
+    if field == CREATED_AT_DT and router is not None:
+        docs = await router.find(query, projection, sort=sort, limit=limit + 1, start=start, end=end)
+    else:
+        docs = await db.orders.find(query, projection).sort(sort).limit(limit + 1).to_list(limit + 1)
+
+    has_more = len(docs) > limit
+    docs = docs[:limit]
+    next_cursor = None
+    if has_more and docs:
+        last = docs[-1]
+        next_cursor = encode_cursor(last.get(field), last["id"])
+    for doc in docs:
+        doc.pop(CREATED_AT_DT, None)
+
+    return {"orders": docs, "next_cursor": next_cursor, "has_more": has_more}
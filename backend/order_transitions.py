@@ -0,0 +1,245 @@
+"""
+Order Status Transitions & Optimistic Concurrency
+=================================================
+
+Every order write increments ``version`` (orders written before
+versioning count as version 0). Writers that send the version they
+read (``If-Match``) are rejected at the database if anyone wrote in
+between, instead of silently overwriting:
+- version_filter / parse_if_match: conditional-update building blocks
+- compare_and_set_status: one find_one_and_update that validates the
+  transition, checks the version and skips no-op writes (double taps),
+  so side effects only run for the request that actually changed it
+- conditional_update: versioned field update for order edits
+- status_times: when an order last entered preparing / ready, for
+  kitchen (prep-to-ready) timing
+
+Bulk transitions move many orders of one organization to new statuses
+in a fixed number of round trips, e.g. a kitchen marking a whole ticket
+rail ready:
+- One read of every requested order
+- Per-order validation against the allowed transitions
+- One ``bulk_write``; each update is guarded on the status and version
+  it was validated against, so a concurrent change turns into a
+  ``conflict`` result instead of being overwritten
+- Only when some guards miss, one re-read to tell which ones
+
+Table release and cache patching are left to the caller, which gets the
+transitioned orders back in their new state.
+"""
+
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+from pymongo import ReturnDocument, UpdateOne
+
+ORDER_STATUSES = ("pending", "preparing", "ready", "completed", "cancelled")
+TERMINAL_STATUSES = ("completed", "cancelled", "paid")
+# Statuses that free the order's table
+RELEASING_STATUSES = ("completed", "cancelled")
+# Statuses whose entry time is kept in ``status_times`` (kitchen timing)
+TIMED_STATUSES = ("preparing", "ready")
+
+ALLOWED_TRANSITIONS = {
+    "pending": {"preparing", "ready", "completed", "cancelled"},
+    "preparing": {"pending", "ready", "completed", "cancelled"},
+    "ready": {"preparing", "completed", "cancelled"},
+}
+
+# Per-order result codes
+UPDATED = "updated"
+UNCHANGED = "unchanged"
+NOT_FOUND = "not_found"
+INVALID = "invalid_transition"
+CONFLICT = "conflict"
+
+
+def parse_if_match(value: Optional[str]) -> Optional[int]:
+    """Order version from an If-Match header ('3', '"3"' or 'W/"3"'); raises ValueError"""
+    if value is None or not value.strip():
+        return None
+    value = value.strip()
+    if value.startswith("W/"):
+        value = value[2:]
+    return int(value.strip('"'))
+
+
+def order_etag(order: Dict[str, Any]) -> str:
+    return f'"{order.get("version", 0)}"'
+
+
+def version_filter(expected_version: Optional[int]) -> Dict[str, Any]:
+    """Query condition for an order still at ``expected_version``"""
+    if expected_version is None:
+        return {}
+    if expected_version == 0:
+        # Written before versioning: no version field yet
+        return {"version": {"$in": [0, None]}}
+    return {"version": expected_version}
+
+
+def status_times_update(target: str, at: str) -> Dict[str, str]:
+    """$set fields recording when an order (last) entered ``target``"""
+    return {f"status_times.{target}": at} if target in TIMED_STATUSES else {}
+
+
+def validate_transition(current: Optional[str], target: str) -> Optional[str]:
+    """Why an order can't move from ``current`` to ``target`` (None if it can)"""
+    if target not in ORDER_STATUSES:
+        return f"Unknown status '{target}'"
+    if current in TERMINAL_STATUSES:
+        return f"Order is already {current}"
+    allowed = ALLOWED_TRANSITIONS.get(current)
+    if allowed is not None and target not in allowed:
+        return f"Cannot change status from {current} to {target}"
+    return None
+
+
+async def bulk_transition(db, org_id: str, updates: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Apply ``[{"order_id", "status"}, ...]`` to an organization's orders.
+
+    Returns {"results": [...], "transitioned": [order, ...]} where results
+    has one entry per update (in request order) and transitioned holds
+    the updated orders with their new status and updated_at.
+    """
+    targets: Dict[str, str] = {}
+    results: Dict[str, Dict[str, Any]] = {}
+    order_ids: List[str] = []
+    for update in updates:
+        order_id, target = update.get("order_id"), update.get("status")
+        if not order_id or not target:
+            continue
+        if order_id not in targets:
+            order_ids.append(order_id)
+        # The last update for an order wins
+        targets[order_id] = target
+
+    orders = await db.orders.find(
+        {"id": {"$in": order_ids}, "organization_id": org_id}, {"_id": 0}
+    ).to_list(len(order_ids))
+    orders_by_id = {order["id"]: order for order in orders}
+
+    updated_at = datetime.now(timezone.utc).isoformat()
+    planned: List[Dict[str, Any]] = []
+    operations = []
+    for order_id in order_ids:
+        target = targets[order_id]
+        order = orders_by_id.get(order_id)
+        result = {"order_id": order_id, "to": target}
+        results[order_id] = result
+        if order is None:
+            result.update(result=NOT_FOUND, error="Order not found")
+            continue
+
+        current = order.get("status")
+        result["from"] = current
+        if current == target:
+            result["result"] = UNCHANGED
+            continue
+        error = validate_transition(current, target)
+        if error:
+            result.update(result=INVALID, error=error)
+            continue
+
+        planned_order = {**order, "status": target, "updated_at": updated_at, "version": order.get("version", 0) + 1}
+        if target in TIMED_STATUSES:
+            planned_order["status_times"] = {**(order.get("status_times") or {}), target: updated_at}
+        planned.append(planned_order)
+        operations.append(UpdateOne(
+            {"id": order_id, "organization_id": org_id, "status": current, **version_filter(order.get("version", 0))},
+            {
+                "$set": {"status": target, "updated_at": updated_at, **status_times_update(target, updated_at)},
+                "$inc": {"version": 1},
+            },
+        ))
+
+    transitioned = planned
+    if operations:
+        write = await db.orders.bulk_write(operations, ordered=False)
+        if write.modified_count < len(operations):
+            # Some orders changed since they were read: find out which
+            current_docs = await db.orders.find(
+                {"id": {"$in": [order["id"] for order in planned]}, "organization_id": org_id},
+                {"_id": 0, "id": 1, "status": 1, "updated_at": 1},
+            ).to_list(len(planned))
+            applied = {
+                doc["id"] for doc in current_docs
+                if doc.get("updated_at") == updated_at and doc.get("status") == targets[doc["id"]]
+            }
+            transitioned = [order for order in planned if order["id"] in applied]
+
+    applied_ids = {order["id"] for order in transitioned}
+    for order in planned:
+        result = results[order["id"]]
+        if order["id"] in applied_ids:
+            result["result"] = UPDATED
+        else:
+            result.update(result=CONFLICT, error="Order was changed by another request, reload and retry")
+
+    return {
+        "results": [results[order_id] for order_id in order_ids],
+        "transitioned": transitioned,
+    }
+
+
+async def compare_and_set_status(
+    db, org_id: str, order_id: str, target: str, expected_version: Optional[int] = None
+) -> Tuple[str, Optional[Dict[str, Any]]]:
+    """
+    Move one order to ``target`` if the transition is valid, the order is
+    not already there and (when given) it is still at ``expected_version``.
+
+    Returns (result, order): UPDATED with the order after the write, or
+    UNCHANGED / CONFLICT / INVALID with its current state, or NOT_FOUND.
+    The happy path is a single round trip.
+    """
+    if target not in ORDER_STATUSES:
+        return INVALID, None
+    blocked = [status for status in set(ORDER_STATUSES + TERMINAL_STATUSES)
+               if status == target or validate_transition(status, target)]
+
+    now = datetime.now(timezone.utc).isoformat()
+    order = await db.orders.find_one_and_update(
+        {
+            "id": order_id,
+            "organization_id": org_id,
+            "status": {"$nin": blocked},
+            **version_filter(expected_version),
+        },
+        {
+            "$set": {"status": target, "updated_at": now, **status_times_update(target, now)},
+            "$inc": {"version": 1},
+        },
+        projection={"_id": 0},
+        return_document=ReturnDocument.AFTER,
+    )
+    if order is not None:
+        return UPDATED, order
+
+    # Nothing written: find out why
+    current = await db.orders.find_one({"id": order_id, "organization_id": org_id}, {"_id": 0})
+    if current is None:
+        return NOT_FOUND, None
+    if expected_version is not None and current.get("version", 0) != expected_version:
+        return CONFLICT, current
+    if current.get("status") == target:
+        return UNCHANGED, current
+    return INVALID, current
+
+
+async def conditional_update(
+    db, org_id: str, order_id: str, fields: Dict[str, Any], expected_version: int
+) -> Optional[Dict[str, Any]]:
+    """
+    Set ``fields`` on an order only if it is still at ``expected_version``.
+
+    Returns the order after the write, or None if it was changed (or
+    deleted) in the meantime.
+    """
+    return await db.orders.find_one_and_update(
+        {"id": order_id, "organization_id": org_id, **version_filter(expected_version)},
+        {"$set": fields, "$inc": {"version": 1}},
+        projection={"_id": 0},
+        return_document=ReturnDocument.AFTER,
+    )
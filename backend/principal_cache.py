@@ -0,0 +1,204 @@
+"""
+Authenticated Principal Cache
+=============================
+
+Caches the user document resolved by ``get_current_user`` so the
+per-request ``db.users.find_one({"id": user_id})`` is served from memory:
+- Tier 1: bounded in-process LRU (per worker)
+- Tier 2: Redis (shared across instances)
+- Tier 3: MongoDB
+
+Entries are invalidated explicitly whenever a user document, a staff
+member's organization link or the business settings change. The password
+hash is never cached.
+
+PERFORMANCE TARGETS:
+- Local hit: <1ms (vs MongoDB: 20-100ms)
+- Redis hit: <10ms
+"""
+
+import json
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Optional
+
+from cache_coherence import get_cache_coherence
+
+# Fields never stored in the principal cache
+_EXCLUDED_FIELDS = ("password",)
+
+
+class PrincipalCache:
+    """Bounded LRU + Redis cache of authenticated user documents"""
+
+    def __init__(self, max_entries: int = 5000, local_ttl: int = 60, redis_ttl: int = 600):
+        # Local LRU (tier 1): {user_id: (user_dict, expiry_time)}
+        self._local_cache: "OrderedDict[str, tuple]" = OrderedDict()
+        self._stats = {
+            "local_hits": 0,
+            "redis_hits": 0,
+            "misses": 0,
+            "invalidations": 0,
+            "evictions": 0,
+        }
+
+        # Cache configuration
+        self.MAX_ENTRIES = max_entries
+        self.LOCAL_TTL = local_ttl
+        self.REDIS_TTL = redis_ttl
+
+        # Redis cache (RedisCache instance, injected on startup)
+        self.redis_client = None
+
+    def set_redis_client(self, redis_client):
+        """Set the Redis client for distributed caching"""
+        self.redis_client = redis_client
+
+    @staticmethod
+    def _redis_key(user_id: str) -> str:
+        return f"principal:{user_id}"
+
+    def _redis_available(self) -> bool:
+        return self.redis_client is not None and self.redis_client.is_connected()
+
+    def _store_local(self, user_id: str, user: Dict[str, Any]):
+        self._local_cache[user_id] = (user, time.time() + self.LOCAL_TTL)
+        self._local_cache.move_to_end(user_id)
+        while len(self._local_cache) > self.MAX_ENTRIES:
+            self._local_cache.popitem(last=False)
+            self._stats["evictions"] += 1
+
+    async def get_user(self, user_id: str, db) -> Optional[Dict[str, Any]]:
+        """
+        Get a user document by id.
+
+        Returns a copy so callers can mutate it (get_current_user applies
+        defaults) without corrupting the cached entry.
+        """
+        # Tier 1: local LRU
+        entry = self._local_cache.get(user_id)
+        if entry is not None:
+            user, expiry = entry
+            if time.time() < expiry:
+                self._local_cache.move_to_end(user_id)
+                self._stats["local_hits"] += 1
+                return dict(user)
+            del self._local_cache[user_id]
+
+        # Tier 2: Redis
+        if self._redis_available():
+            try:
+                cached = await self.redis_client.get(self._redis_key(user_id))
+                if cached:
+                    user = json.loads(cached)
+                    self._store_local(user_id, user)
+                    self._stats["redis_hits"] += 1
+                    return dict(user)
+            except Exception as e:
+                print(f"⚠️ Principal cache Redis read failed: {e}")
+
+        # Tier 3: MongoDB
+        self._stats["misses"] += 1
+        projection = {"_id": 0}
+        projection.update({field: 0 for field in _EXCLUDED_FIELDS})
+        user = await db.users.find_one({"id": user_id}, projection)
+        if user is None:
+            return None
+
+        self._store_local(user_id, user)
+        if self._redis_available():
+            try:
+                await self.redis_client.setex(
+                    self._redis_key(user_id), self.REDIS_TTL, json.dumps(user, default=str)
+                )
+            except Exception as e:
+                print(f"⚠️ Principal cache Redis write failed: {e}")
+
+        return dict(user)
+
+    async def invalidate(self, *user_ids: str):
+        """Drop one or more users from every cache tier"""
+        user_ids = [uid for uid in user_ids if uid]
+        if not user_ids:
+            return
+
+        self.evict_local(*user_ids)
+        self._stats["invalidations"] += len(user_ids)
+
+        if self._redis_available():
+            try:
+                await self.redis_client.delete(*[self._redis_key(uid) for uid in user_ids])
+            except Exception as e:
+                print(f"⚠️ Principal cache Redis invalidation failed: {e}")
+
+        # Let other instances drop their local copies (pub/sub fallback mode)
+        await get_cache_coherence().announce("users", None, *user_ids)
+
+    def evict_local(self, *user_ids: str):
+        """Drop users from this instance's LRU only (coherence events)"""
+        for user_id in user_ids:
+            self._local_cache.pop(user_id, None)
+
+    async def invalidate_organization(self, org_id: str, db=None, extra_user_ids: Iterable[str] = ()):
+        """
+        Drop the admin and every staff member of an organization.
+
+        Staff ids are resolved from MongoDB when a database handle is given,
+        otherwise only locally cached members are dropped.
+        """
+        user_ids = {org_id, *extra_user_ids}
+        user_ids.update(
+            uid for uid, (user, _) in self._local_cache.items()
+            if user.get("organization_id") == org_id
+        )
+        if db is not None:
+            try:
+                staff = await db.users.find(
+                    {"organization_id": org_id}, {"_id": 0, "id": 1}
+                ).to_list(None)
+                user_ids.update(member["id"] for member in staff if member.get("id"))
+            except Exception as e:
+                print(f"⚠️ Principal cache organization lookup failed: {e}")
+
+        await self.invalidate(*user_ids)
+
+    def get_cache_stats(self) -> Dict[str, Any]:
+        """Get hit/miss counters"""
+        hits = self._stats["local_hits"] + self._stats["redis_hits"]
+        total_requests = hits + self._stats["misses"]
+        hit_rate = (hits / total_requests * 100) if total_requests > 0 else 0
+
+        return {
+            "total_requests": total_requests,
+            "cache_hits": hits,
+            "local_hits": self._stats["local_hits"],
+            "redis_hits": self._stats["redis_hits"],
+            "cache_misses": self._stats["misses"],
+            "hit_rate": f"{hit_rate:.2f}%",
+            "invalidations": self._stats["invalidations"],
+            "evictions": self._stats["evictions"],
+            "local_cache_size": len(self._local_cache),
+            "max_entries": self.MAX_ENTRIES,
+        }
+
+    def clear_all(self):
+        """Clear the local tier (for maintenance/testing)"""
+        self._local_cache.clear()
+        print("🗑️ Principal cache cleared")
+
+
+# Global instance
+_principal_cache = PrincipalCache()
+
+
+def init_principal_cache(redis_client=None) -> PrincipalCache:
+    """Attach the Redis tier to the principal cache"""
+    if redis_client:
+        _principal_cache.set_redis_client(redis_client)
+    print("✅ Principal cache initialized")
+    return _principal_cache
+
+
+def get_principal_cache() -> PrincipalCache:
+    """Get the global principal cache instance"""
+    return _principal_cache
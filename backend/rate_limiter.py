@@ -0,0 +1,375 @@
+"""
+Local Token-Bucket Rate Limiter
+===============================
+
+Pure-ASGI rate limiting that never touches the network on the request path:
+- Per-client, per-route-prefix token buckets kept in process. A client is
+  the authenticated user when the app can identify one (``identify``),
+  otherwise the client IP
+- Behind nginx the peer address is the proxy, so the client IP is taken
+  from X-Forwarded-For / X-Real-IP, but only when the peer is a trusted
+  proxy; anyone else could set those headers to dodge their limit
+- A background task syncs hit counts to Redis every few hundred
+  milliseconds in one batched round trip (INCRBY + MGET)
+- Cross-instance limits use a sliding-window counter: the previous
+  window's global count is weighted by how much of it still overlaps
+- Without Redis the local buckets alone enforce the limits
+
+CONFIGURATION (environment):
+- RATE_LIMIT_RULES: "name:prefix:limit/window;..." e.g.
+  "auth:/api/auth/:10/60;orders:/api/orders/:200/60"
+- RATE_LIMIT_DEFAULT: "limit/window" for all other paths (default 100/60)
+- RATE_LIMIT_SYNC_MS: Redis sync interval (default 250)
+- TRUSTED_PROXIES: comma-separated proxy addresses/networks whose
+  forwarding headers are believed (default: loopback and private ranges)
+"""
+
+import asyncio
+import ipaddress
+import json
+import os
+import time
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Tuple, Union
+
+# Paths never rate limited (health checks and monitoring probes)
+EXEMPT_PATHS = {"/health", "/api/health", "/api/monitoring/health", "/nginx_status"}
+
+
+@dataclass(frozen=True)
+class RateLimitRule:
+    """Requests allowed per window for paths under a prefix"""
+    name: str
+    prefix: str
+    limit: int
+    window: int
+    message: str = "Rate limit exceeded"
+
+    def matches(self, path: str) -> bool:
+        return path.startswith(self.prefix) or path == self.prefix.rstrip("/")
+
+
+DEFAULT_RULES = [
+    RateLimitRule("auth", "/api/auth/", 10, 60, "Too many authentication requests"),
+    RateLimitRule("orders", "/api/orders/", 200, 60, "Too many order requests"),
+    RateLimitRule("public", "/api/public/", 120, 60, "Too many requests"),
+    RateLimitRule("public_menu", "/r/", 120, 60, "Too many requests"),
+]
+DEFAULT_FALLBACK = RateLimitRule("general", "/", 100, 60)
+
+DEFAULT_TRUSTED_PROXIES = "127.0.0.0/8,::1/128,10.0.0.0/8,172.16.0.0/12,192.168.0.0/16"
+
+IPNetwork = Union[ipaddress.IPv4Network, ipaddress.IPv6Network]
+
+
+def parse_rules(spec: Optional[str]) -> List[RateLimitRule]:
+    """Parse RATE_LIMIT_RULES ("name:prefix:limit/window;...")"""
+    if not spec:
+        return list(DEFAULT_RULES)
+
+    rules = []
+    for entry in spec.split(";"):
+        entry = entry.strip()
+        if not entry:
+            continue
+        try:
+            name, prefix, quota = entry.split(":", 2)
+            limit, window = quota.split("/", 1)
+            rules.append(RateLimitRule(name.strip(), prefix.strip(), int(limit), int(window)))
+        except ValueError:
+            print(f"⚠️ Ignoring invalid rate limit rule: {entry}")
+    return rules or list(DEFAULT_RULES)
+
+
+def parse_quota(spec: Optional[str], fallback: RateLimitRule) -> RateLimitRule:
+    """Parse RATE_LIMIT_DEFAULT ("limit/window")"""
+    if not spec:
+        return fallback
+    try:
+        limit, window = spec.split("/", 1)
+        return RateLimitRule(fallback.name, fallback.prefix, int(limit), int(window), fallback.message)
+    except ValueError:
+        print(f"⚠️ Ignoring invalid default rate limit: {spec}")
+        return fallback
+
+
+def parse_networks(spec: Optional[str]) -> List[IPNetwork]:
+    """Parse TRUSTED_PROXIES ("addr-or-cidr,...")"""
+    networks = []
+    for entry in (spec or "").split(","):
+        entry = entry.strip()
+        if not entry:
+            continue
+        try:
+            networks.append(ipaddress.ip_network(entry, strict=False))
+        except ValueError:
+            print(f"⚠️ Ignoring invalid trusted proxy: {entry}")
+    return networks
+
+
+def _is_trusted(address: str, trusted: List[IPNetwork]) -> bool:
+    try:
+        ip = ipaddress.ip_address(address.strip())
+    except ValueError:
+        return False
+    return any(ip in network for network in trusted)
+
+
+def client_ip(scope, trusted: List[IPNetwork]) -> str:
+    """
+    The requesting client's IP.
+
+    Forwarding headers only count when the peer is a trusted proxy; the
+    client is then the right-most X-Forwarded-For hop that isn't itself a
+    trusted proxy (hops left of it are client-supplied), else X-Real-IP.
+    """
+    client = scope.get("client")
+    peer = client[0] if client else "unknown"
+    if not _is_trusted(peer, trusted):
+        return peer
+
+    forwarded_for, real_ip = None, None
+    for name, value in scope.get("headers") or ():
+        if name == b"x-forwarded-for":
+            forwarded_for = value.decode("latin-1")
+        elif name == b"x-real-ip":
+            real_ip = value.decode("latin-1").strip()
+
+    if forwarded_for:
+        for hop in reversed(forwarded_for.split(",")):
+            hop = hop.strip()
+            if hop and not _is_trusted(hop, trusted):
+                return hop
+    return real_ip or peer
+
+
+class _Bucket:
+    """Token bucket plus the last synced sliding-window counts"""
+    __slots__ = ("tokens", "updated", "pending", "window_id", "current", "previous", "last_seen")
+
+    def __init__(self, capacity: int, now: float, window_id: int):
+        self.tokens = float(capacity)
+        self.updated = now
+        self.pending = 0  # local hits not yet pushed to Redis
+        self.window_id = window_id
+        self.current = 0  # global count of window_id (as of last sync)
+        self.previous = 0  # global count of window_id - 1
+        self.last_seen = now
+
+
+class RateLimiter:
+    """In-process token buckets with batched Redis sliding-window sync"""
+
+    def __init__(self, rules: List[RateLimitRule], default_rule: RateLimitRule,
+                 sync_interval: float = 0.25, max_keys: int = 50000):
+        # Longest prefix wins
+        self.rules = sorted(rules, key=lambda r: len(r.prefix), reverse=True)
+        self.default_rule = default_rule
+        self.sync_interval = sync_interval
+        self.max_keys = max_keys
+
+        self._buckets: Dict[Tuple[str, str], _Bucket] = {}
+        self._redis = None
+        self._sync_task: Optional[asyncio.Task] = None
+        self._stats = {"allowed": 0, "limited_local": 0, "limited_global": 0, "syncs": 0, "sync_errors": 0}
+
+    def rule_for(self, path: str) -> RateLimitRule:
+        for rule in self.rules:
+            if rule.matches(path):
+                return rule
+        return self.default_rule
+
+    def _rules_by_name(self) -> Dict[str, RateLimitRule]:
+        rules = {rule.name: rule for rule in self.rules}
+        rules[self.default_rule.name] = self.default_rule
+        return rules
+
+    def hit(self, client_key: str, path: str) -> Tuple[bool, RateLimitRule, int]:
+        """
+        Record a request of a client ("user:<id>" or "ip:<addr>").
+        Returns (allowed, rule, retry_after_seconds).
+        Pure in-memory: safe to call on every request.
+        """
+        rule = self.rule_for(path)
+        now = time.time()
+        window_id = int(now // rule.window)
+        key = (rule.name, client_key)
+
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            if len(self._buckets) >= self.max_keys:
+                self._evict_idle(now)
+            bucket = _Bucket(rule.limit, now, window_id)
+            self._buckets[key] = bucket
+        bucket.last_seen = now
+
+        # Roll the synced sliding-window counts forward locally
+        if window_id != bucket.window_id:
+            bucket.previous = bucket.current if window_id == bucket.window_id + 1 else 0
+            bucket.current = 0
+            bucket.window_id = window_id
+
+        # Local token bucket: capacity = limit, refilled evenly over the window
+        refill_rate = rule.limit / rule.window
+        bucket.tokens = min(rule.limit, bucket.tokens + (now - bucket.updated) * refill_rate)
+        bucket.updated = now
+        if bucket.tokens < 1:
+            self._stats["limited_local"] += 1
+            return False, rule, max(1, int((1 - bucket.tokens) / refill_rate))
+
+        # Cross-instance sliding window (counts from the last background sync)
+        if self._redis is not None and self._redis.is_connected():
+            overlap = 1 - (now % rule.window) / rule.window
+            estimate = bucket.previous * overlap + bucket.current + bucket.pending
+            if estimate >= rule.limit:
+                self._stats["limited_global"] += 1
+                return False, rule, max(1, int(rule.window - now % rule.window))
+
+        bucket.tokens -= 1
+        bucket.pending += 1
+        self._stats["allowed"] += 1
+        return True, rule, 0
+
+    def _evict_idle(self, now: float):
+        """Drop buckets that have been idle for two windows"""
+        rules = self._rules_by_name()
+        for key in list(self._buckets.keys()):
+            bucket = self._buckets[key]
+            rule = rules.get(key[0], self.default_rule)
+            if bucket.pending == 0 and now - bucket.last_seen > 2 * rule.window:
+                del self._buckets[key]
+
+    # ============ REDIS SYNC ============
+
+    async def sync_once(self):
+        """Push pending hits and pull global window counts in one round trip"""
+        if self._redis is None or not self._redis.is_connected() or not self._buckets:
+            return
+
+        now = time.time()
+        rules = self._rules_by_name()
+        increments: Dict[str, int] = {}
+        read_keys: List[str] = []
+        flushed: List[Tuple[_Bucket, str, str, int, int]] = []
+        max_window = 0
+
+        for (rule_name, client_key), bucket in list(self._buckets.items()):
+            rule = rules.get(rule_name, self.default_rule)
+            max_window = max(max_window, rule.window)
+            window_id = int(now // rule.window)
+            current_key = f"rate_limit:{rule_name}:{client_key}:{window_id}"
+            previous_key = f"rate_limit:{rule_name}:{client_key}:{window_id - 1}"
+            pending = bucket.pending
+            if pending:
+                increments[current_key] = pending
+            else:
+                read_keys.append(current_key)
+            read_keys.append(previous_key)
+            flushed.append((bucket, current_key, previous_key, pending, window_id))
+
+        incremented, read = await self._redis.sync_window_counters(increments, read_keys, ttl=2 * max_window)
+        if not incremented and not read:
+            self._stats["sync_errors"] += 1
+            return
+
+        for bucket, current_key, previous_key, pending, window_id in flushed:
+            bucket.pending = max(0, bucket.pending - pending)
+            if bucket.window_id not in (window_id, window_id - 1):
+                continue
+            current = incremented.get(current_key, read.get(current_key, 0))
+            bucket.window_id = window_id
+            bucket.current = current
+            bucket.previous = read.get(previous_key, 0)
+
+        self._stats["syncs"] += 1
+        self._evict_idle(now)
+
+    async def _sync_loop(self):
+        while True:
+            await asyncio.sleep(self.sync_interval)
+            try:
+                await self.sync_once()
+            except Exception as e:
+                self._stats["sync_errors"] += 1
+                print(f"⚠️ Rate limit sync error: {e}")
+
+    def start(self, redis_client=None):
+        """Attach Redis and start the background sync task"""
+        self._redis = redis_client
+        if self._sync_task is None and redis_client is not None:
+            self._sync_task = asyncio.create_task(self._sync_loop())
+        print(f"✅ Rate limiter started ({'Redis sync' if redis_client else 'local only'})")
+
+    async def stop(self):
+        if self._sync_task:
+            self._sync_task.cancel()
+            self._sync_task = None
+
+    def get_stats(self) -> Dict[str, object]:
+        return {
+            **self._stats,
+            "tracked_keys": len(self._buckets),
+            "rules": {rule.name: f"{rule.prefix} {rule.limit}/{rule.window}s" for rule in self.rules},
+            "default": f"{self.default_rule.limit}/{self.default_rule.window}s",
+        }
+
+
+class RateLimitMiddleware:
+    """
+    Pure-ASGI middleware enforcing the local rate limiter.
+
+    ``identify(scope)`` returns the authenticated user id of a request, or
+    None; identified requests are limited per user, the rest per client IP.
+    """
+
+    def __init__(self, app, limiter: Optional[RateLimiter] = None,
+                 identify: Optional[Callable[[dict], Optional[str]]] = None,
+                 trusted_proxies: Optional[List[IPNetwork]] = None):
+        self.app = app
+        self.limiter = limiter or get_rate_limiter()
+        self.identify = identify
+        self.trusted_proxies = (
+            trusted_proxies if trusted_proxies is not None
+            else parse_networks(os.getenv("TRUSTED_PROXIES", DEFAULT_TRUSTED_PROXIES))
+        )
+
+    def client_key(self, scope) -> str:
+        user_id = self.identify(scope) if self.identify else None
+        if user_id:
+            return f"user:{user_id}"
+        return f"ip:{client_ip(scope, self.trusted_proxies)}"
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in EXEMPT_PATHS or scope["method"] == "OPTIONS":
+            await self.app(scope, receive, send)
+            return
+
+        allowed, rule, retry_after = self.limiter.hit(self.client_key(scope), scope["path"])
+        if allowed:
+            await self.app(scope, receive, send)
+            return
+
+        body = json.dumps({"detail": rule.message}).encode()
+        await send({
+            "type": "http.response.start",
+            "status": 429,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", str(retry_after).encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
+
+
+# Global instance
+_rate_limiter = RateLimiter(
+    parse_rules(os.getenv("RATE_LIMIT_RULES")),
+    parse_quota(os.getenv("RATE_LIMIT_DEFAULT"), DEFAULT_FALLBACK),
+    sync_interval=int(os.getenv("RATE_LIMIT_SYNC_MS", "250")) / 1000,
+)
+
+
+def get_rate_limiter() -> RateLimiter:
+    """Get the global rate limiter instance"""
+    return _rate_limiter
@@ -8,10 +8,51 @@ import json
 import os
 import asyncio
 import aiohttp
-from typing import Dict, List, Optional, Any
+from typing import Dict, List, Optional, Any, Tuple
 from datetime import datetime, timedelta
 import redis.asyncio as redis
 from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import UpdateOne
+
+from active_orders_view import ActiveOrdersView, compact_order
+from cache_codec import CacheCodecError, get_cache_codec
+from cache_coherence import get_cache_coherence
+from event_stream import get_event_bus
+from order_dates import created_range, created_sort_field
+
+# Versioned hash merge (see RedisCache.hmerge_versioned). Values arrive
+# prefixed with "1" so an empty string can mean "remove"; a removal wins
+# a version tie, a snapshot (build) never overwrites an equal version.
+HMERGE_VERSIONED_SCRIPT = """
+local key = KEYS[1]
+local build = ARGV[1] == "1"
+local ttl = tonumber(ARGV[2])
+if ARGV[3] ~= "" then
+  redis.call("HSET", key, ARGV[3], ARGV[4])
+end
+local applied = 0
+for i = 5, #ARGV, 3 do
+  local field, version, value = ARGV[i], tonumber(ARGV[i + 1]), ARGV[i + 2]
+  local stored = tonumber(redis.call("HGET", key, "v:" .. field))
+  local write = stored == nil or version > stored
+  if not write and version == stored then
+    write = value == "" or (not build and redis.call("HEXISTS", key, field) == 1)
+  end
+  if write then
+    redis.call("HSET", key, "v:" .. field, ARGV[i + 1])
+    if value == "" then
+      redis.call("HDEL", key, field)
+    else
+      redis.call("HSET", key, field, string.sub(value, 2))
+    end
+    applied = applied + 1
+  end
+end
+if ttl > 0 then
+  redis.call("EXPIRE", key, ttl)
+end
+return applied
+"""
 
 class UpstashRedisCache:
     """Upstash Redis REST API client for serverless Redis"""
@@ -80,23 +121,45 @@ class UpstashRedisCache:
         """Check if Upstash Redis is connected"""
         return self.connected and self.session is not None
     
+    async def _request(self, command: List[str]) -> Any:
+        """Execute a Redis command via Upstash REST API; raises on transport or server errors"""
+        async with self.session.post(self.rest_url, json=command) as response:
+            if response.status != 200:
+                error_text = await response.text()
+                raise RuntimeError(f"Upstash command failed: {response.status} - {error_text}")
+            data = await response.json()
+            if data.get("error"):
+                raise RuntimeError(f"Upstash command failed: {data['error']}")
+            return data.get("result")
+    
     async def _execute_command(self, command: List[str]) -> Any:
-        """Execute a Redis command via Upstash REST API"""
+        """Execute a Redis command via Upstash REST API (None on errors)"""
         if not self.is_connected():
             return None
             
         try:
-            async with self.session.post(self.rest_url, json=command) as response:
+            return await self._request(command)
+        except Exception as e:
+            print(f"❌ Upstash command error: {e}")
+            return None
+    
+    async def _execute_pipeline(self, commands: List[List[str]]) -> List[Any]:
+        """Execute several Redis commands in one Upstash REST round trip"""
+        if not self.is_connected() or not commands:
+            return []
+            
+        try:
+            async with self.session.post(f"{self.rest_url}/pipeline", json=commands) as response:
                 if response.status == 200:
                     data = await response.json()
-                    return data.get("result")
+                    return [item.get("result") for item in data]
                 else:
                     error_text = await response.text()
-                    print(f"❌ Upstash command failed: {response.status} - {error_text}")
-                    return None
+                    print(f"❌ Upstash pipeline failed: {response.status} - {error_text}")
+                    return []
         except Exception as e:
-            print(f"❌ Upstash command error: {e}")
-            return None
+            print(f"❌ Upstash pipeline error: {e}")
+            return []
     
     async def get(self, key: str) -> Optional[str]:
         """Get value from Upstash Redis"""
@@ -116,6 +179,22 @@ class UpstashRedisCache:
         result = await self._execute_command(["SETEX", key, str(time), value])
         return result == "OK"
     
+    async def set_nx(self, key: str, value: str, time: int) -> Optional[bool]:
+        """
+        Set value with expiration only if the key does not exist.
+
+        True if set, False if the key exists, None on errors (a failed
+        request must not read as "already claimed").
+        """
+        if not self.is_connected():
+            return None
+        try:
+            result = await self._request(["SET", key, value, "EX", str(time), "NX"])
+        except Exception as e:
+            print(f"❌ Upstash set_nx error: {e}")
+            return None
+        return result == "OK"
+    
     async def delete(self, *keys: str) -> int:
         """Delete keys from Upstash Redis"""
         if not keys:
@@ -307,6 +386,51 @@ class RedisCache:
             print(f"❌ Redis setex error: {e}")
         return False
     
+    async def get_entity(self, key: str) -> Optional[Any]:
+        """Get and decode a cached entity (None on a miss or an entry this instance can't read)"""
+        cached_data = await self.get(key)
+        if not cached_data:
+            return None
+        try:
+            return get_cache_codec().decode(cached_data)
+        except CacheCodecError as e:
+            print(f"⚠️ {e} for {key}, treating as cache miss")
+            return None
+
+    async def get_entity_json(self, key: str) -> Optional[bytes]:
+        """A cached entity as JSON bytes, without decoding it when the codec allows"""
+        cached_data = await self.get(key)
+        if not cached_data:
+            return None
+        try:
+            return get_cache_codec().to_json(cached_data)
+        except CacheCodecError as e:
+            print(f"⚠️ {e} for {key}, treating as cache miss")
+            return None
+
+    async def set_entity(self, key: str, ttl: int, value: Any) -> bool:
+        """Encode and cache an entity with expiration"""
+        return await self.setex(key, ttl, get_cache_codec().encode(value))
+    
+    async def set_nx(self, key: str, value: str, time: int) -> Optional[bool]:
+        """
+        Set value with expiration only if the key does not exist.
+
+        Returns True if the key was set, False if it already existed and
+        None when Redis is unavailable.
+        """
+        if not self.is_connected():
+            return None
+        
+        try:
+            if self.use_upstash and self.upstash:
+                return await self.upstash.set_nx(key, value, time)
+            elif self.redis:
+                return bool(await self.redis.set(key, value, ex=time, nx=True))
+        except Exception as e:
+            print(f"❌ Redis set_nx error: {e}")
+        return None
+    
     async def delete(self, *keys: str) -> bool:
         """Delete keys from Redis"""
         if not self.is_connected() or not keys:
@@ -353,6 +477,24 @@ class RedisCache:
             print(f"❌ Redis publish error: {e}")
         return False
     
+    async def subscribe(self, *channels: str):
+        """
+        Subscribe to channels and return the PubSub object.
+
+        Native Redis only: the Upstash REST API has no pub/sub, so None is
+        returned there (and when Redis is unavailable).
+        """
+        if not self.is_connected() or self.use_upstash or not self.redis:
+            return None
+        
+        try:
+            pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+            await pubsub.subscribe(*channels)
+            return pubsub
+        except Exception as e:
+            print(f"❌ Redis subscribe error: {e}")
+        return None
+    
     async def check_rate_limit(self, key: str, limit: int, window: int) -> bool:
         """Check if request is within rate limit"""
         if not self.is_connected():
@@ -375,6 +517,103 @@ class RedisCache:
             print(f"❌ Redis rate limit error: {e}")
         return True  # Allow if error occurs
 
+    async def sync_window_counters(
+        self, increments: Dict[str, int], read_keys: List[str], ttl: int
+    ) -> Tuple[Dict[str, int], Dict[str, int]]:
+        """
+        Batch INCRBY window counters and read other counters in one round trip.
+
+        Returns ({incremented_key: new_value}, {read_key: value}). Used by the
+        rate limiter's background sync, never on the request path.
+        """
+        if not self.is_connected() or (not increments and not read_keys):
+            return {}, {}
+
+        inc_keys = list(increments.keys())
+        try:
+            if self.use_upstash and self.upstash:
+                commands = []
+                for key in inc_keys:
+                    commands.append(["INCRBY", key, str(increments[key])])
+                    commands.append(["EXPIRE", key, str(ttl)])
+                if read_keys:
+                    commands.append(["MGET"] + list(read_keys))
+                results = await self.upstash._execute_pipeline(commands)
+                if not results:
+                    return {}, {}
+                inc_values = results[0:len(inc_keys) * 2:2]
+                read_values = results[-1] if read_keys else []
+            elif self.redis:
+                pipe = self.redis.pipeline(transaction=False)
+                for key in inc_keys:
+                    pipe.incrby(key, increments[key])
+                    pipe.expire(key, ttl)
+                if read_keys:
+                    pipe.mget(list(read_keys))
+                results = await pipe.execute()
+                inc_values = results[0:len(inc_keys) * 2:2]
+                read_values = results[-1] if read_keys else []
+            else:
+                return {}, {}
+
+            incremented = {key: int(value or 0) for key, value in zip(inc_keys, inc_values)}
+            read = {key: int(value or 0) for key, value in zip(read_keys, read_values or [])}
+            return incremented, read
+        except Exception as e:
+            print(f"❌ Redis window counter sync error: {e}")
+        return {}, {}
+
+    # ============ HASHES ============
+
+    async def hgetall(self, key: str) -> Optional[Dict[str, str]]:
+        """Get all fields of a hash (None when Redis is unavailable)"""
+        if not self.is_connected():
+            return None
+
+        try:
+            if self.use_upstash and self.upstash:
+                result = await self.upstash._execute_command(["HGETALL", key])
+                if result is None:
+                    return None
+                return dict(zip(result[0::2], result[1::2]))
+            elif self.redis:
+                return await self.redis.hgetall(key)
+        except Exception as e:
+            print(f"❌ Redis hgetall error: {e}")
+        return None
+
+    async def hmerge_versioned(self, key: str, entries: List[Tuple[str, int, Optional[str]]],
+                               ttl: Optional[int] = None, build: bool = False,
+                               meta: Optional[Tuple[str, str]] = None) -> bool:
+        """
+        Merge versioned fields into a hash in one atomic script.
+
+        ``entries`` are ``(field, version, value)``; a None value removes
+        the field and leaves a tombstone. The field's version is kept in
+        ``v:{field}`` and an entry only lands when it is newer than what
+        the hash holds, so patches from several instances can arrive in
+        any order. ``build`` entries (a snapshot) never overwrite an equal
+        version; ``meta`` is a ``(field, value)`` written unconditionally.
+        """
+        if not self.is_connected() or (not entries and meta is None):
+            return False
+
+        args = ["1" if build else "0", str(ttl or 0)]
+        args.extend(meta if meta is not None else ("", ""))
+        for field, version, value in entries:
+            args.extend([field, str(version), "" if value is None else "1" + value])
+
+        try:
+            if self.use_upstash and self.upstash:
+                result = await self.upstash._request(["EVAL", HMERGE_VERSIONED_SCRIPT, "1", key] + args)
+                return result is not None
+            elif self.redis:
+                await self.redis.eval(HMERGE_VERSIONED_SCRIPT, 1, key, *args)
+                return True
+        except Exception as e:
+            print(f"❌ Redis hmerge error: {e}")
+        return False
+
     # ============ ACTIVE ORDERS CACHE ============
     
     async def get_active_orders(self, org_id: str) -> Optional[List[Dict]]:
@@ -384,10 +623,9 @@ class RedisCache:
             
         try:
             cache_key = f"active_orders:{org_id}"
-            cached_data = await self.get(cache_key)
+            orders = await self.get_entity(cache_key)
             
-            if cached_data:
-                orders = json.loads(cached_data)
+            if orders is not None:
                 print(f"🚀 Cache HIT: {len(orders)} active orders for org {org_id}")
                 return orders
             else:
@@ -405,18 +643,7 @@ class RedisCache:
             
         try:
             cache_key = f"active_orders:{org_id}"
-            
-            # Convert datetime objects to ISO strings for JSON serialization
-            serializable_orders = []
-            for order in orders:
-                order_copy = order.copy()
-                if isinstance(order_copy.get('created_at'), datetime):
-                    order_copy['created_at'] = order_copy['created_at'].isoformat()
-                if isinstance(order_copy.get('updated_at'), datetime):
-                    order_copy['updated_at'] = order_copy['updated_at'].isoformat()
-                serializable_orders.append(order_copy)
-            
-            success = await self.setex(cache_key, ttl, json.dumps(serializable_orders))
+            success = await self.set_entity(cache_key, ttl, orders)
             if success:
                 print(f"💾 Cached {len(orders)} active orders for org {org_id} (TTL: {ttl}s)")
             return success
@@ -450,10 +677,9 @@ class RedisCache:
             
         try:
             cache_key = f"order:{org_id}:{order_id}"
-            cached_data = await self.get(cache_key)
+            order = await self.get_entity(cache_key)
             
-            if cached_data:
-                order = json.loads(cached_data)
+            if order is not None:
                 print(f"🚀 Cache HIT: order {order_id}")
                 return order
             else:
@@ -472,14 +698,8 @@ class RedisCache:
         try:
             cache_key = f"order:{org_id}:{order_id}"
             
-            # Convert datetime objects to ISO strings
-            order_copy = order.copy()
-            if isinstance(order_copy.get('created_at'), datetime):
-                order_copy['created_at'] = order_copy['created_at'].isoformat()
-            if isinstance(order_copy.get('updated_at'), datetime):
-                order_copy['updated_at'] = order_copy['updated_at'].isoformat()
-            
-            success = await self.setex(cache_key, ttl, json.dumps(order_copy))
+            # Without Mongo _id and the BSON date mirror
+            success = await self.set_entity(cache_key, ttl, compact_order(order))
             if success:
                 print(f"💾 Cached order {order_id}")
             return success
@@ -538,10 +758,9 @@ class RedisCache:
             
         try:
             cache_key = f"super_admin:users:{skip}:{limit}"
-            cached_data = await self.get(cache_key)
+            users_data = await self.get_entity(cache_key)
             
-            if cached_data:
-                users_data = json.loads(cached_data)
+            if users_data is not None:
                 print(f"🚀 Cache HIT: super admin users (skip={skip}, limit={limit})")
                 return users_data
             else:
@@ -559,17 +778,7 @@ class RedisCache:
             
         try:
             cache_key = f"super_admin:users:{skip}:{limit}"
-            
-            # Convert datetime objects to ISO strings for JSON serialization
-            serializable_data = users_data.copy()
-            if 'users' in serializable_data:
-                for user in serializable_data['users']:
-                    if isinstance(user.get('created_at'), datetime):
-                        user['created_at'] = user['created_at'].isoformat()
-                    if isinstance(user.get('subscription_expires_at'), datetime):
-                        user['subscription_expires_at'] = user['subscription_expires_at'].isoformat()
-            
-            success = await self.setex(cache_key, ttl, json.dumps(serializable_data))
+            success = await self.set_entity(cache_key, ttl, users_data)
             if success:
                 print(f"💾 Cached super admin users (skip={skip}, limit={limit}, TTL: {ttl}s)")
             return success
@@ -606,10 +815,9 @@ class RedisCache:
             
         try:
             cache_key = f"super_admin:analytics:{days}"
-            cached_data = await self.get(cache_key)
+            analytics_data = await self.get_entity(cache_key)
             
-            if cached_data:
-                analytics_data = json.loads(cached_data)
+            if analytics_data is not None:
                 print(f"🚀 Cache HIT: super admin analytics (days={days})")
                 return analytics_data
             else:
@@ -627,13 +835,7 @@ class RedisCache:
             
         try:
             cache_key = f"super_admin:analytics:{days}"
-            
-            # Convert datetime objects to ISO strings for JSON serialization
-            serializable_data = analytics_data.copy()
-            if 'cached_at' in serializable_data and isinstance(serializable_data['cached_at'], datetime):
-                serializable_data['cached_at'] = serializable_data['cached_at'].isoformat()
-            
-            success = await self.setex(cache_key, ttl, json.dumps(serializable_data))
+            success = await self.set_entity(cache_key, ttl, analytics_data)
             if success:
                 print(f"💾 Cached super admin analytics (days={days}, TTL: {ttl}s)")
             return success
@@ -648,50 +850,31 @@ class CachedOrderService:
     def __init__(self, db: AsyncIOMotorDatabase, cache: RedisCache):
         self.db = db
         self.cache = cache
+        # Today's active orders per organization, patched in place on writes
+        self.active_view = ActiveOrdersView(cache)
+        # Response normalizers for cached tables / menu items (see set_response_shapes)
+        self.table_shape = None
+        self.menu_item_shape = None
+    
+    def set_response_shapes(self, order=None, table=None, menu_item=None):
+        """
+        Normalizers (fast_response.response_shape) that bring cached
+        documents to their response model's field set, so the JSON
+        fast paths send what the validated path would
+        """
+        self.active_view.shape = order
+        self.table_shape = table
+        self.menu_item_shape = menu_item
     
     async def get_active_orders(self, org_id: str, use_cache: bool = True) -> List[Dict]:
-        """Get active orders with Redis caching and robust fallback"""
+        """Get today's active orders from the materialized view with robust fallback"""
         
-        # Try cache first if enabled and Redis is connected
-        if use_cache and self.cache.is_connected():
+        # Materialized view: local mirror -> Redis hash -> one MongoDB build per day
+        if use_cache:
             try:
-                cached_orders = await self.cache.get_active_orders(org_id)
-                if cached_orders is not None:
-                    print(f"🚀 Cache HIT: {len(cached_orders)} active orders for org {org_id}")
-                    
-                    # CRITICAL FIX: Filter cached orders to only show TODAY's orders
-                    from datetime import timezone, timedelta
-                    IST = timezone(timedelta(hours=5, minutes=30))
-                    
-                    # Get current time in IST and find start of today in IST
-                    now_ist = datetime.now(IST)
-                    today_ist = now_ist.replace(hour=0, minute=0, second=0, microsecond=0)
-                    
-                    # Convert to UTC for comparison
-                    today_utc = today_ist.astimezone(timezone.utc)
-                    
-                    todays_cached_orders = []
-                    for order in cached_orders:
-                        try:
-                            if isinstance(order.get("created_at"), str):
-                                order_date = datetime.fromisoformat(order["created_at"])
-                            else:
-                                order_date = order.get("created_at")
-                            
-                            # Only include orders created today or later
-                            if order_date and order_date >= today_utc:
-                                todays_cached_orders.append(order)
-                        except Exception as date_error:
-                            print(f"⚠️ Date parsing error for cached order {order.get('id', 'unknown')}: {date_error}")
-                            # If date parsing fails, exclude the order to be safe
-                            continue
-                    
-                    print(f"🚀 Filtered cached orders to TODAY only: {len(todays_cached_orders)} from {len(cached_orders)} total")
-                    return todays_cached_orders
-                else:
-                    print(f"💾 Cache MISS: active orders for org {org_id}")
-            except Exception as cache_error:
-                print(f"❌ Redis cache error: {cache_error}, falling back to MongoDB")
+                return await self.active_view.get_orders(org_id, self.db)
+            except Exception as view_error:
+                print(f"❌ Active orders view error: {view_error}, falling back to MongoDB")
         
         # Fallback to MongoDB
         print(f"📊 Fetching active orders from MongoDB for org {org_id}")
@@ -712,32 +895,13 @@ class CachedOrderService:
             query = {
                 "organization_id": org_id,
                 "status": {"$nin": ["completed", "cancelled"]},
-                "created_at": {"$gte": today_utc.isoformat()}  # CRITICAL FIX: Only today's orders
+                **created_range(today_utc),  # CRITICAL FIX: Only today's orders
             }
             
             orders = await self.db.orders.find(
                 query, 
                 {"_id": 0}
-            ).sort("created_at", -1).limit(100).to_list(100)
-            
-            # Convert datetime objects for consistency
-            for order in orders:
-                try:
-                    if isinstance(order.get("created_at"), str):
-                        order["created_at"] = datetime.fromisoformat(order["created_at"])
-                    if isinstance(order.get("updated_at"), str):
-                        order["updated_at"] = datetime.fromisoformat(order["updated_at"])
-                except Exception as dt_error:
-                    # If datetime conversion fails, leave as string
-                    print(f"⚠️ Datetime conversion error for order {order.get('id', 'unknown')}: {dt_error}")
-                    pass
-            
-            # Try to cache the results if Redis is available
-            if use_cache and self.cache.is_connected():
-                try:
-                    await self.cache.set_active_orders(org_id, orders, ttl=300)  # 5 min cache
-                except Exception as cache_set_error:
-                    print(f"⚠️ Failed to cache orders: {cache_set_error}")
+            ).sort(created_sort_field(), -1).limit(100).to_list(100)
             
             print(f"📊 Found {len(orders)} TODAY's active orders for org {org_id} (filtered by date)")
             return orders
@@ -747,11 +911,23 @@ class CachedOrderService:
             # Return empty list rather than crash
             return []
     
+    async def get_active_orders_json(self, org_id: str, status: Optional[str] = None) -> bytes:
+        """
+        Today's active orders as JSON response bytes, from the view's
+        serialized copy. Raises if the view is unavailable; the MongoDB
+        fallback belongs to the validated get_active_orders path.
+        """
+        return await self.active_view.get_orders_json(org_id, self.db, status)
+    
     async def get_order_by_id(self, order_id: str, org_id: str, use_cache: bool = True) -> Optional[Dict]:
         """Get single order with caching"""
         
-        # Try cache first
+        # Try cache first (active orders are usually in the local view mirror)
         if use_cache:
+            view_order = self.active_view.peek(org_id, order_id)
+            if view_order is not None:
+                return view_order
+            
             cached_order = await self.cache.get_order(order_id, org_id)
             if cached_order is not None:
                 return cached_order
@@ -763,31 +939,75 @@ class CachedOrderService:
         )
         
         if order:
-            # Convert datetime objects
-            if isinstance(order.get("created_at"), str):
-                order["created_at"] = datetime.fromisoformat(order["created_at"])
-            if isinstance(order.get("updated_at"), str):
-                order["updated_at"] = datetime.fromisoformat(order["updated_at"])
-            
             # Cache the result
             if use_cache:
                 await self.cache.set_order(order_id, org_id, order, ttl=600)  # 10 min cache
         
         return order
     
-    async def invalidate_order_caches(self, org_id: str, order_id: str = None):
-        """Invalidate caches when orders change"""
+    async def invalidate_order_caches(self, org_id: str, order_id: str = None,
+                                      order: Optional[Dict] = None, removed: bool = False):
+        """
+        Update caches when orders change.
         
-        # Always invalidate active orders list
-        await self.cache.invalidate_active_orders(org_id)
+        The active orders view is patched in place: with ``order`` (the
+        order's current state), ``removed`` (deleted order) or, when only
+        the id is known, by re-reading that single order. Without an
+        ``order_id`` the whole view is dropped and rebuilt on next read.
+        """
+        try:
+            if not order_id:
+                await self.active_view.invalidate(org_id)
+            elif removed:
+                await self.active_view.remove(org_id, order_id)
+            elif order is not None:
+                await self.active_view.apply(org_id, order)
+            else:
+                await self.active_view.refresh_order(org_id, order_id, self.db)
+        except Exception as view_error:
+            print(f"⚠️ Active orders view patch failed: {view_error}, dropping view")
+            await self.active_view.invalidate(org_id)
+        
+        # Let other instances drop their local copies (pub/sub fallback mode)
+        await get_cache_coherence().announce("orders", org_id, order_id)
         
         # Invalidate specific order if provided
         if order_id:
             await self.cache.invalidate_order(order_id, org_id)
         
-        # Publish real-time update
-        if order_id:
-            await self.cache.publish_order_update(org_id, order_id, "cache_invalidated")
+        # Push the change to connected screens (SSE)
+        if not order_id:
+            await get_event_bus().publish(org_id, "orders.reset", {})
+        elif removed:
+            await get_event_bus().publish(org_id, "order.removed", {"order_id": order_id})
+        elif order is not None:
+            await get_event_bus().publish(org_id, "order.updated", {
+                "order_id": order_id,
+                "status": order.get("status"),
+                "order": compact_order(order),
+            })
+        else:
+            await get_event_bus().publish(org_id, "order.updated", {"order_id": order_id})
+    
+    async def invalidate_orders_bulk(self, org_id: str, orders: List[Dict]):
+        """Update caches for several changed orders of one organization at once"""
+        if not orders:
+            return
+        order_ids = [order["id"] for order in orders]
+        try:
+            await self.active_view.apply_many(org_id, orders)
+        except Exception as view_error:
+            print(f"⚠️ Active orders view patch failed: {view_error}, dropping view")
+            await self.active_view.invalidate(org_id)
+        
+        await get_cache_coherence().announce("orders", org_id, *order_ids)
+        await self.cache.delete(*[f"order:{org_id}:{order_id}" for order_id in order_ids])
+        await get_event_bus().publish(org_id, "orders.updated", {
+            "orders": [
+                {"order_id": order["id"], "status": order.get("status"), "order": compact_order(order)}
+                for order in orders
+            ]
+        })
     
     async def get_tables(self, org_id: str, use_cache: bool = True) -> List[Dict]:
         """Get tables with Redis caching and robust fallback"""
@@ -796,10 +1016,9 @@ class CachedOrderService:
         if use_cache and self.cache.is_connected():
             try:
                 cache_key = f"tables:{org_id}"
-                cached_data = await self.cache.get(cache_key)
+                tables = await self.cache.get_entity(cache_key)
                 
-                if cached_data:
-                    tables = json.loads(cached_data)
+                if tables is not None:
                     print(f"🚀 Cache HIT: {len(tables)} tables for org {org_id}")
                     return tables
                 else:
@@ -818,12 +1037,14 @@ class CachedOrderService:
                 query, 
                 {"_id": 0}
             ).sort("table_number", 1).to_list(100)
+            if self.table_shape is not None:
+                tables = [self.table_shape(table) for table in tables]
             
             # Try to cache the results if Redis is available
             if use_cache and self.cache.is_connected():
                 try:
                     cache_key = f"tables:{org_id}"
-                    await self.cache.setex(cache_key, 600, json.dumps(tables))  # 10 min cache
+                    await self.cache.set_entity(cache_key, 600, tables)  # 10 min cache
                     print(f"💾 Cached {len(tables)} tables for org {org_id}")
                 except Exception as cache_set_error:
                     print(f"⚠️ Failed to cache tables: {cache_set_error}")
@@ -836,6 +1057,12 @@ class CachedOrderService:
             # Return empty list rather than crash
             return []
     
+    async def get_tables_json(self, org_id: str) -> Optional[bytes]:
+        """Tables as JSON response bytes straight from the Redis entry (None on a miss)"""
+        if not self.cache.is_connected():
+            return None
+        return await self.cache.get_entity_json(f"tables:{org_id}")
+    
     async def get_menu_items(self, org_id: str, use_cache: bool = True) -> List[Dict]:
         """Get menu items with Redis caching and robust fallback"""
         
@@ -843,10 +1070,9 @@ class CachedOrderService:
         if use_cache and self.cache.is_connected():
             try:
                 cache_key = f"menu_items:{org_id}"
-                cached_data = await self.cache.get(cache_key)
+                menu_items = await self.cache.get_entity(cache_key)
                 
-                if cached_data:
-                    menu_items = json.loads(cached_data)
+                if menu_items is not None:
                     print(f"🚀 Cache HIT: {len(menu_items)} menu items for org {org_id}")
                     return menu_items
                 else:
@@ -875,20 +1101,14 @@ class CachedOrderService:
                     # If datetime conversion fails, leave as string
                     print(f"⚠️ Datetime conversion error for menu item {item.get('id', 'unknown')}: {dt_error}")
                     pass
+            if self.menu_item_shape is not None:
+                menu_items = [self.menu_item_shape(item) for item in menu_items]
             
             # Try to cache the results if Redis is available
             if use_cache and self.cache.is_connected():
                 try:
                     cache_key = f"menu_items:{org_id}"
-                    # Convert datetime objects to strings for JSON serialization
-                    cache_items = []
-                    for item in menu_items:
-                        cache_item = item.copy()
-                        if isinstance(cache_item.get("created_at"), datetime):
-                            cache_item["created_at"] = cache_item["created_at"].isoformat()
-                        cache_items.append(cache_item)
-                    
-                    await self.cache.setex(cache_key, 600, json.dumps(cache_items))  # 10 min cache
+                    await self.cache.set_entity(cache_key, 600, menu_items)  # 10 min cache
                     print(f"💾 Cached {len(menu_items)} menu items for org {org_id}")
                 except Exception as cache_set_error:
                     print(f"⚠️ Failed to cache menu items: {cache_set_error}")
@@ -901,8 +1121,15 @@ class CachedOrderService:
             # Return empty list rather than crash
             return []
     
+    async def get_menu_items_json(self, org_id: str) -> Optional[bytes]:
+        """Menu items as JSON response bytes straight from the Redis entry (None on a miss)"""
+        if not self.cache.is_connected():
+            return None
+        return await self.cache.get_entity_json(f"menu_items:{org_id}")
+    
     async def invalidate_menu_caches(self, org_id: str):
         """Invalidate menu item caches when menu changes"""
+        await get_cache_coherence().announce("menu_items", org_id)
         
         if self.cache.is_connected():
             try:
@@ -921,10 +1148,9 @@ class CachedOrderService:
         if use_cache and self.cache.is_connected():
             try:
                 cache_key = f"inventory:{org_id}"
-                cached_data = await self.cache.get(cache_key)
+                inventory_items = await self.cache.get_entity(cache_key)
                 
-                if cached_data:
-                    inventory_items = json.loads(cached_data)
+                if inventory_items is not None:
                     print(f"🚀 Cache HIT: {len(inventory_items)} inventory items for org {org_id}")
                     return inventory_items
                 else:
@@ -958,15 +1184,7 @@ class CachedOrderService:
             if use_cache and self.cache.is_connected():
                 try:
                     cache_key = f"inventory:{org_id}"
-                    # Convert datetime objects to strings for JSON serialization
-                    cache_items = []
-                    for item in inventory_items:
-                        cache_item = item.copy()
-                        if isinstance(cache_item.get("last_updated"), datetime):
-                            cache_item["last_updated"] = cache_item["last_updated"].isoformat()
-                        cache_items.append(cache_item)
-                    
-                    await self.cache.setex(cache_key, 300, json.dumps(cache_items))  # 5 min cache
+                    await self.cache.set_entity(cache_key, 300, inventory_items)  # 5 min cache
                     print(f"💾 Cached {len(inventory_items)} inventory items for org {org_id}")
                 except Exception as cache_set_error:
                     print(f"⚠️ Failed to cache inventory items: {cache_set_error}")
@@ -981,6 +1199,7 @@ class CachedOrderService:
     
     async def invalidate_inventory_caches(self, org_id: str):
         """Invalidate inventory caches when inventory changes"""
+        await get_cache_coherence().announce("inventory", org_id)
         
         if self.cache.is_connected():
             try:
@@ -994,6 +1213,8 @@ class CachedOrderService:
     
     async def invalidate_table_caches(self, org_id: str):
         """Invalidate table caches when table status changes"""
+        await get_event_bus().publish(org_id, "tables.changed", {})
+        await get_cache_coherence().announce("tables", org_id)
         
         if self.cache.is_connected():
             try:
@@ -1038,7 +1259,9 @@ class TableStatusManager:
                 
                 if result.modified_count > 0 or result.matched_count > 0:
                     # Invalidate cache after successful DB update
-                    await self._invalidate_table_cache(org_id)
+                    await self._invalidate_table_cache(
+                        org_id, {"table_id": table_id, "status": "occupied", "current_order_id": order_id}
+                    )
                     
                     print(f"✅ Table {table_id} set to OCCUPIED (order: {order_id})")
                     return {
@@ -1085,7 +1308,9 @@ class TableStatusManager:
                 
                 if result.modified_count > 0 or result.matched_count > 0:
                     # Invalidate cache after successful DB update
-                    await self._invalidate_table_cache(org_id)
+                    await self._invalidate_table_cache(
+                        org_id, {"table_id": table_id, "status": "available", "current_order_id": None}
+                    )
                     
                     print(f"✅ Table {table_id} set to AVAILABLE (cleared)")
                     return {
@@ -1113,6 +1338,33 @@ class TableStatusManager:
         
         return {"success": False, "message": "Max retries exceeded", "table_id": table_id}
     
+    async def release_tables(self, org_id: str, table_orders: Dict[str, str]) -> int:
+        """
+        Set several tables available in one bulk write.
+        
+        ``table_orders`` maps table id -> the order being closed; a table
+        that already holds a different order is left alone. Returns the
+        number of tables released.
+        """
+        if not table_orders:
+            return 0
+        operations = [
+            UpdateOne(
+                {"id": table_id, "organization_id": org_id, "current_order_id": {"$in": [order_id, None]}},
+                {"$set": {"status": "available", "current_order_id": None}},
+            )
+            for table_id, order_id in table_orders.items()
+        ]
+        try:
+            result = await self.db.tables.bulk_write(operations, ordered=False)
+        except Exception as e:
+            print(f"❌ Error releasing tables: {e}")
+            return 0
+        
+        await self._invalidate_table_cache(org_id)
+        print(f"✅ Released {result.modified_count} tables for org {org_id}")
+        return result.modified_count
+    
     async def get_tables_fresh(self, org_id: str) -> List[Dict]:
         """
         Fetch tables directly from database, bypassing cache.
@@ -1131,8 +1383,13 @@ class TableStatusManager:
             print(f"❌ Error fetching fresh tables: {e}")
             return []
     
-    async def _invalidate_table_cache(self, org_id: str):
-        """Internal method to invalidate table cache"""
+    async def _invalidate_table_cache(self, org_id: str, table_update: Optional[Dict] = None):
+        """Internal method to invalidate table cache and push the change"""
+        if table_update:
+            await get_event_bus().publish(org_id, "table.updated", table_update)
+        else:
+            await get_event_bus().publish(org_id, "tables.changed", {})
+        await get_cache_coherence().announce("tables", org_id)
         if self.cache.is_connected():
             try:
                 cache_key = f"tables:{org_id}"
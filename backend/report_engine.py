@@ -0,0 +1,193 @@
+"""
+Report Engine
+=============
+
+Reports used to read at most 1000 orders (``to_list(1000)``) and add them
+up in Python, so on a busy outlet "all time" quietly meant the last day
+or two. The engine keeps report cost proportional to the answer instead
+of the history:
+- ``group``: filtering and grouping run in MongoDB. Each orders
+  collection (hot and the monthly archives the window touches) is
+  grouped on its own, then the partial groups are merged
+- ``totals``: order count and amount sums of a window
+- ``stream``: when Python has to look at every order (Day Book entries,
+  exports) the cursor is read in batches with a narrow projection, so
+  memory holds one batch rather than the whole window
+- Windows are UTC ``[start, end)`` datetimes and either end may be open;
+  ``business_window`` turns IST business days (YYYY-MM-DD) into one
+
+Sales reports count completed and paid orders, like the daily rollups.
+"""
+
+from datetime import datetime, timedelta, timezone
+from typing import Any, AsyncIterator, Dict, List, Optional, Sequence, Tuple
+
+from order_archive import get_order_router
+from order_dates import CREATED_AT_DT, created_range
+from sales_rollups import IST, SALE_STATUSES
+
+# Creation time as a date, for orders the date migration has not reached yet too
+CREATED_DATE_EXPR = {"$ifNull": [
+    f"${CREATED_AT_DT}",
+    {"$convert": {"input": "$created_at", "to": "date", "onError": None, "onNull": None}},
+]}
+
+# Accumulators whose partial results merge with the same operator
+MERGEABLE_ACCUMULATORS = ("$sum", "$min", "$max", "$first", "$last")
+
+
+def business_window(start_day: Optional[str], end_day: Optional[str]) -> Tuple[Optional[datetime], Optional[datetime]]:
+    """UTC [start, end) of the business days start_day..end_day; raises ValueError on bad dates"""
+    start = datetime.strptime(start_day, "%Y-%m-%d").replace(tzinfo=IST) if start_day else None
+    end = datetime.strptime(end_day, "%Y-%m-%d").replace(tzinfo=IST) + timedelta(days=1) if end_day else None
+    return (
+        start.astimezone(timezone.utc) if start else None,
+        end.astimezone(timezone.utc) if end else None,
+    )
+
+
+def merge_group(accumulators: Dict[str, Dict[str, Any]]) -> Dict[str, Any]:
+    """$group stage combining partial groups that were built with ``accumulators``"""
+    merged: Dict[str, Any] = {"_id": "$_id"}
+    for field, accumulator in accumulators.items():
+        (operator, _), = accumulator.items()
+        if operator not in MERGEABLE_ACCUMULATORS:
+            raise ValueError(f"{operator} partial results can't be merged ({field})")
+        merged[field] = {operator: f"${field}"}
+    return {"$group": merged}
+
+
+class ReportEngine:
+    """Order reports pushed into MongoDB, over hot and archived orders"""
+
+    def __init__(self, db=None, batch_size: int = 500):
+        self.db = db
+        self._stats = {
+            "groupings": 0,
+            "groups_returned": 0,
+            "streams": 0,
+            "streamed_orders": 0,
+        }
+
+        self.BATCH_SIZE = batch_size
+
+    def order_match(
+        self,
+        org_id: str,
+        statuses: Optional[Sequence[str]] = SALE_STATUSES,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+        match: Optional[Dict[str, Any]] = None,
+    ) -> Dict[str, Any]:
+        """Filter for an organization's orders in a window (statuses=None: any status)"""
+        query: Dict[str, Any] = {"organization_id": org_id, **(match or {})}
+        if statuses:
+            query["status"] = {"$in": list(statuses)}
+        if start is not None or end is not None:
+            query.update(created_range(start, end))
+        return query
+
+    async def _pipeline(
+        self,
+        match: Dict[str, Any],
+        start: Optional[datetime],
+        end: Optional[datetime],
+        per_collection: Sequence[Dict[str, Any]],
+    ) -> Tuple[List[Dict[str, Any]], bool]:
+        """(pipeline, reads archives too)"""
+        router = get_order_router()
+        if router is None:
+            return [{"$match": match}, *per_collection], False
+        pipeline = await router.union_pipeline(match, start, end, per_collection=per_collection)
+        return pipeline, len(pipeline) > len(per_collection) + 1
+
+    async def group(
+        self,
+        org_id: str,
+        key: Any,
+        accumulators: Dict[str, Dict[str, Any]],
+        pre_stages: Sequence[Dict[str, Any]] = (),
+        statuses: Optional[Sequence[str]] = SALE_STATUSES,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+        match: Optional[Dict[str, Any]] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        ``$group`` of the window's orders by ``key``.
+
+        ``pre_stages`` ($project, $unwind, ...) run before the grouping
+        inside each collection. Accumulators must be mergeable ($sum,
+        $min, $max, $first, $last); derive averages from sums.
+        """
+        self._stats["groupings"] += 1
+        stages = [*pre_stages, {"$group": {"_id": key, **accumulators}}]
+        pipeline, unioned = await self._pipeline(
+            self.order_match(org_id, statuses, start, end, match), start, end, stages
+        )
+        if unioned:
+            pipeline.append(merge_group(accumulators))
+        groups = await self.db.orders.aggregate(pipeline, allowDiskUse=True).to_list(None)
+        self._stats["groups_returned"] += len(groups)
+        return groups
+
+    async def totals(
+        self,
+        org_id: str,
+        fields: Sequence[str] = ("total",),
+        statuses: Optional[Sequence[str]] = SALE_STATUSES,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+        match: Optional[Dict[str, Any]] = None,
+    ) -> Dict[str, Any]:
+        """{"orders": count, <field>: sum, ...} of the window's orders"""
+        accumulators = {"orders": {"$sum": 1}}
+        accumulators.update({field: {"$sum": f"${field}"} for field in fields})
+        groups = await self.group(org_id, None, accumulators, statuses=statuses, start=start, end=end, match=match)
+        result = groups[0] if groups else {}
+        return {name: result.get(name, 0) for name in accumulators}
+
+    async def stream(
+        self,
+        org_id: str,
+        projection: Dict[str, Any],
+        statuses: Optional[Sequence[str]] = SALE_STATUSES,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+        match: Optional[Dict[str, Any]] = None,
+        sort: Optional[Dict[str, int]] = None,
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        The window's orders, read in batches of BATCH_SIZE.
+
+        Keep the projection to the fields the caller needs. ``sort`` is
+        applied after the collections are combined (allowDiskUse), so
+        prefer consuming in storage order when the caller doesn't care.
+        """
+        self._stats["streams"] += 1
+        pipeline, _ = await self._pipeline(
+            self.order_match(org_id, statuses, start, end, match), start, end, [{"$project": projection}]
+        )
+        if sort:
+            pipeline.append({"$sort": sort})
+        cursor = self.db.orders.aggregate(pipeline, allowDiskUse=True, batchSize=self.BATCH_SIZE)
+        async for order in cursor:
+            self._stats["streamed_orders"] += 1
+            yield order
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {**self._stats, "batch_size": self.BATCH_SIZE}
+
+
+# Global instance
+_report_engine = ReportEngine()
+
+
+def init_report_engine(db) -> ReportEngine:
+    """Attach the global report engine to a database"""
+    _report_engine.db = db
+    return _report_engine
+
+
+def get_report_engine() -> ReportEngine:
+    """Get the global report engine"""
+    return _report_engine
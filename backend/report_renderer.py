@@ -0,0 +1,638 @@
+"""
+Report Renderer
+===============
+
+Day Book PDF (reportlab) and Excel (openpyxl) documents used to be built
+inside the request handler, so a month-long export with thousands of
+entries held the event loop for seconds and stalled every other request
+on the worker. Rendering now runs as jobs on a small process pool:
+- A job is (format, Day Book data, date range); the worker process
+  returns the finished file as bytes. Workers are spawned rather than
+  forked from the app's threads and sockets, and live as long as the pool
+- A semaphore caps concurrent jobs at the pool size; excess jobs wait
+- Budgets: a job with more than MAX_ENTRIES transactions is refused, and
+  one running longer than TIMEOUT seconds is stopped: the pool's worker
+  processes are terminated (killed if they ignore it) and a fresh pool
+  takes later jobs. Jobs that were running next to it on the old pool
+  are retried once on the new one
+- openpyxl writes in write-only mode (rows streamed to the file, not held
+  as cell objects) and the PDF transaction list is split into page-sized
+  tables, so layout cost grows with the entry count instead of its square
+- Rendered files are cached in process, keyed by (organization, range,
+  format, data version), where the version is a digest of the Day Book
+  data; repeated downloads of an unchanged range skip rendering. The
+  cache is bounded by total size and entry age
+
+Without reportlab/openpyxl installed, jobs fall back to CSV.
+
+CONFIGURATION (environment):
+- REPORT_RENDER_WORKERS: pool size (default 2)
+- REPORT_RENDER_TIMEOUT: seconds per job (default 60)
+- REPORT_RENDER_MAX_ENTRIES: transactions per job (default 50000)
+- REPORT_RENDER_CACHE_MB: rendered file cache size (default 64)
+"""
+
+import asyncio
+import csv
+import hashlib
+import io
+import json
+import multiprocessing
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import date as date_type, datetime
+from typing import Any, Dict, Optional, Tuple
+
+PDF_MEDIA_TYPE = "application/pdf"
+EXCEL_MEDIA_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+CSV_MEDIA_TYPE = "text/csv"
+
+# Transaction rows per PDF table, about one A4 page
+PDF_TABLE_ROWS = 40
+
+# (content, media type, file extension)
+RenderedFile = Tuple[bytes, str, str]
+
+
+class RenderBudgetError(Exception):
+    """Raised for jobs over their size or time budget"""
+
+
+def _entry_time(entry: Dict[str, Any]) -> str:
+    timestamp = entry.get("timestamp")
+    if not timestamp:
+        return "-"
+    try:
+        if isinstance(timestamp, datetime):
+            return timestamp.strftime("%H:%M")
+        return datetime.fromisoformat(str(timestamp).replace("Z", "+00:00")).strftime("%H:%M")
+    except ValueError:
+        return "-"
+
+
+def _date_range_label(date: str, end_date: str) -> str:
+    return f"{date}" if date == end_date else f"{date} to {end_date}"
+
+
+# ============ RENDERERS (run in worker processes) ============
+
+
+def render_daybook_csv(daybook_data: dict, date: str, end_date: str) -> RenderedFile:
+    """Plain CSV Day Book, the fallback when the document libraries are missing"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow([f"Day Book Report - {_date_range_label(date, end_date)}"])
+    writer.writerow([f"Generated: {datetime.now().strftime('%Y-%m-%d %H:%M')}"])
+    writer.writerow([])
+
+    writer.writerow(["SUMMARY"])
+    writer.writerow(["Opening Balance", "Total Inflows", "Total Outflows", "Net Cash Flow", "Closing Balance"])
+    writer.writerow([
+        f"{daybook_data[key]:.2f}"
+        for key in ("opening_balance", "total_inflows", "total_outflows", "net_cash_flow", "closing_balance")
+    ])
+    writer.writerow([])
+
+    writer.writerow(["INFLOW BREAKDOWN"])
+    writer.writerow(["Payment Method", "Amount"])
+    for method, amount in daybook_data["inflow_breakdown"].items():
+        writer.writerow([method, f"{amount:.2f}"])
+    writer.writerow(["Total", f"{daybook_data['total_inflows']:.2f}"])
+    writer.writerow([])
+
+    writer.writerow(["OUTFLOW BREAKDOWN"])
+    writer.writerow(["Category", "Amount"])
+    for category, amount in daybook_data["outflow_breakdown"].items():
+        writer.writerow([category, f"{amount:.2f}"])
+    writer.writerow(["Total", f"{daybook_data['total_outflows']:.2f}"])
+    writer.writerow([])
+
+    writer.writerow(["TRANSACTION DETAILS"])
+    writer.writerow(["Time", "Type", "Category", "Description", "Amount", "Running Balance"])
+    for entry in daybook_data["entries"]:
+        amount_prefix = "+" if entry["type"] == "inflow" else "-"
+        writer.writerow([
+            _entry_time(entry),
+            entry["type"],
+            entry.get("category", ""),
+            entry.get("description", ""),
+            f"{amount_prefix}{entry['amount']:.2f}",
+            f"{entry.get('running_balance', 0):.2f}",
+        ])
+
+    return buffer.getvalue().encode(), CSV_MEDIA_TYPE, "csv"
+
+
+def render_daybook_pdf(daybook_data: dict, date: str, end_date: str) -> RenderedFile:
+    """Day Book PDF; the transaction list is laid out one page-sized table at a time"""
+    try:
+        from reportlab.lib import colors
+        from reportlab.lib.enums import TA_CENTER
+        from reportlab.lib.pagesizes import A4
+        from reportlab.lib.styles import ParagraphStyle, getSampleStyleSheet
+        from reportlab.lib.units import mm
+        from reportlab.platypus import Paragraph, SimpleDocTemplate, Spacer, Table, TableStyle
+    except ImportError:
+        return render_daybook_csv(daybook_data, date, end_date)
+
+    buffer = io.BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=A4, rightMargin=20*mm, leftMargin=20*mm, topMargin=20*mm, bottomMargin=20*mm)
+
+    styles = getSampleStyleSheet()
+    title_style = ParagraphStyle('Title', parent=styles['Heading1'], fontSize=18, alignment=TA_CENTER, spaceAfter=12, textColor=colors.HexColor('#7c3aed'))
+    subtitle_style = ParagraphStyle('Subtitle', parent=styles['Normal'], fontSize=10, alignment=TA_CENTER, spaceAfter=20, textColor=colors.gray)
+    section_style = ParagraphStyle('Section', parent=styles['Heading2'], fontSize=12, spaceBefore=15, spaceAfter=8, textColor=colors.HexColor('#7c3aed'))
+
+    elements = []
+
+    # Title
+    elements.append(Paragraph("📒 Day Book Report", title_style))
+    elements.append(Paragraph(f"Date: {_date_range_label(date, end_date)} | Generated: {datetime.now().strftime('%Y-%m-%d %H:%M')}", subtitle_style))
+
+    # Summary Table
+    elements.append(Paragraph("Summary", section_style))
+    summary_data = [
+        ['Opening Balance', 'Total Inflows', 'Total Outflows', 'Net Cash Flow', 'Closing Balance'],
+        [
+            f"₹{daybook_data['opening_balance']:.2f}",
+            f"₹{daybook_data['total_inflows']:.2f}",
+            f"₹{daybook_data['total_outflows']:.2f}",
+            f"{'+'if daybook_data['net_cash_flow'] >= 0 else ''}₹{daybook_data['net_cash_flow']:.2f}",
+            f"₹{daybook_data['closing_balance']:.2f}"
+        ]
+    ]
+    summary_table = Table(summary_data, colWidths=[90, 90, 90, 90, 90])
+    summary_table.setStyle(TableStyle([
+        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#7c3aed')),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
+        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+        ('FONTSIZE', (0, 0), (-1, -1), 9),
+        ('BOTTOMPADDING', (0, 0), (-1, 0), 10),
+        ('TOPPADDING', (0, 0), (-1, 0), 10),
+        ('BACKGROUND', (0, 1), (-1, 1), colors.HexColor('#f3e8ff')),
+        ('GRID', (0, 0), (-1, -1), 0.5, colors.gray),
+        ('TEXTCOLOR', (1, 1), (1, 1), colors.green),
+        ('TEXTCOLOR', (2, 1), (2, 1), colors.red),
+    ]))
+    elements.append(summary_table)
+    elements.append(Spacer(1, 15))
+
+    # Inflow Breakdown
+    if daybook_data['inflow_breakdown']:
+        elements.append(Paragraph("💰 Inflow Breakdown", section_style))
+        inflow_data = [['Payment Method', 'Amount']]
+        for method, amount in daybook_data['inflow_breakdown'].items():
+            if amount > 0:
+                inflow_data.append([method.capitalize(), f"₹{amount:.2f}"])
+        inflow_data.append(['Total Inflows', f"₹{daybook_data['total_inflows']:.2f}"])
+
+        inflow_table = Table(inflow_data, colWidths=[200, 100])
+        inflow_table.setStyle(TableStyle([
+            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#15803d')),
+            ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
+            ('ALIGN', (1, 0), (1, -1), 'RIGHT'),
+            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+            ('FONTNAME', (0, -1), (-1, -1), 'Helvetica-Bold'),
+            ('FONTSIZE', (0, 0), (-1, -1), 9),
+            ('BACKGROUND', (0, 1), (-1, -2), colors.HexColor('#dcfce7')),
+            ('BACKGROUND', (0, -1), (-1, -1), colors.HexColor('#bbf7d0')),
+            ('GRID', (0, 0), (-1, -1), 0.5, colors.gray),
+        ]))
+        elements.append(inflow_table)
+        elements.append(Spacer(1, 10))
+
+    # Outflow Breakdown
+    if daybook_data['outflow_breakdown']:
+        elements.append(Paragraph("📤 Outflow Breakdown", section_style))
+        outflow_data = [['Category', 'Amount']]
+        for category, amount in daybook_data['outflow_breakdown'].items():
+            if amount > 0:
+                outflow_data.append([category, f"₹{amount:.2f}"])
+        outflow_data.append(['Total Outflows', f"₹{daybook_data['total_outflows']:.2f}"])
+
+        outflow_table = Table(outflow_data, colWidths=[200, 100])
+        outflow_table.setStyle(TableStyle([
+            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#dc2626')),
+            ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
+            ('ALIGN', (1, 0), (1, -1), 'RIGHT'),
+            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+            ('FONTNAME', (0, -1), (-1, -1), 'Helvetica-Bold'),
+            ('FONTSIZE', (0, 0), (-1, -1), 9),
+            ('BACKGROUND', (0, 1), (-1, -2), colors.HexColor('#fee2e2')),
+            ('BACKGROUND', (0, -1), (-1, -1), colors.HexColor('#fecaca')),
+            ('GRID', (0, 0), (-1, -1), 0.5, colors.gray),
+        ]))
+        elements.append(outflow_table)
+        elements.append(Spacer(1, 10))
+
+    # Transaction Details, one table per page-sized chunk (a single table
+    # of thousands of rows is re-split for every page it spills over)
+    entries = daybook_data['entries']
+    if entries:
+        elements.append(Paragraph(f"📋 Transaction Details ({len(entries)} transactions)", section_style))
+        header = ['Time', 'Type', 'Category', 'Description', 'Amount', 'Balance']
+        base_style = [
+            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#7c3aed')),
+            ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
+            ('ALIGN', (0, 0), (-1, 0), 'CENTER'),
+            ('ALIGN', (4, 1), (5, -1), 'RIGHT'),
+            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+            ('FONTSIZE', (0, 0), (-1, -1), 8),
+            ('GRID', (0, 0), (-1, -1), 0.5, colors.gray),
+        ]
+        inflow_color, outflow_color = colors.HexColor('#f0fdf4'), colors.HexColor('#fef2f2')
+
+        for offset in range(0, len(entries), PDF_TABLE_ROWS):
+            chunk = entries[offset:offset + PDF_TABLE_ROWS]
+            trans_data = [header]
+            trans_style = list(base_style)
+            for i, entry in enumerate(chunk, 1):
+                inflow = entry['type'] == 'inflow'
+                trans_data.append([
+                    _entry_time(entry),
+                    '↑ Inflow' if inflow else '↓ Outflow',
+                    entry.get('category', '')[:20],
+                    entry.get('description', '')[:30],
+                    f"{'+' if inflow else '-'}₹{entry['amount']:.2f}",
+                    f"₹{entry.get('running_balance', 0):.2f}"
+                ])
+                trans_style.append(('BACKGROUND', (0, i), (-1, i), inflow_color if inflow else outflow_color))
+
+            trans_table = Table(trans_data, colWidths=[40, 55, 80, 130, 70, 70], repeatRows=1)
+            trans_table.setStyle(TableStyle(trans_style))
+            elements.append(trans_table)
+
+    # Footer
+    elements.append(Spacer(1, 20))
+    footer_style = ParagraphStyle('Footer', parent=styles['Normal'], fontSize=8, alignment=TA_CENTER, textColor=colors.gray)
+    elements.append(Paragraph("Generated by BillByteKOT - Restaurant Management System", footer_style))
+
+    doc.build(elements)
+    return buffer.getvalue(), PDF_MEDIA_TYPE, "pdf"
+
+
+def render_daybook_excel(daybook_data: dict, date: str, end_date: str) -> RenderedFile:
+    """Day Book workbook, written row by row in openpyxl's write-only mode"""
+    try:
+        from openpyxl import Workbook
+        from openpyxl.cell import WriteOnlyCell
+        from openpyxl.styles import Alignment, Border, Font, PatternFill, Side
+        from openpyxl.utils import get_column_letter
+    except ImportError:
+        return render_daybook_csv(daybook_data, date, end_date)
+
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("Day Book")
+
+    # Column widths must be set before the first row is written
+    column_widths = [12, 12, 20, 40, 15, 18]
+    for i, width in enumerate(column_widths, 1):
+        ws.column_dimensions[get_column_letter(i)].width = width
+
+    # Styles
+    header_font = Font(bold=True, color="FFFFFF", size=11)
+    header_fill = PatternFill(start_color="7c3aed", end_color="7c3aed", fill_type="solid")
+    inflow_header_fill = PatternFill(start_color="15803d", end_color="15803d", fill_type="solid")
+    outflow_header_fill = PatternFill(start_color="dc2626", end_color="dc2626", fill_type="solid")
+    inflow_fill = PatternFill(start_color="dcfce7", end_color="dcfce7", fill_type="solid")
+    outflow_fill = PatternFill(start_color="fee2e2", end_color="fee2e2", fill_type="solid")
+    summary_fill = PatternFill(start_color="f3e8ff", end_color="f3e8ff", fill_type="solid")
+    thin_border = Border(
+        left=Side(style='thin'),
+        right=Side(style='thin'),
+        top=Side(style='thin'),
+        bottom=Side(style='thin')
+    )
+    center = Alignment(horizontal='center')
+    right = Alignment(horizontal='right')
+
+    def cell(value, font=None, fill=None, alignment=None, border=None):
+        c = WriteOnlyCell(ws, value=value)
+        if font is not None:
+            c.font = font
+        if fill is not None:
+            c.fill = fill
+        if alignment is not None:
+            c.alignment = alignment
+        if border is not None:
+            c.border = border
+        return c
+
+    def header_row(headers, fill):
+        ws.append([cell(header, header_font, fill, center, thin_border) for header in headers])
+
+    # Title
+    ws.append([cell(f"Day Book Report - {_date_range_label(date, end_date)}", Font(bold=True, size=16, color="7c3aed"))])
+    ws.append([cell(f"Generated: {datetime.now().strftime('%Y-%m-%d %H:%M')}")])
+    ws.append([])
+
+    # Summary Section
+    ws.append([cell("SUMMARY", Font(bold=True, size=12, color="7c3aed"))])
+    header_row(['Opening Balance', 'Total Inflows', 'Total Outflows', 'Net Cash Flow', 'Closing Balance'], header_fill)
+    net = daybook_data['net_cash_flow']
+    summary_fonts = [None, Font(color="15803d", bold=True), Font(color="dc2626", bold=True), Font(color="15803d" if net >= 0 else "dc2626", bold=True), None]
+    summary_values = [
+        daybook_data['opening_balance'],
+        daybook_data['total_inflows'],
+        daybook_data['total_outflows'],
+        net,
+        daybook_data['closing_balance']
+    ]
+    ws.append([
+        cell(f"₹{value:.2f}", font, summary_fill, center, thin_border)
+        for value, font in zip(summary_values, summary_fonts)
+    ])
+    ws.append([])
+
+    # Inflow and Outflow Breakdown
+    breakdowns = (
+        ("INFLOW BREAKDOWN", "15803d", 'Payment Method', inflow_header_fill, inflow_fill,
+         {method.capitalize(): amount for method, amount in daybook_data['inflow_breakdown'].items()},
+         "Total Inflows", daybook_data['total_inflows']),
+        ("OUTFLOW BREAKDOWN", "dc2626", 'Category', outflow_header_fill, outflow_fill,
+         daybook_data['outflow_breakdown'], "Total Outflows", daybook_data['total_outflows']),
+    )
+    for title, color, label, title_fill, row_fill, amounts, total_label, total in breakdowns:
+        ws.append([cell(title, Font(bold=True, size=12, color=color))])
+        header_row([label, 'Amount'], title_fill)
+        for name, amount in amounts.items():
+            if amount > 0:
+                ws.append([
+                    cell(name, fill=row_fill, border=thin_border),
+                    cell(f"₹{amount:.2f}", fill=row_fill, alignment=right, border=thin_border),
+                ])
+        ws.append([
+            cell(total_label, Font(bold=True), border=thin_border),
+            cell(f"₹{total:.2f}", Font(bold=True, color=color), alignment=right, border=thin_border),
+        ])
+        ws.append([])
+
+    # Transaction Details
+    entries = daybook_data['entries']
+    ws.append([cell(f"TRANSACTION DETAILS ({len(entries)} transactions)", Font(bold=True, size=12, color="7c3aed"))])
+    header_row(['Time', 'Type', 'Category', 'Description', 'Amount', 'Running Balance'], header_fill)
+
+    for entry in entries:
+        inflow = entry['type'] == 'inflow'
+        fill = inflow_fill if inflow else outflow_fill
+        values = [
+            _entry_time(entry),
+            '↑ Inflow' if inflow else '↓ Outflow',
+            entry.get('category', ''),
+            entry.get('description', ''),
+            f"{'+' if inflow else '-'}₹{entry['amount']:.2f}",
+            f"₹{entry.get('running_balance', 0):.2f}"
+        ]
+        ws.append([
+            cell(value, fill=fill, alignment=right if col >= 5 else None, border=thin_border)
+            for col, value in enumerate(values, 1)
+        ])
+
+    buffer = io.BytesIO()
+    wb.save(buffer)
+    return buffer.getvalue(), EXCEL_MEDIA_TYPE, "xlsx"
+
+
+RENDERERS = {
+    "pdf": render_daybook_pdf,
+    "excel": render_daybook_excel,
+    "csv": render_daybook_csv,
+}
+
+
+def _render_job(fmt: str, daybook_data: dict, date: str, end_date: str) -> RenderedFile:
+    """Worker process entry point"""
+    return RENDERERS[fmt](daybook_data, date, end_date)
+
+
+def _default(value: Any) -> Any:
+    if isinstance(value, (datetime, date_type)):
+        return value.isoformat()
+    return str(value)
+
+
+def data_version(daybook_data: dict) -> str:
+    """Digest of the Day Book data a document is rendered from"""
+    payload = json.dumps(daybook_data, sort_keys=True, separators=(",", ":"), default=_default)
+    return hashlib.sha1(payload.encode()).hexdigest()
+
+
+# ============ JOB RUNNER ============
+
+
+class ReportRenderer:
+    """Bounded process pool for document rendering, with a rendered file cache"""
+
+    def __init__(self, max_workers: int = 2, timeout: float = 60, max_entries: int = 50000,
+                 cache_bytes: int = 64 * 1024 * 1024, cache_ttl: int = 900):
+        self.max_workers = max_workers
+        self.TIMEOUT = timeout
+        self.MAX_ENTRIES = max_entries
+        self.CACHE_BYTES = cache_bytes
+        self.CACHE_TTL = cache_ttl
+
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._cache: "OrderedDict[Tuple, Tuple[float, RenderedFile]]" = OrderedDict()
+        self._cache_size = 0
+
+        self._stats = {
+            "jobs": 0,
+            "waiting": 0,
+            "in_flight": 0,
+            "errors": 0,
+            "over_size": 0,
+            "timeouts": 0,
+            "pool_restarts": 0,
+            "retries": 0,
+            "cache_hits": 0,
+            "cache_misses": 0,
+            "total_render_ms": 0.0,
+            "max_render_ms": 0.0,
+        }
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        # Spawned workers don't inherit the app's event loop, sockets or threads
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.max_workers, mp_context=multiprocessing.get_context("spawn")
+            )
+        return self._executor
+
+    @staticmethod
+    def _stop_workers(executor: ProcessPoolExecutor, grace: float = 2):
+        """Shut a pool down and terminate its worker processes, running jobs included"""
+        # The executor can't stop a running job, its processes can
+        processes = list((getattr(executor, "_processes", None) or {}).values())
+        executor.shutdown(wait=False, cancel_futures=True)
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+
+        def reap():
+            for process in processes:
+                process.join(grace)
+                if process.is_alive():
+                    process.kill()
+                    process.join(grace)
+
+        threading.Thread(target=reap, name="report-renderer-reaper", daemon=True).start()
+
+    def _restart_pool(self, executor: Optional[ProcessPoolExecutor] = None):
+        """Stop the pool (a stuck or broken one) so the next job gets a fresh one"""
+        if self._executor is None or (executor is not None and executor is not self._executor):
+            # Already replaced by another job
+            return
+        self._stop_workers(self._executor)
+        self._executor = None
+        self._stats["pool_restarts"] += 1
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        # Created lazily so it binds to the running event loop
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_workers)
+        return self._semaphore
+
+    # ============ CACHE ============
+
+    def _cache_get(self, key: Tuple) -> Optional[RenderedFile]:
+        cached = self._cache.get(key)
+        if cached is None:
+            return None
+        if time.monotonic() - cached[0] >= self.CACHE_TTL:
+            self._cache_evict(key)
+            return None
+        self._cache.move_to_end(key)
+        return cached[1]
+
+    def _cache_evict(self, key: Tuple):
+        _, rendered = self._cache.pop(key)
+        self._cache_size -= len(rendered[0])
+
+    def _cache_put(self, key: Tuple, rendered: RenderedFile):
+        size = len(rendered[0])
+        if size > self.CACHE_BYTES:
+            return
+        if key in self._cache:
+            self._cache_evict(key)
+        self._cache[key] = (time.monotonic(), rendered)
+        self._cache_size += size
+        while self._cache_size > self.CACHE_BYTES:
+            self._cache_evict(next(iter(self._cache)))
+
+    def invalidate(self, org_id: str):
+        """Drop an organization's rendered files"""
+        for key in [key for key in self._cache if key[0] == org_id]:
+            self._cache_evict(key)
+
+    # ============ JOBS ============
+
+    async def _run(self, fmt: str, daybook_data: dict, date: str, end_date: str) -> RenderedFile:
+        """Run one render job on the pool within its time budget"""
+        queued = False
+        self._stats["waiting"] += 1
+        try:
+            async with self._get_semaphore():
+                self._stats["waiting"] -= 1
+                queued = True
+                self._stats["in_flight"] += 1
+                started_at = time.perf_counter()
+                loop = asyncio.get_running_loop()
+                try:
+                    for attempt in range(2):
+                        executor = self._get_executor()
+                        future = loop.run_in_executor(executor, _render_job, fmt, daybook_data, date, end_date)
+                        try:
+                            return await asyncio.wait_for(future, timeout=self.TIMEOUT)
+                        except asyncio.TimeoutError:
+                            self._stats["timeouts"] += 1
+                            self._restart_pool(executor)
+                            raise RenderBudgetError(f"Rendering took longer than {self.TIMEOUT:g}s")
+                        except BrokenProcessPool:
+                            if executor is not self._executor and attempt == 0:
+                                # Stopped under us because another job timed out
+                                self._stats["retries"] += 1
+                                continue
+                            self._restart_pool(executor)
+                            raise
+                except RenderBudgetError:
+                    raise
+                except Exception:
+                    self._stats["errors"] += 1
+                    raise
+                finally:
+                    render_ms = (time.perf_counter() - started_at) * 1000
+                    self._stats["in_flight"] -= 1
+                    self._stats["total_render_ms"] += render_ms
+                    self._stats["max_render_ms"] = max(self._stats["max_render_ms"], render_ms)
+        finally:
+            # Cancelled while still queued
+            if not queued:
+                self._stats["waiting"] -= 1
+
+    async def render_daybook(self, org_id: str, fmt: str, daybook_data: dict, date: str, end_date: str) -> RenderedFile:
+        """
+        (content, media type, extension) of a Day Book document.
+
+        ``fmt`` is "pdf", "excel" or "csv". Raises RenderBudgetError when
+        the data has too many entries or rendering runs out of time.
+        """
+        if fmt not in RENDERERS:
+            raise ValueError(f"Unknown report format: {fmt}")
+        entries = len(daybook_data.get("entries") or ())
+        if entries > self.MAX_ENTRIES:
+            self._stats["over_size"] += 1
+            raise RenderBudgetError(
+                f"{entries} transactions is more than {self.MAX_ENTRIES} per export, choose a shorter range"
+            )
+
+        key = (org_id, date, end_date, fmt, data_version(daybook_data))
+        rendered = self._cache_get(key)
+        if rendered is not None:
+            self._stats["cache_hits"] += 1
+            return rendered
+        self._stats["cache_misses"] += 1
+
+        self._stats["jobs"] += 1
+        rendered = await self._run(fmt, daybook_data, date, end_date)
+        self._cache_put(key, rendered)
+        return rendered
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get pool, budget and cache metrics"""
+        jobs = self._stats["jobs"]
+        return {
+            **self._stats,
+            "max_workers": self.max_workers,
+            "queue_depth": self._stats["waiting"],
+            "avg_render_ms": f"{(self._stats['total_render_ms'] / jobs) if jobs else 0:.2f}ms",
+            "total_render_ms": f"{self._stats['total_render_ms']:.2f}ms",
+            "max_render_ms": f"{self._stats['max_render_ms']:.2f}ms",
+            "cached_files": len(self._cache),
+            "cache_bytes": self._cache_size,
+        }
+
+    def shutdown(self):
+        """Stop the worker processes"""
+        if self._executor is not None:
+            self._stop_workers(self._executor)
+            self._executor = None
+
+
+# Global instance
+_report_renderer = ReportRenderer(
+    max_workers=int(os.getenv("REPORT_RENDER_WORKERS", "2")),
+    timeout=float(os.getenv("REPORT_RENDER_TIMEOUT", "60")),
+    max_entries=int(os.getenv("REPORT_RENDER_MAX_ENTRIES", "50000")),
+    cache_bytes=int(os.getenv("REPORT_RENDER_CACHE_MB", "64")) * 1024 * 1024,
+)
+
+
+def get_report_renderer() -> ReportRenderer:
+    """Get the global report renderer"""
+    return _report_renderer
@@ -0,0 +1,142 @@
+"""
+Sales Heatmap
+=============
+
+Orders and revenue on a weekday x hour grid, in the organization's own
+timezone (``timezone`` of the business profile, Asia/Kolkata when unset
+or unknown), cheap enough for the dashboard to refresh:
+- Organizations on IST-equivalent time (UTC+5:30 all year) are read
+  from the daily rollups: one document per day of the range, its
+  ``hours.HH`` counters added into the day's weekday row
+- Any other timezone, or before the rollup backfill has finished, is
+  grouped by ``$dayOfWeek`` / ``$hour`` in that timezone through the
+  report engine, over hot and archived orders
+
+Counts completed and paid orders, like the rollups. Weekdays are
+Monday=0 .. Sunday=6; ``days_per_weekday`` tells how many of each the
+range holds, for per-day averages.
+"""
+
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Tuple
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+from report_engine import CREATED_DATE_EXPR, get_report_engine
+from sales_rollups import IST, get_sales_rollups
+
+DEFAULT_TIMEZONE = "Asia/Kolkata"
+WEEKDAYS = ("Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun")
+
+
+def resolve_timezone(name: Any) -> Tuple[str, ZoneInfo]:
+    """(name, zone) of a configured timezone, the default if it is unset or unknown"""
+    if name:
+        try:
+            return name, ZoneInfo(name)
+        except (ZoneInfoNotFoundError, ValueError):
+            print(f"⚠️ Unknown timezone '{name}', using {DEFAULT_TIMEZONE}")
+    return DEFAULT_TIMEZONE, ZoneInfo(DEFAULT_TIMEZONE)
+
+
+def _follows_ist(zone: ZoneInfo) -> bool:
+    """Whether local time is IST all year (no DST), so rollup days and hours line up"""
+    offset = IST.utcoffset(None)
+    return all(
+        zone.utcoffset(datetime(2024, month, 1)) == offset for month in (1, 4, 7, 10)
+    )
+
+
+def _empty_grid() -> List[List[Dict[str, float]]]:
+    return [[{"orders": 0, "revenue": 0} for _ in range(24)] for _ in WEEKDAYS]
+
+
+class SalesHeatmap:
+    """Weekday x hour sales grid from rollups or one aggregation"""
+
+    def __init__(self):
+        self._stats = {
+            "rollup_builds": 0,
+            "aggregate_builds": 0,
+        }
+
+    async def _from_rollups(self, org_id: str, start_day: str, end_day: str, grid):
+        for day in await get_sales_rollups().get_days(org_id, start_day, end_day):
+            weekday = datetime.strptime(day["date"], "%Y-%m-%d").weekday()
+            for hour, counters in (day.get("hours") or {}).items():
+                cell = grid[weekday][int(hour)]
+                cell["orders"] += counters.get("orders", 0)
+                cell["revenue"] += counters.get("revenue", 0)
+
+    async def _from_orders(self, org_id: str, start_day: str, end_day: str, tz_name: str, zone: ZoneInfo, grid):
+        start = datetime.strptime(start_day, "%Y-%m-%d").replace(tzinfo=zone).astimezone(timezone.utc)
+        end = (datetime.strptime(end_day, "%Y-%m-%d") + timedelta(days=1)).replace(tzinfo=zone).astimezone(timezone.utc)
+        local = {"date": CREATED_DATE_EXPR, "timezone": tz_name}
+        groups = await get_report_engine().group(
+            org_id,
+            {"weekday": {"$dayOfWeek": local}, "hour": {"$hour": local}},
+            {"orders": {"$sum": 1}, "revenue": {"$sum": "$total"}},
+            start=start,
+            end=end,
+        )
+        for group in groups:
+            key = group["_id"] or {}
+            if key.get("weekday") is None or key.get("hour") is None:
+                continue
+            # $dayOfWeek: Sunday=1 .. Saturday=7
+            cell = grid[(key["weekday"] + 5) % 7][key["hour"]]
+            cell["orders"] += group["orders"]
+            cell["revenue"] += group["revenue"]
+
+    async def build(self, org_id: str, start_day: str, end_day: str, tz_name: Any = None) -> Dict[str, Any]:
+        """Grid of the local days start_day..end_day (YYYY-MM-DD, inclusive)"""
+        tz_name, zone = resolve_timezone(tz_name)
+        grid = _empty_grid()
+        if _follows_ist(zone) and get_sales_rollups().is_ready():
+            self._stats["rollup_builds"] += 1
+            source = "rollups"
+            await self._from_rollups(org_id, start_day, end_day, grid)
+        else:
+            self._stats["aggregate_builds"] += 1
+            source = "orders"
+            await self._from_orders(org_id, start_day, end_day, tz_name, zone, grid)
+
+        days_per_weekday = [0] * 7
+        day = datetime.strptime(start_day, "%Y-%m-%d")
+        last = datetime.strptime(end_day, "%Y-%m-%d")
+        while day <= last:
+            days_per_weekday[day.weekday()] += 1
+            day += timedelta(days=1)
+
+        peak = None
+        for weekday, row in enumerate(grid):
+            for hour, cell in enumerate(row):
+                cell["revenue"] = round(cell["revenue"], 2)
+                if cell["orders"] and (peak is None or cell["orders"] > peak["orders"]):
+                    peak = {"weekday": weekday, "hour": hour, **cell}
+
+        return {
+            "timezone": tz_name,
+            "start_date": start_day,
+            "end_date": end_day,
+            "source": source,
+            "weekdays": list(WEEKDAYS),
+            "cells": grid,
+            "days_per_weekday": days_per_weekday,
+            "totals": {
+                "orders": sum(cell["orders"] for row in grid for cell in row),
+                "revenue": round(sum(cell["revenue"] for row in grid for cell in row), 2),
+            },
+            "peak": peak,
+        }
+
+    def get_stats(self) -> Dict[str, Any]:
+        return dict(self._stats)
+
+
+# Global instance
+_sales_heatmap = SalesHeatmap()
+
+
+def get_sales_heatmap() -> SalesHeatmap:
+    """Get the global sales heatmap"""
+    return _sales_heatmap
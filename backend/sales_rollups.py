@@ -0,0 +1,411 @@
+"""
+Daily Sales Rollups
+===================
+
+The dashboard and the period reports used to rescan raw orders on every
+request (the dashboard pulled up to 5000 orders into Python to sum
+``total``). This module keeps one ``daily_rollups`` document per
+(organization, business day) instead:
+- ``created``: orders created that day, any status
+- ``orders.<status>`` / ``revenue.<status>``: count and total of closed
+  orders (completed, paid, cancelled)
+- ``sales.*``: completed and paid orders: orders, total, subtotal, tax,
+  discount and received
+- ``payments.<method>.orders/amount``: cash, card, upi, split, credit
+  and other
+- ``inflows.<tender>``: money received per tender, split payments broken
+  into cash/card/upi the way the Day Book counts them
+- ``hours.<HH>.orders/revenue``: sales per local hour
+
+Writers call ``record(before, after)`` with an order's state before and
+after a change (None for "did not exist"). The difference of the two
+contributions is applied as one ``$inc`` upsert, so completing,
+editing a completed order, cancelling and deleting all keep the day
+consistent without reading it.
+
+The rebuild job recomputes days from the orders themselves (hot and
+archived): once for the initial backfill (recorded in ``db.migrations``;
+readers stay on raw orders until then) and regularly for the last few
+days as a repair. Rebuilds never touch the current business day: its
+live ``$inc`` writes would be overwritten by a snapshot taken moments
+earlier. The backfill therefore stops at yesterday, and the day it ran
+on (only partly recorded) is rebuilt once it is over; readers switch to
+the rollups after that catch-up. The job runs in one worker at a time
+(``JobLease``).
+
+Business days are IST (UTC+5:30), like the rest of the app.
+"""
+
+import asyncio
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from pymongo import ReplaceOne, UpdateOne
+
+from order_archive import get_order_router
+from order_dates import created_range, parse_timestamp
+
+IST = timezone(timedelta(hours=5, minutes=30))
+MIGRATION_ID = "daily_rollups"
+
+CLOSED_STATUSES = ("completed", "paid", "cancelled")
+SALE_STATUSES = ("completed", "paid")
+PAYMENT_METHODS = ("cash", "card", "upi", "split")
+
+# Order fields a contribution depends on (rebuild projection)
+ROLLUP_FIELDS = {
+    "_id": 0, "organization_id": 1, "created_at": 1, "status": 1, "total": 1, "subtotal": 1, "tax": 1,
+    "discount": 1, "discount_amount": 1, "payment_method": 1, "payment_received": 1, "is_credit": 1,
+    "cash_amount": 1, "card_amount": 1, "upi_amount": 1,
+}
+
+
+def _num(value: Any) -> float:
+    try:
+        return float(value or 0)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def business_day(value: Any) -> Optional[datetime]:
+    """An order timestamp in business-day time (IST), None if unparseable"""
+    created_at = parse_timestamp(value)
+    return created_at.astimezone(IST) if created_at else None
+
+
+def day_bounds(start_day: str, end_day: str) -> Tuple[datetime, datetime]:
+    """UTC [start, end) of the business days start_day..end_day (YYYY-MM-DD)"""
+    start = datetime.strptime(start_day, "%Y-%m-%d").replace(tzinfo=IST)
+    end = datetime.strptime(end_day, "%Y-%m-%d").replace(tzinfo=IST) + timedelta(days=1)
+    return start.astimezone(timezone.utc), end.astimezone(timezone.utc)
+
+
+def order_contribution(order: Optional[Dict[str, Any]]) -> Dict[str, float]:
+    """Flat ``$inc`` counters one order adds to its day's rollup"""
+    if not order:
+        return {}
+    counters: Dict[str, float] = {"created": 1}
+    status = order.get("status")
+    if status not in CLOSED_STATUSES:
+        return counters
+
+    total = _num(order.get("total"))
+    counters[f"orders.{status}"] = 1
+    counters[f"revenue.{status}"] = total
+    if status not in SALE_STATUSES:
+        return counters
+
+    received = _num(order.get("payment_received", total))
+    counters.update({
+        "sales.orders": 1,
+        "sales.total": total,
+        "sales.subtotal": _num(order.get("subtotal")),
+        "sales.tax": _num(order.get("tax")),
+        "sales.discount": _num(order.get("discount") or order.get("discount_amount")),
+        "sales.received": received,
+    })
+
+    payment_method = order.get("payment_method") or "cash"
+    method = "credit" if order.get("is_credit") else (payment_method if payment_method in PAYMENT_METHODS else "other")
+    counters[f"payments.{method}.orders"] = 1
+    counters[f"payments.{method}.amount"] = total
+
+    if payment_method == "split":
+        for tender in ("cash", "card", "upi"):
+            counters[f"inflows.{tender}"] = counters.get(f"inflows.{tender}", 0) + _num(order.get(f"{tender}_amount"))
+    else:
+        tender = payment_method if payment_method in ("cash", "card", "upi") else "other"
+        counters[f"inflows.{tender}"] = received
+
+    local = business_day(order.get("created_at"))
+    if local is not None:
+        counters[f"hours.{local.hour:02d}.orders"] = 1
+        counters[f"hours.{local.hour:02d}.revenue"] = total
+    return counters
+
+
+def order_day_key(order: Dict[str, Any]) -> Optional[Tuple[str, str]]:
+    local = business_day(order.get("created_at"))
+    org_id = order.get("organization_id")
+    if local is None or not org_id:
+        return None
+    return org_id, local.strftime("%Y-%m-%d")
+
+
+def _nest(counters: Dict[str, float]) -> Dict[str, Any]:
+    """Flat dotted counters -> nested document"""
+    doc: Dict[str, Any] = {}
+    for path, value in counters.items():
+        node = doc
+        *parents, leaf = path.split(".")
+        for part in parents:
+            node = node.setdefault(part, {})
+        node[leaf] = round(value, 2)
+    return doc
+
+
+def _merge(target: Dict[str, Any], source: Dict[str, Any]):
+    """Add a rollup document's counters into target (in place)"""
+    for key, value in source.items():
+        if isinstance(value, dict):
+            _merge(target.setdefault(key, {}), value)
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            target[key] = target.get(key, 0) + value
+
+
+def _rounded(doc: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        key: _rounded(value) if isinstance(value, dict) else round(value, 2)
+        for key, value in doc.items()
+    }
+
+
+class SalesRollups:
+    """Maintains and reads the daily_rollups collection"""
+
+    def __init__(self, db=None, repair_days: int = 2, batch_size: int = 1000):
+        self.db = db
+        self._ready = False
+        self._marker: Dict[str, Any] = {}
+        self._stats = {"recorded": 0, "record_errors": 0, "rebuilt_days": 0, "rebuilds": 0, "reads": 0}
+
+        self.REPAIR_DAYS = repair_days
+        self.BATCH_SIZE = batch_size
+
+    def is_ready(self) -> bool:
+        """Whether the backfill finished, so reports may read rollups alone"""
+        return self.db is not None and self._ready
+
+    def is_backfilled(self) -> bool:
+        """Whether the initial rebuild (through the day before it ran) finished"""
+        return bool(self._marker.get("completed"))
+
+    async def load_state(self):
+        self._marker = await self.db.migrations.find_one({"_id": MIGRATION_ID}) or {}
+        # Ready once the partly recorded day the backfill ran on was rebuilt
+        self._ready = self.is_backfilled() and self._marker.get("through", "") >= self._marker.get("started_day", "")
+
+    # ============ WRITES ============
+
+    def _operations(self, changes: Iterable[Tuple[Optional[Dict], Optional[Dict]]]) -> List[UpdateOne]:
+        deltas: Dict[Tuple[str, str], Dict[str, float]] = defaultdict(lambda: defaultdict(float))
+        for before, after in changes:
+            for order, sign in ((before, -1), (after, 1)):
+                key = order_day_key(order) if order else None
+                if key is None:
+                    continue
+                for path, value in order_contribution(order).items():
+                    deltas[key][path] += sign * value
+
+        now = datetime.now(timezone.utc)
+        operations = []
+        for (org_id, day), counters in deltas.items():
+            counters = {path: value for path, value in counters.items() if abs(value) > 1e-9}
+            if not counters:
+                continue
+            operations.append(UpdateOne(
+                {"_id": f"{org_id}:{day}"},
+                {
+                    "$inc": counters,
+                    "$set": {"updated_at": now},
+                    "$setOnInsert": {"organization_id": org_id, "date": day},
+                },
+                upsert=True,
+            ))
+        return operations
+
+    async def record(self, before: Optional[Dict[str, Any]], after: Optional[Dict[str, Any]]):
+        """Apply one order change (before/after state, None if absent)"""
+        await self.record_many([(before, after)])
+
+    async def record_many(self, changes: Iterable[Tuple[Optional[Dict], Optional[Dict]]]):
+        """Apply several order changes in one round trip; never raises"""
+        if self.db is None:
+            return
+        try:
+            operations = self._operations(changes)
+            if operations:
+                await self.db.daily_rollups.bulk_write(operations, ordered=False)
+                self._stats["recorded"] += len(operations)
+        except Exception as e:
+            # The repair job rebuilds recent days from the orders
+            self._stats["record_errors"] += 1
+            print(f"⚠️ Daily rollup update failed: {e}")
+
+    # ============ READS ============
+
+    async def get_days(self, org_id: str, start_day: str, end_day: str) -> List[Dict[str, Any]]:
+        """Rollup documents of the business days start_day..end_day, oldest first"""
+        self._stats["reads"] += 1
+        return await self.db.daily_rollups.find(
+            {"organization_id": org_id, "date": {"$gte": start_day, "$lte": end_day}},
+            {"_id": 0, "organization_id": 0, "updated_at": 0},
+        ).sort("date", 1).to_list(None)
+
+    async def summary(self, org_id: str, start_day: str, end_day: str) -> Dict[str, Any]:
+        """All counters of a business-day range added up (missing counters read as absent)"""
+        totals: Dict[str, Any] = {}
+        days = await self.get_days(org_id, start_day, end_day)
+        for day in days:
+            day.pop("date", None)
+            _merge(totals, day)
+        return _rounded(totals)
+
+    async def total_created(self, org_id: str) -> int:
+        """Orders ever created by an organization"""
+        self._stats["reads"] += 1
+        result = await self.db.daily_rollups.aggregate([
+            {"$match": {"organization_id": org_id}},
+            {"$group": {"_id": None, "created": {"$sum": "$created"}}},
+        ]).to_list(1)
+        return int(result[0]["created"]) if result else 0
+
+    # ============ REBUILD ============
+
+    async def rebuild(
+        self, org_id: Optional[str] = None, start_day: Optional[str] = None, end_day: Optional[str] = None
+    ) -> int:
+        """
+        Recompute rollups from orders (hot and archived) and replace them.
+
+        Scope: one organization or all, and optionally a business-day
+        range. Returns the number of days written. A change recorded
+        while its day is being recomputed can be lost, which is why the
+        repair job only rebuilds days that are already over.
+        """
+        self._stats["rebuilds"] += 1
+        scope: Dict[str, Any] = {}
+        match: Dict[str, Any] = {}
+        start = end = None
+        if org_id:
+            scope["organization_id"] = match["organization_id"] = org_id
+        if start_day or end_day:
+            start, end = day_bounds(start_day or "2000-01-01", end_day or datetime.now(IST).strftime("%Y-%m-%d"))
+            match.update(created_range(start, end))
+            scope["date"] = {"$gte": start_day or "2000-01-01"}
+            if end_day:
+                scope["date"]["$lte"] = end_day
+
+        projection = {"$project": ROLLUP_FIELDS}
+        router = get_order_router()
+        if router is not None:
+            pipeline = await router.union_pipeline(match, start, end, per_collection=[projection])
+        else:
+            pipeline = [{"$match": match}, projection]
+
+        counters: Dict[Tuple[str, str], Dict[str, float]] = defaultdict(lambda: defaultdict(float))
+        async for order in self.db.orders.aggregate(pipeline, allowDiskUse=True, batchSize=self.BATCH_SIZE):
+            key = order_day_key(order)
+            if key is None:
+                continue
+            for path, value in order_contribution(order).items():
+                counters[key][path] += value
+
+        now = datetime.now(timezone.utc)
+        operations = [
+            ReplaceOne(
+                {"_id": f"{org}:{day}"},
+                {"organization_id": org, "date": day, **_nest(values), "updated_at": now},
+                upsert=True,
+            )
+            for (org, day), values in counters.items()
+        ]
+        for offset in range(0, len(operations), self.BATCH_SIZE):
+            await self.db.daily_rollups.bulk_write(operations[offset:offset + self.BATCH_SIZE], ordered=False)
+            await asyncio.sleep(0)
+
+        # Days that no longer have any orders
+        written = {f"{org}:{day}" for org, day in counters}
+        existing = await self.db.daily_rollups.distinct("_id", scope)
+        stale = [day_id for day_id in existing if day_id not in written]
+        if stale:
+            await self.db.daily_rollups.delete_many({"_id": {"$in": stale}})
+
+        self._stats["rebuilt_days"] += len(operations)
+        return len(operations)
+
+    async def _set_marker(self, fields: Dict[str, Any]):
+        await self.db.migrations.update_one({"_id": MIGRATION_ID}, {"$set": fields}, upsert=True)
+        self._marker.update(fields)
+
+    async def backfill(self):
+        """Initial rebuild of every day before today; readers wait for ``catch_up``"""
+        today = datetime.now(IST).date()
+        through = (today - timedelta(days=1)).isoformat()
+        days = await self.rebuild(end_day=through)
+        await self._set_marker({
+            "completed": True,
+            "completed_at": datetime.now(timezone.utc),
+            "started_day": today.isoformat(),
+            "through": through,
+        })
+        print(f"✅ Daily rollups backfilled ({days} organization-days through {through})")
+
+    async def catch_up(self) -> bool:
+        """Rebuild the days since the backfill once they are over; True when readers may switch"""
+        today = datetime.now(IST).date()
+        through = self._marker.get("through", "")
+        yesterday = (today - timedelta(days=1)).isoformat()
+        if yesterday < self._marker.get("started_day", ""):
+            return False
+        start_day = (datetime.strptime(through, "%Y-%m-%d").date() + timedelta(days=1)).isoformat()
+        days = await self.rebuild(start_day=start_day, end_day=yesterday)
+        await self._set_marker({"through": yesterday})
+        self._ready = True
+        print(f"✅ Daily rollups caught up ({days} organization-days {start_day}..{yesterday})")
+        return True
+
+    async def repair_recent(self) -> int:
+        """Rebuild the last few closed business days"""
+        today = datetime.now(IST).date()
+        start_day = (today - timedelta(days=self.REPAIR_DAYS)).isoformat()
+        end_day = (today - timedelta(days=1)).isoformat()
+        return await self.rebuild(start_day=start_day, end_day=end_day)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {**self._stats, "ready": self.is_ready()}
+
+
+# Global instance
+_sales_rollups = SalesRollups()
+
+
+def init_sales_rollups(db) -> SalesRollups:
+    """Attach the global rollups to a database"""
+    _sales_rollups.db = db
+    return _sales_rollups
+
+
+def get_sales_rollups() -> SalesRollups:
+    """Get the global daily sales rollups"""
+    return _sales_rollups
+
+
+async def sales_rollup_task(interval: int = 6 * 3600, retry_delay: int = 300, lease=None):
+    """Background task: backfill rollups once, then repair recent days every few hours"""
+    rollups = _sales_rollups
+    while True:
+        try:
+            await rollups.load_state()
+            if lease is not None and not await lease.acquire():
+                # Another worker runs the job; keep our ready flag current
+                await asyncio.sleep(retry_delay)
+                continue
+            if not rollups.is_backfilled():
+                await rollups.backfill()
+                continue
+            if not rollups.is_ready():
+                if not await rollups.catch_up():
+                    # The backfill day is not over yet
+                    await asyncio.sleep(retry_delay)
+                    continue
+            else:
+                days = await rollups.repair_recent()
+                print(f"🔧 Daily rollups repaired ({days} organization-days)")
+            await asyncio.sleep(interval)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"⚠️ Daily rollup rebuild failed: {e}, retrying in {retry_delay}s")
+            await asyncio.sleep(retry_delay)
@@ -19,15 +19,14 @@ from typing import Any, Dict, List, Optional
 import jwt
 import razorpay
 from dotenv import load_dotenv
-from fastapi import APIRouter, Body, Depends, FastAPI, File, Form, HTTPException, UploadFile, status, Query, Request
+from fastapi import APIRouter, Body, Depends, FastAPI, File, Form, Header, HTTPException, UploadFile, status, Query, Request
 from fastapi.responses import Response, StreamingResponse
 from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
 from motor.motor_asyncio import AsyncIOMotorClient
-from passlib.context import CryptContext
 from pydantic import BaseModel, ConfigDict, Field
 from starlette.middleware.cors import CORSMiddleware
 from starlette.middleware.gzip import GZipMiddleware
-from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.datastructures import MutableHeaders
 
 # Import Redis cache service
 from redis_cache import init_redis_cache, cleanup_redis_cache, get_cached_order_service, get_table_status_manager
@@ -35,6 +34,69 @@ from redis_cache import init_redis_cache, cleanup_redis_cache, get_cached_order_
 # Import monitoring system
 from monitoring import init_monitoring, collect_metrics_task, monitoring_router
 
+# Import authenticated principal cache
+from principal_cache import init_principal_cache, get_principal_cache
+
+# Import order idempotency and duplicate detection
+from order_dedup import (
+    init_order_dedup,
+    get_idempotency_store,
+    get_recent_signatures,
+    order_signature,
+    request_fingerprint,
+)
+
+# Import cross-instance cache coherence and the local caches it keeps in step
+from cache_coherence import get_cache_coherence, CoherenceEvent
+from event_stream import get_event_bus
+from cache_codec import get_cache_codec
+from fast_response import FastJSONResponse, fast_responses_enabled, response_shape
+from order_dates import (
+    CREATED_AT_DT,
+    add_bson_dates,
+    created_range,
+    created_sort_field,
+    get_order_date_migration,
+    order_date_migration_task,
+)
+from order_history import fetch_order_page
+from order_archive import get_order_archiver, get_order_router, init_order_archive, order_archive_task
+from sales_rollups import get_sales_rollups, init_sales_rollups, sales_rollup_task
+from item_analytics import get_item_analytics, init_item_analytics
+from report_engine import CREATED_DATE_EXPR, business_window, get_report_engine, init_report_engine
+from staff_analytics import get_staff_analytics, init_staff_analytics, parse_shift
+from sales_heatmap import get_sales_heatmap, resolve_timezone
+from cash_ledger import cash_ledger_task, get_cash_ledger, init_cash_ledger
+from job_lease import JobLease
+from report_renderer import RenderBudgetError, get_report_renderer
+from order_export import XLSX_AVAILABLE, XLSX_MEDIA_TYPE, get_order_exporter, report_projection
+from order_transitions import (
+    CONFLICT,
+    INVALID,
+    NOT_FOUND,
+    RELEASING_STATUSES,
+    UNCHANGED,
+    bulk_transition,
+    compare_and_set_status,
+    conditional_update,
+    order_etag,
+    parse_if_match,
+    validate_transition,
+)
+from order_fast_access_cache import get_order_fast_access_cache
+from business_profile_cache import get_business_profile_cache
+
+# Import block-reserved invoice number allocator
+from invoice_allocator import init_invoice_allocator, get_invoice_allocator
+
+# Import organization entitlement service
+from entitlement_service import (
+    init_entitlement_service,
+    get_entitlement_service,
+    subscription_expiry_sweeper_task,
+    parse_timestamp,
+)
+
 # ✅ Import Performance Optimization Modules
 try:
     from response_optimizer import (
@@ -85,6 +147,12 @@ from super_admin import super_admin_router, set_database as set_super_admin_db,
 # Import ops panel router
 from ops_panel import ops_router, set_database as set_ops_db, set_redis_cache as set_ops_cache
 
+# Import async password hasher AFTER loading .env (reads BCRYPT_ROUNDS)
+from hashing_service import get_password_hasher
+
+# Import local token-bucket rate limiter AFTER loading .env (reads RATE_LIMIT_*)
+from rate_limiter import RateLimitMiddleware, get_rate_limiter
+
 # MongoDB connection with SSL configuration
 mongo_url = os.getenv(
     "MONGO_URL",
@@ -158,7 +226,7 @@ except Exception as e:
 db = client[os.getenv("DB_NAME", "restrobill")]
 
 # Security
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+pwd_context = get_password_hasher().context
 security = HTTPBearer()
 JWT_SECRET = os.getenv("JWT_SECRET", "default-jwt-secret-please-change-in-production")
 JWT_ALGORITHM = os.getenv("JWT_ALGORITHM", "HS256")
@@ -271,6 +339,26 @@ ALLOWED_ORIGINS = [
     "https://restro-ai-u9kz-ed0v8idw3-shivs-projects-db2d52eb.vercel.app",
 ]
 
+def _rate_limit_identity(scope) -> Optional[str]:
+    """User id of a request's valid bearer token, so signed-in users are limited per user"""
+    for name, value in scope.get("headers") or ():
+        if name == b"authorization":
+            header = value.decode("latin-1")
+            if not header.lower().startswith("bearer "):
+                return None
+            try:
+                payload = jwt.decode(header[7:].strip(), JWT_SECRET, algorithms=[JWT_ALGORITHM])
+            except jwt.exceptions.InvalidTokenError:
+                return None
+            return payload.get("user_id")
+    return None
+
+
+# Rate limiting (pure ASGI, in-process token buckets synced to Redis in the
+# background). Added before CORS so 429 responses still carry CORS headers.
+# Clients behind nginx are told apart by the forwarded IP (TRUSTED_PROXIES).
+app.add_middleware(RateLimitMiddleware, identify=_rate_limit_identity)
+
 # CRITICAL: Add CORS middleware BEFORE any routes
 app.add_middleware(
     CORSMiddleware,
@@ -282,66 +370,58 @@ app.add_middleware(
 )
 
 # Add GZip compression for faster response times (compress responses > 500 bytes)
-app.add_middleware(GZipMiddleware, minimum_size=500)
+# Event streams are skipped: GZip buffers the body, which would hold SSE events back
+class SkipStreamsGZipMiddleware(GZipMiddleware):
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and scope["path"].startswith("/api/events/"):
+            await self.app(scope, receive, send)
+            return
+        await super().__call__(scope, receive, send)
+
+
+app.add_middleware(SkipStreamsGZipMiddleware, minimum_size=500)
+
+# Monitoring middleware (pure ASGI - no per-request task or body buffering)
+class MonitoringMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in ["/health", "/api/monitoring/health", "/nginx_status"]:
+            await self.app(scope, receive, send)
+            return
 
-# Rate limiting and monitoring middleware
-class MonitoringMiddleware(BaseHTTPMiddleware):
-    async def dispatch(self, request: Request, call_next):
         start_time = time.time()
-        
-        # Rate limiting check
-        client_ip = request.client.host
-        user_agent = request.headers.get("user-agent", "")
-        
-        # Skip rate limiting for health checks and monitoring endpoints
-        if request.url.path in ["/health", "/api/monitoring/health", "/nginx_status"]:
-            response = await call_next(request)
-            return response
-        
-        # Check rate limits using Redis if available
-        try:
-            from redis_cache import redis_cache
-            if redis_cache and redis_cache.is_connected():
-                # Different rate limits for different endpoints
-                if request.url.path.startswith("/api/auth/"):
-                    rate_limit_key = f"rate_limit:auth:{client_ip}"
-                    if not await redis_cache.check_rate_limit(rate_limit_key, 10, 60):  # 10 requests per minute
-                        raise HTTPException(status_code=429, detail="Too many authentication requests")
-                elif request.url.path.startswith("/api/orders/"):
-                    rate_limit_key = f"rate_limit:orders:{client_ip}"
-                    if not await redis_cache.check_rate_limit(rate_limit_key, 200, 60):  # 200 requests per minute
-                        raise HTTPException(status_code=429, detail="Too many order requests")
-                else:
-                    rate_limit_key = f"rate_limit:general:{client_ip}"
-                    if not await redis_cache.check_rate_limit(rate_limit_key, 100, 60):  # 100 requests per minute
-                        raise HTTPException(status_code=429, detail="Rate limit exceeded")
-        except Exception as e:
-            # Continue without rate limiting if Redis is unavailable
-            print(f"Rate limiting error: {e}")
-        
-        # Process request
+        status_code = 500
+        response_started = False
+
+        async def send_wrapper(message):
+            nonlocal status_code, response_started
+            if message["type"] == "http.response.start":
+                response_started = True
+                status_code = message["status"]
+                # Add performance headers
+                response_time = (time.time() - start_time) * 1000
+                headers = MutableHeaders(scope=message)
+                headers["X-Response-Time"] = f"{response_time:.2f}ms"
+                headers["X-Server-Instance"] = os.getenv("SERVER_INSTANCE", "1")
+            await send(message)
+
         try:
-            response = await call_next(request)
-            is_error = response.status_code >= 400
+            await self.app(scope, receive, send_wrapper)
         except Exception as e:
-            is_error = True
-            response = Response(content=str(e), status_code=500)
-        
+            if response_started:
+                raise
+            await Response(content=str(e), status_code=500)(scope, receive, send)
+
         # Record metrics
         response_time = (time.time() - start_time) * 1000  # Convert to milliseconds
-        
         try:
             from monitoring import metrics_collector
             if metrics_collector:
-                metrics_collector.record_request(response_time, is_error)
+                metrics_collector.record_request(response_time, status_code >= 400)
         except Exception as e:
             print(f"Metrics recording error: {e}")
-        
-        # Add performance headers
-        response.headers["X-Response-Time"] = f"{response_time:.2f}ms"
-        response.headers["X-Server-Instance"] = os.getenv("SERVER_INSTANCE", "1")
-        
-        return response
 
 app.add_middleware(MonitoringMiddleware)
 
@@ -448,6 +528,8 @@ class BusinessSettings(BaseModel):
     frontend_url: Optional[str] = None  # For generating QR codes
     # UPI Payment Settings
     upi_id: Optional[str] = None  # UPI ID for QR code payments
+    # Invoice Numbering
+    invoice_gap_free: bool = False  # Strict gap-free invoice sequence (tax compliance)
 
 
 class User(BaseModel):
@@ -639,8 +721,24 @@ class OrderItem(BaseModel):
     notes: Optional[str] = None
 
 
-async def get_next_invoice_number(organization_id: str) -> int:
+async def _org_business_settings(organization_id: str) -> dict:
+    """The organization admin's business settings (staff users carry none of their own)"""
+    profiles = get_business_profile_cache()
+    if profiles:
+        profile = await profiles.get_profile(organization_id, db)
+    else:
+        profile = await db.users.find_one(
+            {"id": organization_id, "role": "admin"}, {"_id": 0, "business_settings": 1}
+        )
+    return (profile or {}).get("business_settings") or {}
+
+
+async def get_next_invoice_number(organization_id: str, gap_free: bool = False) -> int:
     """Get the next invoice number for an organization"""
+    allocator = get_invoice_allocator()
+    if allocator is not None:
+        return await allocator.allocate(organization_id, gap_free=gap_free)
+
     counter = await db.counters.find_one_and_update(
         {"_id": f"invoice_{organization_id}"},
         {"$inc": {"seq": 1}},
@@ -680,6 +778,8 @@ class Order(BaseModel):
     card_amount: float = 0
     upi_amount: float = 0
     credit_amount: float = 0  # Amount on credit (unpaid)
+    # Incremented on every write; send it back as If-Match for conditional updates
+    version: int = 0
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
     updated_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
@@ -818,17 +918,34 @@ class PrintData(BaseModel):
 
 
 # Helper functions
-def hash_password(password: str) -> str:
-    return pwd_context.hash(password)
+async def hash_password(password: str) -> str:
+    return await get_password_hasher().hash(password)
+
+
+async def verify_password(plain_password: str, hashed_password: str) -> bool:
+    try:
+        return await get_password_hasher().verify(plain_password, hashed_password)
+    except Exception as e:
+        print(f"❌ Password verification exception: {str(e)}")
+        return False
 
 
-def verify_password(plain_password: str, hashed_password: str) -> bool:
+async def verify_password_and_rehash(plain_password: str, hashed_password: str, collection, record_id: str) -> bool:
+    """Verify a password and transparently upgrade outdated hashes on success"""
     try:
-        return pwd_context.verify(plain_password, hashed_password)
+        valid, new_hash = await get_password_hasher().verify_and_update(plain_password, hashed_password)
     except Exception as e:
         print(f"❌ Password verification exception: {str(e)}")
         return False
 
+    if valid and new_hash:
+        try:
+            await collection.update_one({"id": record_id}, {"$set": {"password": new_hash}})
+            print(f"🔐 Rehashed password for {record_id} with current work factor")
+        except Exception as e:
+            print(f"⚠️ Password rehash failed for {record_id}: {e}")
+    return valid
+
 
 def create_access_token(data: dict) -> str:
     to_encode = data.copy()
@@ -837,6 +954,20 @@ def create_access_token(data: dict) -> str:
     return jwt.encode(to_encode, JWT_SECRET, algorithm=JWT_ALGORITHM)
 
 
+# EventSource can't send headers, so the stream URL carries a ticket: a
+# JWT that only opens event streams and expires within a minute, instead
+# of the 7-day access token (URLs end up in proxy and browser logs)
+EVENT_STREAM_PURPOSE = "event_stream"
+EVENT_STREAM_TICKET_TTL = 60
+
+
+def create_stream_ticket(user_id: str) -> str:
+    expire = datetime.now(timezone.utc) + timedelta(seconds=EVENT_STREAM_TICKET_TTL)
+    return jwt.encode(
+        {"user_id": user_id, "purpose": EVENT_STREAM_PURPOSE, "exp": expire}, JWT_SECRET, algorithm=JWT_ALGORITHM
+    )
+
+
 # Referral System Helper Functions
 import string
 
@@ -923,6 +1054,7 @@ async def assign_referral_code_to_user(user_id: str) -> str:
         {"id": user_id},
         {"$set": {"referral_code": code}}
     )
+    await get_principal_cache().invalidate(user_id)
     return code
 
 
@@ -1375,17 +1507,38 @@ def get_secure_org_id(current_user: dict) -> str:
     return org_id
 
 
+async def _record_order_changes(changes):
+    """Keep the daily rollups and the cash ledger in step with order writes ``(before, after)``"""
+    changes = list(changes)
+    await get_sales_rollups().record_many(changes)
+    await get_cash_ledger().record_orders(changes)
+
+
+async def _record_order_change(before: Optional[dict], after: Optional[dict]):
+    await _record_order_changes([(before, after)])
+
+
 async def get_current_user(
     credentials: HTTPAuthorizationCredentials = Depends(security),
 ):
+    return await authenticate_token(credentials.credentials)
+
+
+async def authenticate_token(token: str, purpose: Optional[str] = None) -> dict:
+    """
+    User a JWT belongs to. ``purpose`` is the kind of single-purpose token
+    expected (e.g. an event stream ticket); None accepts access tokens only.
+    """
     try:
-        token = credentials.credentials
         payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
+        if payload.get("purpose") != purpose:
+            print(f"❌ Invalid token: purpose {payload.get('purpose')!r}, expected {purpose!r}")
+            raise HTTPException(status_code=401, detail="Invalid token")
         user_id = payload.get("user_id")
         if user_id is None:
             print(f"❌ Invalid token: no user_id in payload")
             raise HTTPException(status_code=401, detail="Invalid token")
-        user = await db.users.find_one({"id": user_id}, {"_id": 0})
+        user = await get_principal_cache().get_user(user_id, db)
         if user is None:
             print(f"❌ User not found: {user_id}")
             raise HTTPException(status_code=401, detail="User not found")
@@ -1433,85 +1586,28 @@ async def check_subscription(user: dict):
     - After trial: Must have active paid subscription
     - No bill count limit during trial
     - Staff users: Check their own subscription first, then fall back to admin's
+    - Organization status comes from the cached entitlement record; expired
+      subscriptions are deactivated by the background sweeper
     """
-    
+    entitlements = get_entitlement_service()
+
     # For staff users, check their own subscription first
     if user.get("role") in ["waiter", "cashier", "kitchen", "staff"]:
         # First check if staff has their own active subscription
         if user.get("subscription_active"):
-            expires_at = user.get("subscription_expires_at")
-            if expires_at:
-                if isinstance(expires_at, str):
-                    try:
-                        expires_at = datetime.fromisoformat(expires_at.replace("Z", "+00:00"))
-                    except:
-                        expires_at = None
-                
-                if expires_at and expires_at >= datetime.now(timezone.utc):
-                    # Staff has their own active subscription
-                    return True
-        
+            expires_at = parse_timestamp(user.get("subscription_expires_at"))
+            if expires_at and expires_at >= datetime.now(timezone.utc):
+                # Staff has their own active subscription
+                return True
+
         # Staff doesn't have own subscription, check organization admin's subscription
         org_id = user.get("organization_id")
-        if org_id:
-            # Find the admin of this organization
-            admin_user = await db.users.find_one(
-                {"id": org_id, "role": "admin"}, 
-                {"_id": 0, "subscription_active": 1, "subscription_expires_at": 1, "created_at": 1, "trial_extension_days": 1}
-            )
-            if admin_user:
-                # Use admin's subscription status for trial/subscription check
-                user = admin_user
-            else:
-                # If no admin found, block access
-                return False
-    
-    # Check if user has active paid subscription
-    if user.get("subscription_active"):
-        # Check if subscription has expired
-        expires_at = user.get("subscription_expires_at")
-        if expires_at:
-            if isinstance(expires_at, str):
-                try:
-                    expires_at = datetime.fromisoformat(expires_at.replace("Z", "+00:00"))
-                except:
-                    expires_at = None
-            
-            if expires_at and expires_at < datetime.now(timezone.utc):
-                # Subscription expired - deactivate it
-                await db.users.update_one(
-                    {"id": user["id"]}, 
-                    {"$set": {"subscription_active": False}}
-                )
-                # Fall through to check trial
-            else:
-                # Active subscription - allow access
-                return True
-    
-    # No active subscription - check trial period
-    created_at = user.get("created_at")
-    if isinstance(created_at, str):
-        try:
-            created_at = datetime.fromisoformat(created_at.replace("Z", "+00:00"))
-        except:
-            created_at = None
-    
-    if created_at:
-        # Base trial is 7 days + any extension days granted by admin
-        trial_extension_days = user.get("trial_extension_days", 0)
-        total_trial_days = 7 + trial_extension_days
-        trial_end = created_at + timedelta(days=total_trial_days)
-        now = datetime.now(timezone.utc)
-        
-        if now < trial_end:
-            # Still in trial period - allow access
-            return True
-        else:
-            # Trial expired and no active subscription - block access
+        if not org_id:
             return False
-    
-    # No created_at date (shouldn't happen) - block access for safety
-    return False
+        return await entitlements.is_entitled(org_id, db)
+
+    # Admin: entitlement is computed from the already-loaded user document
+    return await entitlements.is_entitled(user["id"], db, admin=user)
 
 
 def get_paper_width_chars(paper_width: str, custom_width: Optional[int] = None) -> int:
@@ -2041,7 +2137,7 @@ async def verify_registration(verify_data: VerifyRegistrationOTP):
     print(f"🔍 Document keys before insert: {list(doc.keys())}")
     print(f"🔍 Referral code in doc: {doc.get('referral_code', 'NOT_FOUND')}")
     
-    doc["password"] = hash_password(user_data["password"])
+    doc["password"] = await hash_password(user_data["password"])
     doc["created_at"] = doc["created_at"].isoformat()
     doc["email_verified"] = True
     doc["email_verified_at"] = datetime.now(timezone.utc).isoformat()
@@ -2185,7 +2281,7 @@ async def register_direct(user_data: UserCreate):
     
     # Prepare document for database
     doc = user_obj.model_dump()
-    doc["password"] = hash_password(user_data.password)
+    doc["password"] = await hash_password(user_data.password)
     doc["created_at"] = doc["created_at"].isoformat()
     doc["email_verified"] = False  # Not verified since no OTP
     doc["username_lower"] = username_lower
@@ -2285,7 +2381,9 @@ async def login(credentials: UserLogin):
     
     # Verify password
     try:
-        password_valid = verify_password(credentials.password, user["password"])
+        password_valid = await verify_password_and_rehash(
+            credentials.password, user["password"], db.users, user["id"]
+        )
     except Exception as e:
         print(f"❌ Password verification error for {username_clean}: {str(e)}")
         raise HTTPException(status_code=401, detail="Invalid credentials")
@@ -2405,49 +2503,58 @@ async def get_dashboard(current_user: dict = Depends(get_current_user)):
         # Convert to UTC for database query
         today_utc = today_ist.astimezone(timezone.utc)
         
-        # Get today's orders (all statuses)
-        today_orders = await db.orders.find({
-            "organization_id": user_org_id,
-            "created_at": {"$gte": today_utc.isoformat()}
-        }, {"_id": 0}).to_list(1000)
-        
-        # Get today's completed orders only
-        today_completed_orders = [order for order in today_orders if order.get("status") in ["completed", "paid"]]
-        
-        # Calculate today's revenue (completed orders only)
-        todays_revenue = sum(order.get("total", 0) for order in today_completed_orders)
-        
-        # Get pending orders count
-        pending_orders = await db.orders.count_documents({
+        pending_query = {
             "organization_id": user_org_id,
             "status": {"$in": ["pending", "preparing", "confirmed"]}
-        })
+        }
+        
+        # Daily rollups: a few small documents instead of rescanning the month's orders
+        rollups = get_sales_rollups()
+        if rollups.is_ready():
+            today = now_ist.strftime("%Y-%m-%d")
+            today_summary, month_summary, total_orders, pending_orders = await asyncio.gather(
+                rollups.summary(user_org_id, today, today),
+                rollups.summary(user_org_id, now_ist.replace(day=1).strftime("%Y-%m-%d"), today),
+                rollups.total_created(user_org_id),
+                db.orders.count_documents(pending_query),
+            )
+            today_sales = today_summary.get("sales", {})
+            month_sales = month_summary.get("sales", {})
+            return {
+                "todaysRevenue": today_sales.get("total", 0),
+                "todaysOrders": int(today_summary.get("created", 0)),
+                "todaysCompletedOrders": int(today_sales.get("orders", 0)),
+                "totalOrders": total_orders,
+                "pendingOrders": pending_orders,
+                "monthlyRevenue": month_sales.get("total", 0),
+                "monthlyOrders": int(month_sales.get("orders", 0)),
+                "timestamp": now_ist.isoformat()
+            }
         
-        # Get this month's data
+        # Counted and summed in MongoDB (today: all statuses, and completed/paid sales)
+        engine = get_report_engine()
         month_start = now_ist.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
         month_start_utc = month_start.astimezone(timezone.utc)
+        today_all, today_sales, month_sales, pending_orders = await asyncio.gather(
+            engine.totals(user_org_id, fields=(), statuses=None, start=today_utc),
+            engine.totals(user_org_id, start=today_utc),
+            engine.totals(user_org_id, start=month_start_utc),
+            db.orders.count_documents(pending_query),
+        )
         
-        monthly_orders = await db.orders.find({
-            "organization_id": user_org_id,
-            "created_at": {"$gte": month_start_utc.isoformat()},
-            "status": {"$in": ["completed", "paid"]}
-        }, {"_id": 0}).to_list(5000)
-        
-        monthly_revenue = sum(order.get("total", 0) for order in monthly_orders)
-        
-        # Get total orders count (all time)
-        total_orders = await db.orders.count_documents({
+        # Get total orders count (all time, including archived months)
+        total_orders = await get_order_router().count_documents({
             "organization_id": user_org_id
         })
         
         return {
-            "todaysRevenue": todays_revenue,
-            "todaysOrders": len(today_orders),
-            "todaysCompletedOrders": len(today_completed_orders),
+            "todaysRevenue": today_sales["total"],
+            "todaysOrders": today_all["orders"],
+            "todaysCompletedOrders": today_sales["orders"],
             "totalOrders": total_orders,
             "pendingOrders": pending_orders,
-            "monthlyRevenue": monthly_revenue,
-            "monthlyOrders": len(monthly_orders),
+            "monthlyRevenue": month_sales["total"],
+            "monthlyOrders": month_sales["orders"],
             "timestamp": now_ist.isoformat()
         }
         
@@ -2476,6 +2583,7 @@ async def complete_onboarding(
         {"id": current_user["id"]},
         {"$set": {"onboarding_completed": data.get("onboarding_completed", True)}}
     )
+    await get_principal_cache().invalidate(current_user["id"])
     return {"message": "Onboarding status updated"}
 
 
@@ -2619,7 +2727,7 @@ async def reset_password(request: ResetPasswordRequest):
     actual_email = user.get("email")
     
     # Update password
-    hashed_password = hash_password(request.new_password)
+    hashed_password = await hash_password(request.new_password)
     print(f"🔐 Resetting password for {actual_email}")
     print(f"🔐 New password hash: {hashed_password[:20]}...")
     
@@ -2778,7 +2886,7 @@ async def verify_staff_creation(
     )
 
     doc = user_obj.model_dump()
-    doc["password"] = hash_password(staff_data["password"])
+    doc["password"] = await hash_password(staff_data["password"])
     doc["phone"] = staff_data["phone"]
     doc["salary"] = staff_data["salary"]
     doc["created_at"] = doc["created_at"].isoformat()
@@ -2786,6 +2894,7 @@ async def verify_staff_creation(
     doc["email_verified_at"] = datetime.now(timezone.utc).isoformat()
 
     await db.users.insert_one(doc)
+    get_staff_analytics().invalidate_directory(admin_org_id)
     
     # Remove used OTP
     del staff_otp_storage[email_lower]
@@ -2816,13 +2925,14 @@ async def create_staff(
     )
 
     doc = user_obj.model_dump()
-    doc["password"] = hash_password(staff_data.password)
+    doc["password"] = await hash_password(staff_data.password)
     doc["phone"] = staff_data.phone
     doc["salary"] = staff_data.salary
     doc["created_at"] = doc["created_at"].isoformat()
     doc["email_verified"] = False
 
     await db.users.insert_one(doc)
+    get_staff_analytics().invalidate_directory(admin_org_id)
     return {"message": "Staff member created", "id": user_obj.id}
 
 
@@ -2866,7 +2976,7 @@ async def update_staff(
     if staff_data.email:
         update_data["email"] = staff_data.email
     if staff_data.password:
-        update_data["password"] = hash_password(staff_data.password)
+        update_data["password"] = await hash_password(staff_data.password)
     if staff_data.role:
         update_data["role"] = staff_data.role
     if staff_data.phone is not None:
@@ -2875,6 +2985,8 @@ async def update_staff(
         update_data["salary"] = staff_data.salary
 
     await db.users.update_one({"id": staff_id}, {"$set": update_data})
+    await get_principal_cache().invalidate(staff_id)
+    get_staff_analytics().invalidate_directory(admin_org_id)
     return {"message": "Staff updated"}
 
 
@@ -2897,6 +3009,8 @@ async def delete_staff(staff_id: str, current_user: dict = Depends(get_current_u
         raise HTTPException(status_code=400, detail="Cannot delete admin user")
 
     await db.users.delete_one({"id": staff_id})
+    await get_principal_cache().invalidate(staff_id)
+    get_staff_analytics().invalidate_directory(admin_org_id)
     return {"message": "Staff deleted"}
 
 
@@ -2935,6 +3049,7 @@ async def setup_business(
         {"id": current_user["id"]},
         {"$set": {"business_settings": settings.model_dump(), "setup_completed": True}},
     )
+    await get_principal_cache().invalidate(current_user["id"])
     return {"message": "Business setup completed", "settings": settings.model_dump()}
 
 
@@ -2949,6 +3064,7 @@ async def update_business_settings(
         {"id": current_user["id"]},
         {"$set": {"business_settings": settings.model_dump()}},
     )
+    await get_principal_cache().invalidate(current_user["id"])
     return {"message": "Business settings updated successfully", "settings": settings.model_dump()}
 
 
@@ -3198,6 +3314,7 @@ async def update_razorpay_settings(
             }
         },
     )
+    await get_principal_cache().invalidate(current_user["id"])
     return {"message": "Razorpay settings updated successfully"}
 
 
@@ -3754,6 +3871,8 @@ async def verify_subscription_payment(
                 }
             },
         )
+        await get_principal_cache().invalidate(current_user["id"])
+        await get_entitlement_service().invalidate(current_user["id"])
         
         print(f"Subscription activated for user: {current_user['id']} via campaign: {campaign_name}, plan: {plan_type} ({plan_months} months)")
         
@@ -3812,6 +3931,8 @@ async def verify_subscription_payment(
                     }
                 },
             )
+            await get_principal_cache().invalidate(current_user["id"])
+            await get_entitlement_service().invalidate(current_user["id"])
             
             # Also trigger referral completion in fallback case
             try:
@@ -3875,6 +3996,7 @@ async def create_menu_item(
     try:
         cached_service = get_cached_order_service()
         await cached_service.invalidate_menu_caches(user_org_id)
+        get_item_analytics().invalidate_menu(user_org_id)
         print(f"🗑️ Menu cache invalidated for new item {menu_obj.id}")
     except Exception as e:
         print(f"⚠️ Menu cache invalidation error: {e}")
@@ -3944,6 +4066,12 @@ async def get_menu(current_user: dict = Depends(get_current_user)):
     try:
         # Use Redis-cached service for menu items
         cached_service = get_cached_order_service()
+        if fast_responses_enabled():
+            # Trusted cache hit: send the cached JSON without response_model revalidation
+            cached_json = await cached_service.get_menu_items_json(user_org_id)
+            if cached_json is not None:
+                print("🚀 Returned menu items (Redis cached JSON)")
+                return FastJSONResponse(cached_json)
         items = await cached_service.get_menu_items(user_org_id, use_cache=True)
         print(f"🚀 Returned {len(items)} menu items (Redis cached)")
         return items
@@ -4007,6 +4135,7 @@ async def update_menu_item(
     try:
         cached_service = get_cached_order_service()
         await cached_service.invalidate_menu_caches(user_org_id)
+        get_item_analytics().invalidate_menu(user_org_id)
         print(f"🗑️ Menu cache invalidated for updated item {item_id}")
     except Exception as e:
         print(f"⚠️ Menu cache invalidation error: {e}")
@@ -4034,6 +4163,7 @@ async def delete_menu_item(
     try:
         cached_service = get_cached_order_service()
         await cached_service.invalidate_menu_caches(user_org_id)
+        get_item_analytics().invalidate_menu(user_org_id)
         print(f"🗑️ Menu cache invalidated for deleted item {item_id}")
     except Exception as e:
         print(f"⚠️ Menu cache invalidation error: {e}")
@@ -4104,6 +4234,12 @@ async def get_tables(
         
         # Otherwise use Redis-cached service for tables
         cached_service = get_cached_order_service()
+        if fast_responses_enabled():
+            # Trusted cache hit: send the cached JSON without response_model revalidation
+            cached_json = await cached_service.get_tables_json(user_org_id)
+            if cached_json is not None:
+                print("🚀 Returned tables (Redis cached JSON)")
+                return FastJSONResponse(cached_json)
         tables = await cached_service.get_tables(user_org_id, use_cache=True)
         print(f"🚀 Returned {len(tables)} tables (Redis cached)")
         return tables
@@ -4279,6 +4415,7 @@ async def create_reservation(
     reservation_obj = Reservation(**reservation_data)
     await db.reservations.insert_one(reservation_obj.model_dump())
     print(f"✅ Created reservation: Table {table['table_number']} for {reservation.customer_name} on {reservation.reservation_date}")
+    await get_event_bus().publish(user_org_id, "reservation.updated", reservation_obj.model_dump())
     
     # Smart table status update based on timing
     from datetime import date, datetime as dt, timedelta
@@ -4382,6 +4519,8 @@ async def update_reservation(
         "organization_id": user_org_id
     }, {"_id": 0})
     
+    if updated:
+        await get_event_bus().publish(user_org_id, "reservation.updated", updated)
     return updated
 
 
@@ -4415,6 +4554,8 @@ async def delete_reservation(
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Reservation not found")
     
+    await get_event_bus().publish(user_org_id, "reservation.removed", {"id": reservation_id})
+    
     # Clear table status if it was reserved for this reservation
     table_id = existing.get("table_id")
     if table_id:
@@ -4472,6 +4613,9 @@ async def auto_clear_expired_reservations(
                     {"id": reservation["id"]},
                     {"$set": {"status": "expired", "updated_at": current_time.isoformat()}}
                 )
+                await get_event_bus().publish(user_org_id, "reservation.updated", {
+                    "id": reservation["id"], "status": "expired", "updated_at": current_time.isoformat()
+                })
                 
                 # Clear table status
                 table_result = await db.tables.update_one(
@@ -4576,6 +4720,46 @@ async def activate_pending_reservations(
     }
 
 
+@api_router.post("/events/ticket")
+async def create_event_stream_ticket(current_user: dict = Depends(get_current_user)):
+    """Short-lived ticket for opening /events/stream (EventSource cannot send headers)"""
+    return {"ticket": create_stream_ticket(current_user["id"]), "expires_in": EVENT_STREAM_TICKET_TTL}
+
+
+@api_router.get("/events/stream")
+async def stream_org_events(
+    request: Request,
+    ticket: Optional[str] = Query(None, description="Ticket from POST /events/ticket"),
+    last_event_id: Optional[str] = Query(None, alias="lastEventId"),
+):
+    """
+    Server-Sent Events stream of order, table and reservation changes.
+
+    Events: order.updated, order.removed, orders.updated (batch),
+    orders.reset, table.updated, tables.changed, reservation.updated,
+    reservation.removed and resync (refetch everything). Clients reconnecting with ``Last-Event-ID`` get
+    the events they missed; screens should only poll while disconnected.
+    """
+    authorization = request.headers.get("authorization", "")
+    if authorization.lower().startswith("bearer "):
+        current_user = await authenticate_token(authorization[7:])
+    elif ticket:
+        current_user = await authenticate_token(ticket, purpose=EVENT_STREAM_PURPOSE)
+    else:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    user_org_id = get_secure_org_id(current_user)
+
+    event_bus = get_event_bus()
+    if not event_bus.can_accept(user_org_id):
+        raise HTTPException(status_code=429, detail="Too many open event streams for this organization")
+
+    return StreamingResponse(
+        event_bus.stream(user_org_id, request.headers.get("last-event-id") or last_event_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 # Helper function to generate WhatsApp notification link
 def generate_whatsapp_notification(phone: str, message: str) -> str:
     """Generate WhatsApp link for notification"""
@@ -4659,11 +4843,53 @@ We hope to see you again soon! 🙏
     return messages.get(status, f"Order #{order_id} status: {status}")
 
 
+async def run_idempotent(scope: str, idempotency_key: Optional[str], fingerprint: str, handler):
+    """
+    Run an order-creating handler at most once per Idempotency-Key.
+
+    Retries with the same key get the stored response; requests without
+    a key are processed normally.
+    """
+    if not idempotency_key:
+        return await handler()
+    if len(idempotency_key) > 255:
+        raise HTTPException(status_code=400, detail="Idempotency-Key must be at most 255 characters")
+
+    store = get_idempotency_store()
+    outcome, stored_response = await store.begin(scope, idempotency_key, fingerprint)
+    if outcome == store.REPLAY:
+        print(f"🔁 Replaying stored response for Idempotency-Key {idempotency_key}")
+        return stored_response
+    if outcome == store.IN_PROGRESS:
+        raise HTTPException(status_code=409, detail="A request with this Idempotency-Key is still being processed")
+    if outcome == store.MISMATCH:
+        raise HTTPException(status_code=422, detail="Idempotency-Key was already used for a different request")
+
+    try:
+        response = await handler()
+    except BaseException:
+        await store.abort(scope, idempotency_key)
+        raise
+    await store.complete(scope, idempotency_key, fingerprint, response)
+    return response
+
+
 # Order routes
 @api_router.post("/orders", response_model=Order)
 async def create_order(
-    order_data: OrderCreate, current_user: dict = Depends(get_current_user)
+    order_data: OrderCreate,
+    current_user: dict = Depends(get_current_user),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
 ):
+    return await run_idempotent(
+        f"orders:{current_user.get('organization_id') or current_user['id']}",
+        idempotency_key,
+        request_fingerprint(order_data.model_dump_json()),
+        lambda: _create_order(order_data, current_user),
+    )
+
+
+async def _create_order(order_data: OrderCreate, current_user: dict):
     if not await check_subscription(current_user):
         # Check if trial expired or subscription expired
         created_at = current_user.get("created_at")
@@ -4698,40 +4924,19 @@ async def create_order(
     table_id = order_data.table_id or "counter"
     table_number = order_data.table_number or 0
 
-    # ENHANCED DUPLICATE PREVENTION - Check for exact duplicate orders
+    # DUPLICATE PREVENTION - same table, same items within 30 seconds
+    # (in-memory signature LRU mirrored to Redis, no database query)
+    signature = None
     if kot_mode_enabled and table_id != "counter":
+        signature = order_signature(order_data.items)
+        if not await get_recent_signatures().claim(user_org_id, table_id, signature):
+            print(f"🚫 Duplicate order detected for table {table_number} - rejecting")
+            raise HTTPException(
+                status_code=400,
+                detail=f"Duplicate order detected for Table {table_number}. Please wait 30 seconds before placing the same order again."
+            )
+
         try:
-            # Check for exact duplicate orders (same table, same items, within last 30 seconds)
-            recent_cutoff = (datetime.now(timezone.utc) - timedelta(seconds=30)).isoformat()
-            
-            # Create signature of current order items for comparison
-            current_items_signature = sorted([
-                f"{item.menu_item_id}_{item.quantity}_{item.price}" 
-                for item in order_data.items
-            ])
-            
-            # Find recent orders on same table
-            recent_orders = await db.orders.find({
-                "organization_id": user_org_id,
-                "table_id": table_id,
-                "created_at": {"$gte": recent_cutoff}
-            }).to_list(10)
-            
-            for recent_order in recent_orders:
-                # Create signature of recent order items
-                recent_items_signature = sorted([
-                    f"{item.get('menu_item_id', 'unknown')}_{item.get('quantity', 0)}_{item.get('price', 0)}" 
-                    for item in recent_order.get("items", [])
-                ])
-                
-                # Check if signatures match (exact duplicate)
-                if current_items_signature == recent_items_signature:
-                    print(f"🚫 Duplicate order detected for table {table_number} - rejecting")
-                    raise HTTPException(
-                        status_code=400, 
-                        detail=f"Duplicate order detected for Table {table_number}. Please wait 30 seconds before placing the same order again."
-                    )
-            
             # ORDER CONSOLIDATION LOGIC - Check for existing pending orders on the same table
             existing_order = await db.orders.find_one({
                 "organization_id": user_org_id,
@@ -4787,21 +4992,22 @@ async def create_order(
                             # Update customer info if provided
                             "customer_name": order_data.customer_name or existing_order.get("customer_name", ""),
                             "customer_phone": order_data.customer_phone or existing_order.get("customer_phone", "")
-                        }
+                        },
+                        "$inc": {"version": 1}
                     }
                 )
                 
-                # Invalidate Redis cache
+                # Return the updated order
+                updated_order = await db.orders.find_one({"id": existing_order["id"]}, {"_id": 0})
+                
+                # Patch the active orders view with the consolidated order
                 try:
                     cached_service = get_cached_order_service()
-                    await cached_service.invalidate_order_caches(user_org_id, existing_order["id"])
-                    print(f"🗑️ Cache invalidated for consolidated order {existing_order['id']}")
+                    await cached_service.invalidate_order_caches(user_org_id, existing_order["id"], order=updated_order)
+                    print(f"🗑️ Cache updated for consolidated order {existing_order['id']}")
                 except Exception as e:
                     print(f"⚠️ Cache invalidation error: {e}")
                 
-                # Return the updated order
-                updated_order = await db.orders.find_one({"id": existing_order["id"]}, {"_id": 0})
-                
                 # Generate WhatsApp notification if enabled
                 whatsapp_link = None
                 frontend_url = order_data.frontend_origin or ""
@@ -4829,38 +5035,52 @@ async def create_order(
     # Generate tracking token for customer live tracking
     tracking_token = str(uuid.uuid4())[:12]
 
-    # Get next invoice number for the organization
-    invoice_number = await get_next_invoice_number(user_org_id)
-    
-    order_obj = Order(
-        table_id=table_id,
-        table_number=table_number,
-        items=[item.model_dump() for item in order_data.items],
-        subtotal=subtotal,
-        tax=tax,
-        tax_rate=tax_rate_setting if tax_rate_setting is not None else 5.0,  # Store the tax rate used
-        total=total,
-        waiter_id=current_user["id"],
-        waiter_name=current_user["username"],
-        customer_name=order_data.customer_name,
-        customer_phone=order_data.customer_phone,
-        tracking_token=tracking_token,
-        order_type=order_data.order_type or "takeaway",
-        organization_id=user_org_id,
-        invoice_number=invoice_number
-    )
-
-    doc = order_obj.model_dump()
-    doc["created_at"] = doc["created_at"].isoformat()
-    doc["updated_at"] = doc["updated_at"].isoformat()
+    try:
+        # Get next invoice number for the organization
+        # Strict numbering is an organization setting: read it from the admin
+        org_business = business
+        if current_user.get("id") != user_org_id:
+            org_business = await _org_business_settings(user_org_id)
+        invoice_number = await get_next_invoice_number(
+            user_org_id, gap_free=org_business.get("invoice_gap_free", False)
+        )
+        
+        order_obj = Order(
+            table_id=table_id,
+            table_number=table_number,
+            items=[item.model_dump() for item in order_data.items],
+            subtotal=subtotal,
+            tax=tax,
+            tax_rate=tax_rate_setting if tax_rate_setting is not None else 5.0,  # Store the tax rate used
+            total=total,
+            waiter_id=current_user["id"],
+            waiter_name=current_user["username"],
+            customer_name=order_data.customer_name,
+            customer_phone=order_data.customer_phone,
+            tracking_token=tracking_token,
+            order_type=order_data.order_type or "takeaway",
+            organization_id=user_org_id,
+            invoice_number=invoice_number
+        )
 
-    await db.orders.insert_one(doc)
+        doc = order_obj.model_dump()
+        doc["created_at"] = doc["created_at"].isoformat()
+        doc["updated_at"] = doc["updated_at"].isoformat()
+        add_bson_dates(doc)
+
+        await db.orders.insert_one(doc)
+    except Exception:
+        # Order was not created - let the same items be submitted again
+        if signature:
+            await get_recent_signatures().release(user_org_id, table_id, signature)
+        raise
+    await _record_order_change(None, doc)
     
     # Invalidate Redis cache for active orders
     try:
         cached_service = get_cached_order_service()
-        await cached_service.invalidate_order_caches(user_org_id, order_obj.id)
-        print(f"🗑️ Cache invalidated for new order {order_obj.id}")
+        await cached_service.invalidate_order_caches(user_org_id, order_obj.id, order=doc)
+        print(f"🗑️ Cache updated for new order {order_obj.id}")
     except Exception as e:
         print(f"⚠️ Cache invalidation error: {e}")
         # If Redis is not available, that's okay - MongoDB will handle the queries
@@ -4946,50 +5166,18 @@ async def get_orders(
             try:
                 cached_service = get_cached_order_service()
                 
+                # The active orders view only holds TODAY's active orders
+                if fast_responses_enabled():
+                    # Trusted view data: serialized once per change, no response_model revalidation
+                    body = await cached_service.get_active_orders_json(user_org_id, status)
+                    print(f"🚀 Returned TODAY's active orders (status: {status or 'any'}, {len(body)} bytes)")
+                    return FastJSONResponse(body)
+                orders = await cached_service.get_active_orders(user_org_id, use_cache=True)
                 if not status:
-                    # Get all active orders (Redis cache with MongoDB fallback)
-                    orders = await cached_service.get_active_orders(user_org_id, use_cache=True)
-                    
-                    # CRITICAL FIX: Filter active orders to only show TODAY's orders
-                    todays_active_orders = []
-                    for order in orders:
-                        try:
-                            if isinstance(order.get("created_at"), str):
-                                order_date = datetime.fromisoformat(order["created_at"])
-                            else:
-                                order_date = order.get("created_at")
-                            
-                            # Only include orders created today or later
-                            if order_date and order_date >= today_utc:
-                                todays_active_orders.append(order)
-                        except Exception as date_error:
-                            print(f"⚠️ Date parsing error for order {order.get('id', 'unknown')}: {date_error}")
-                            # If date parsing fails, exclude the order to be safe
-                            continue
-                    
-                    print(f"🚀 Returned {len(todays_active_orders)} TODAY's active orders (filtered from {len(orders)} total active orders)")
-                    return todays_active_orders
+                    print(f"🚀 Returned {len(orders)} TODAY's active orders")
+                    return orders
                 else:
-                    # Get active orders and filter by status AND date
-                    active_orders = await cached_service.get_active_orders(user_org_id, use_cache=True)
-                    
-                    # Filter by status AND today's date
-                    filtered_orders = []
-                    for order in active_orders:
-                        if order.get("status") == status:
-                            try:
-                                if isinstance(order.get("created_at"), str):
-                                    order_date = datetime.fromisoformat(order["created_at"])
-                                else:
-                                    order_date = order.get("created_at")
-                                
-                                # Only include orders created today or later
-                                if order_date and order_date >= today_utc:
-                                    filtered_orders.append(order)
-                            except Exception as date_error:
-                                print(f"⚠️ Date parsing error for order {order.get('id', 'unknown')}: {date_error}")
-                                continue
-                    
+                    filtered_orders = [order for order in orders if order.get("status") == status]
                     print(f"🚀 Returned {len(filtered_orders)} TODAY's orders with status '{status}' (cached service)")
                     return filtered_orders
                     
@@ -5006,30 +5194,17 @@ async def get_orders(
         if not status:
             # If no status specified, get TODAY's active orders from MongoDB
             query["status"] = {"$nin": ["completed", "cancelled"]}
-            query["created_at"] = {"$gte": today_utc.isoformat()}  # CRITICAL FIX: Only today's orders
+            query.update(created_range(today_utc))  # CRITICAL FIX: Only today's orders
         elif status in ["pending", "preparing", "ready"]:
             # For active statuses, also filter by today's date
             query["status"] = status
-            query["created_at"] = {"$gte": today_utc.isoformat()}  # CRITICAL FIX: Only today's orders
+            query.update(created_range(today_utc))  # CRITICAL FIX: Only today's orders
         elif status:
             # For completed/cancelled, don't filter by date (historical data)
             query["status"] = status
 
         try:
-            orders = await db.orders.find(query, {"_id": 0}).sort("created_at", -1).limit(1000).to_list(1000)
-            
-            # Convert datetime objects for consistency
-            for order in orders:
-                if isinstance(order.get("created_at"), str):
-                    try:
-                        order["created_at"] = datetime.fromisoformat(order["created_at"])
-                    except:
-                        pass
-                if isinstance(order.get("updated_at"), str):
-                    try:
-                        order["updated_at"] = datetime.fromisoformat(order["updated_at"])
-                    except:
-                        pass
+            orders = await db.orders.find(query, {"_id": 0}).sort(created_sort_field(), -1).limit(1000).to_list(1000)
             
             print(f"📊 Returned {len(orders)} orders from MongoDB (status: {status})")
             return orders
@@ -5062,17 +5237,6 @@ async def get_orders(
                 # Filter to active orders only (already filtered by date in query)
                 orders = [order for order in orders if order.get("status") not in ["completed", "cancelled"]]
             
-            # Basic datetime conversion
-            for order in orders:
-                try:
-                    if isinstance(order.get("created_at"), str):
-                        order["created_at"] = datetime.fromisoformat(order["created_at"])
-                    if isinstance(order.get("updated_at"), str):
-                        order["updated_at"] = datetime.fromisoformat(order["updated_at"])
-                except:
-                    # If datetime conversion fails, leave as string
-                    pass
-            
             print(f"🆘 Fallback returned {len(orders)} orders (filtered by today's date for active orders)")
             return orders
             
@@ -5134,24 +5298,11 @@ async def get_todays_bills(current_user: dict = Depends(get_current_user)):
             # Query for today's COMPLETED orders ONLY
             query = {
                 "organization_id": user_org_id,
-                "created_at": {"$gte": today_utc.isoformat()},
+                **created_range(today_utc),
                 "status": {"$in": ["completed", "paid"]}  # ONLY completed or paid orders
             }
             
-            orders = await db.orders.find(query, {"_id": 0}).sort("created_at", -1).limit(500).to_list(500)
-            
-            # Convert datetime objects for consistency
-            for order in orders:
-                if isinstance(order.get("created_at"), str):
-                    try:
-                        order["created_at"] = datetime.fromisoformat(order["created_at"])
-                    except:
-                        pass
-                if isinstance(order.get("updated_at"), str):
-                    try:
-                        order["updated_at"] = datetime.fromisoformat(order["updated_at"])
-                    except:
-                        pass
+            orders = await db.orders.find(query, {"_id": 0}).sort(created_sort_field(), -1).limit(500).to_list(500)
             
             print(f"📊 Found {len(orders)} today's bills for org {user_org_id}")
             return orders
@@ -5164,31 +5315,14 @@ async def get_todays_bills(current_user: dict = Depends(get_current_user)):
         print(f"🆘 Using fallback query for today's bills org {user_org_id}")
         
         try:
-            # Get recent completed/paid orders only
+            # Get today's completed/paid orders with the plain string range
             basic_query = {
                 "organization_id": user_org_id,
+                "created_at": {"$gte": today_utc.isoformat()},
                 "status": {"$in": ["completed", "paid"]}  # ONLY completed/paid, no cancelled
             }
             
-            orders = await db.orders.find(basic_query, {"_id": 0}).sort("created_at", -1).limit(200).to_list(200)
-            
-            # Filter to today's orders
-            todays_orders = []
-            for order in orders:
-                try:
-                    if isinstance(order.get("created_at"), str):
-                        order_date = datetime.fromisoformat(order["created_at"])
-                    else:
-                        order_date = order.get("created_at")
-                    
-                    if order_date and order_date >= today_utc:
-                        # Only include orders that are actually completed or paid
-                        if order.get("status") in ["completed", "paid"]:
-                            todays_orders.append(order)
-                            
-                except Exception as date_error:
-                    print(f"⚠️ Date parsing error for order {order.get('id', 'unknown')}: {date_error}")
-                    continue
+            todays_orders = await db.orders.find(basic_query, {"_id": 0}).sort("created_at", -1).limit(200).to_list(200)
             
             print(f"🆘 Fallback returned {len(todays_orders)} today's bills")
             return todays_orders
@@ -5202,8 +5336,51 @@ async def get_todays_bills(current_user: dict = Depends(get_current_user)):
         return []
 
 
+@api_router.get("/orders/history")
+async def get_order_history(
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page"),
+    limit: int = Query(50, ge=1, le=200, description="Orders per page"),
+    status: Optional[str] = Query(None, description="Status or comma-separated statuses"),
+    start_date: Optional[str] = Query(None, description="From business day (YYYY-MM-DD, IST)"),
+    end_date: Optional[str] = Query(None, description="To business day inclusive (YYYY-MM-DD, IST)"),
+    include_items: bool = Query(False, description="Include order items"),
+    current_user: dict = Depends(get_current_user),
+):
+    """
+    Order history, newest first, with keyset (cursor) pagination.
+
+    Every page costs the same regardless of how far back it is; pass
+    ``next_cursor`` from the response to get the next page.
+    """
+    user_org_id = get_secure_org_id(current_user)
+    IST = timezone(timedelta(hours=5, minutes=30))
+
+    try:
+        start = datetime.strptime(start_date, "%Y-%m-%d").replace(tzinfo=IST) if start_date else None
+        end = datetime.strptime(end_date, "%Y-%m-%d").replace(tzinfo=IST) + timedelta(days=1) if end_date else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Dates must be YYYY-MM-DD")
+    statuses = [s.strip() for s in status.split(",") if s.strip()] if status else None
+
+    try:
+        page = await fetch_order_page(
+            db, user_org_id,
+            limit=limit,
+            cursor=cursor,
+            statuses=statuses,
+            start=start.astimezone(timezone.utc) if start else None,
+            end=end.astimezone(timezone.utc) if end else None,
+            include_items=include_items,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    print(f"📜 Order history page for org {user_org_id}: {len(page['orders'])} orders (more: {page['has_more']})")
+    return page
+
+
 @api_router.get("/orders/{order_id}", response_model=Order)
-async def get_order(order_id: str, current_user: dict = Depends(get_current_user)):
+async def get_order(order_id: str, response: Response, current_user: dict = Depends(get_current_user)):
     # Get user's organization_id
     user_org_id = get_secure_org_id(current_user)
 
@@ -5214,68 +5391,77 @@ async def get_order(order_id: str, current_user: dict = Depends(get_current_user
         
         if order:
             print(f"🚀 Order {order_id} retrieved from cache")
+            response.headers["ETag"] = order_etag(order)
             return order
         else:
             raise HTTPException(status_code=404, detail="Order not found")
             
     except Exception as e:
         print(f"❌ Cache error for order {order_id}: {e}")
-        # Fallback to direct MongoDB query
-        order = await db.orders.find_one(
-            {"id": order_id, "organization_id": user_org_id}, {"_id": 0}
+        # Fallback to direct MongoDB query (old orders may be archived)
+        order = await get_order_router().find_one(
+            {"id": order_id, "organization_id": user_org_id}, {"_id": 0, CREATED_AT_DT: 0}
         )
         if not order:
             raise HTTPException(status_code=404, detail="Order not found")
         
-        # Convert datetime objects
-        if isinstance(order["created_at"], str):
-            order["created_at"] = datetime.fromisoformat(order["created_at"])
-        if isinstance(order["updated_at"], str):
-            order["updated_at"] = datetime.fromisoformat(order["updated_at"])
-        
         print(f"📊 Order {order_id} retrieved from MongoDB (fallback)")
+        response.headers["ETag"] = order_etag(order)
         return order
 
 
+def _expected_order_version(if_match: Optional[str], expected_version: Optional[int]) -> Optional[int]:
+    """Order version a client expects, from If-Match or ?expected_version="""
+    try:
+        parsed = parse_if_match(if_match)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="If-Match must be an order version")
+    return parsed if parsed is not None else expected_version
+
+
 @api_router.put("/orders/{order_id}/status")
 async def update_order_status(
     order_id: str, 
     status: str, 
+    response: Response,
     frontend_origin: Optional[str] = None,
+    expected_version: Optional[int] = Query(None, description="Order version the client last saw"),
+    if_match: Optional[str] = Header(None, alias="If-Match"),
     current_user: dict = Depends(get_current_user)
 ):
     # Get user's organization_id
     user_org_id = get_secure_org_id(current_user)
+    expected_version = _expected_order_version(if_match, expected_version)
 
-    # Try to get order from cache first, then fallback to MongoDB
-    try:
-        cached_service = get_cached_order_service()
-        order = await cached_service.get_order_by_id(order_id, user_org_id, use_cache=True)
-        if not order:
-            raise HTTPException(status_code=404, detail="Order not found")
-    except Exception as e:
-        print(f"⚠️ Cache error getting order {order_id}: {e}")
-        order = await db.orders.find_one(
-            {"id": order_id, "organization_id": user_org_id}, {"_id": 0}
+    # Compare-and-set: validates the transition and version in one write;
+    # repeated taps and stale pollers change nothing and trigger no side effects
+    result, order = await compare_and_set_status(db, user_org_id, order_id, status, expected_version)
+    if result == NOT_FOUND:
+        raise HTTPException(status_code=404, detail="Order not found")
+    if result == CONFLICT:
+        raise HTTPException(
+            status_code=412,
+            detail=f"Order was modified (now version {order.get('version', 0)}, status {order.get('status')}), reload and retry"
         )
-        if not order:
-            raise HTTPException(status_code=404, detail="Order not found")
+    if result == INVALID:
+        detail = validate_transition(order.get("status") if order else None, status) or "Invalid status"
+        raise HTTPException(status_code=400, detail=detail)
+    response.headers["ETag"] = order_etag(order)
+    if result == UNCHANGED:
+        return {
+            "message": "Order status unchanged",
+            "whatsapp_link": None,
+            "customer_phone": order.get("customer_phone"),
+            "version": order.get("version", 0)
+        }
 
-    # Update order status in MongoDB
-    await db.orders.update_one(
-        {"id": order_id, "organization_id": user_org_id},
-        {
-            "$set": {
-                "status": status,
-                "updated_at": datetime.now(timezone.utc).isoformat(),
-            }
-        },
-    )
+    # The compare-and-set only ever moves an order out of an open status
+    await _record_order_change({**order, "status": None}, order)
 
-    # Invalidate Redis cache for this order and active orders list
+    # Patch the active orders view and invalidate the order cache
     try:
         cached_service = get_cached_order_service()
-        await cached_service.invalidate_order_caches(user_org_id, order_id)
+        await cached_service.invalidate_order_caches(user_org_id, order_id, order=order)
         
         # Also invalidate table cache if status affects table
         if status == "completed":
@@ -5330,15 +5516,14 @@ async def update_order_status(
             should_notify = True
         
         if should_notify:
-            # Update order with current status for message generation
-            order["status"] = status
             message = get_status_message(status, order, business, frontend_origin or "")
             whatsapp_link = generate_whatsapp_notification(customer_phone, message)
 
     return {
         "message": "Order status updated",
         "whatsapp_link": whatsapp_link,
-        "customer_phone": customer_phone
+        "customer_phone": customer_phone,
+        "version": order.get("version", 0)
     }
 
 
@@ -5347,19 +5532,45 @@ async def update_order_status(
 async def update_order(
     order_id: str,
     order_data: dict,
+    expected_version: Optional[int] = Query(None, description="Order version the client last saw"),
+    if_match: Optional[str] = Header(None, alias="If-Match"),
     current_user: dict = Depends(get_current_user)
 ):
-    """Update an existing order"""
+    """
+    Update an existing order.
+
+    Writes are conditional on the order's version: the one sent as
+    If-Match (412 if it moved on), otherwise the one just read here (409
+    if another request wrote in between), so racing edits never
+    silently overwrite each other.
+    """
     user_org_id = get_secure_org_id(current_user)
+    client_version = _expected_order_version(if_match, expected_version)
     
     # Verify order belongs to user's organization
     existing_order = await db.orders.find_one(
-        {"id": order_id, "organization_id": user_org_id}
+        {"id": order_id, "organization_id": user_org_id}, {"_id": 0}
     )
     
     if not existing_order:
         raise HTTPException(status_code=404, detail="Order not found")
     
+    current_version = existing_order.get("version", 0)
+    if client_version is not None and client_version != current_version:
+        raise HTTPException(
+            status_code=412,
+            detail=f"Order was modified (now version {current_version}), reload and retry"
+        )
+    
+    async def write_update(update_data: dict) -> dict:
+        updated = await conditional_update(db, user_org_id, order_id, update_data, current_version)
+        if updated is None:
+            raise HTTPException(
+                status_code=412 if client_version is not None else 409,
+                detail="Order was modified by another request, reload and retry"
+            )
+        return updated
+    
     # Handle status update separately (e.g., marking as completed from billing page)
     if "status" in order_data and order_data.get("status") == "completed":
         update_data = {
@@ -5372,13 +5583,13 @@ async def update_order(
             if field in order_data:
                 update_data[field] = order_data[field]
         
-        await db.orders.update_one(
-            {"id": order_id, "organization_id": user_org_id},
-            {"$set": update_data}
-        )
+        updated_order = await write_update(update_data)
+        await _record_order_change(existing_order, updated_order)
         
         # Clear table when order is completed - Use TableStatusManager for immediate, direct DB update
-        if existing_order.get("table_id") and existing_order.get("table_id") != "counter":
+        # (not again when it was already completed, e.g. a repeated click)
+        already_completed = existing_order.get("status") == "completed"
+        if not already_completed and existing_order.get("table_id") and existing_order.get("table_id") != "counter":
             try:
                 table_manager = get_table_status_manager()
                 result = await table_manager.set_table_available(user_org_id, existing_order["table_id"])
@@ -5407,12 +5618,12 @@ async def update_order(
         # Invalidate cache for completed order update
         try:
             cached_service = get_cached_order_service()
-            await cached_service.invalidate_order_caches(user_org_id, order_id)
+            await cached_service.invalidate_order_caches(user_org_id, order_id, order=updated_order)
             print(f"🗑️ Cache invalidated for completed order update {order_id}")
         except Exception as e:
             print(f"⚠️ Cache invalidation error: {e}")
         
-        return {"message": "Order completed and table cleared successfully"}
+        return {"message": "Order completed and table cleared successfully", "version": updated_order.get("version", 0)}
     
     # For completed orders, only allow updating payment-related fields
     if existing_order.get("status") == "completed":
@@ -5446,15 +5657,13 @@ async def update_order(
                 update_data["balance_amount"] = 0
             print(f"💰 Payment update: total={total}, received={payment_received}, balance={calculated_balance}, is_credit={update_data['is_credit']}")
         
-        await db.orders.update_one(
-            {"id": order_id, "organization_id": user_org_id},
-            {"$set": update_data}
-        )
+        updated_order = await write_update(update_data)
+        await _record_order_change(existing_order, updated_order)
         
         # Invalidate cache for payment update
         try:
             cached_service = get_cached_order_service()
-            await cached_service.invalidate_order_caches(user_org_id, order_id)
+            await cached_service.invalidate_order_caches(user_org_id, order_id, order=updated_order)
             print(f"🗑️ Cache invalidated for payment update {order_id}")
         except Exception as e:
             print(f"⚠️ Cache invalidation error: {e}")
@@ -5488,7 +5697,7 @@ async def update_order(
                     except Exception as fallback_error:
                         print(f"⚠️ Table clearing fallback error: {fallback_error}")
         
-        return {"message": "Order payment details updated successfully"}
+        return {"message": "Order payment details updated successfully", "version": updated_order.get("version", 0)}
     
     # For non-completed orders, allow full editing
     update_data = {
@@ -5538,15 +5747,13 @@ async def update_order(
     
     print(f"📝 Order update: total={total}, received={payment_received}, balance={calculated_balance}, is_credit={is_credit}")
     
-    await db.orders.update_one(
-        {"id": order_id, "organization_id": user_org_id},
-        {"$set": update_data}
-    )
+    updated_order = await write_update(update_data)
+    await _record_order_change(existing_order, updated_order)
     
     # Invalidate cache for order update
     try:
         cached_service = get_cached_order_service()
-        await cached_service.invalidate_order_caches(user_org_id, order_id)
+        await cached_service.invalidate_order_caches(user_org_id, order_id, order=updated_order)
         print(f"🗑️ Cache invalidated for order update {order_id}")
     except Exception as e:
         print(f"⚠️ Cache invalidation error: {e}")
@@ -5582,7 +5789,7 @@ async def update_order(
                 except Exception as fallback_error:
                     print(f"⚠️ Table clearing fallback error: {fallback_error}")
     
-    return {"message": "Order updated successfully"}
+    return {"message": "Order updated successfully", "version": updated_order.get("version", 0)}
 
 
 @api_router.put("/orders/{order_id}/cancel")
@@ -5610,14 +5817,16 @@ async def cancel_order(
             "$set": {
                 "status": "cancelled",
                 "updated_at": datetime.now(timezone.utc).isoformat()
-            }
+            },
+            "$inc": {"version": 1}
         }
     )
+    await _record_order_change(order, {**order, "status": "cancelled"})
     
-    # Invalidate cache for cancelled order
+    # Remove the cancelled order from the active orders view
     try:
         cached_service = get_cached_order_service()
-        await cached_service.invalidate_order_caches(user_org_id, order_id)
+        await cached_service.invalidate_order_caches(user_org_id, order_id, removed=True)
         print(f"🗑️ Cache invalidated for cancelled order {order_id}")
     except Exception as e:
         print(f"⚠️ Cache invalidation error: {e}")
@@ -5699,11 +5908,12 @@ async def delete_order(
     await db.orders.delete_one(
         {"id": order_id, "organization_id": user_org_id}
     )
+    await _record_order_change(order, None)
     
     # Invalidate cache for deleted order
     try:
         cached_service = get_cached_order_service()
-        await cached_service.invalidate_order_caches(user_org_id, order_id)
+        await cached_service.invalidate_order_caches(user_org_id, order_id, removed=True)
         print(f"🗑️ Cache invalidated for deleted order {order_id}")
     except Exception as e:
         print(f"⚠️ Cache invalidation error: {e}")
@@ -5783,11 +5993,14 @@ async def create_payment_order(
 
         await db.orders.update_one(
             {"id": payment_data.order_id, "organization_id": user_org_id},
-            {"$set": {"status": "completed"}},
+            {"$set": {"status": "completed"}, "$inc": {"version": 1}},
         )
+        if existing_order:
+            await _record_order_change(existing_order, {**existing_order, "status": "completed"})
         await db.users.update_one(
             {"id": current_user["id"]}, {"$inc": {"bill_count": 1}}
         )
+        await get_principal_cache().invalidate(current_user["id"])
 
         # Use TableStatusManager to set table to available when payment is completed
         # This ensures immediate table status sync (Requirements 1.2, 1.3)
@@ -5858,9 +6071,12 @@ async def verify_payment(
 
     await db.orders.update_one(
         {"id": order_id, "organization_id": user_org_id},
-        {"$set": {"status": "completed"}},
+        {"$set": {"status": "completed"}, "$inc": {"version": 1}},
     )
+    if existing_order:
+        await _record_order_change(existing_order, {**existing_order, "status": "completed"})
     await db.users.update_one({"id": current_user["id"]}, {"$inc": {"bill_count": 1}})
+    await get_principal_cache().invalidate(current_user["id"])
 
     # Use TableStatusManager to set table to available when payment is completed
     # This ensures immediate table status sync (Requirements 1.2, 1.3)
@@ -5936,6 +6152,7 @@ async def create_inventory_item(
         cached_service = get_cached_order_service()
         await cached_service.invalidate_inventory_caches(user_org_id)
         await cached_service.invalidate_menu_caches(user_org_id)
+        get_item_analytics().invalidate_menu(user_org_id)
         print(f"🗑️ Inventory and menu caches invalidated for new item {inv_obj.id}")
     except Exception as e:
         print(f"⚠️ Cache invalidation error: {e}")
@@ -5999,6 +6216,7 @@ async def update_inventory_item(
         cached_service = get_cached_order_service()
         await cached_service.invalidate_inventory_caches(user_org_id)
         await cached_service.invalidate_menu_caches(user_org_id)
+        get_item_analytics().invalidate_menu(user_org_id)
         print(f"🗑️ Inventory and menu caches invalidated for updated item {item_id}")
     except Exception as e:
         print(f"⚠️ Cache invalidation error: {e}")
@@ -6049,6 +6267,7 @@ async def delete_inventory_item(
         cached_service = get_cached_order_service()
         await cached_service.invalidate_inventory_caches(user_org_id)
         await cached_service.invalidate_menu_caches(user_org_id)
+        get_item_analytics().invalidate_menu(user_org_id)
         print(f"🗑️ Inventory and menu caches invalidated for deleted item {item_id}")
     except Exception as e:
         print(f"⚠️ Cache invalidation error: {e}")
@@ -6641,6 +6860,7 @@ async def create_expense(
     )
     
     await db.expenses.insert_one(expense_obj.model_dump())
+    await get_cash_ledger().record_expense(None, expense_obj.model_dump())
     print(f"💰 Created expense: {expense.category} - ₹{expense.amount}")
     
     return expense_obj
@@ -6683,6 +6903,7 @@ async def update_expense(
     updated = await db.expenses.find_one(
         {"id": expense_id, "organization_id": user_org_id}, {"_id": 0}
     )
+    await get_cash_ledger().record_expense(existing, updated)
     
     print(f"💰 Updated expense: {expense_id}")
     return updated
@@ -6701,6 +6922,7 @@ async def delete_expense(expense_id: str, current_user: dict = Depends(get_curre
         raise HTTPException(status_code=404, detail="Expense not found")
     
     await db.expenses.delete_one({"id": expense_id, "organization_id": user_org_id})
+    await get_cash_ledger().record_expense(existing, None)
     
     print(f"🗑️ Deleted expense: {expense_id}")
     return {"message": "Expense deleted successfully"}
@@ -6708,6 +6930,29 @@ async def delete_expense(expense_id: str, current_user: dict = Depends(get_curre
 
 # ============ DAY BOOK / CASH FLOW REPORT ENDPOINTS ============
 
+def _business_day_range(start_date: Optional[str], end_date: Optional[str]):
+    """UTC [start, end) of the IST business days start_date..end_date; either may be open"""
+    try:
+        return business_window(start_date, end_date)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Dates must be YYYY-MM-DD")
+
+
+async def _daybook_balances(org_id: str, start_date: str, end_date: str, net_cash_flow: float):
+    """(opening, closing) balance of a Day Book range: one cash ledger aggregation once it is backfilled"""
+    ledger = get_cash_ledger()
+    if ledger.is_ready():
+        return await ledger.balances(org_id, start_date, end_date)
+    return 0, net_cash_flow
+
+
+# Order fields the Day Book entries are built from
+DAYBOOK_ORDER_FIELDS = {
+    "_id": 0, "id": 1, "invoice_number": 1, "table_number": 1, "created_at": 1, "total": 1,
+    "payment_method": 1, "payment_received": 1, "cash_amount": 1, "card_amount": 1, "upi_amount": 1,
+}
+
+
 @api_router.get("/reports/daybook")
 async def get_daybook(
     date: str = Query(..., description="Date YYYY-MM-DD"),
@@ -6725,14 +6970,11 @@ async def get_daybook(
     if not end_date:
         end_date = date
     
-    # Get completed orders (inflows) for the date range
-    orders_query = {
-        "organization_id": user_org_id,
-        "status": {"$in": ["completed", "paid"]},
-        "created_at": {"$gte": f"{start_date}T00:00:00", "$lte": f"{end_date}T23:59:59"}
-    }
-    
-    orders = await db.orders.find(orders_query, {"_id": 0}).to_list(1000)
+    # Completed and paid orders (inflows) of the date range, read in batches
+    range_start, range_end = _business_day_range(start_date, end_date)
+    orders = get_report_engine().stream(
+        user_org_id, DAYBOOK_ORDER_FIELDS, start=range_start, end=range_end
+    )
     
     # Get expenses (outflows) for the date range
     expenses_query = {
@@ -6740,14 +6982,16 @@ async def get_daybook(
         "date": {"$gte": start_date, "$lte": end_date}
     }
     
-    expenses = await db.expenses.find(expenses_query, {"_id": 0}).to_list(1000)
+    expenses = db.expenses.find(expenses_query, {"_id": 0}).batch_size(500)
     
     # Calculate inflows by payment method
     inflow_breakdown = {"cash": 0, "card": 0, "upi": 0, "other": 0}
     total_inflows = 0
     
     inflow_entries = []
-    for order in orders:
+    order_count = 0
+    async for order in orders:
+        order_count += 1
         amount = order.get("payment_received", order.get("total", 0))
         payment_method = order.get("payment_method", "cash")
         
@@ -6781,7 +7025,9 @@ async def get_daybook(
     total_outflows = 0
     
     outflow_entries = []
-    for expense in expenses:
+    expense_count = 0
+    async for expense in expenses:
+        expense_count += 1
         amount = expense.get("amount", 0)
         category = expense.get("category", "Other")
         
@@ -6801,8 +7047,12 @@ async def get_daybook(
     all_entries = inflow_entries + outflow_entries
     all_entries.sort(key=lambda x: x.get("timestamp", ""))
     
-    # Calculate running balance
-    running_balance = 0
+    opening_balance, closing_balance = await _daybook_balances(
+        user_org_id, start_date, end_date, total_inflows - total_outflows
+    )
+    
+    # Calculate running balance (from the balance brought forward)
+    running_balance = opening_balance
     for entry in all_entries:
         if entry["type"] == "inflow":
             running_balance += entry["amount"]
@@ -6810,12 +7060,6 @@ async def get_daybook(
             running_balance -= entry["amount"]
         entry["running_balance"] = running_balance
     
-    # Calculate opening balance (sum of all previous transactions)
-    # For simplicity, we'll set opening balance to 0 for now
-    # In a real system, this would be calculated from previous day's closing
-    opening_balance = 0
-    closing_balance = opening_balance + total_inflows - total_outflows
-    
     return {
         "date": date,
         "end_date": end_date,
@@ -6827,8 +7071,8 @@ async def get_daybook(
         "inflow_breakdown": inflow_breakdown,
         "outflow_breakdown": outflow_breakdown,
         "entries": all_entries,
-        "order_count": len(orders),
-        "expense_count": len(expenses)
+        "order_count": order_count,
+        "expense_count": expense_count
     }
 
 
@@ -6840,7 +7084,8 @@ async def get_daybook_summary(
     """Get Day Book summary for a period"""
     user_org_id = get_secure_org_id(current_user)
     
-    today = datetime.now(timezone.utc)
+    # Business days are IST, like the daily rollups
+    today = datetime.now(timezone(timedelta(hours=5, minutes=30)))
     
     if period == "today":
         start_date = today.strftime("%Y-%m-%d")
@@ -6858,31 +7103,46 @@ async def get_daybook_summary(
         start_date = today.strftime("%Y-%m-%d")
         end_date = start_date
     
-    # Get orders
-    orders = await db.orders.find({
-        "organization_id": user_org_id,
-        "status": {"$in": ["completed", "paid"]},
-        "created_at": {"$gte": f"{start_date}T00:00:00", "$lte": f"{end_date}T23:59:59"}
-    }, {"_id": 0}).to_list(1000)
-    
-    # Get expenses
-    expenses = await db.expenses.find({
-        "organization_id": user_org_id,
-        "date": {"$gte": start_date, "$lte": end_date}
-    }, {"_id": 0}).to_list(1000)
+    # Get expenses (summed in MongoDB)
+    expense_totals = await db.expenses.aggregate([
+        {"$match": {
+            "organization_id": user_org_id,
+            "date": {"$gte": start_date, "$lte": end_date}
+        }},
+        {"$group": {"_id": None, "count": {"$sum": 1}, "amount": {"$sum": "$amount"}}},
+    ]).to_list(1)
+    total_outflows = expense_totals[0]["amount"] if expense_totals else 0
+    expense_count = expense_totals[0]["count"] if expense_totals else 0
+    
+    rollups = get_sales_rollups()
+    if rollups.is_ready():
+        sales = (await rollups.summary(user_org_id, start_date, end_date)).get("sales", {})
+        total_inflows = sales.get("received", 0)
+        order_count = int(sales.get("orders", 0))
+    else:
+        range_start, range_end = _business_day_range(start_date, end_date)
+        groups = await get_report_engine().group(user_org_id, None, {
+            "orders": {"$sum": 1},
+            "received": {"$sum": {"$ifNull": ["$payment_received", "$total"]}},
+        }, start=range_start, end=range_end)
+        total_inflows = groups[0]["received"] if groups else 0
+        order_count = groups[0]["orders"] if groups else 0
     
-    total_inflows = sum(o.get("payment_received", o.get("total", 0)) for o in orders)
-    total_outflows = sum(e.get("amount", 0) for e in expenses)
+    opening_balance, closing_balance = await _daybook_balances(
+        user_org_id, start_date, end_date, total_inflows - total_outflows
+    )
     
     return {
         "period": period,
         "start_date": start_date,
         "end_date": end_date,
+        "opening_balance": opening_balance,
+        "closing_balance": closing_balance,
         "total_inflows": total_inflows,
         "total_outflows": total_outflows,
         "net_cash_flow": total_inflows - total_outflows,
-        "order_count": len(orders),
-        "expense_count": len(expenses)
+        "order_count": order_count,
+        "expense_count": expense_count
     }
 
 
@@ -6903,14 +7163,11 @@ async def export_daybook(
     if not end_date:
         end_date = date
     
-    # Get completed orders (inflows) for the date range
-    orders_query = {
-        "organization_id": user_org_id,
-        "status": {"$in": ["completed", "paid"]},
-        "created_at": {"$gte": f"{start_date}T00:00:00", "$lte": f"{end_date}T23:59:59"}
-    }
-    
-    orders = await db.orders.find(orders_query, {"_id": 0}).to_list(1000)
+    # Completed and paid orders (inflows) of the date range, read in batches
+    range_start, range_end = _business_day_range(start_date, end_date)
+    orders = get_report_engine().stream(
+        user_org_id, DAYBOOK_ORDER_FIELDS, start=range_start, end=range_end
+    )
     
     # Get expenses (outflows) for the date range
     expenses_query = {
@@ -6918,14 +7175,16 @@ async def export_daybook(
         "date": {"$gte": start_date, "$lte": end_date}
     }
     
-    expenses = await db.expenses.find(expenses_query, {"_id": 0}).to_list(1000)
+    expenses = db.expenses.find(expenses_query, {"_id": 0}).batch_size(500)
     
     # Calculate inflows by payment method
     inflow_breakdown = {"cash": 0, "card": 0, "upi": 0, "other": 0}
     total_inflows = 0
     
     inflow_entries = []
-    for order in orders:
+    order_count = 0
+    async for order in orders:
+        order_count += 1
         amount = order.get("payment_received", order.get("total", 0))
         payment_method = order.get("payment_method", "cash")
         
@@ -6959,7 +7218,9 @@ async def export_daybook(
     total_outflows = 0
     
     outflow_entries = []
-    for expense in expenses:
+    expense_count = 0
+    async for expense in expenses:
+        expense_count += 1
         amount = expense.get("amount", 0)
         category = expense.get("category", "Other")
         
@@ -6979,8 +7240,12 @@ async def export_daybook(
     all_entries = inflow_entries + outflow_entries
     all_entries.sort(key=lambda x: x.get("timestamp", ""))
     
-    # Calculate running balance
-    running_balance = 0
+    opening_balance, closing_balance = await _daybook_balances(
+        user_org_id, start_date, end_date, total_inflows - total_outflows
+    )
+    
+    # Calculate running balance (from the balance brought forward)
+    running_balance = opening_balance
     for entry in all_entries:
         if entry["type"] == "inflow":
             running_balance += entry["amount"]
@@ -6988,9 +7253,6 @@ async def export_daybook(
             running_balance -= entry["amount"]
         entry["running_balance"] = running_balance
     
-    # Calculate balances
-    opening_balance = 0
-    closing_balance = opening_balance + total_inflows - total_outflows
     net_cash_flow = total_inflows - total_outflows
     
     # Prepare daybook data
@@ -7005,414 +7267,24 @@ async def export_daybook(
         "inflow_breakdown": inflow_breakdown,
         "outflow_breakdown": outflow_breakdown,
         "entries": all_entries,
-        "order_count": len(orders),
-        "expense_count": len(expenses)
+        "order_count": order_count,
+        "expense_count": expense_count
     }
     
-    if format.lower() == "excel":
-        return await generate_daybook_excel(daybook_data, date, end_date)
-    else:
-        return await generate_daybook_pdf(daybook_data, date, end_date)
-
-
-async def generate_daybook_pdf(daybook_data: dict, date: str, end_date: str) -> StreamingResponse:
-    """Generate Day Book PDF report using reportlab"""
+    # Rendered on the report process pool (cached per data version)
+    fmt = "excel" if format.lower() == "excel" else "pdf"
     try:
-        from reportlab.lib import colors
-        from reportlab.lib.pagesizes import A4
-        from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-        from reportlab.lib.units import inch, mm
-        from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
-        from reportlab.lib.enums import TA_CENTER, TA_RIGHT, TA_LEFT
-    except ImportError:
-        # Fallback to CSV if reportlab not available
-        return await generate_daybook_csv(daybook_data, date, end_date)
-    
-    buffer = io.BytesIO()
-    doc = SimpleDocTemplate(buffer, pagesize=A4, rightMargin=20*mm, leftMargin=20*mm, topMargin=20*mm, bottomMargin=20*mm)
-    
-    styles = getSampleStyleSheet()
-    title_style = ParagraphStyle('Title', parent=styles['Heading1'], fontSize=18, alignment=TA_CENTER, spaceAfter=12, textColor=colors.HexColor('#7c3aed'))
-    subtitle_style = ParagraphStyle('Subtitle', parent=styles['Normal'], fontSize=10, alignment=TA_CENTER, spaceAfter=20, textColor=colors.gray)
-    section_style = ParagraphStyle('Section', parent=styles['Heading2'], fontSize=12, spaceBefore=15, spaceAfter=8, textColor=colors.HexColor('#7c3aed'))
-    
-    elements = []
-    
-    # Title
-    date_range_str = f"{date}" if date == end_date else f"{date} to {end_date}"
-    elements.append(Paragraph("📒 Day Book Report", title_style))
-    elements.append(Paragraph(f"Date: {date_range_str} | Generated: {datetime.now().strftime('%Y-%m-%d %H:%M')}", subtitle_style))
-    
-    # Summary Table
-    elements.append(Paragraph("Summary", section_style))
-    summary_data = [
-        ['Opening Balance', 'Total Inflows', 'Total Outflows', 'Net Cash Flow', 'Closing Balance'],
-        [
-            f"₹{daybook_data['opening_balance']:.2f}",
-            f"₹{daybook_data['total_inflows']:.2f}",
-            f"₹{daybook_data['total_outflows']:.2f}",
-            f"{'+'if daybook_data['net_cash_flow'] >= 0 else ''}₹{daybook_data['net_cash_flow']:.2f}",
-            f"₹{daybook_data['closing_balance']:.2f}"
-        ]
-    ]
-    summary_table = Table(summary_data, colWidths=[90, 90, 90, 90, 90])
-    summary_table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#7c3aed')),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
-        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, -1), 9),
-        ('BOTTOMPADDING', (0, 0), (-1, 0), 10),
-        ('TOPPADDING', (0, 0), (-1, 0), 10),
-        ('BACKGROUND', (0, 1), (-1, 1), colors.HexColor('#f3e8ff')),
-        ('GRID', (0, 0), (-1, -1), 0.5, colors.gray),
-        ('TEXTCOLOR', (1, 1), (1, 1), colors.green),
-        ('TEXTCOLOR', (2, 1), (2, 1), colors.red),
-    ]))
-    elements.append(summary_table)
-    elements.append(Spacer(1, 15))
-    
-    # Inflow Breakdown
-    if daybook_data['inflow_breakdown']:
-        elements.append(Paragraph("💰 Inflow Breakdown", section_style))
-        inflow_data = [['Payment Method', 'Amount']]
-        for method, amount in daybook_data['inflow_breakdown'].items():
-            if amount > 0:
-                inflow_data.append([method.capitalize(), f"₹{amount:.2f}"])
-        inflow_data.append(['Total Inflows', f"₹{daybook_data['total_inflows']:.2f}"])
-        
-        inflow_table = Table(inflow_data, colWidths=[200, 100])
-        inflow_table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#15803d')),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
-            ('ALIGN', (1, 0), (1, -1), 'RIGHT'),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('FONTNAME', (0, -1), (-1, -1), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, -1), 9),
-            ('BACKGROUND', (0, 1), (-1, -2), colors.HexColor('#dcfce7')),
-            ('BACKGROUND', (0, -1), (-1, -1), colors.HexColor('#bbf7d0')),
-            ('GRID', (0, 0), (-1, -1), 0.5, colors.gray),
-        ]))
-        elements.append(inflow_table)
-        elements.append(Spacer(1, 10))
-    
-    # Outflow Breakdown
-    if daybook_data['outflow_breakdown']:
-        elements.append(Paragraph("📤 Outflow Breakdown", section_style))
-        outflow_data = [['Category', 'Amount']]
-        for category, amount in daybook_data['outflow_breakdown'].items():
-            if amount > 0:
-                outflow_data.append([category, f"₹{amount:.2f}"])
-        outflow_data.append(['Total Outflows', f"₹{daybook_data['total_outflows']:.2f}"])
-        
-        outflow_table = Table(outflow_data, colWidths=[200, 100])
-        outflow_table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#dc2626')),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
-            ('ALIGN', (1, 0), (1, -1), 'RIGHT'),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('FONTNAME', (0, -1), (-1, -1), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, -1), 9),
-            ('BACKGROUND', (0, 1), (-1, -2), colors.HexColor('#fee2e2')),
-            ('BACKGROUND', (0, -1), (-1, -1), colors.HexColor('#fecaca')),
-            ('GRID', (0, 0), (-1, -1), 0.5, colors.gray),
-        ]))
-        elements.append(outflow_table)
-        elements.append(Spacer(1, 10))
-    
-    # Transaction Details
-    if daybook_data['entries']:
-        elements.append(Paragraph(f"📋 Transaction Details ({len(daybook_data['entries'])} transactions)", section_style))
-        trans_data = [['Time', 'Type', 'Category', 'Description', 'Amount', 'Balance']]
-        for entry in daybook_data['entries']:
-            try:
-                time_str = datetime.fromisoformat(entry['timestamp'].replace('Z', '+00:00')).strftime('%H:%M') if entry.get('timestamp') else '-'
-            except:
-                time_str = '-'
-            
-            amount_str = f"{'+'if entry['type'] == 'inflow' else '-'}₹{entry['amount']:.2f}"
-            trans_data.append([
-                time_str,
-                '↑ Inflow' if entry['type'] == 'inflow' else '↓ Outflow',
-                entry.get('category', '')[:20],
-                entry.get('description', '')[:30],
-                amount_str,
-                f"₹{entry.get('running_balance', 0):.2f}"
-            ])
-        
-        trans_table = Table(trans_data, colWidths=[40, 55, 80, 130, 70, 70])
-        trans_style = [
-            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#7c3aed')),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
-            ('ALIGN', (0, 0), (-1, 0), 'CENTER'),
-            ('ALIGN', (4, 1), (5, -1), 'RIGHT'),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, -1), 8),
-            ('GRID', (0, 0), (-1, -1), 0.5, colors.gray),
-        ]
-        # Add row colors based on type
-        for i, entry in enumerate(daybook_data['entries'], 1):
-            if entry['type'] == 'inflow':
-                trans_style.append(('BACKGROUND', (0, i), (-1, i), colors.HexColor('#f0fdf4')))
-            else:
-                trans_style.append(('BACKGROUND', (0, i), (-1, i), colors.HexColor('#fef2f2')))
-        
-        trans_table.setStyle(TableStyle(trans_style))
-        elements.append(trans_table)
-    
-    # Footer
-    elements.append(Spacer(1, 20))
-    footer_style = ParagraphStyle('Footer', parent=styles['Normal'], fontSize=8, alignment=TA_CENTER, textColor=colors.gray)
-    elements.append(Paragraph("Generated by BillByteKOT - Restaurant Management System", footer_style))
-    
-    doc.build(elements)
-    buffer.seek(0)
-    
-    filename = f"daybook-{date}.pdf" if date == end_date else f"daybook-{date}-to-{end_date}.pdf"
-    
-    return StreamingResponse(
-        buffer,
-        media_type="application/pdf",
-        headers={"Content-Disposition": f"attachment; filename={filename}"}
-    )
-
-
-async def generate_daybook_excel(daybook_data: dict, date: str, end_date: str) -> StreamingResponse:
-    """Generate Day Book Excel report using openpyxl"""
-    try:
-        from openpyxl import Workbook
-        from openpyxl.styles import Font, Alignment, PatternFill, Border, Side
-        from openpyxl.utils import get_column_letter
-    except ImportError:
-        # Fallback to CSV if openpyxl not available
-        return await generate_daybook_csv(daybook_data, date, end_date)
-    
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "Day Book"
-    
-    # Styles
-    header_font = Font(bold=True, color="FFFFFF", size=11)
-    header_fill = PatternFill(start_color="7c3aed", end_color="7c3aed", fill_type="solid")
-    inflow_fill = PatternFill(start_color="dcfce7", end_color="dcfce7", fill_type="solid")
-    outflow_fill = PatternFill(start_color="fee2e2", end_color="fee2e2", fill_type="solid")
-    summary_fill = PatternFill(start_color="f3e8ff", end_color="f3e8ff", fill_type="solid")
-    thin_border = Border(
-        left=Side(style='thin'),
-        right=Side(style='thin'),
-        top=Side(style='thin'),
-        bottom=Side(style='thin')
-    )
-    
-    row = 1
-    
-    # Title
-    date_range_str = f"{date}" if date == end_date else f"{date} to {end_date}"
-    ws.merge_cells(f'A{row}:F{row}')
-    ws[f'A{row}'] = f"Day Book Report - {date_range_str}"
-    ws[f'A{row}'].font = Font(bold=True, size=16, color="7c3aed")
-    ws[f'A{row}'].alignment = Alignment(horizontal='center')
-    row += 1
-    
-    ws.merge_cells(f'A{row}:F{row}')
-    ws[f'A{row}'] = f"Generated: {datetime.now().strftime('%Y-%m-%d %H:%M')}"
-    ws[f'A{row}'].alignment = Alignment(horizontal='center')
-    row += 2
-    
-    # Summary Section
-    ws[f'A{row}'] = "SUMMARY"
-    ws[f'A{row}'].font = Font(bold=True, size=12, color="7c3aed")
-    row += 1
-    
-    summary_headers = ['Opening Balance', 'Total Inflows', 'Total Outflows', 'Net Cash Flow', 'Closing Balance']
-    for col, header in enumerate(summary_headers, 1):
-        cell = ws.cell(row=row, column=col, value=header)
-        cell.font = header_font
-        cell.fill = header_fill
-        cell.alignment = Alignment(horizontal='center')
-        cell.border = thin_border
-    row += 1
-    
-    summary_values = [
-        daybook_data['opening_balance'],
-        daybook_data['total_inflows'],
-        daybook_data['total_outflows'],
-        daybook_data['net_cash_flow'],
-        daybook_data['closing_balance']
-    ]
-    for col, value in enumerate(summary_values, 1):
-        cell = ws.cell(row=row, column=col, value=f"₹{value:.2f}")
-        cell.fill = summary_fill
-        cell.alignment = Alignment(horizontal='center')
-        cell.border = thin_border
-        if col == 2:  # Inflows - green
-            cell.font = Font(color="15803d", bold=True)
-        elif col == 3:  # Outflows - red
-            cell.font = Font(color="dc2626", bold=True)
-        elif col == 4:  # Net - based on value
-            cell.font = Font(color="15803d" if value >= 0 else "dc2626", bold=True)
-    row += 2
-    
-    # Inflow Breakdown
-    ws[f'A{row}'] = "INFLOW BREAKDOWN"
-    ws[f'A{row}'].font = Font(bold=True, size=12, color="15803d")
-    row += 1
-    
-    for col, header in enumerate(['Payment Method', 'Amount'], 1):
-        cell = ws.cell(row=row, column=col, value=header)
-        cell.font = header_font
-        cell.fill = PatternFill(start_color="15803d", end_color="15803d", fill_type="solid")
-        cell.alignment = Alignment(horizontal='center')
-        cell.border = thin_border
-    row += 1
-    
-    for method, amount in daybook_data['inflow_breakdown'].items():
-        if amount > 0:
-            ws.cell(row=row, column=1, value=method.capitalize()).border = thin_border
-            ws.cell(row=row, column=1).fill = inflow_fill
-            cell = ws.cell(row=row, column=2, value=f"₹{amount:.2f}")
-            cell.border = thin_border
-            cell.fill = inflow_fill
-            cell.alignment = Alignment(horizontal='right')
-            row += 1
-    
-    # Total row
-    ws.cell(row=row, column=1, value="Total Inflows").font = Font(bold=True)
-    ws.cell(row=row, column=1).border = thin_border
-    cell = ws.cell(row=row, column=2, value=f"₹{daybook_data['total_inflows']:.2f}")
-    cell.font = Font(bold=True, color="15803d")
-    cell.border = thin_border
-    cell.alignment = Alignment(horizontal='right')
-    row += 2
-    
-    # Outflow Breakdown
-    ws[f'A{row}'] = "OUTFLOW BREAKDOWN"
-    ws[f'A{row}'].font = Font(bold=True, size=12, color="dc2626")
-    row += 1
-    
-    for col, header in enumerate(['Category', 'Amount'], 1):
-        cell = ws.cell(row=row, column=col, value=header)
-        cell.font = header_font
-        cell.fill = PatternFill(start_color="dc2626", end_color="dc2626", fill_type="solid")
-        cell.alignment = Alignment(horizontal='center')
-        cell.border = thin_border
-    row += 1
-    
-    for category, amount in daybook_data['outflow_breakdown'].items():
-        if amount > 0:
-            ws.cell(row=row, column=1, value=category).border = thin_border
-            ws.cell(row=row, column=1).fill = outflow_fill
-            cell = ws.cell(row=row, column=2, value=f"₹{amount:.2f}")
-            cell.border = thin_border
-            cell.fill = outflow_fill
-            cell.alignment = Alignment(horizontal='right')
-            row += 1
-    
-    # Total row
-    ws.cell(row=row, column=1, value="Total Outflows").font = Font(bold=True)
-    ws.cell(row=row, column=1).border = thin_border
-    cell = ws.cell(row=row, column=2, value=f"₹{daybook_data['total_outflows']:.2f}")
-    cell.font = Font(bold=True, color="dc2626")
-    cell.border = thin_border
-    cell.alignment = Alignment(horizontal='right')
-    row += 2
-    
-    # Transaction Details
-    ws[f'A{row}'] = f"TRANSACTION DETAILS ({len(daybook_data['entries'])} transactions)"
-    ws[f'A{row}'].font = Font(bold=True, size=12, color="7c3aed")
-    row += 1
-    
-    trans_headers = ['Time', 'Type', 'Category', 'Description', 'Amount', 'Running Balance']
-    for col, header in enumerate(trans_headers, 1):
-        cell = ws.cell(row=row, column=col, value=header)
-        cell.font = header_font
-        cell.fill = header_fill
-        cell.alignment = Alignment(horizontal='center')
-        cell.border = thin_border
-    row += 1
-    
-    for entry in daybook_data['entries']:
-        try:
-            time_str = datetime.fromisoformat(entry['timestamp'].replace('Z', '+00:00')).strftime('%H:%M') if entry.get('timestamp') else '-'
-        except:
-            time_str = '-'
-        
-        fill = inflow_fill if entry['type'] == 'inflow' else outflow_fill
-        amount_prefix = '+' if entry['type'] == 'inflow' else '-'
-        
-        values = [
-            time_str,
-            '↑ Inflow' if entry['type'] == 'inflow' else '↓ Outflow',
-            entry.get('category', ''),
-            entry.get('description', ''),
-            f"{amount_prefix}₹{entry['amount']:.2f}",
-            f"₹{entry.get('running_balance', 0):.2f}"
-        ]
-        
-        for col, value in enumerate(values, 1):
-            cell = ws.cell(row=row, column=col, value=value)
-            cell.fill = fill
-            cell.border = thin_border
-            if col >= 5:
-                cell.alignment = Alignment(horizontal='right')
-        row += 1
-    
-    # Adjust column widths
-    column_widths = [12, 12, 20, 40, 15, 18]
-    for i, width in enumerate(column_widths, 1):
-        ws.column_dimensions[get_column_letter(i)].width = width
-    
-    # Save to buffer
-    buffer = io.BytesIO()
-    wb.save(buffer)
-    buffer.seek(0)
-    
-    filename = f"daybook-{date}.xlsx" if date == end_date else f"daybook-{date}-to-{end_date}.xlsx"
-    
-    return StreamingResponse(
-        buffer,
-        media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-        headers={"Content-Disposition": f"attachment; filename={filename}"}
-    )
-
-
-async def generate_daybook_csv(daybook_data: dict, date: str, end_date: str) -> StreamingResponse:
-    """Fallback CSV export if PDF/Excel libraries not available"""
-    csv_content = f"Day Book Report - {date}\n"
-    csv_content += f"Generated: {datetime.now().strftime('%Y-%m-%d %H:%M')}\n\n"
-    
-    csv_content += "SUMMARY\n"
-    csv_content += f"Opening Balance,Total Inflows,Total Outflows,Net Cash Flow,Closing Balance\n"
-    csv_content += f"{daybook_data['opening_balance']:.2f},{daybook_data['total_inflows']:.2f},{daybook_data['total_outflows']:.2f},{daybook_data['net_cash_flow']:.2f},{daybook_data['closing_balance']:.2f}\n\n"
-    
-    csv_content += "INFLOW BREAKDOWN\n"
-    csv_content += "Payment Method,Amount\n"
-    for method, amount in daybook_data['inflow_breakdown'].items():
-        csv_content += f"{method},{amount:.2f}\n"
-    csv_content += f"Total,{daybook_data['total_inflows']:.2f}\n\n"
-    
-    csv_content += "OUTFLOW BREAKDOWN\n"
-    csv_content += "Category,Amount\n"
-    for category, amount in daybook_data['outflow_breakdown'].items():
-        csv_content += f"{category},{amount:.2f}\n"
-    csv_content += f"Total,{daybook_data['total_outflows']:.2f}\n\n"
-    
-    csv_content += "TRANSACTION DETAILS\n"
-    csv_content += "Time,Type,Category,Description,Amount,Running Balance\n"
-    for entry in daybook_data['entries']:
-        try:
-            time_str = datetime.fromisoformat(entry['timestamp'].replace('Z', '+00:00')).strftime('%H:%M') if entry.get('timestamp') else '-'
-        except:
-            time_str = '-'
-        
-        amount_prefix = '+' if entry['type'] == 'inflow' else '-'
-        csv_content += f"{time_str},{entry['type']},{entry.get('category', '')},\"{entry.get('description', '')}\",{amount_prefix}{entry['amount']:.2f},{entry.get('running_balance', 0):.2f}\n"
+        content, media_type, extension = await get_report_renderer().render_daybook(
+            user_org_id, fmt, daybook_data, date, end_date
+        )
+    except RenderBudgetError as e:
+        raise HTTPException(status_code=413, detail=str(e))
     
-    filename = f"daybook-{date}.csv" if date == end_date else f"daybook-{date}-to-{end_date}.csv"
+    filename = f"daybook-{date}.{extension}" if date == end_date else f"daybook-{date}-to-{end_date}.{extension}"
     
     return Response(
-        content=csv_content,
-        media_type="text/csv",
+        content=content,
+        media_type=media_type,
         headers={"Content-Disposition": f"attachment; filename={filename}"}
     )
 
@@ -7496,12 +7368,11 @@ async def sales_forecast(current_user: dict = Depends(get_current_user)):
     try:
         user_org_id = get_secure_org_id(current_user)
         
-        orders = await db.orders.find({
-            "status": "completed",
-            "organization_id": user_org_id
-        }, {"_id": 0}).to_list(1000)
+        # All-time totals, summed in MongoDB
+        totals = await get_report_engine().totals(user_org_id)
+        order_count = totals["orders"]
 
-        if not orders:
+        if not order_count:
             return {
                 "forecast": "Not enough data yet. Complete some orders to get sales forecasts!",
                 "current_stats": {
@@ -7511,15 +7382,15 @@ async def sales_forecast(current_user: dict = Depends(get_current_user)):
                 },
             }
 
-        total_sales = sum(order["total"] for order in orders)
-        avg_order_value = total_sales / len(orders) if orders else 0
+        total_sales = totals["total"]
+        avg_order_value = total_sales / order_count
 
         if not _LLM_AVAILABLE:
             # Fallback without AI
             return {
-                "forecast": f"Based on {len(orders)} orders with ₹{total_sales:.2f} total sales, your average order value is ₹{avg_order_value:.2f}. Keep up the good work!",
+                "forecast": f"Based on {order_count} orders with ₹{total_sales:.2f} total sales, your average order value is ₹{avg_order_value:.2f}. Keep up the good work!",
                 "current_stats": {
-                    "total_orders": len(orders),
+                    "total_orders": order_count,
                     "total_sales": total_sales,
                     "avg_order": avg_order_value,
                 },
@@ -7531,14 +7402,14 @@ async def sales_forecast(current_user: dict = Depends(get_current_user)):
             system_message="You are a sales analyst. Provide sales predictions based on historical data.",
         ).with_model("openai", "gpt-4o-mini")
 
-        prompt = f"Total orders: {len(orders)}, Total sales: ₹{total_sales:.2f}, Average order: ₹{avg_order_value:.2f}. Predict next week's sales."
+        prompt = f"Total orders: {order_count}, Total sales: ₹{total_sales:.2f}, Average order: ₹{avg_order_value:.2f}. Predict next week's sales."
         user_msg = UserMessage(text=prompt)
         response = await chat.send_message(user_msg)
 
         return {
             "forecast": response,
             "current_stats": {
-                "total_orders": len(orders),
+                "total_orders": order_count,
                 "total_sales": total_sales,
                 "avg_order": avg_order_value,
             },
@@ -7595,38 +7466,46 @@ async def daily_report(current_user: dict = Depends(get_current_user)):
         "created_at": {"$gte": today_utc.isoformat()}
     }, {"_id": 0}).sort("created_at", -1).to_list(1000)
 
-    # Use aggregation for better performance - include paid orders
-    pipeline = [
-        {
-            "$match": {
-                "$or": [
-                    {"status": "completed"},
-                    {"status": "paid"},
-                    {"payment_received": {"$gt": 0}},
-                    {"is_credit": False, "total": {"$gt": 0}}
-                ],
-                "organization_id": user_org_id,
-                "created_at": {"$gte": today_utc.isoformat()}
-            }
-        },
-        {
-            "$group": {
-                "_id": None,
-                "total_orders": {"$sum": 1},
-                "total_sales": {"$sum": "$total"}
-            }
-        }
-    ]
-    
-    aggregation_result = await db.orders.aggregate(pipeline).to_list(1)
-    
-    if aggregation_result:
-        stats = aggregation_result[0]
-        total_orders = stats["total_orders"]
-        total_sales = stats["total_sales"]
+    rollups = get_sales_rollups()
+    if rollups.is_ready():
+        # Totals from today's rollup (completed and paid orders)
+        today = today_ist.strftime("%Y-%m-%d")
+        today_sales = (await rollups.summary(user_org_id, today, today)).get("sales", {})
+        total_orders = int(today_sales.get("orders", 0))
+        total_sales = today_sales.get("total", 0)
     else:
-        total_orders = 0
-        total_sales = 0
+        # Use aggregation for better performance - include paid orders
+        pipeline = [
+            {
+                "$match": {
+                    "$or": [
+                        {"status": "completed"},
+                        {"status": "paid"},
+                        {"payment_received": {"$gt": 0}},
+                        {"is_credit": False, "total": {"$gt": 0}}
+                    ],
+                    "organization_id": user_org_id,
+                    "created_at": {"$gte": today_utc.isoformat()}
+                }
+            },
+            {
+                "$group": {
+                    "_id": None,
+                    "total_orders": {"$sum": 1},
+                    "total_sales": {"$sum": "$total"}
+                }
+            }
+        ]
+        
+        aggregation_result = await db.orders.aggregate(pipeline).to_list(1)
+        
+        if aggregation_result:
+            stats = aggregation_result[0]
+            total_orders = stats["total_orders"]
+            total_sales = stats["total_sales"]
+        else:
+            total_orders = 0
+            total_sales = 0
 
     result = {
         "date": today_ist.isoformat(),
@@ -7667,6 +7546,28 @@ async def get_performance_metrics(current_user: dict = Depends(get_current_user)
             "active_keys": cache_size - expired_count,
             "cache_memory_bytes": sum(len(str(v).encode()) for v in _cache.values()) if _cache else 0
         },
+        "principal_cache": get_principal_cache().get_cache_stats(),
+        "password_hasher": get_password_hasher().get_stats(),
+        "rate_limiter": get_rate_limiter().get_stats(),
+        "invoice_allocator": get_invoice_allocator().get_stats() if get_invoice_allocator() else None,
+        "idempotency": get_idempotency_store().get_stats(),
+        "order_signatures": get_recent_signatures().get_stats(),
+        "active_orders_view": get_cached_order_service().active_view.get_stats(),
+        "cache_coherence": get_cache_coherence().get_stats(),
+        "cache_codec": get_cache_codec().get_stats(),
+        "event_stream": get_event_bus().get_stats(),
+        "order_date_migration": get_order_date_migration().get_stats(),
+        "order_archive": get_order_archiver().get_stats() if get_order_archiver() else None,
+        "daily_rollups": get_sales_rollups().get_stats(),
+        "cash_ledger": get_cash_ledger().get_stats(),
+        "job_leases": {name: lease.get_stats() for name, lease in _job_leases.items()},
+        "item_analytics": get_item_analytics().get_stats(),
+        "report_engine": get_report_engine().get_stats(),
+        "staff_analytics": get_staff_analytics().get_stats(),
+        "sales_heatmap": get_sales_heatmap().get_stats(),
+        "report_renderer": get_report_renderer().get_stats(),
+        "order_export": get_order_exporter().get_stats(),
+        "entitlement_cache": get_entitlement_service().get_cache_stats(),
         "endpoints_with_cache": [
             {"endpoint": "/reports/daily", "ttl_seconds": 3600, "description": "Daily sales report"},
             {"endpoint": "/orders", "ttl_seconds": 300, "description": "List orders (browser cache)"},
@@ -7704,320 +7605,317 @@ async def clear_cache(current_user: dict = Depends(get_current_user), pattern: O
         return {"message": f"Cleared all {cleared} cache entries"}
 
 
-# ✅ NEW: Batch Update Orders Endpoint (reduces N+1 queries)
+# Bulk order status transitions (e.g. mark a whole ticket rail ready)
 @api_router.post("/orders/batch-update-status")
 async def batch_update_order_status(
     current_user: dict = Depends(get_current_user),
     updates: List[dict] = Body(...)
 ):
-    """Batch update order statuses - reduces database round trips"""
+    """
+    Move up to 100 orders to new statuses in one request.
+
+    Body: ``[{"order_id": ..., "status": ...}, ...]``. Each order is
+    validated on its own and reported in ``results`` as updated,
+    unchanged, not_found, invalid_transition or conflict. Tables of
+    completed/cancelled orders are released and caches patched once.
+    """
     user_org_id = get_secure_org_id(current_user)
     
     if not updates or len(updates) > 100:
         raise HTTPException(status_code=400, detail="Provide 1-100 updates")
     
     try:
-        from pymongo import UpdateOne
-        
-        # Build bulk operations
-        bulk_ops = []
-        for update in updates:
-            order_id = update.get("order_id")
-            new_status = update.get("status")
-            
-            if not order_id or not new_status:
-                continue
-            
-            bulk_ops.append(
-                UpdateOne(
-                    {
-                        "_id": order_id,
-                        "organization_id": user_org_id
-                    },
-                    {
-                        "$set": {
-                            "status": new_status,
-                            "updated_at": datetime.now(timezone.utc).isoformat()
-                        }
-                    }
-                )
-            )
-        
-        if bulk_ops:
-            result = await db.orders.bulk_write(bulk_ops)
-            
-            # Clear related cache entries
-            with _cache_lock:
-                cache_keys_to_clear = [k for k in _cache.keys() if "order" in k or user_org_id in k]
-                for key in cache_keys_to_clear:
-                    _cache.pop(key, None)
-                    _cache_ttl.pop(key, None)
-            
-            return {
-                "success": True,
-                "modified_count": result.modified_count,
-                "message": f"Updated {result.modified_count} orders"
-            }
-        
-        return {"success": True, "modified_count": 0, "message": "No valid updates provided"}
-        
+        outcome = await bulk_transition(db, user_org_id, updates)
     except Exception as e:
         logger.error(f"Batch update error: {e}")
         raise HTTPException(status_code=500, detail="Failed to batch update orders")
+    
+    transitioned = outcome["transitioned"]
+    tables_released = 0
+    if transitioned:
+        previous = {result["order_id"]: result.get("from") for result in outcome["results"]}
+        await _record_order_changes(
+            ({**order, "status": previous.get(order["id"])}, order) for order in transitioned
+        )
+
+        # Release the tables of closed orders in one bulk write
+        table_orders = {
+            order["table_id"]: order["id"]
+            for order in transitioned
+            if order.get("status") in RELEASING_STATUSES
+            and order.get("table_id") and order.get("table_id") != "counter"
+        }
+        try:
+            tables_released = await get_table_status_manager().release_tables(user_org_id, table_orders)
+        except Exception as e:
+            print(f"⚠️ Bulk table release error: {e}")
+        
+        # Patch the active orders view once for the whole batch
+        try:
+            await get_cached_order_service().invalidate_orders_bulk(user_org_id, transitioned)
+        except Exception as e:
+            print(f"⚠️ Cache invalidation error: {e}")
+        _drop_local_response_cache(user_org_id)
+    
+    print(f"📦 Batch status update for org {user_org_id}: {len(transitioned)}/{len(outcome['results'])} orders updated, {tables_released} tables released")
+    return {
+        "success": True,
+        "modified_count": len(transitioned),
+        "tables_released": tables_released,
+        "results": outcome["results"],
+        "message": f"Updated {len(transitioned)} orders"
+    }
 
 
 @api_router.get("/reports/export")
 async def export_report(
-    start_date: str, 
-    end_date: str,
+    start_date: str = Query(..., description="From business day (YYYY-MM-DD, IST)"),
+    end_date: str = Query(..., description="To business day inclusive (YYYY-MM-DD, IST)"),
+    fields: Optional[str] = Query(None, description="Comma-separated order fields (default: all)"),
+    format: str = Query("json", description="json or ndjson"),
     current_user: dict = Depends(get_current_user)
 ):
-    user_org_id = get_secure_org_id(current_user)
-    # Parse dates and make them timezone-aware (UTC)
-    start = datetime.fromisoformat(start_date).replace(tzinfo=timezone.utc)
-    end = datetime.fromisoformat(end_date).replace(hour=23, minute=59, second=59, tzinfo=timezone.utc)
+    """
+    Orders created in the date range, streamed with totals.
 
-    orders = await db.orders.find({
-        "organization_id": user_org_id
-    }, {"_id": 0}).to_list(1000)
+    json keeps the ``{"orders": [...], "total_sales": ...}`` document;
+    ndjson sends one order per line and a final ``{"totals": ...}`` line.
+    """
+    user_org_id = get_secure_org_id(current_user)
     
-    filtered_orders = []
-
-    for order in orders:
-        order_date = order.get("created_at")
-        if not order_date:
-            continue
-        if isinstance(order_date, str):
-            try:
-                order_date = datetime.fromisoformat(order_date.replace("Z", "+00:00"))
-            except:
-                continue
-        # Make sure order_date is timezone-aware
-        if order_date.tzinfo is None:
-            order_date = order_date.replace(tzinfo=timezone.utc)
-        if start <= order_date <= end:
-            filtered_orders.append(order)
-
-    return {
-        "orders": filtered_orders,
-        "total_sales": sum(o.get("total", 0) for o in filtered_orders),
-    }
+    format = format.lower()
+    if format not in ("json", "ndjson"):
+        raise HTTPException(status_code=400, detail="Format must be json or ndjson")
+    try:
+        projection = report_projection(fields)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    # The range is part of the indexed query; orders are read in batches
+    start, end = _business_day_range(start_date, end_date)
+    ndjson = format == "ndjson"
+    return StreamingResponse(
+        get_order_exporter().report_chunks(user_org_id, projection, start, end, ndjson=ndjson),
+        media_type="application/x-ndjson" if ndjson else "application/json",
+    )
 
 
-@api_router.get("/reports/weekly")
-async def weekly_report(current_user: dict = Depends(get_current_user)):
-    user_org_id = get_secure_org_id(current_user)
-    week_ago = datetime.now(timezone.utc) - timedelta(days=7)
-    
-    # Optimized: Use database aggregation instead of filtering in Python
-    pipeline = [
-        {
-            "$match": {
-                "status": "completed",
-                "organization_id": user_org_id,
-                "created_at": {"$gte": week_ago.isoformat()}
-            }
-        },
-        {
+async def _completed_orders_report(org_id: str, days: int, period: str) -> dict:
+    """Completed orders and sales of the last ``days`` days"""
+    rollups = get_sales_rollups()
+    if rollups.is_ready():
+        # The last ``days`` business days, today included
+        today = datetime.now(timezone(timedelta(hours=5, minutes=30))).date()
+        summary = await rollups.summary(
+            org_id, (today - timedelta(days=days - 1)).isoformat(), today.isoformat()
+        )
+        total_orders = int(summary.get("orders", {}).get("completed", 0))
+        total_sales = summary.get("revenue", {}).get("completed", 0)
+    else:
+        since = datetime.now(timezone.utc) - timedelta(days=days)
+        # Spans archived months too, should the archive age be set below the period
+        pipeline = await get_order_router().union_pipeline(
+            {"status": "completed", "organization_id": org_id, **created_range(since)},
+            start=since,
+            per_collection=[{"$project": {"total": 1}}],
+        )
+        pipeline.append({
             "$group": {
                 "_id": None,
                 "total_orders": {"$sum": 1},
                 "total_sales": {"$sum": "$total"}
             }
-        }
-    ]
-    
-    result = await db.orders.aggregate(pipeline).to_list(1)
-    
-    if result:
-        stats = result[0]
-        total_orders = stats["total_orders"]
-        total_sales = stats["total_sales"]
-        avg_order_value = total_sales / total_orders if total_orders > 0 else 0
-    else:
-        total_orders = 0
-        total_sales = 0
-        avg_order_value = 0
+        })
+        
+        result = await db.orders.aggregate(pipeline).to_list(1)
+        total_orders = result[0]["total_orders"] if result else 0
+        total_sales = result[0]["total_sales"] if result else 0
     
     return {
         "total_orders": total_orders,
         "total_sales": total_sales,
-        "avg_order_value": avg_order_value,
-        "period": "last_7_days"
+        "avg_order_value": total_sales / total_orders if total_orders > 0 else 0,
+        "period": period
     }
 
 
+@api_router.get("/reports/weekly")
+async def weekly_report(current_user: dict = Depends(get_current_user)):
+    user_org_id = get_secure_org_id(current_user)
+    return await _completed_orders_report(user_org_id, 7, "last_7_days")
+
+
 @api_router.get("/reports/monthly")
 async def monthly_report(current_user: dict = Depends(get_current_user)):
     user_org_id = get_secure_org_id(current_user)
-    month_ago = datetime.now(timezone.utc) - timedelta(days=30)
+    return await _completed_orders_report(user_org_id, 30, "last_30_days")
+
+
+@api_router.get("/reports/item-analytics")
+async def item_analytics_report(
+    start_date: Optional[str] = Query(None, description="From business day (YYYY-MM-DD, IST)"),
+    end_date: Optional[str] = Query(None, description="To business day inclusive (YYYY-MM-DD, IST)"),
+    current_user: dict = Depends(get_current_user)
+):
+    """Quantity, revenue and share of every item and category sold"""
+    user_org_id = get_secure_org_id(current_user)
+    start, end = _business_day_range(start_date, end_date)
+    report = await get_item_analytics().report(user_org_id, start, end)
+    return {**report, "start_date": start_date, "end_date": end_date}
+
+
+@api_router.get("/reports/best-selling")
+async def best_selling_report(
+    start_date: Optional[str] = Query(None, description="From business day (YYYY-MM-DD, IST)"),
+    end_date: Optional[str] = Query(None, description="To business day inclusive (YYYY-MM-DD, IST)"),
+    current_user: dict = Depends(get_current_user)
+):
+    user_org_id = get_secure_org_id(current_user)
+    start, end = _business_day_range(start_date, end_date)
+    report = await get_item_analytics().report(user_org_id, start, end)
     
-    # Optimized: Use database aggregation instead of filtering in Python
-    pipeline = [
-        {
-            "$match": {
-                "status": "completed",
-                "organization_id": user_org_id,
-                "created_at": {"$gte": month_ago.isoformat()}
-            }
-        },
+    return [
         {
-            "$group": {
-                "_id": None,
-                "total_orders": {"$sum": 1},
-                "total_sales": {"$sum": "$total"}
-            }
+            "menu_item_id": item["menu_item_id"],
+            "name": item["name"],
+            "category": item["category"],
+            "price": item["price"],
+            "total_quantity": item["quantity"],
+            "total_revenue": item["revenue"],
+            "quantity_share": item["quantity_share"],
+            "revenue_share": item["revenue_share"],
         }
+        for item in report["items"][:10]
     ]
-    
-    result = await db.orders.aggregate(pipeline).to_list(1)
-    
-    if result:
-        stats = result[0]
-        total_orders = stats["total_orders"]
-        total_sales = stats["total_sales"]
-        avg_order_value = total_sales / total_orders if total_orders > 0 else 0
-    else:
-        total_orders = 0
-        total_sales = 0
-        avg_order_value = 0
-    
-    return {
-        "total_orders": total_orders,
-        "total_sales": total_sales,
-        "avg_order_value": avg_order_value,
-        "period": "last_30_days"
-    }
 
 
-@api_router.get("/reports/best-selling")
-async def best_selling_report(current_user: dict = Depends(get_current_user)):
-    user_org_id = get_secure_org_id(current_user)
-    
-    orders = await db.orders.find({
-        "status": "completed",
-        "organization_id": user_org_id
-    }, {"_id": 0}).to_list(1000)
-    
-    from collections import defaultdict
-    item_stats = defaultdict(lambda: {
-        "total_quantity": 0, 
-        "total_revenue": 0, 
-        "name": "", 
-        "category": "Uncategorized",
-        "price": 0
-    })
-    
-    for order in orders:
-        for item in order["items"]:
-            item_id = item.get("menu_item_id", item["name"])
-            item_stats[item_id]["name"] = item["name"]
-            item_stats[item_id]["total_quantity"] += item["quantity"]
-            item_stats[item_id]["total_revenue"] += item["price"] * item["quantity"]
-            item_stats[item_id]["price"] = item["price"]  # Store price
-    
-    # Get category info from menu
-    for item_id, stats in item_stats.items():
-        menu_item = await db.menu_items.find_one({
-            "name": stats["name"], 
-            "organization_id": user_org_id
-        }, {"_id": 0})
-        if menu_item:
-            stats["category"] = menu_item.get("category", "Uncategorized")
-            if not stats["price"]:
-                stats["price"] = menu_item.get("price", 0)
-    
-    sorted_items = sorted(
-        item_stats.values(), 
-        key=lambda x: x["total_quantity"], 
-        reverse=True
-    )[:10]
-    
-    return sorted_items
+# Default window of the dashboard's top items widget, in business days
+TOP_ITEMS_DAYS = 30
 
 
 @api_router.get("/reports/top-items")
-async def top_items_report(current_user: dict = Depends(get_current_user)):
-    """Get top selling items for dashboard display"""
+async def top_items_report(
+    start_date: Optional[str] = Query(None, description=f"From business day (YYYY-MM-DD, IST), default {TOP_ITEMS_DAYS} days back"),
+    end_date: Optional[str] = Query(None, description="To business day inclusive (YYYY-MM-DD, IST), default today"),
+    current_user: dict = Depends(get_current_user)
+):
+    """Get top selling items for dashboard display (last TOP_ITEMS_DAYS business days by default)"""
     user_org_id = get_secure_org_id(current_user)
+    start, end = _business_day_range(start_date, end_date)
+    if start is None:
+        # IST has no DST: business days are exactly 24h apart
+        until = end or _business_day_range(None, datetime.now(timezone(timedelta(hours=5, minutes=30))).date().isoformat())[1]
+        start = until - timedelta(days=TOP_ITEMS_DAYS)
+    report = await get_item_analytics().report(user_org_id, start, end)
     
-    orders = await db.orders.find({
-        "status": "completed",
-        "organization_id": user_org_id
-    }, {"_id": 0}).to_list(1000)
-    
-    from collections import defaultdict
-    item_stats = defaultdict(lambda: {
-        "quantity": 0, 
-        "revenue": 0, 
-        "name": ""
-    })
-    
-    for order in orders:
-        for item in order["items"]:
-            item_name = item["name"]
-            item_stats[item_name]["name"] = item_name
-            item_stats[item_name]["quantity"] += item["quantity"]
-            item_stats[item_name]["revenue"] += item["price"] * item["quantity"]
-    
-    # Sort by quantity sold and return top 10
-    sorted_items = sorted(
-        item_stats.values(), 
-        key=lambda x: x["quantity"], 
-        reverse=True
-    )[:10]
+    return [
+        {"name": item["name"], "quantity": item["quantity"], "revenue": item["revenue"]}
+        for item in report["items"][:10]
+    ]
+
+
+@api_router.get("/reports/staff-analytics")
+async def staff_analytics_report(
+    start_date: Optional[str] = Query(None, description="From business day (YYYY-MM-DD, IST)"),
+    end_date: Optional[str] = Query(None, description="To business day inclusive (YYYY-MM-DD, IST)"),
+    shift_start: Optional[str] = Query(None, description="Shift start, HH:MM in the organization's timezone"),
+    shift_end: Optional[str] = Query(None, description="Shift end, HH:MM in the organization's timezone (may be past midnight)"),
+    current_user: dict = Depends(get_current_user)
+):
+    """Orders, revenue, average ticket and prep-to-ready time per staff member"""
+    user_org_id = get_secure_org_id(current_user)
+    start, end = _business_day_range(start_date, end_date)
+    try:
+        shift = parse_shift(shift_start, shift_end)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid shift: {e}")
     
-    return sorted_items
+    tz_name = await _org_timezone(user_org_id) if shift else None
+    report = await get_staff_analytics().report(user_org_id, start, end, shift, tz_name)
+    return {
+        **report,
+        "start_date": start_date,
+        "end_date": end_date,
+        "shift": {"start": shift_start, "end": shift_end} if shift else None,
+    }
 
 
 @api_router.get("/reports/staff-performance")
-async def staff_performance_report(current_user: dict = Depends(get_current_user)):
+async def staff_performance_report(
+    start_date: Optional[str] = Query(None, description="From business day (YYYY-MM-DD, IST)"),
+    end_date: Optional[str] = Query(None, description="To business day inclusive (YYYY-MM-DD, IST)"),
+    current_user: dict = Depends(get_current_user)
+):
     user_org_id = get_secure_org_id(current_user)
+    start, end = _business_day_range(start_date, end_date)
+    report = await get_staff_analytics().report(user_org_id, start, end)
     
-    orders = await db.orders.find({
-        "status": "completed",
-        "organization_id": user_org_id
-    }, {"_id": 0}).to_list(1000)
-    
-    from collections import defaultdict
-    staff_stats = defaultdict(lambda: {"total_orders": 0, "total_sales": 0, "waiter_name": ""})
-    
-    for order in orders:
-        waiter_id = order["waiter_id"]
-        staff_stats[waiter_id]["waiter_name"] = order["waiter_name"]
-        staff_stats[waiter_id]["total_orders"] += 1
-        staff_stats[waiter_id]["total_sales"] += order["total"]
+    staff = [
+        {
+            "waiter_name": member["name"],
+            "role": member["role"],
+            "total_orders": member["orders"],
+            "total_sales": member["revenue"],
+            "avg_order_value": member["avg_ticket"],
+            "avg_prep_minutes": member["avg_prep_minutes"],
+        }
+        for member in report["staff"] if member["orders"]
+    ]
+    return sorted(staff, key=lambda x: x["total_orders"], reverse=True)
+
+
+async def _org_timezone(org_id: str) -> str:
+    """The organization's configured timezone (business profile), default Asia/Kolkata"""
+    profiles = get_business_profile_cache()
+    if profiles:
+        profile = await profiles.get_profile(org_id, db) or {}
+    else:
+        profile = await db.users.find_one({"id": org_id}, {"_id": 0, "timezone": 1, "business_settings": 1}) or {}
+    name = profile.get("timezone") or (profile.get("business_settings") or {}).get("timezone")
+    return resolve_timezone(name)[0]
+
+
+@api_router.get("/reports/heatmap")
+async def sales_heatmap_report(
+    start_date: Optional[str] = Query(None, description="From local day (YYYY-MM-DD), default 4 weeks back"),
+    end_date: Optional[str] = Query(None, description="To local day inclusive (YYYY-MM-DD), default today"),
+    current_user: dict = Depends(get_current_user)
+):
+    """Orders and revenue per weekday and hour, in the organization's timezone"""
+    user_org_id = get_secure_org_id(current_user)
+    tz_name = await _org_timezone(user_org_id)
     
-    # Calculate average order value
-    for staff_id, stats in staff_stats.items():
-        stats["avg_order_value"] = stats["total_sales"] / stats["total_orders"] if stats["total_orders"] > 0 else 0
-        # Get role from users collection
-        staff_user = await db.users.find_one({"id": staff_id}, {"_id": 0})
-        if staff_user:
-            stats["role"] = staff_user.get("role", "waiter")
+    today = datetime.now(resolve_timezone(tz_name)[1]).date()
+    try:
+        end_day = datetime.strptime(end_date, "%Y-%m-%d").date() if end_date else today
+        start_day = datetime.strptime(start_date, "%Y-%m-%d").date() if start_date else end_day - timedelta(days=27)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Dates must be YYYY-MM-DD")
+    if start_day > end_day:
+        raise HTTPException(status_code=400, detail="start_date must not be after end_date")
     
-    sorted_staff = sorted(staff_stats.values(), key=lambda x: x["total_orders"], reverse=True)
-    return sorted_staff
+    return await get_sales_heatmap().build(user_org_id, start_day.isoformat(), end_day.isoformat(), tz_name)
 
 
 @api_router.get("/reports/peak-hours")
-async def peak_hours_report(current_user: dict = Depends(get_current_user)):
+async def peak_hours_report(
+    start_date: Optional[str] = Query(None, description="From business day (YYYY-MM-DD, IST)"),
+    end_date: Optional[str] = Query(None, description="To business day inclusive (YYYY-MM-DD, IST)"),
+    current_user: dict = Depends(get_current_user)
+):
     user_org_id = get_secure_org_id(current_user)
+    start, end = _business_day_range(start_date, end_date)
+    tz_name = await _org_timezone(user_org_id)
     
-    orders = await db.orders.find({
-        "status": "completed",
-        "organization_id": user_org_id
-    }, {"_id": 0}).to_list(1000)
-    
-    from collections import defaultdict
-    hour_stats = defaultdict(int)
-    
-    for order in orders:
-        order_date = order["created_at"]
-        if isinstance(order_date, str):
-            order_date = datetime.fromisoformat(order_date)
-        hour = order_date.hour
-        hour_stats[hour] += 1
+    # Orders per local hour (organization timezone), counted in MongoDB
+    groups = await get_report_engine().group(
+        user_org_id,
+        {"$hour": {"date": CREATED_DATE_EXPR, "timezone": tz_name}},
+        {"order_count": {"$sum": 1}},
+        start=start,
+        end=end,
+    )
+    hour_stats = {group["_id"]: group["order_count"] for group in groups if group["_id"] is not None}
     
     # Format hours
     formatted_hours = []
@@ -8031,46 +7929,26 @@ async def peak_hours_report(current_user: dict = Depends(get_current_user)):
 
 
 @api_router.get("/reports/category-analysis")
-async def category_analysis_report(current_user: dict = Depends(get_current_user)):
+async def category_analysis_report(
+    start_date: Optional[str] = Query(None, description="From business day (YYYY-MM-DD, IST)"),
+    end_date: Optional[str] = Query(None, description="To business day inclusive (YYYY-MM-DD, IST)"),
+    current_user: dict = Depends(get_current_user)
+):
     user_org_id = get_secure_org_id(current_user)
+    start, end = _business_day_range(start_date, end_date)
+    report = await get_item_analytics().report(user_org_id, start, end)
     
-    orders = await db.orders.find({
-        "status": "completed",
-        "organization_id": user_org_id
-    }, {"_id": 0}).to_list(1000)
-    
-    from collections import defaultdict
-    category_stats = defaultdict(lambda: {"total_sold": 0, "total_revenue": 0})
-    
-    for order in orders:
-        for item in order["items"]:
-            # Get category from menu
-            menu_item = await db.menu_items.find_one({
-                "name": item["name"],
-                "organization_id": user_org_id
-            }, {"_id": 0})
-            
-            category = "Uncategorized"
-            if menu_item:
-                category = menu_item.get("category", "Uncategorized")
-            
-            category_stats[category]["total_sold"] += item["quantity"]
-            category_stats[category]["total_revenue"] += item["price"] * item["quantity"]
-    
-    # Calculate percentages
-    total_revenue = sum(stats["total_revenue"] for stats in category_stats.values())
-    
-    result = []
-    for category, stats in category_stats.items():
-        percentage = (stats["total_revenue"] / total_revenue * 100) if total_revenue > 0 else 0
-        result.append({
-            "category": category,
-            "total_sold": stats["total_sold"],
-            "total_revenue": stats["total_revenue"],
-            "percentage": percentage
-        })
-    
-    return sorted(result, key=lambda x: x["total_revenue"], reverse=True)
+    return [
+        {
+            "category": category["category"],
+            "total_sold": category["quantity"],
+            "total_revenue": category["revenue"],
+            "percentage": category["revenue_share"],
+            "quantity_share": category["quantity_share"],
+            "items": category["items"],
+        }
+        for category in report["categories"]
+    ]
 
 
 @api_router.get("/reports/customer-balances")
@@ -8403,6 +8281,7 @@ async def update_whatsapp_settings(
         {"id": current_user["id"]},
         {"$set": {"business_settings": business}}
     )
+    await get_principal_cache().invalidate(current_user["id"])
     
     return {"message": "WhatsApp settings updated successfully", "settings": settings.model_dump()}
 
@@ -8811,8 +8690,20 @@ class CustomerOrderCreate(BaseModel):
 
 
 @app.post("/api/public/order")
-async def create_customer_order(order_data: CustomerOrderCreate):
+async def create_customer_order(
+    order_data: CustomerOrderCreate,
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
+):
     """Public endpoint for customers to place orders (self-ordering)"""
+    return await run_idempotent(
+        f"public_order:{order_data.org_id}",
+        idempotency_key,
+        request_fingerprint(order_data.model_dump_json()),
+        lambda: _create_customer_order(order_data),
+    )
+
+
+async def _create_customer_order(order_data: CustomerOrderCreate):
     # Verify restaurant and self-ordering enabled
     admin = await db.users.find_one({"id": order_data.org_id}, {"_id": 0})
     if not admin:
@@ -8822,6 +8713,15 @@ async def create_customer_order(order_data: CustomerOrderCreate):
     if not business.get("customer_self_order_enabled"):
         raise HTTPException(status_code=403, detail="Self-ordering not enabled")
     
+    # Reject double taps: same customer, table and items within 30 seconds
+    signature = order_signature(order_data.items, order_data.customer_phone)
+    signatures = get_recent_signatures()
+    if not await signatures.claim(order_data.org_id, order_data.table_id, signature):
+        raise HTTPException(
+            status_code=400,
+            detail="This order was already placed. Please wait 30 seconds before placing the same order again."
+        )
+    
     # Calculate totals - handle tax_rate properly (allow 0)
     tax_rate_setting = business.get("tax_rate")
     tax_rate = (tax_rate_setting if tax_rate_setting is not None else 5.0) / 100
@@ -8851,8 +8751,14 @@ async def create_customer_order(order_data: CustomerOrderCreate):
     doc = order_obj.model_dump()
     doc["created_at"] = doc["created_at"].isoformat()
     doc["updated_at"] = doc["updated_at"].isoformat()
+    add_bson_dates(doc)
     
-    await db.orders.insert_one(doc)
+    try:
+        await db.orders.insert_one(doc)
+    except Exception:
+        await signatures.release(order_data.org_id, order_data.table_id, signature)
+        raise
+    await _record_order_change(None, doc)
     await db.tables.update_one(
         {"id": order_data.table_id, "organization_id": order_data.org_id},
         {"$set": {"status": "occupied", "current_order_id": order_obj.id}},
@@ -8861,7 +8767,7 @@ async def create_customer_order(order_data: CustomerOrderCreate):
     # Invalidate Redis cache for active orders (CRITICAL for real-time updates)
     try:
         cached_service = get_cached_order_service()
-        await cached_service.invalidate_order_caches(order_data.org_id, order_obj.id)
+        await cached_service.invalidate_order_caches(order_data.org_id, order_obj.id, order=doc)
         print(f"🗑️ Cache invalidated for new QR order {order_obj.id}")
     except Exception as e:
         print(f"⚠️ Cache invalidation error for QR order: {e}")
@@ -9523,6 +9429,10 @@ async def root():
     }
 
 
+# Background job leases by job name (see job_lease)
+_job_leases: Dict[str, JobLease] = {}
+
+
 # Startup validation
 @app.on_event("startup")
 async def startup_validation():
@@ -9634,6 +9544,14 @@ async def startup_validation():
             await db.orders.create_index([("organization_id", 1), ("created_at", -1), ("total", 1)])
             await db.orders.create_index([("organization_id", 1), ("items.name", 1), ("items.quantity", 1)])
             
+            # Native date mirror (created_at_dt) for range queries and aggregations;
+            # the trailing id makes them serve keyset pagination of order history
+            await db.orders.create_index([("organization_id", 1), ("created_at_dt", -1), ("id", -1)])
+            await db.orders.create_index([("organization_id", 1), ("created_at_dt", -1), ("waiter_id", 1)])
+            await db.orders.create_index([("organization_id", 1), ("status", 1), ("created_at_dt", -1), ("id", -1)])
+            await db.orders.create_index([("created_at_dt", -1)])
+            await db.orders.create_index([("organization_id", 1), ("created_at", -1), ("id", -1)])
+            
             # Tables indexes
             await db.tables.create_index("organization_id")
             await db.tables.create_index([("organization_id", 1), ("status", 1)])
@@ -9674,6 +9592,11 @@ async def startup_validation():
             await db.referrals.create_index([("created_at", -1)])  # Sort by date
             await db.referrals.create_index("referee_phone", sparse=True)  # Fast lookup for duplicate mobile check (Requirement 11.1)
             
+            # Daily sales rollups (dashboard and period reports) and the Day Book cash ledger
+            await db.daily_rollups.create_index([("organization_id", 1), ("date", 1)])
+            await db.cash_ledger.create_index([("organization_id", 1), ("date", -1)])
+            await db.expenses.create_index([("organization_id", 1), ("date", 1)])
+            
             # Wallet transactions indexes
             await db.wallet_transactions.create_index("user_id")
             await db.wallet_transactions.create_index([("user_id", 1), ("created_at", -1)])
@@ -9769,12 +9692,20 @@ async def startup_validation():
     # Initialize Redis cache for orders
     try:
         await init_redis_cache(db)
+        get_cached_order_service().set_response_shapes(
+            order=response_shape(Order), table=response_shape(Table), menu_item=response_shape(MenuItem)
+        )
         print("✅ Redis cache initialized for fast order handling")
         
         # Set Redis cache for super admin after initialization
         from redis_cache import redis_cache
         set_super_admin_cache(redis_cache)
         set_ops_cache(redis_cache)
+        init_principal_cache(redis_cache)
+        init_entitlement_service(redis_cache)
+        init_order_dedup(redis_cache)
+        get_rate_limiter().start(redis_cache)
+        await get_event_bus().start(redis_cache)
         print("✅ Super admin Redis cache configured")
         print("✅ Ops panel Redis cache configured")
     except Exception as e:
@@ -9793,10 +9724,169 @@ async def startup_validation():
         print(f"⚠️ Monitoring initialization failed: {e}")
         print("📝 Continuing without monitoring")
     
+    # Reserve invoice numbers in blocks instead of one counter round trip per order
+    init_invoice_allocator(db, block_size=int(os.getenv("INVOICE_BLOCK_SIZE", "20")))
+
+    # Backfill native order dates; range filters dual-read until it finishes
+    asyncio.create_task(order_date_migration_task(db))
+    print("✅ Order date migration task started")
+
+    # Maintenance jobs run in one worker of one instance at a time
+    for name in ("order_archive", "sales_rollups", "cash_ledger", "subscription_expiry"):
+        _job_leases[name] = JobLease(db, name)
+
+    # Move old closed orders into monthly archive collections
+    init_order_archive(db)
+    asyncio.create_task(order_archive_task(lease=_job_leases["order_archive"]))
+    print("✅ Order archive task started")
+
+    # Daily sales rollups: backfill once, then repair recent days
+    init_sales_rollups(db)
+    asyncio.create_task(sales_rollup_task(lease=_job_leases["sales_rollups"]))
+    print("✅ Daily rollup task started")
+
+    # Cash ledger: backfilled from the rollups, then repaired where it drifted
+    init_cash_ledger(db)
+    asyncio.create_task(cash_ledger_task(lease=_job_leases["cash_ledger"]))
+    print("✅ Cash ledger task started")
+
+    # Report engines
+    init_report_engine(db)
+    init_item_analytics(db)
+    init_staff_analytics(db)
+
     # Start background cache cleanup task
     asyncio.create_task(periodic_cache_cleanup())
     print("✅ Background cache cleanup task started")
 
+    # Deactivate expired subscriptions off the request path
+    asyncio.create_task(
+        subscription_expiry_sweeper_task(
+            db, on_expired=_on_subscriptions_expired, lease=_job_leases["subscription_expiry"]
+        )
+    )
+    print("✅ Subscription expiry sweeper started")
+
+    # Keep process-local caches coherent across backend instances
+    try:
+        from redis_cache import redis_cache
+        coherence = get_cache_coherence()
+        coherence.on("orders", _coherence_orders)
+        for collection in ("tables", "menu_items", "inventory"):
+            coherence.on(collection, _coherence_shared)
+        coherence.on("users", _coherence_users)
+        await coherence.start(db, redis_cache)
+
+        if coherence.is_active():
+            # Writes on other instances now evict local entries, so local
+            # tiers no longer need short TTLs to bound staleness
+            get_principal_cache().LOCAL_TTL = 300
+            get_cached_order_service().active_view.LOCAL_TTL = 60
+    except Exception as e:
+        print(f"⚠️ Cache coherence initialization failed: {e}")
+
+
+async def _on_subscriptions_expired(user_ids: List[str]):
+    """Drop cached principals whose subscription flag was just cleared"""
+    await get_principal_cache().invalidate(*user_ids)
+
+
+# ============ CROSS-INSTANCE CACHE COHERENCE ============
+
+def _drop_local_response_cache(org_id: Optional[str] = None):
+    """Drop _cache entries for an organization (or all of them)"""
+    with _cache_lock:
+        keys = [k for k in _cache.keys() if org_id is None or org_id in k]
+        for key in keys:
+            _cache.pop(key, None)
+            _cache_ttl.pop(key, None)
+
+
+async def _coherence_orders(event: CoherenceEvent):
+    """Apply order writes from any instance to this instance's local caches"""
+    try:
+        view = get_cached_order_service().active_view
+    except RuntimeError:
+        view = None
+    fast_cache = get_order_fast_access_cache()
+
+    if event.object_id and not event.organization_id:
+        # A delete: only the _id is known. Evict that one order if this
+        # instance mirrors it; other local copies expire with their TTLs
+        located = view.locate(event.object_id) if view else None
+        if located is None:
+            return
+        org_id, order_id = located
+        view.forget_local(org_id, order_id)
+        _drop_local_response_cache(org_id)
+        if fast_cache:
+            await fast_cache.invalidate_order_cache(org_id, order_id)
+            await fast_cache.invalidate_billing_cache(org_id)
+        return
+
+    if event.is_reset or not event.organization_id:
+        if view:
+            view.drop_local()
+        _drop_local_response_cache()
+        if fast_cache:
+            fast_cache.clear_all()
+        return
+
+    if view:
+        if event.document is not None:
+            view.patch_local(event.organization_id, event.document)
+        else:
+            view.drop_local(event.organization_id)
+    _drop_local_response_cache(event.organization_id)
+    if fast_cache:
+        for order_id in event.doc_ids or [None]:
+            await fast_cache.invalidate_order_cache(event.organization_id, order_id)
+        await fast_cache.invalidate_billing_cache(event.organization_id)
+
+
+async def _coherence_shared(event: CoherenceEvent):
+    """
+    Drop local state derived from tables/menu/inventory on every instance.
+    Writes seen by the change stream (including direct writes that bypass
+    the cache helpers) also drop the Redis-cached lists; pub/sub messages
+    come from those helpers, which already did.
+    """
+    if event.is_reset or not event.organization_id:
+        _drop_local_response_cache()
+        if event.collection == "menu_items":
+            get_item_analytics().invalidate_menu()
+        return
+    _drop_local_response_cache(event.organization_id)
+    if event.source != "change_stream":
+        if event.collection == "menu_items":
+            get_item_analytics().invalidate_menu(event.organization_id)
+        return
+    cached_service = get_cached_order_service()
+    if event.collection == "tables":
+        await cached_service.invalidate_table_caches(event.organization_id)
+    elif event.collection == "menu_items":
+        await cached_service.invalidate_menu_caches(event.organization_id)
+        get_item_analytics().invalidate_menu(event.organization_id)
+    elif event.collection == "inventory":
+        await cached_service.invalidate_inventory_caches(event.organization_id)
+
+
+async def _coherence_users(event: CoherenceEvent):
+    """Evict changed users from the local principal, entitlement and profile tiers"""
+    profiles = get_business_profile_cache()
+    if event.is_reset or not event.doc_ids:
+        get_principal_cache().clear_all()
+        get_entitlement_service().evict_local()
+        if profiles:
+            profiles.evict_local()
+        return
+
+    get_principal_cache().evict_local(*event.doc_ids)
+    get_entitlement_service().evict_local(*event.doc_ids)
+    if profiles:
+        for user_id in event.doc_ids:
+            profiles.evict_local(user_id)
+
 
 async def periodic_cache_cleanup():
     """Periodically clean up expired cache entries to free memory"""
@@ -9898,6 +9988,7 @@ async def process_referral_completion(referee_user_id: str, payment_id: str) ->
             }
         }
     )
+    await get_principal_cache().invalidate(referrer_user_id)
     
     # Create wallet transaction record
     wallet_transaction = {
@@ -10029,6 +10120,7 @@ async def wallet_credit(
         {"id": user_id},
         {"$set": {"wallet_balance": new_balance}}
     )
+    await get_principal_cache().invalidate(user_id)
     
     # Create transaction record
     now = datetime.now(timezone.utc)
@@ -10104,6 +10196,7 @@ async def wallet_debit(
         {"id": user_id},
         {"$set": {"wallet_balance": new_balance}}
     )
+    await get_principal_cache().invalidate(user_id)
     
     # Create transaction record
     now = datetime.now(timezone.utc)
@@ -10551,6 +10644,7 @@ async def apply_referral_code(
         {"id": referee_user_id},
         {"$set": {"referred_by": code}}
     )
+    await get_principal_cache().invalidate(referee_user_id)
     
     return {
         "success": True,
@@ -10616,6 +10710,7 @@ async def complete_referral(request: ReferralCompleteRequest):
             }
         }
     )
+    await get_principal_cache().invalidate(referrer_user_id)
     
     # Create wallet transaction record
     wallet_transaction = {
@@ -10981,149 +11076,45 @@ async def download_inventory_template():
 
 @api_router.get("/orders/export/excel")
 async def export_orders_to_excel(
-    start_date: Optional[str] = None,
-    end_date: Optional[str] = None,
+    start_date: Optional[str] = Query(None, description="From business day (YYYY-MM-DD, IST)"),
+    end_date: Optional[str] = Query(None, description="To business day inclusive (YYYY-MM-DD, IST)"),
+    format: str = Query("csv", description="Export format: csv or xlsx"),
     current_user: dict = Depends(get_current_user)
 ):
-    """Export all orders to Excel file with sequential invoice numbers"""
+    """Export all orders with sequential invoice numbers, streamed as CSV or XLSX"""
     user_org_id = get_secure_org_id(current_user)
     
-    # Build query
-    query = {"organization_id": user_org_id}
-    
-    # Add date filters if provided
-    if start_date or end_date:
-        query["created_at"] = {}
-        if start_date:
-            query["created_at"]["$gte"] = start_date
-        if end_date:
-            query["created_at"]["$lte"] = end_date
+    format = format.lower()
+    if format not in ("csv", "xlsx"):
+        raise HTTPException(status_code=400, detail="Format must be csv or xlsx")
+    if format == "xlsx" and not XLSX_AVAILABLE:
+        raise HTTPException(status_code=503, detail="XLSX export unavailable, use csv")
     
-    # Fetch orders sorted by creation date (newest first)
-    orders = await db.orders.find(query, {"_id": 0}).sort("created_at", -1).to_list(length=10000)
+    range_start, range_end = _business_day_range(start_date, end_date)
     
-    if not orders:
+    # Newest first, read in batches; no cap on the number of orders
+    exporter = get_order_exporter()
+    orders = exporter.orders(user_org_id, range_start, range_end, sort_field=created_sort_field())
+    try:
+        first_order = await anext(orders)
+    except StopAsyncIteration:
         raise HTTPException(status_code=404, detail="No orders found")
     
-    # Create CSV content with improved formatting
-    csv_content = (
-        "Invoice #,Order ID,Date,Time,Table,Customer Name,Phone,Waiter,"
-        "Item Name,Quantity,Unit Price,Item Total,Subtotal,Tax,Discount,Total,Payment Method,Status\n"
-    )
+    async def all_orders():
+        yield first_order
+        async for order in orders:
+            yield order
     
-    for order in orders:
-        order_id = order.get("id", "")[:8]
-        invoice_number = order.get("invoice_number", "")
-        created_at = order.get("created_at", "")
-        
-        # Parse date and time
-        try:
-            dt = datetime.fromisoformat(created_at.replace("Z", "+00:00"))
-            date_str = dt.strftime("%Y-%m-%d")
-            time_str = dt.strftime("%H:%M:%S")
-        except:
-            date_str = created_at
-            time_str = ""
-        
-        table_number = order.get("table_number", "")
-        customer_name = order.get("customer_name", "")
-        customer_phone = order.get("customer_phone", "")
-        waiter_name = order.get("waiter_name", "")
-        
-        # Get order totals
-        subtotal = order.get("subtotal", 0)
-        tax = order.get("tax", 0)
-        discount = order.get("discount", 0)
-        total = order.get("total", 0)
-        payment_method = order.get("payment_method", "")
-        status = order.get("status", "")
-        
-        # Format items with each item on a new line
-        items = order.get("items", [])
-        first_item = True
-        
-        for item in items:
-            item_name = item.get('name', '').replace('"', '""')
-            quantity = item.get('quantity', 0)
-            price = item.get('price', 0)
-            item_total = quantity * price
-            
-            if first_item:
-                # First item includes order details
-                csv_content += (
-                    f'"{invoice_number}",'  # Invoice #
-                    f'"{order_id}",'        # Order ID
-                    f'"{date_str}",'        # Date
-                    f'"{time_str}",'        # Time
-                    f'"{table_number}",'     # Table
-                    f'"{customer_name}",'    # Customer Name
-                    f'"{customer_phone}",'   # Phone
-                    f'"{waiter_name}",'      # Waiter
-                    f'"{item_name}",'        # Item Name
-                    f'{quantity},'           # Quantity
-                    f'{price:.2f},'          # Unit Price
-                    f'{item_total:.2f},'     # Item Total
-                    f'"",'                   # Empty for subtotal
-                    f'"",'                   # Empty for tax
-                    f'"",'                   # Empty for discount
-                    f'"",'                   # Empty for total
-                    f'"",'                   # Empty for payment method
-                    f'""\n'                  # Empty for status
-                )
-                first_item = False
-            else:
-                # Subsequent items only show item details
-                csv_content += (
-                    f'"",'                   # Empty invoice #
-                    f'"",'                   # Empty order ID
-                    f'"",'                   # Empty date
-                    f'"",'                   # Empty time
-                    f'"",'                   # Empty table
-                    f'"",'                   # Empty customer name
-                    f'"",'                   # Empty phone
-                    f'"",'                   # Empty waiter
-                    f'"{item_name}",'        # Item Name
-                    f'{quantity},'           # Quantity
-                    f'{price:.2f},'          # Unit Price
-                    f'{item_total:.2f},'     # Item Total
-                    f'"",'                   # Empty for subtotal
-                    f'"",'                   # Empty for tax
-                    f'"",'                   # Empty for discount
-                    f'"",'                   # Empty for total
-                    f'"",'                   # Empty for payment method
-                    f'""\n'                  # Empty for status
-                )
-        
-        # Add order totals on a new line
-        if items:  # Only add if there are items
-            csv_content += (
-                f'"",'                   # Empty invoice #
-                f'"",'                   # Empty order ID
-                f'"",'                   # Empty date
-                f'"",'                   # Empty time
-                f'"",'                   # Empty table
-                f'"",'                   # Empty customer name
-                f'"",'                   # Empty phone
-                f'"",'                   # Empty waiter
-                f'"",'                   # Empty item name
-                f'"",'                   # Empty quantity
-                f'"",'                   # Empty unit price
-                f'"",'                   # Empty item total
-                f'{subtotal:.2f},'       # Subtotal
-                f'{tax:.2f},'            # Tax
-                f'{discount:.2f},'       # Discount
-                f'{total:.2f},'          # Total
-                f'"{payment_method}",'   # Payment Method
-                f'"{status}"\n'         # Status
-            )
-        
-        # Add an empty line between orders for better readability
-        csv_content += '"","","","","","","","","","","","","","","","","",""\n'
-    # Return as downloadable file
-    return Response(
-        content=csv_content,
-        media_type="text/csv",
-        headers={"Content-Disposition": f"attachment; filename=invoices_export_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"}
+    if format == "xlsx":
+        body, media_type = exporter.xlsx_chunks(all_orders()), XLSX_MEDIA_TYPE
+    else:
+        body, media_type = exporter.csv_chunks(all_orders()), "text/csv"
+    
+    filename = f"invoices_export_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{format}"
+    return StreamingResponse(
+        body,
+        media_type=media_type,
+        headers={"Content-Disposition": f"attachment; filename={filename}"}
     )
 
 
@@ -11658,6 +11649,8 @@ async def extend_user_trial_admin(
         {"id": user_id}, 
         {"$set": {"trial_extension_days": new_extension}}
     )
+    await get_principal_cache().invalidate(user_id)
+    await get_entitlement_service().invalidate(user_id)
     
     return {
         "message": f"Trial extended by {trial_extension.days} days",
@@ -11685,6 +11678,8 @@ async def update_user_subscription_admin(
     
     if result.matched_count == 0:
         raise HTTPException(status_code=404, detail="User not found")
+    await get_principal_cache().invalidate(user_id)
+    await get_entitlement_service().invalidate(user_id)
     
     return {
         "message": "Subscription updated successfully",
@@ -11946,6 +11941,8 @@ async def create_manual_subscription(
             "subscription_created_at": datetime.now(timezone.utc).isoformat()
         }}
     )
+    await get_principal_cache().invalidate(user_id)
+    await get_entitlement_service().invalidate(user_id)
     
     # Send invoice email if requested
     email_result = {"success": False}
@@ -12092,6 +12089,14 @@ async def send_invoice_to_user(
         "message": "Invoice sent successfully" if result.get("success") else "Failed to send invoice"
     }
 
+async def _delete_organization_orders(org_id: str):
+    """Delete an organization's orders, hot and archived"""
+    await db.orders.delete_many({"organization_id": org_id})
+    archiver = get_order_archiver()
+    if archiver is not None:
+        await archiver.delete_organization(org_id)
+
+
 @api_router.delete("/super-admin/users/{user_id}")
 async def delete_user_admin(user_id: str, username: str, password: str):
     """Delete user and all their data - Site Owner Only"""
@@ -12099,12 +12104,20 @@ async def delete_user_admin(user_id: str, username: str, password: str):
         raise HTTPException(status_code=403, detail="Invalid super admin credentials")
     
     # Delete user and all data
+    await get_principal_cache().invalidate_organization(user_id, db)
+    await get_entitlement_service().invalidate(user_id)
     await db.users.delete_one({"id": user_id})
-    await db.orders.delete_many({"organization_id": user_id})
+    await _delete_organization_orders(user_id)
+    await db.daily_rollups.delete_many({"organization_id": user_id})
+    await db.cash_ledger.delete_many({"organization_id": user_id})
     await db.menu_items.delete_many({"organization_id": user_id})
     await db.tables.delete_many({"organization_id": user_id})
     await db.payments.delete_many({"organization_id": user_id})
     await db.inventory.delete_many({"organization_id": user_id})
+    try:
+        await get_cached_order_service().invalidate_order_caches(user_id)
+    except Exception as e:
+        print(f"⚠️ Cache invalidation error: {e}")
     
     return {"message": "User and all data deleted successfully", "user_id": user_id}
 
@@ -12528,12 +12541,13 @@ async def import_user_database(
         
         # If replace_existing, delete existing data first
         if replace_existing:
-            await db.orders.delete_many({"organization_id": user_id})
+            await _delete_organization_orders(user_id)
             await db.menu_items.delete_many({"organization_id": user_id})
             await db.tables.delete_many({"organization_id": user_id})
             await db.inventory.delete_many({"organization_id": user_id})
             await db.payments.delete_many({"organization_id": user_id})
             # Delete staff but not the main user
+            await get_principal_cache().invalidate_organization(user_id, db)
             await db.users.delete_many({"organization_id": user_id})
         
         # Import users (staff)
@@ -12569,6 +12583,7 @@ async def import_user_database(
                     order_data['items'] = json.loads(order_data['items'])
                 except:
                     order_data['items'] = []
+            add_bson_dates(order_data)
             
             await db.orders.update_one(
                 {"id": order_data['id']},
@@ -12636,6 +12651,17 @@ async def import_user_database(
             imported_counts["payments"] += 1
         
         conn.close()
+        await get_principal_cache().invalidate_organization(user_id, db)
+        try:
+            # Bulk import: rebuild the active orders view on next read
+            await get_cached_order_service().invalidate_order_caches(user_id)
+        except Exception as e:
+            print(f"⚠️ Cache invalidation error: {e}")
+        try:
+            await get_sales_rollups().rebuild(org_id=user_id)
+            await get_cash_ledger().rebuild(org_id=user_id)
+        except Exception as e:
+            print(f"⚠️ Daily rollup rebuild error: {e}")
         
         return {
             "message": "Database imported successfully",
@@ -12767,6 +12793,7 @@ async def update_staff_subscription(
             "updated_at": datetime.now(timezone.utc)
         }}
     )
+    await get_principal_cache().invalidate(staff_id)
     
     return {
         "message": f"Staff subscription {'activated' if subscription_active else 'deactivated'}",
@@ -13078,7 +13105,7 @@ async def create_team_member(
         "username_lower": member.username.lower(),
         "email": member.email,
         "email_lower": member.email.lower(),
-        "password": hash_password(member.password),
+        "password": await hash_password(member.password),
         "role": member.role,
         "permissions": member.permissions,
         "full_name": member.full_name,
@@ -13177,7 +13204,9 @@ async def team_login(credentials: TeamLogin):
             "username": {"$regex": f"^{credentials.username}$", "$options": "i"}
         })
     
-    if not member or not verify_password(credentials.password, member["password"]):
+    if not member or not await verify_password_and_rehash(
+        credentials.password, member["password"], db.team_members, member["id"]
+    ):
         raise HTTPException(status_code=401, detail="Invalid credentials")
     
     if not member.get("active", True):
@@ -14621,6 +14650,20 @@ async def shutdown_db_client():
     except Exception as e:
         print(f"⚠️ Redis cleanup error: {e}")
     
+    get_password_hasher().shutdown()
+    get_report_renderer().shutdown()
+
+    # Return unused invoice numbers from reserved blocks
+    allocator = get_invoice_allocator()
+    if allocator is not None:
+        await allocator.release_all()
+    # Let another worker pick the maintenance jobs up right away
+    for lease in _job_leases.values():
+        await lease.release()
+    await get_rate_limiter().stop()
+    await get_cache_coherence().stop()
+    await get_event_bus().stop()
+
     # Close MongoDB client
     client.close()
     print("🔌 Database connections closed")
@@ -0,0 +1,220 @@
+"""
+Staff Analytics
+===============
+
+The staff performance report used to load 1000 orders and look every
+waiter's role up with its own ``users.find_one``. Managers now get one
+aggregation per request, cheap enough to run during service:
+- Orders are grouped per ``waiter_id`` through the report engine (hot
+  and archived orders), optionally limited to a date window and to a
+  shift: a time-of-day range in the organization's timezone such as
+  18:00-23:00, which may run past midnight
+- Per waiter: completed orders, revenue, average ticket, items sold,
+  open and cancelled orders, and the average prep-to-ready time of the
+  orders the kitchen marked ready (``status_times``, from entering
+  preparing, or from creation when the order skipped it)
+- Names and roles come from a per-organization staff directory cached in
+  process for a few minutes and dropped whenever staff change
+"""
+
+import asyncio
+import time
+from datetime import datetime
+from typing import Any, Dict, Optional, Tuple
+
+from report_engine import CREATED_DATE_EXPR, get_report_engine
+from sales_heatmap import resolve_timezone
+from sales_rollups import SALE_STATUSES
+
+OPEN_STATUSES = ("pending", "preparing", "ready")
+
+STAFF_FIELDS = {"_id": 0, "id": 1, "username": 1, "role": 1}
+
+
+def _as_date(field: str) -> Dict[str, Any]:
+    return {"$convert": {"input": f"${field}", "to": "date", "onError": None, "onNull": None}}
+
+
+def _count_if(condition: Dict[str, Any], value: Any = 1) -> Dict[str, Any]:
+    return {"$sum": {"$cond": [condition, value, 0]}}
+
+
+IS_SALE = {"$in": ["$status", list(SALE_STATUSES)]}
+IS_TIMED = {"$gte": ["$prep_ms", 0]}
+
+STAFF_ACCUMULATORS = {
+    "waiter_name": {"$last": "$waiter_name"},
+    "orders": _count_if(IS_SALE),
+    "revenue": _count_if(IS_SALE, "$total"),
+    "items_sold": _count_if(IS_SALE, "$items_sold"),
+    "open_orders": _count_if({"$in": ["$status", list(OPEN_STATUSES)]}),
+    "cancelled_orders": _count_if({"$eq": ["$status", "cancelled"]}),
+    "prep_ms": _count_if(IS_TIMED, "$prep_ms"),
+    "timed_orders": _count_if(IS_TIMED),
+}
+
+
+def parse_shift(shift_start: Optional[str], shift_end: Optional[str]) -> Optional[Tuple[int, int]]:
+    """(start, end) minutes of the local day from "HH:MM" times; raises ValueError"""
+    if not shift_start and not shift_end:
+        return None
+    if not shift_start or not shift_end:
+        raise ValueError("Give both shift_start and shift_end")
+    minutes = []
+    for value in (shift_start, shift_end):
+        parsed = datetime.strptime(value, "%H:%M")
+        minutes.append(parsed.hour * 60 + parsed.minute)
+    if minutes[0] == minutes[1]:
+        raise ValueError("Shift start and end must differ")
+    return minutes[0], minutes[1]
+
+
+def _shift_match(shift: Tuple[int, int]) -> Dict[str, Any]:
+    """$match on the local minute of day; a shift past midnight wraps"""
+    start, end = shift
+    after_start = {"$gte": ["$minute_of_day", start]}
+    before_end = {"$lt": ["$minute_of_day", end]}
+    return {"$match": {"$expr": {"$and" if start < end else "$or": [after_start, before_end]}}}
+
+
+def _order_stages(shift: Optional[Tuple[int, int]], tz_name: str):
+    local = {"date": "$created", "timezone": tz_name}
+    stages = [
+        {"$project": {
+            "_id": 0,
+            "waiter_id": 1,
+            "waiter_name": 1,
+            "status": 1,
+            "total": 1,
+            "items_sold": {"$sum": "$items.quantity"},
+            "created": CREATED_DATE_EXPR,
+            "preparing": _as_date("status_times.preparing"),
+            "ready": _as_date("status_times.ready"),
+        }},
+        {"$set": {
+            "prep_ms": {"$subtract": ["$ready", {"$ifNull": ["$preparing", "$created"]}]},
+            "minute_of_day": {"$add": [{"$multiply": [{"$hour": local}, 60]}, {"$minute": local}]},
+        }},
+    ]
+    if shift is not None:
+        stages.append(_shift_match(shift))
+    return stages
+
+
+class StaffAnalytics:
+    """Per-waiter service metrics from a single aggregation"""
+
+    def __init__(self, db=None, directory_ttl: int = 300):
+        self.db = db
+        self._directories: Dict[str, Tuple[float, Dict[str, Dict[str, Any]]]] = {}
+        self._stats = {
+            "reports": 0,
+            "directory_hits": 0,
+            "directory_loads": 0,
+            "directory_invalidations": 0,
+        }
+
+        self.DIRECTORY_TTL = directory_ttl
+
+    # ============ STAFF DIRECTORY ============
+
+    async def directory(self, org_id: str) -> Dict[str, Dict[str, Any]]:
+        """{user_id: {"id", "username", "role"}} of an organization's staff and owner"""
+        cached = self._directories.get(org_id)
+        if cached and time.monotonic() - cached[0] < self.DIRECTORY_TTL:
+            self._stats["directory_hits"] += 1
+            return cached[1]
+
+        self._stats["directory_loads"] += 1
+        users = await self.db.users.find(
+            {"$or": [{"organization_id": org_id}, {"id": org_id}]}, STAFF_FIELDS
+        ).to_list(None)
+        directory = {user["id"]: user for user in users if user.get("id")}
+        self._directories[org_id] = (time.monotonic(), directory)
+        return directory
+
+    def invalidate_directory(self, org_id: str):
+        """Drop an organization's staff directory after a staff change"""
+        if self._directories.pop(org_id, None) is not None:
+            self._stats["directory_invalidations"] += 1
+
+    # ============ REPORTS ============
+
+    async def report(
+        self,
+        org_id: str,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+        shift: Optional[Tuple[int, int]] = None,
+        tz_name: Any = None,
+    ) -> Dict[str, Any]:
+        """
+        Service metrics per waiter of orders created in [start, end),
+        optionally within a shift (see ``parse_shift``) in the ``tz_name``
+        timezone (Asia/Kolkata when unknown).
+
+        Staff are sorted by revenue, descending. ``avg_prep_minutes`` is
+        None for waiters without kitchen-timed orders.
+        """
+        self._stats["reports"] += 1
+        tz_name = resolve_timezone(tz_name)[0]
+        groups, directory = await asyncio.gather(
+            get_report_engine().group(
+                org_id, "$waiter_id", STAFF_ACCUMULATORS, _order_stages(shift, tz_name), statuses=None, start=start, end=end
+            ),
+            self.directory(org_id),
+        )
+
+        total_revenue = sum(group["revenue"] for group in groups)
+        staff = []
+        for group in groups:
+            member = directory.get(group["_id"]) or {}
+            orders, timed = group["orders"], group["timed_orders"]
+            staff.append({
+                "staff_id": group["_id"],
+                "name": member.get("username") or group.get("waiter_name") or "Unknown",
+                "role": member.get("role", "waiter"),
+                "orders": orders,
+                "revenue": round(group["revenue"], 2),
+                "avg_ticket": round(group["revenue"] / orders, 2) if orders else 0,
+                "items_sold": group["items_sold"],
+                "open_orders": group["open_orders"],
+                "cancelled_orders": group["cancelled_orders"],
+                "timed_orders": timed,
+                "avg_prep_minutes": round(group["prep_ms"] / timed / 60000, 1) if timed else None,
+                "revenue_share": round(group["revenue"] / total_revenue * 100, 2) if total_revenue else 0,
+            })
+        staff.sort(key=lambda x: x["revenue"], reverse=True)
+
+        total_orders = sum(member["orders"] for member in staff)
+        total_timed = sum(group["timed_orders"] for group in groups)
+        return {
+            "staff": staff,
+            "totals": {
+                "orders": total_orders,
+                "revenue": round(total_revenue, 2),
+                "avg_ticket": round(total_revenue / total_orders, 2) if total_orders else 0,
+                "open_orders": sum(member["open_orders"] for member in staff),
+                "avg_prep_minutes": (
+                    round(sum(group["prep_ms"] for group in groups) / total_timed / 60000, 1) if total_timed else None
+                ),
+            },
+        }
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {**self._stats, "cached_directories": len(self._directories)}
+
+
+# Global instance
+_staff_analytics = StaffAnalytics()
+
+
+def init_staff_analytics(db) -> StaffAnalytics:
+    """Attach the global staff analytics to a database"""
+    _staff_analytics.db = db
+    return _staff_analytics
+
+
+def get_staff_analytics() -> StaffAnalytics:
+    """Get the global staff analytics engine"""
+    return _staff_analytics
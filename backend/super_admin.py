@@ -13,6 +13,8 @@ import io
 import csv
 import uuid
 
+from order_dates import created_range
+
 
 # ============ PRICING CONFIGURATION MODEL (Requirements 8.2) ============
 
@@ -483,9 +485,7 @@ async def get_basic_stats(
         
         # Recent activity (last 24 hours)
         yesterday = datetime.now(timezone.utc) - timedelta(days=1)
-        recent_orders = await db.orders.count_documents({
-            "created_at": {"$gte": yesterday}
-        })
+        recent_orders = await db.orders.count_documents(created_range(yesterday))
         
         stats = {
             "total_users": total_users,
@@ -741,7 +741,7 @@ async def get_revenue_stats(
         pipeline = [
             {
                 "$match": {
-                    "created_at": {"$gte": start_date, "$lte": end_date},
+                    **created_range(start_date, end_date),
                     "status": {"$in": ["completed", "paid"]}
                 }
             },
@@ -0,0 +1,101 @@
+"""
+Active orders view writes are versioned merges: out-of-order patches from
+several instances and stale build snapshots never undo newer state.
+"""
+
+import asyncio
+from datetime import datetime, timezone
+
+import pytest
+
+fakeredis = pytest.importorskip("fakeredis")
+pytest.importorskip("lupa")
+pytest.importorskip("aiohttp")
+pytest.importorskip("motor")
+
+from active_orders_view import ActiveOrdersView  # noqa: E402
+from redis_cache import RedisCache  # noqa: E402
+
+ORG = "org-1"
+
+
+def redis_cache():
+    cache = RedisCache()
+    cache.redis = fakeredis.aioredis.FakeRedis(decode_responses=True)
+    cache.connected = True
+    return cache
+
+
+def order(order_id="o1", version=1, status="pending"):
+    return {
+        "id": order_id,
+        "organization_id": ORG,
+        "status": status,
+        "version": version,
+        "created_at": datetime.now(timezone.utc).isoformat(),
+    }
+
+
+async def stored(view, cache):
+    view.drop_local()
+    raw = await cache.hgetall(view._redis_key(ORG))
+    return {key: value for key, value in raw.items() if not key.startswith("v:") and key != "__meta__"}
+
+
+def test_late_patch_does_not_resurrect_removed_order():
+    async def run():
+        cache = redis_cache()
+        view = ActiveOrdersView(redis_client=cache)
+        await view.apply(ORG, order(version=2, status="completed"))
+        await view.apply(ORG, order(version=1))
+        return await stored(view, cache)
+
+    assert asyncio.run(run()) == {}
+
+
+def test_older_patch_does_not_overwrite_newer_one():
+    async def run():
+        cache = redis_cache()
+        view = ActiveOrdersView(redis_client=cache)
+        await view.apply(ORG, order(version=3, status="preparing"))
+        await view.apply(ORG, order(version=2, status="pending"))
+        return await stored(view, cache)
+
+    fields = asyncio.run(run())
+    assert list(fields) == ["o1"]
+    assert '"preparing"' in fields["o1"]
+
+
+def test_deleted_order_stays_deleted():
+    async def run():
+        cache = redis_cache()
+        view = ActiveOrdersView(redis_client=cache)
+        await view.remove(ORG, "o1")
+        await view.apply(ORG, order(version=7))
+        return await stored(view, cache)
+
+    assert asyncio.run(run()) == {}
+
+
+def test_build_merges_into_patches_from_other_instances():
+    async def run():
+        cache = redis_cache()
+        other = ActiveOrdersView(redis_client=cache)
+        await other.apply(ORG, order("o2", version=4, status="ready"))
+        await other.apply(ORG, order("o3", version=2, status="completed"))
+
+        view = ActiveOrdersView(redis_client=cache)
+        snapshot = {"o2": order("o2", version=3), "o3": order("o3", version=1)}
+        key = view._redis_key(ORG)
+        day = key.rsplit(":", 1)[1]
+        await cache.hmerge_versioned(
+            key,
+            [(order_id, doc["version"], '{"id": "%s"}' % order_id) for order_id, doc in snapshot.items()],
+            build=True,
+            meta=("__meta__", '{"day": "%s"}' % day),
+        )
+        return await stored(view, cache)
+
+    fields = asyncio.run(run())
+    assert list(fields) == ["o2"]
+    assert '"ready"' in fields["o2"]
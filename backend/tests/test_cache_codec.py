@@ -0,0 +1,64 @@
+"""
+Cache entries must round-trip through every codec, stay readable by
+older and newer instances during a rolling deploy, and come out as the
+same JSON whichever way they are read.
+"""
+
+import json
+from datetime import datetime, timezone
+
+import pytest
+
+from cache_codec import CacheCodec, CacheCodecError, _codec_functions
+
+VALUE = {
+    "id": "o1",
+    "total": 105.5,
+    "items": [{"name": "Tea", "quantity": 2}],
+    "created_at": datetime(2024, 6, 1, 10, 30, tzinfo=timezone.utc),
+    "note": None,
+}
+# Datetimes always read back as ISO strings
+DECODED = {**VALUE, "created_at": "2024-06-01T10:30:00+00:00"}
+
+CODECS = [name for name in ("json", "orjson", "msgpack") if _codec_functions(name) is not None]
+
+
+@pytest.mark.parametrize("codec", CODECS)
+@pytest.mark.parametrize("threshold", [0, 16])
+def test_round_trip(codec, threshold):
+    cache_codec = CacheCodec(codec, compress_threshold=threshold)
+    entry = cache_codec.encode(VALUE)
+    assert entry[:3] == "~1" + {"json": "j", "orjson": "o", "msgpack": "m"}[codec]
+    assert entry[3] == ("z" if threshold else "-")
+    assert cache_codec.decode(entry) == DECODED
+    assert json.loads(cache_codec.to_json(entry)) == DECODED
+
+
+@pytest.mark.parametrize("writer", CODECS)
+@pytest.mark.parametrize("reader", CODECS)
+def test_any_codec_reads_any_other(writer, reader):
+    entry = CacheCodec(writer, compress_threshold=16).encode(VALUE)
+    assert CacheCodec(reader).decode(entry) == DECODED
+
+
+def test_legacy_plain_json_entries():
+    cache_codec = CacheCodec("json")
+    legacy = json.dumps(DECODED)
+    assert cache_codec.decode(legacy) == DECODED
+    assert cache_codec.decode(legacy.encode()) == DECODED
+    assert cache_codec.to_json(legacy) == legacy.encode()
+    assert cache_codec.get_stats()["legacy_reads"] == 3
+
+
+@pytest.mark.parametrize("entry", ["~2o-:{}", "~1x-:{}", "~1oq:{}", "~1o-;{}"])
+def test_unknown_headers_are_errors(entry):
+    cache_codec = CacheCodec("json")
+    with pytest.raises(CacheCodecError):
+        cache_codec.decode(entry)
+    with pytest.raises(CacheCodecError):
+        cache_codec.to_json(entry)
+
+
+def test_unavailable_codec_falls_back_to_json():
+    assert CacheCodec("nope").codec == "json"
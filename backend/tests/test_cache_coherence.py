@@ -0,0 +1,152 @@
+"""
+Change stream deletes carry no document: they must become a single-order
+eviction (by Mongo _id), never an organization-less flush of everything.
+In pub/sub mode every shared-cache write is announced, and a dropped
+subscription resets local tiers once it is back.
+"""
+
+import asyncio
+import json
+from datetime import datetime, timezone
+
+import pytest
+
+from active_orders_view import ActiveOrdersView, business_day_start
+from cache_coherence import CacheCoherence
+
+
+def change(operation, document=None, object_id="65f0c0ffee0000000000beef"):
+    return {
+        "operationType": operation,
+        "ns": {"db": "app", "coll": "orders"},
+        "documentKey": {"_id": object_id},
+        "fullDocument": document,
+    }
+
+
+def test_delete_event_keeps_the_object_id():
+    event = CacheCoherence._event_from_change(change("delete"))
+    assert event.operation == "delete"
+    assert event.organization_id is None
+    assert event.doc_ids == []
+    assert event.document is None
+    assert event.object_id == "65f0c0ffee0000000000beef"
+    assert not event.is_reset
+
+
+def test_update_event_names_the_order():
+    event = CacheCoherence._event_from_change(
+        change("update", {"_id": "x", "id": "o1", "organization_id": "org"})
+    )
+    assert (event.organization_id, event.doc_ids, event.object_id) == ("org", ["o1"], None)
+
+
+def test_view_locates_and_forgets_a_deleted_order():
+    async def run():
+        view = ActiveOrdersView()
+        now = datetime.now(timezone.utc).isoformat()
+        view._views["org"] = ("day", {}, float("inf"))
+        for order_id, object_id in (("o1", "oid-1"), ("o2", "oid-2")):
+            await view.apply("org", {"_id": object_id, "id": order_id, "status": "pending", "created_at": now})
+        located = view.locate("oid-1")
+        view.forget_local(*located)
+        return located, set(view._views["org"][1]), view.locate("unknown")
+
+    located, remaining, unknown = asyncio.run(run())
+    assert located == ("org", "o1")
+    assert remaining == {"o2"}
+    assert unknown is None
+
+
+def test_object_ids_leave_with_their_orders():
+    async def run():
+        view = ActiveOrdersView()
+        now = datetime.now(timezone.utc).isoformat()
+        view._views["org"] = (business_day_start().date().isoformat(), {}, float("inf"))
+        for order_id in ("o1", "o2", "o3", "o4"):
+            await view.apply("org", {"_id": f"oid-{order_id}", "id": order_id, "status": "pending", "created_at": now})
+        await view.apply("org", {"_id": "oid-o1", "id": "o1", "status": "completed", "created_at": now})
+        await view.remove("org", "o2")
+        view.forget_local("org", "o3")
+        view.patch_local("org", {"_id": "oid-o5", "id": "o5", "status": "cancelled", "created_at": now})
+        return view
+
+    view = asyncio.run(run())
+    assert view._object_ids == {"oid-o4": ("org", "o4")}
+    assert view.get_stats()["object_ids"] == 1
+    view.drop_local("org")
+    assert view._object_ids == {} and view._org_object_ids == {}
+
+
+class Recorder:
+    """Redis stand-in for announce(): records published messages"""
+
+    def __init__(self):
+        self.published = []
+
+    async def publish(self, channel, message):
+        self.published.append(json.loads(message))
+
+
+def test_shared_cache_invalidations_are_announced(monkeypatch):
+    pytest.importorskip("aiohttp")
+    pytest.importorskip("motor")
+    import redis_cache
+
+    coherence = CacheCoherence()
+    coherence.mode, coherence._redis = "pubsub", Recorder()
+    monkeypatch.setattr(redis_cache, "get_cache_coherence", lambda: coherence)
+
+    async def run():
+        service = redis_cache.CachedOrderService(None, redis_cache.RedisCache())
+        await service.invalidate_table_caches("org")
+        await service.invalidate_menu_caches("org")
+        await service.invalidate_inventory_caches("org")
+        await redis_cache.TableStatusManager(None, redis_cache.RedisCache())._invalidate_table_cache("org")
+
+    asyncio.run(run())
+    assert [(m["collection"], m["organization_id"]) for m in coherence._redis.published] == [
+        ("tables", "org"), ("menu_items", "org"), ("inventory", "org"), ("tables", "org"),
+    ]
+
+
+class FlakyPubSub:
+    """Pub/sub whose connection drops once and whose first resubscribe fails"""
+
+    def __init__(self):
+        self.subscribes = 0
+        self.listens = 0
+
+    async def subscribe(self, channel):
+        self.subscribes += 1
+        if self.subscribes == 1:
+            raise ConnectionError("still down")
+
+    async def listen(self):
+        self.listens += 1
+        if self.listens == 1:
+            raise ConnectionError("connection lost")
+        await asyncio.sleep(3600)
+        yield {}
+
+
+def test_resubscribe_resets_local_tiers():
+    async def run():
+        coherence = CacheCoherence(reconnect_delay=0)
+        events = []
+
+        async def handler(event):
+            events.append((event.operation, pubsub.subscribes))
+
+        coherence.on("tables", handler)
+        pubsub = FlakyPubSub()
+        task = asyncio.create_task(coherence._pubsub_loop(pubsub))
+        while pubsub.listens < 2:
+            await asyncio.sleep(0)
+        task.cancel()
+        return events, coherence.get_stats()
+
+    events, stats = asyncio.run(run())
+    # One reset, only once the second subscribe went through
+    assert events == [("reset", 2)]
+    assert stats["resets"] == 1 and stats["reconnects"] == 2
@@ -0,0 +1,102 @@
+"""
+Entitlement evaluation keeps check_subscription's semantics, and the
+expiry sweep only touches subscriptions that actually expired.
+"""
+
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from entitlement_service import EntitlementService, build_entitlement, evaluate_entitlement
+
+NOW = datetime(2024, 6, 1, tzinfo=timezone.utc)
+
+
+def admin(**fields):
+    return {"id": "org", "created_at": (NOW - timedelta(days=30)).isoformat(), **fields}
+
+
+def test_subscription_without_expiry_falls_through_to_trial():
+    expired_trial = build_entitlement("org", admin(subscription_active=True))
+    assert evaluate_entitlement(expired_trial, NOW) == "expired"
+
+    in_trial = build_entitlement("org", admin(subscription_active=True, created_at=NOW.isoformat()))
+    assert evaluate_entitlement(in_trial, NOW) == "trial"
+
+
+def test_subscription_with_future_expiry_is_active_until_it_passes():
+    record = build_entitlement(
+        "org", admin(subscription_active=True, subscription_expires_at=(NOW + timedelta(days=1)).isoformat())
+    )
+    assert evaluate_entitlement(record, NOW) == "active"
+    assert evaluate_entitlement(record, NOW + timedelta(days=2)) == "expired"
+
+
+def test_missing_admin_is_expired():
+    assert evaluate_entitlement(build_entitlement("org", None), NOW) == "expired"
+
+
+def test_sweep_deactivates_only_expired_subscriptions():
+    mongomock_motor = pytest.importorskip("mongomock_motor")
+
+    async def run():
+        db = mongomock_motor.AsyncMongoMockClient()["test"]
+        now = datetime.now(timezone.utc)
+        await db.users.insert_many([
+            {"id": "past-string", "subscription_active": True,
+             "subscription_expires_at": (now - timedelta(days=1)).isoformat()},
+            {"id": "past-date", "subscription_active": True, "subscription_expires_at": now - timedelta(hours=1)},
+            {"id": "future", "subscription_active": True,
+             "subscription_expires_at": (now + timedelta(days=1)).isoformat()},
+            {"id": "no-expiry", "subscription_active": True, "subscription_expires_at": None},
+            {"id": "inactive", "subscription_active": False,
+             "subscription_expires_at": (now - timedelta(days=1)).isoformat()},
+        ])
+        swept = await EntitlementService().sweep_expired_subscriptions(db, batch_size=1)
+        active = {user["id"] async for user in db.users.find({"subscription_active": True})}
+        return swept, active
+
+    swept, active = asyncio.run(run())
+    assert sorted(swept) == ["past-date", "past-string"]
+    assert active == {"future", "no-expiry"}
+
+
+class FixedLease:
+    def __init__(self, held):
+        self.held = held
+
+    async def acquire(self):
+        return self.held
+
+
+def test_sweeper_only_runs_in_the_lease_holder(monkeypatch):
+    import entitlement_service
+
+    def sweeps_with(lease):
+        calls = []
+
+        async def sweep(db):
+            calls.append(db)
+            return ["u1"]
+
+        async def run():
+            expired = []
+
+            async def on_expired(user_ids):
+                expired.extend(user_ids)
+
+            monkeypatch.setattr(entitlement_service._entitlement_service, "sweep_expired_subscriptions", sweep)
+            task = asyncio.create_task(
+                entitlement_service.subscription_expiry_sweeper_task("db", interval=0, on_expired=on_expired, lease=lease)
+            )
+            for _ in range(5):
+                await asyncio.sleep(0)
+            task.cancel()
+            return len(calls), len(expired)
+
+        return asyncio.run(run())
+
+    assert sweeps_with(FixedLease(False)) == (0, 0)
+    swept, expired = sweeps_with(FixedLease(True))
+    assert swept > 0 and expired == swept
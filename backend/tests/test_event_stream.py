@@ -0,0 +1,45 @@
+"""
+Replay buffers exist only for organizations with local connections and
+expire once those connections have been gone for REPLAY_IDLE.
+"""
+
+import asyncio
+
+from event_stream import EventBus
+
+
+def publish(bus, org_id, count=1):
+    for _ in range(count):
+        asyncio.run(bus.publish(org_id, "order.updated", {"order_id": "o1"}))
+
+
+def test_no_buffer_without_local_subscribers():
+    bus = EventBus()
+    publish(bus, "org", 3)
+    assert bus.get_stats()["replay_buffers"] == 0
+
+
+def test_buffer_replays_to_reconnecting_client():
+    bus = EventBus()
+    subscriber, _, _ = bus._subscribe("org", None)
+    publish(bus, "org", 3)
+    first = subscriber.queue.get_nowait()
+    bus._unsubscribe("org", subscriber)
+
+    # Reconnect within the idle window: events after the last one seen are replayed
+    _, backlog, resync = bus._subscribe("org", first["id"])
+    assert not resync
+    assert len(backlog) == 2
+
+
+def test_idle_buffer_is_dropped():
+    bus = EventBus(replay_idle=0)
+    subscriber, _, _ = bus._subscribe("org", None)
+    publish(bus, "org")
+    event_id = subscriber.queue.get_nowait()["id"]
+    bus._unsubscribe("org", subscriber)
+    publish(bus, "org")
+    assert bus.get_stats()["replay_buffers"] == 0
+
+    _, backlog, resync = bus._subscribe("org", event_id)
+    assert resync and backlog == []
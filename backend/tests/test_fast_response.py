@@ -0,0 +1,67 @@
+"""
+The JSON fast paths must send what the validated response_model path
+would, including for documents written before a model field existed.
+"""
+
+import asyncio
+import json
+from datetime import datetime, timezone
+from typing import Optional
+
+import pytest
+
+pydantic = pytest.importorskip("pydantic")
+pytest.importorskip("fastapi")
+
+from active_orders_view import ActiveOrdersView, business_day_start  # noqa: E402
+from fast_response import response_shape  # noqa: E402
+
+
+class Order(pydantic.BaseModel):
+    model_config = pydantic.ConfigDict(extra="ignore")
+    id: str
+    status: str = "pending"
+    payment_received: float = 0
+    version: int = 0
+    customer_name: Optional[str] = None
+    created_at: datetime
+
+
+LEGACY = {"id": "o1", "status": "pending", "status_times": {"pending": "x"}, "created_at": "2024-06-01T10:00:00+00:00"}
+
+
+def test_shape_fills_defaults_and_drops_unknown_fields():
+    shaped = response_shape(Order)(LEGACY)
+    assert shaped == Order.model_validate(LEGACY).model_dump(mode="json")
+    assert shaped["version"] == 0 and shaped["payment_received"] == 0
+    assert "status_times" not in shaped
+
+
+def test_invalid_document_is_left_alone():
+    assert response_shape(Order)({"id": "o2"}) == {"id": "o2"}
+
+
+def test_view_renders_shaped_orders():
+    async def run():
+        view = ActiveOrdersView()
+        view.shape = response_shape(Order)
+        now = datetime.now(timezone.utc).isoformat()
+        view._views["org"] = (business_day_start().date().isoformat(), {}, float("inf"))
+        await view.apply("org", {**LEGACY, "created_at": now})
+        return await view.get_orders_json("org", None), await view.get_orders_json("org", None, "ready")
+
+    everything, ready = asyncio.run(run())
+    order, = json.loads(everything)
+    assert order["version"] == 0 and "status_times" not in order
+    assert json.loads(ready) == []
+
+
+def test_only_known_status_filters_are_memoized():
+    async def run():
+        view = ActiveOrdersView()
+        view._views["org"] = (business_day_start().date().isoformat(), {}, float("inf"))
+        for status in (None, "pending", "no-such-status", "x" * 50):
+            await view.get_orders_json("org", None, status)
+        return view._rendered["org"]
+
+    assert set(asyncio.run(run())) == {None, "pending"}
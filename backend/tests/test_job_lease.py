@@ -0,0 +1,63 @@
+"""
+Maintenance jobs run in exactly one worker: the job lease is exclusive,
+renewable by its holder and taken over once it expires or is released.
+"""
+
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+mongomock_motor = pytest.importorskip("mongomock_motor")
+
+from job_lease import JobLease  # noqa: E402
+
+
+def database():
+    return mongomock_motor.AsyncMongoMockClient()["test"]
+
+
+def test_only_one_worker_holds_the_lease():
+    async def run():
+        db = database()
+        workers = [JobLease(db, "sales_rollups") for _ in range(4)]
+        held = [await worker.acquire() for worker in workers]
+        # The holder keeps it on later passes
+        again = await workers[0].acquire()
+        for worker in workers:
+            await worker.release()
+        return held, again
+
+    held, again = asyncio.run(run())
+    assert held == [True, False, False, False]
+    assert again is True
+
+
+def test_expired_lease_is_taken_over():
+    async def run():
+        db = database()
+        first, second = JobLease(db, "cash_ledger"), JobLease(db, "cash_ledger")
+        await first.acquire()
+        # The holder died without renewing
+        await db.job_leases.update_one(
+            {"_id": "cash_ledger"}, {"$set": {"expires_at": datetime.now(timezone.utc) - timedelta(seconds=1)}}
+        )
+        taken = await second.acquire()
+        await first.release()
+        await second.release()
+        return taken
+
+    assert asyncio.run(run()) is True
+
+
+def test_released_lease_is_free_at_once():
+    async def run():
+        db = database()
+        first, second = JobLease(db, "order_archive"), JobLease(db, "order_archive")
+        await first.acquire()
+        await first.release()
+        taken = await second.acquire()
+        await second.release()
+        return taken
+
+    assert asyncio.run(run()) is True
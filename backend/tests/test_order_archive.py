@@ -0,0 +1,39 @@
+"""
+Restoring archived open-balance orders is a one-off repair: once a pass
+completes it is recorded and the archive scans never run again.
+"""
+
+import asyncio
+
+import pytest
+
+from order_archive import RESTORE_MIGRATION_ID, OrderArchiver, OrderReadRouter
+
+
+def test_open_balances_are_restored_once():
+    mongomock_motor = pytest.importorskip("mongomock_motor")
+
+    async def run():
+        db = mongomock_motor.AsyncMongoMockClient()["test"]
+        archive = db["orders_archive_2024_01"]
+        await archive.insert_many([
+            {"id": "open", "organization_id": "org", "balance_amount": 50},
+            {"id": "paid", "organization_id": "org", "balance_amount": 0},
+        ])
+        archiver = OrderArchiver(db, OrderReadRouter(db))
+        first = await archiver.restore_open_balances()
+
+        # Anything found later is left alone, also by a freshly started instance
+        await archive.insert_one({"id": "late", "organization_id": "org", "balance_amount": 10})
+        again = await OrderArchiver(db, OrderReadRouter(db)).restore_open_balances()
+
+        hot = [doc["id"] async for doc in db.orders.find()]
+        archived = sorted([doc["id"] async for doc in archive.find()])
+        marker = await db.migrations.find_one({"_id": RESTORE_MIGRATION_ID})
+        return first, again, hot, archived, marker
+
+    first, again, hot, archived, marker = asyncio.run(run())
+    assert (first, again) == (1, 0)
+    assert hot == ["open"]
+    assert archived == ["late", "paid"]
+    assert marker["completed"] and marker["restored"] == 1
@@ -0,0 +1,48 @@
+"""
+The created_at_dt migration only completes on a clean sweep and drops
+back to dual read when orders without the mirror show up again.
+"""
+
+import asyncio
+
+import pytest
+
+from order_dates import CREATED_AT_DT, OrderDateMigration, add_bson_dates, parse_timestamp
+
+mongomock_motor = pytest.importorskip("mongomock_motor")
+
+
+def test_add_bson_dates_parses_iso_strings():
+    doc = add_bson_dates({"created_at": "2024-03-01T10:00:00Z"})
+    assert doc[CREATED_AT_DT] == parse_timestamp("2024-03-01T10:00:00+00:00")
+    assert add_bson_dates({"created_at": "yesterday"})[CREATED_AT_DT] is None
+
+
+def test_migration_completes_on_clean_sweep_and_reopens_for_stragglers():
+    async def run():
+        db = mongomock_motor.AsyncMongoMockClient()["test"]
+        migration = OrderDateMigration()
+        await db.orders.insert_one({"id": "o1", "created_at": "2024-03-01T10:00:00+00:00"})
+
+        states = []
+        for straggler in (None, None, "o2", None):
+            if straggler:
+                # Written by an instance without add_bson_dates
+                await db.orders.insert_one({"id": straggler, "created_at": "2024-03-02T10:00:00+00:00"})
+            await migration.run(db)
+            states.append(migration.is_complete())
+
+        other = OrderDateMigration()
+        await other.load_state(db)
+        return states, other.is_complete()
+
+    states, loaded = asyncio.run(run())
+    assert states == [False, True, False, True]
+    assert loaded is True
+
+
+def test_created_range_keeps_string_fallback_until_complete():
+    migration = OrderDateMigration()
+    assert "$or" in migration.created_range()
+    migration._complete = True
+    assert list(migration.created_range()) == [CREATED_AT_DT]
@@ -0,0 +1,79 @@
+"""
+Duplicate-order detection must fail open: only a definite "key exists"
+from Redis rejects an order, never an error.
+"""
+
+import asyncio
+
+import pytest
+
+from order_dedup import IdempotencyStore, RecentOrderSignatures
+
+
+class FakeRedis:
+    def __init__(self, set_nx_result):
+        self.set_nx_result = set_nx_result
+        self.values = {}
+
+    def is_connected(self):
+        return True
+
+    async def set_nx(self, key, value, time):
+        if isinstance(self.set_nx_result, Exception):
+            raise self.set_nx_result
+        return self.set_nx_result
+
+    async def get(self, key):
+        return self.values.get(key)
+
+    async def delete(self, *keys):
+        return True
+
+
+@pytest.mark.parametrize("result", [None, RuntimeError("upstash down")])
+def test_signature_claim_fails_open_on_redis_errors(result):
+    signatures = RecentOrderSignatures()
+    signatures.set_redis_client(FakeRedis(result))
+    assert asyncio.run(signatures.claim("org", "t1", "sig")) is True
+
+
+def test_signature_claim_rejects_when_redis_has_the_key():
+    signatures = RecentOrderSignatures()
+    signatures.set_redis_client(FakeRedis(False))
+    assert asyncio.run(signatures.claim("org", "t1", "sig")) is False
+
+
+def test_signature_claim_rejects_local_repeat_and_release_allows_retry():
+    signatures = RecentOrderSignatures()
+    assert asyncio.run(signatures.claim("org", "t1", "sig")) is True
+    assert asyncio.run(signatures.claim("org", "t1", "sig")) is False
+    assert asyncio.run(signatures.claim("org", "t2", "sig")) is True
+    asyncio.run(signatures.release("org", "t1", "sig"))
+    assert asyncio.run(signatures.claim("org", "t1", "sig")) is True
+
+
+def test_idempotency_begin_treats_redis_errors_as_new():
+    store = IdempotencyStore()
+    store.set_redis_client(FakeRedis(None))
+    outcome, _ = asyncio.run(store.begin("org", "key", "fp"))
+    assert outcome == IdempotencyStore.NEW
+
+
+def test_upstash_set_nx_returns_none_on_request_errors():
+    pytest.importorskip("aiohttp")
+    pytest.importorskip("redis")
+    pytest.importorskip("motor")
+    from redis_cache import UpstashRedisCache
+
+    class FailingUpstash(UpstashRedisCache):
+        async def _request(self, command):
+            raise RuntimeError("503")
+
+    class ExistingKeyUpstash(UpstashRedisCache):
+        async def _request(self, command):
+            return None  # SET NX on an existing key replies nil
+
+    for cls, expected in ((FailingUpstash, None), (ExistingKeyUpstash, False)):
+        client = cls()
+        client.connected, client.session = True, object()
+        assert asyncio.run(client.set_nx("k", "v", 10)) is expected
@@ -0,0 +1,46 @@
+"""
+Report field lists are validated up front, so a bad projection is a 400
+instead of a MongoDB error halfway through a streamed response.
+"""
+
+import pytest
+
+from order_export import MAX_FIELDS, REPORT_ORDER_FIELDS, report_projection
+
+
+def test_no_fields_means_all_fields():
+    assert report_projection(None) == REPORT_ORDER_FIELDS
+    assert report_projection("") == REPORT_ORDER_FIELDS
+
+
+def test_selected_fields():
+    assert report_projection(" id, items.name ,total,id") == {"_id": 0, "id": 1, "items.name": 1, "total": 1}
+
+
+@pytest.mark.parametrize("fields", [",", " , ,"])
+def test_empty_list_is_rejected(fields):
+    with pytest.raises(ValueError, match="No fields"):
+        report_projection(fields)
+
+
+@pytest.mark.parametrize("fields", ["items,items.name", "items.name,items", "a.b.c,a", "a.b,a.b.c"])
+def test_overlapping_paths_are_rejected(fields):
+    with pytest.raises(ValueError, match="Overlapping"):
+        report_projection(fields)
+
+
+def test_sibling_paths_with_a_common_prefix_are_fine():
+    assert report_projection("items,items_count,item.name") == {
+        "_id": 0, "items": 1, "items_count": 1, "item.name": 1,
+    }
+
+
+@pytest.mark.parametrize("fields", ["_id", "created_at_dt.x", "bad name", "$where", "a..b"])
+def test_invalid_names_are_rejected(fields):
+    with pytest.raises(ValueError, match="Invalid field"):
+        report_projection(fields)
+
+
+def test_too_many_fields():
+    with pytest.raises(ValueError, match="At most"):
+        report_projection(",".join(f"f{i}" for i in range(MAX_FIELDS + 1)))
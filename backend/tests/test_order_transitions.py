@@ -0,0 +1,151 @@
+"""
+Status transitions and optimistic concurrency: a write based on a stale
+read must turn into a conflict, never silently overwrite the newer state.
+"""
+
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from order_transitions import (
+    CONFLICT, INVALID, NOT_FOUND, UNCHANGED, UPDATED,
+    bulk_transition, compare_and_set_status, conditional_update, parse_if_match, validate_transition, version_filter,
+)
+
+
+@pytest.mark.parametrize("current,target", [
+    ("pending", "preparing"), ("preparing", "pending"), ("ready", "completed"), ("pending", "cancelled"), (None, "ready"),
+])
+def test_allowed_transitions(current, target):
+    assert validate_transition(current, target) is None
+
+
+@pytest.mark.parametrize("current,target,message", [
+    ("pending", "served", "Unknown status"),
+    ("completed", "pending", "already completed"),
+    ("cancelled", "completed", "already cancelled"),
+    ("paid", "ready", "already paid"),
+    ("ready", "pending", "Cannot change status"),
+])
+def test_rejected_transitions(current, target, message):
+    assert message in validate_transition(current, target)
+
+
+def test_version_filter():
+    assert version_filter(None) == {}
+    # Orders written before versioning have no version field
+    assert version_filter(0) == {"version": {"$in": [0, None]}}
+    assert version_filter(4) == {"version": 4}
+
+
+@pytest.mark.parametrize("header,version", [(None, None), ("  ", None), ("3", 3), ('"3"', 3), ('W/"7"', 7)])
+def test_parse_if_match(header, version):
+    assert parse_if_match(header) == version
+
+
+def test_parse_if_match_rejects_garbage():
+    with pytest.raises(ValueError):
+        parse_if_match('"abc"')
+
+
+# ============ DATABASE PATHS ============
+
+class Orders:
+    """
+    mongomock orders collection. mongomock re-reads find_one_and_update
+    results with the original filter when _id is projected out (so a
+    guarded update looks like a miss); ask for _id and drop it here.
+    """
+
+    def __init__(self, collection):
+        self._collection = collection
+
+    def __getattr__(self, name):
+        return getattr(self._collection, name)
+
+    async def find_one_and_update(self, filter, update, projection=None, **kwargs):
+        order = await self._collection.find_one_and_update(filter, update, **kwargs)
+        if order is not None and projection == {"_id": 0}:
+            order.pop("_id", None)
+        return order
+
+
+def run_with_orders(orders, scenario):
+    mongomock_motor = pytest.importorskip("mongomock_motor")
+
+    async def run():
+        db = SimpleNamespace(orders=Orders(mongomock_motor.AsyncMongoMockClient()["test"].orders))
+        await db.orders.insert_many([{"organization_id": "org", **order} for order in orders])
+        return await scenario(db)
+
+    return asyncio.run(run())
+
+
+def test_compare_and_set_status_results():
+    async def scenario(db):
+        updated = await compare_and_set_status(db, "org", "o1", "preparing")
+        unchanged = await compare_and_set_status(db, "org", "o1", "preparing")
+        invalid = await compare_and_set_status(db, "org", "done", "pending")
+        missing = await compare_and_set_status(db, "org", "nope", "ready")
+        other_org = await compare_and_set_status(db, "other", "o1", "ready")
+        return updated, unchanged, invalid, missing, other_org
+
+    updated, unchanged, invalid, missing, other_org = run_with_orders(
+        [{"id": "o1", "status": "pending"}, {"id": "done", "status": "completed", "version": 2}], scenario
+    )
+    assert updated[0] == UPDATED
+    assert updated[1]["version"] == 1 and "preparing" in updated[1]["status_times"]
+    assert unchanged[0] == UNCHANGED
+    assert invalid[0] == INVALID
+    assert missing == (NOT_FOUND, None)
+    assert other_org == (NOT_FOUND, None)
+
+
+def test_stale_version_is_a_conflict():
+    async def scenario(db):
+        # Two clients read version 0 (a pre-versioning order); the first write wins
+        first = await compare_and_set_status(db, "org", "o1", "preparing", expected_version=0)
+        second = await compare_and_set_status(db, "org", "o1", "ready", expected_version=0)
+        edit = await conditional_update(db, "org", "o1", {"customer_name": "late"}, expected_version=0)
+        current = await db.orders.find_one({"id": "o1"}, {"_id": 0})
+        return first, second, edit, current
+
+    first, second, edit, current = run_with_orders([{"id": "o1", "status": "pending"}], scenario)
+    assert first[0] == UPDATED
+    assert second[0] == CONFLICT and second[1]["status"] == "preparing"
+    assert edit is None
+    assert current["status"] == "preparing" and current["version"] == 1 and "customer_name" not in current
+
+
+def test_bulk_transition_reports_concurrent_changes_as_conflicts():
+    async def scenario(db):
+        bulk_write = db.orders.bulk_write
+
+        async def racing_bulk_write(operations, **kwargs):
+            # Another request moves o2 between the read and the write
+            await db.orders.update_one({"id": "o2"}, {"$set": {"status": "cancelled"}, "$inc": {"version": 1}})
+            return await bulk_write(operations, **kwargs)
+
+        db.orders.bulk_write = racing_bulk_write
+        outcome = await bulk_transition(db, "org", [
+            {"order_id": "o1", "status": "ready"},
+            {"order_id": "o2", "status": "ready"},
+            {"order_id": "o3", "status": "ready"},
+            {"order_id": "o4", "status": "ready"},
+            {"order_id": "missing", "status": "ready"},
+        ])
+        o2 = await db.orders.find_one({"id": "o2"}, {"_id": 0})
+        return outcome, o2
+
+    outcome, o2 = run_with_orders([
+        {"id": "o1", "status": "preparing", "version": 3},
+        {"id": "o2", "status": "pending"},
+        {"id": "o3", "status": "ready"},
+        {"id": "o4", "status": "completed"},
+    ], scenario)
+    results = {result["order_id"]: result["result"] for result in outcome["results"]}
+    assert results == {"o1": UPDATED, "o2": CONFLICT, "o3": UNCHANGED, "o4": INVALID, "missing": NOT_FOUND}
+    assert [order["id"] for order in outcome["transitioned"]] == ["o1"]
+    assert outcome["transitioned"][0]["version"] == 4
+    assert o2["status"] == "cancelled"
@@ -0,0 +1,87 @@
+"""
+Rate limiter client identification: forwarded headers are only believed
+from trusted proxies, and identified users get their own buckets.
+"""
+
+import asyncio
+
+from rate_limiter import (
+    DEFAULT_TRUSTED_PROXIES,
+    RateLimitMiddleware,
+    RateLimiter,
+    RateLimitRule,
+    client_ip,
+    parse_networks,
+)
+
+TRUSTED = parse_networks(DEFAULT_TRUSTED_PROXIES)
+
+
+def scope(peer, headers=(), path="/api/orders/", method="GET"):
+    return {
+        "type": "http",
+        "path": path,
+        "method": method,
+        "client": (peer, 50000),
+        "headers": [(name.encode(), value.encode()) for name, value in headers],
+    }
+
+
+class TestClientIp:
+    def test_direct_client_ignores_forwarding_headers(self):
+        s = scope("203.0.113.9", [("x-forwarded-for", "1.2.3.4"), ("x-real-ip", "1.2.3.4")])
+        assert client_ip(s, TRUSTED) == "203.0.113.9"
+
+    def test_trusted_proxy_uses_forwarded_for(self):
+        s = scope("127.0.0.1", [("x-forwarded-for", "198.51.100.7")])
+        assert client_ip(s, TRUSTED) == "198.51.100.7"
+
+    def test_spoofed_hops_left_of_the_proxy_are_skipped(self):
+        # Client sent "X-Forwarded-For: 1.1.1.1", nginx appended the real address
+        s = scope("10.0.0.5", [("x-forwarded-for", "1.1.1.1, 198.51.100.7, 10.0.0.4")])
+        assert client_ip(s, TRUSTED) == "198.51.100.7"
+
+    def test_trusted_proxy_falls_back_to_real_ip_then_peer(self):
+        assert client_ip(scope("127.0.0.1", [("x-real-ip", "198.51.100.8")]), TRUSTED) == "198.51.100.8"
+        assert client_ip(scope("127.0.0.1"), TRUSTED) == "127.0.0.1"
+
+    def test_invalid_trusted_entries_are_ignored(self):
+        assert len(parse_networks("127.0.0.1, nonsense, 10.0.0.0/8")) == 2
+
+
+class TestMiddlewareKeys:
+    def _run(self, middleware, s):
+        sent = []
+
+        async def receive():
+            return {"type": "http.request"}
+
+        async def send(message):
+            sent.append(message)
+
+        asyncio.run(middleware(s, receive, send))
+        return sent
+
+    def _middleware(self, limit=2, identify=None):
+        async def app(scope, receive, send):
+            await send({"type": "http.response.start", "status": 200, "headers": []})
+
+        limiter = RateLimiter([], RateLimitRule("general", "/", limit, 60))
+        return RateLimitMiddleware(app, limiter=limiter, identify=identify, trusted_proxies=TRUSTED)
+
+    def test_clients_behind_one_proxy_have_separate_buckets(self):
+        middleware = self._middleware(limit=2)
+        for _ in range(2):
+            assert self._run(middleware, scope("127.0.0.1", [("x-forwarded-for", "198.51.100.1")]))[0]["status"] == 200
+        assert self._run(middleware, scope("127.0.0.1", [("x-forwarded-for", "198.51.100.1")]))[0]["status"] == 429
+        assert self._run(middleware, scope("127.0.0.1", [("x-forwarded-for", "198.51.100.2")]))[0]["status"] == 200
+
+    def test_identified_users_are_limited_per_user(self):
+        def identify(s):
+            return dict(s["headers"]).get(b"authorization", b"").decode() or None
+
+        middleware = self._middleware(limit=1, identify=identify)
+        assert self._run(middleware, scope("127.0.0.1", [("authorization", "u1")]))[0]["status"] == 200
+        assert self._run(middleware, scope("127.0.0.1", [("authorization", "u1")]))[0]["status"] == 429
+        # Same IP, another user
+        assert self._run(middleware, scope("127.0.0.1", [("authorization", "u2")]))[0]["status"] == 200
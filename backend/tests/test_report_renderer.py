@@ -0,0 +1,63 @@
+"""
+A render job over its time budget must not leave its worker process
+running: the pool is stopped and its processes terminated.
+"""
+
+import asyncio
+import time
+
+import pytest
+
+import report_renderer
+from report_renderer import RenderBudgetError, ReportRenderer
+
+
+def _slow_job(seconds, daybook_data, date, end_date):
+    time.sleep(seconds)
+
+
+def _wait_dead(processes, timeout=10):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline and any(process.is_alive() for process in processes):
+        time.sleep(0.05)
+    return not any(process.is_alive() for process in processes)
+
+
+def test_restart_pool_terminates_running_workers():
+    renderer = ReportRenderer(max_workers=1)
+    executor = renderer._get_executor()
+    executor.submit(time.sleep, 60)
+    processes = list(executor._processes.values())
+    assert processes and all(process.is_alive() for process in processes)
+
+    renderer._restart_pool(executor)
+    assert renderer._executor is None
+    assert _wait_dead(processes)
+
+
+def test_stale_restart_keeps_the_new_pool():
+    renderer = ReportRenderer(max_workers=1)
+    old = renderer._get_executor()
+    renderer._restart_pool(old)
+    new = renderer._get_executor()
+    # A second job that timed out on the old pool must not stop the new one
+    renderer._restart_pool(old)
+    assert renderer._executor is new
+    renderer.shutdown()
+
+
+def test_timed_out_job_raises_budget_error(monkeypatch):
+    renderer = ReportRenderer(max_workers=1, timeout=0.5)
+    monkeypatch.setattr(report_renderer, "_render_job", _slow_job)
+
+    async def run():
+        executor = renderer._get_executor()
+        executor.submit(int).result()  # workers started
+        processes = list(executor._processes.values())
+        with pytest.raises(RenderBudgetError):
+            await renderer._run(30, {}, "", "")
+        return processes
+
+    processes = asyncio.run(run())
+    assert renderer.get_stats()["timeouts"] == 1
+    assert _wait_dead(processes)
@@ -0,0 +1,67 @@
+"""
+order_contribution is the $inc one order adds to its day's rollup; the
+rollup is only right if these counters match what the reports compute.
+"""
+
+import pytest
+
+from sales_rollups import order_contribution
+
+
+def order(**fields):
+    return {
+        "status": "completed", "total": 105.0, "subtotal": 100.0, "tax": 5.0,
+        "created_at": "2024-06-01T14:45:00+00:00", **fields,
+    }
+
+
+def test_no_order_contributes_nothing():
+    assert order_contribution(None) == {}
+    assert order_contribution({}) == {}
+
+
+@pytest.mark.parametrize("status", ["pending", "preparing", "ready"])
+def test_open_orders_only_count_as_created(status):
+    assert order_contribution(order(status=status)) == {"created": 1}
+
+
+def test_cancelled_order_is_not_a_sale():
+    assert order_contribution(order(status="cancelled")) == {
+        "created": 1, "orders.cancelled": 1, "revenue.cancelled": 105.0,
+    }
+
+
+def test_cash_sale():
+    counters = order_contribution(order(payment_method="cash", discount=2))
+    assert counters["sales.orders"] == 1
+    assert counters["sales.total"] == 105.0
+    assert counters["sales.subtotal"] == 100.0
+    assert counters["sales.tax"] == 5.0
+    assert counters["sales.discount"] == 2.0
+    # Without payment_received the whole total counts as received
+    assert counters["sales.received"] == 105.0
+    assert counters["payments.cash.amount"] == 105.0
+    assert counters["inflows.cash"] == 105.0
+    # 14:45 UTC is 20:15 IST
+    assert counters["hours.20.orders"] == 1 and counters["hours.20.revenue"] == 105.0
+
+
+def test_split_payment_inflows_per_tender():
+    counters = order_contribution(order(payment_method="split", cash_amount=50, card_amount="30", upi_amount=None))
+    assert counters["payments.split.amount"] == 105.0
+    assert (counters["inflows.cash"], counters["inflows.card"], counters["inflows.upi"]) == (50.0, 30.0, 0.0)
+
+
+def test_credit_and_unknown_methods():
+    credit = order_contribution(order(payment_method="card", is_credit=True, payment_received=40))
+    assert credit["payments.credit.orders"] == 1
+    assert credit["sales.received"] == 40.0 and credit["inflows.card"] == 40.0
+
+    other = order_contribution(order(payment_method="voucher"))
+    assert other["payments.other.orders"] == 1 and other["inflows.other"] == 105.0
+
+
+def test_unparseable_values_count_as_zero():
+    counters = order_contribution(order(total="n/a", created_at="yesterday"))
+    assert counters["sales.total"] == 0.0
+    assert not any(key.startswith("hours.") for key in counters)
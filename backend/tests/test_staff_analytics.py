@@ -0,0 +1,63 @@
+"""
+Shifts are local times of day in the organization's timezone and may
+run past midnight.
+"""
+
+import pytest
+
+from staff_analytics import _order_stages, _shift_match, parse_shift
+
+
+def in_shift(shift, minute):
+    """Evaluate the shift $match for one order's minute of day"""
+    expr = _shift_match(shift)["$match"]["$expr"]
+    (operator, conditions), = expr.items()
+    results = []
+    for condition in conditions:
+        (comparison, (_, bound)), = condition.items()
+        results.append(minute >= bound if comparison == "$gte" else minute < bound)
+    return all(results) if operator == "$and" else any(results)
+
+
+def test_parse_shift():
+    assert parse_shift(None, None) is None
+    assert parse_shift("", "") is None
+    assert parse_shift("18:00", "23:30") == (1080, 1410)
+    assert parse_shift("22:00", "02:00") == (1320, 120)
+
+
+@pytest.mark.parametrize("start,end,message", [
+    ("18:00", None, "both"),
+    (None, "23:00", "both"),
+    ("09:00", "09:00", "differ"),
+])
+def test_parse_shift_rejects(start, end, message):
+    with pytest.raises(ValueError, match=message):
+        parse_shift(start, end)
+
+
+@pytest.mark.parametrize("value", ["25:00", "9am", "18:60"])
+def test_parse_shift_rejects_bad_times(value):
+    with pytest.raises(ValueError):
+        parse_shift(value, "10:00")
+
+
+def test_day_shift():
+    shift = parse_shift("11:00", "15:00")
+    assert [in_shift(shift, minute) for minute in (659, 660, 899, 900)] == [False, True, True, False]
+
+
+def test_shift_past_midnight_wraps():
+    shift = parse_shift("22:00", "02:00")
+    assert _shift_match(shift)["$match"]["$expr"].keys() == {"$or"}
+    assert [in_shift(shift, minute) for minute in (1319, 1320, 1439, 0, 119, 120, 720)] == [
+        False, True, True, True, True, False, False,
+    ]
+
+
+def test_minute_of_day_uses_the_given_timezone():
+    stages = _order_stages(None, "Asia/Dubai")
+    minute_of_day = stages[1]["$set"]["minute_of_day"]
+    assert minute_of_day["$add"][0]["$multiply"][0]["$hour"]["timezone"] == "Asia/Dubai"
+    assert len(stages) == 2
+    assert _order_stages((60, 120), "Asia/Dubai")[2] == _shift_match((60, 120))
@@ -0,0 +1,106 @@
+import { useEffect, useRef, useState } from 'react';
+import axios from 'axios';
+import { API } from '../App';
+
+const EVENT_TYPES = [
+  'order.updated',
+  'order.removed',
+  'orders.updated',
+  'orders.reset',
+  'table.updated',
+  'tables.changed',
+  'reservation.updated',
+  'reservation.removed',
+  'resync',
+];
+
+const RECONNECT_DELAY_MS = 3000;
+
+/**
+ * Subscribe to the organization's live event stream (Server-Sent Events).
+ * Calls onEvent(type, data) for order, table and reservation changes.
+ * Returns true while the stream is connected; pages should only poll
+ * while it is false. The stream is opened with a short-lived ticket
+ * (never the login token); when the browser's own reconnect is refused
+ * because the ticket expired, a new ticket is fetched and the stream
+ * resumes from the last received event.
+ */
+export const useOrgEvents = (onEvent, enabled = true) => {
+  const [connected, setConnected] = useState(false);
+  const handlerRef = useRef(onEvent);
+  handlerRef.current = onEvent;
+
+  useEffect(() => {
+    const token = localStorage.getItem('token');
+    if (!enabled || !token || typeof EventSource === 'undefined') {
+      setConnected(false);
+      return undefined;
+    }
+
+    let source = null;
+    let retryTimer = null;
+    let closed = false;
+    let lastEventId = null;
+
+    const scheduleReconnect = () => {
+      if (!closed && retryTimer === null) {
+        retryTimer = setTimeout(() => {
+          retryTimer = null;
+          connect();
+        }, RECONNECT_DELAY_MS);
+      }
+    };
+
+    const connect = async () => {
+      let ticket;
+      try {
+        const response = await axios.post(`${API}/events/ticket`);
+        ticket = response.data.ticket;
+      } catch (e) {
+        setConnected(false);
+        scheduleReconnect();
+        return;
+      }
+      if (closed) return;
+
+      const params = new URLSearchParams({ ticket });
+      if (lastEventId) params.set('lastEventId', lastEventId);
+      source = new EventSource(`${API}/events/stream?${params}`);
+      source.onopen = () => setConnected(true);
+      source.onerror = () => {
+        setConnected(false);
+        // CLOSED: the browser gave up (e.g. the ticket expired), start over
+        if (source.readyState === EventSource.CLOSED) {
+          source.close();
+          scheduleReconnect();
+        }
+      };
+
+      EVENT_TYPES.forEach((type) => {
+        source.addEventListener(type, (event) => {
+          if (event.lastEventId) lastEventId = event.lastEventId;
+          let data = {};
+          try {
+            data = JSON.parse(event.data);
+          } catch (e) {
+            console.warn('Invalid event payload:', type, e);
+          }
+          handlerRef.current?.(type, data);
+        });
+      });
+    };
+
+    connect();
+
+    return () => {
+      closed = true;
+      if (retryTimer !== null) clearTimeout(retryTimer);
+      if (source) source.close();
+      setConnected(false);
+    };
+  }, [enabled]);
+
+  return connected;
+};
+
+export default useOrgEvents;
@@ -12,6 +12,7 @@ import {
   Phone, Vibrate, Settings, Speaker
 } from 'lucide-react';
 import { printKOT as printKOTUtil } from '../utils/printUtils';
+import { useOrgEvents } from '../hooks/useOrgEvents';
 
 const KitchenPage = ({ user }) => {
   const [orders, setOrders] = useState([]);
@@ -42,12 +43,25 @@ const KitchenPage = ({ user }) => {
   const phoneRingAudioRef = useRef(null);
   const successAudioRef = useRef(null);
 
+  // Live order events; timer polling is only a fallback while disconnected
+  const liveEventsRef = useRef(false);
+  liveEventsRef.current = useOrgEvents((type) => {
+    if (type.startsWith('order') || type === 'resync') {
+      fetchOrders();
+    }
+  }, autoRefresh);
+
   useEffect(() => {
     fetchOrders();
     fetchBusinessSettings();
     initializeAudioElements();
     
     const interval = autoRefresh ? setInterval(() => {
+      // Event stream connected: changes are pushed, no need to poll
+      if (liveEventsRef.current) {
+        return;
+      }
+
       // COMPLETELY BLOCK polling if there are status changes in progress
       if (processingOrders.size > 0) {
         console.log('⏸️ Kitchen: BLOCKING polling - status changes in progress:', Array.from(processingOrders));
@@ -14,6 +14,7 @@ import OptimizedBillingButton from '../components/OptimizedBillingButton';
 import { billingCache } from '../utils/billingCache';
 import EditOrderModal from '../components/EditOrderModal';
 import { apiWithRetry, apiSilent } from '../utils/apiClient';
+import { useOrgEvents } from '../hooks/useOrgEvents';
 
 // Enhanced sound effects for better UX
 const playSound = (type) => {
@@ -133,6 +134,16 @@ const OrdersPage = ({ user }) => {
   const [globalPollingDisabled, setGlobalPollingDisabled] = useState(false);
   const dataLoadedRef = useRef(false);
 
+  // Live events: changes trigger a protected refresh, polling is only a fallback
+  const eventsConnected = useOrgEvents((type) => {
+    if (type.startsWith('order') || type === 'resync') {
+      setNeedsImmediateRefresh(true);
+    }
+    if (type.startsWith('table') || type === 'resync') {
+      fetchTables();
+    }
+  });
+
   // Get unique categories from menu items
   const categories = ['all', ...new Set(menuItems.map(item => item.category).filter(Boolean))];
 
@@ -294,6 +305,11 @@ const OrdersPage = ({ user }) => {
         return;
       }
       
+      // Event stream connected: changes arrive as events, no background polling
+      if (eventsConnected) {
+        return;
+      }
+      
       // Skip polling if there are active status changes to avoid conflicts
       if (processingStatusChanges.size > 0) {
         console.log('⏸️ Skipping polling - status changes in progress:', Array.from(processingStatusChanges));
@@ -328,7 +344,7 @@ const OrdersPage = ({ user }) => {
     }, 2000); // Reduced to 2 seconds for faster updates
 
     return () => clearInterval(interval);
-  }, [activeTab, processingStatusChanges, needsImmediateRefresh, recentPaymentCompletions, paymentProtectionActive]); // Removed recentOrderCreation dependency
+  }, [activeTab, processingStatusChanges, needsImmediateRefresh, recentPaymentCompletions, paymentProtectionActive, eventsConnected]); // Removed recentOrderCreation dependency
 
   // Track user interactions to pause polling
   useEffect(() => {